@@ -39,6 +39,7 @@ minimum_password_hash_time = 0.25
 minimum_rounds = {}
 auth_database = "internal"
 enable_access_tokens = True
+http_authentication_cache_max_age = 300
 
 ldap_url = "ldap://ldap.example.com:389"
 ldap_search_base = "dc=example,dc=com"
@@ -260,7 +261,7 @@ def prepare(mode, arguments, data):
     global verify_email_addresses, archive_review_branches
     global password_hash_schemes, default_password_hash_scheme
     global minimum_password_hash_time, minimum_rounds, auth_database
-    global enable_access_tokens
+    global enable_access_tokens, http_authentication_cache_max_age
     global is_development, is_testing, coverage_dir
 
     global ldap_url, ldap_search_base, ldap_create_user, ldap_username_attribute
@@ -370,6 +371,12 @@ the Web front-end.  This can be handled in two different ways:
         except AttributeError:
             pass
 
+        try:
+            http_authentication_cache_max_age = \
+                configuration.auth.HTTP_AUTHENTICATION_CACHE_MAX_AGE
+        except AttributeError:
+            pass
+
         try: is_development = configuration.debug.IS_DEVELOPMENT
         except AttributeError:
             # Was moved from configuration.base to configuration.debug.
@@ -626,6 +633,8 @@ web server to redirect all HTTP accesses to HTTPS.
     data["installation.config.minimum_password_hash_time"] = minimum_password_hash_time
     data["installation.config.auth_database"] = auth_database
     data["installation.config.enable_access_tokens"] = enable_access_tokens
+    data["installation.config.http_authentication_cache_max_age"] = \
+        http_authentication_cache_max_age
 
     data["installation.config.is_quickstart"] = False
     data["installation.config.is_development"] = is_development
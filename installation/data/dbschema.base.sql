@@ -54,3 +54,17 @@ CREATE TABLE timezones
 
 INSERT INTO timezones (name, abbrev, utc_offset)
      VALUES ('Universal/UTC', 'UTC', INTERVAL '0');
+
+-- Generation counters used to invalidate process-wide caches.  A counter is
+-- incremented in every transaction that modifies the data it covers; see
+-- src/dbutils/generations.py.
+CREATE TABLE cachegenerations
+  ( name VARCHAR(64) PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0 );
+
+INSERT INTO cachegenerations (name)
+     VALUES ('accesscontrol');
+INSERT INTO cachegenerations (name)
+     VALUES ('preferences');
+INSERT INTO cachegenerations (name)
+     VALUES ('extensions');
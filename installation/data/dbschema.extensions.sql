@@ -107,6 +107,23 @@ CREATE TABLE extensionfilterhookfiles
 CREATE INDEX extensionfilterhookfiles_event
           ON extensionfilterhookfiles (event);
 
+-- Queued invocations of asynchronous ProcessCommits roles.
+CREATE TABLE extensionprocesscommitsevents
+  ( id SERIAL PRIMARY KEY,
+    extension INTEGER NOT NULL REFERENCES extensions ON DELETE CASCADE,
+    uid INTEGER REFERENCES users ON DELETE CASCADE, -- NULL => the system user
+    review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    changeset INTEGER REFERENCES changesets ON DELETE CASCADE,
+    script VARCHAR(64) NOT NULL,
+    function VARCHAR(64) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    failed BOOLEAN NOT NULL DEFAULT FALSE );
+CREATE TABLE extensionprocesscommitscommits
+  ( event INTEGER NOT NULL REFERENCES extensionprocesscommitsevents ON DELETE CASCADE,
+    commit INTEGER NOT NULL REFERENCES commits );
+CREATE INDEX extensionprocesscommitscommits_event
+          ON extensionprocesscommitscommits (event);
+
 CREATE TABLE extensionstorage
   ( extension INTEGER NOT NULL REFERENCES extensions,
     uid INTEGER NOT NULL REFERENCES users,
@@ -23,6 +23,17 @@ CREATE TABLE repositories
     name VARCHAR(64) NOT NULL UNIQUE,
     path VARCHAR(256) NOT NULL UNIQUE );
 
+-- Per-repository activity, used by the maintenance service to skip
+-- repositories that haven't changed since they were last maintained.
+CREATE TABLE repositorymaintenance
+  ( repository INTEGER PRIMARY KEY REFERENCES repositories ON DELETE CASCADE,
+    -- Number of pushes since the repository was last maintained.
+    pushes INTEGER NOT NULL DEFAULT 0,
+    -- Number of refs in the repository when it was last maintained.
+    refs INTEGER,
+    -- Number of nightly maintenance runs since the last full garbage collect.
+    gc_age INTEGER NOT NULL DEFAULT 0 );
+
 CREATE TABLE gitusers
   ( id SERIAL PRIMARY KEY,
     email VARCHAR(256) NOT NULL,
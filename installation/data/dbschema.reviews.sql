@@ -44,6 +44,23 @@ CREATE TABLE reviews
     description TEXT );
 CREATE INDEX reviews_branch ON reviews (branch);
 
+-- Trigram index used by the review search (see reviewing/searchindex.py.)
+-- Records which lower-cased trigrams occur in each indexed field of each
+-- review.  Duplicate rows may occur, and are harmless.
+CREATE TYPE reviewsearchfield AS ENUM
+  ( 'summary',      -- The review summary.
+    'description',  -- The review description.
+    'branch',       -- The name of the review branch.
+    'comment',      -- The text of published comments.
+    'path'          -- The paths of files in the review.
+  );
+CREATE TABLE reviewsearchtrigrams
+  ( review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    field reviewsearchfield NOT NULL,
+    trigram VARCHAR(3) NOT NULL );
+CREATE INDEX reviewsearchtrigrams_field_trigram ON reviewsearchtrigrams (field, trigram, review);
+CREATE INDEX reviewsearchtrigrams_review_field ON reviewsearchtrigrams (review, field);
+
 CREATE TABLE scheduledreviewbrancharchivals
   ( review INTEGER PRIMARY KEY REFERENCES reviews (id),
     deadline TIMESTAMP NOT NULL );
@@ -222,6 +239,33 @@ CREATE TABLE reviewmessageids
 
 CREATE INDEX reviewmessageids_review ON reviewmessageids (review);
 
+-- Review events for which notification mails have not been generated yet.  The
+-- mails are generated (and queued for delivery) by the mailgeneration service.
+CREATE TYPE mailgenerationeventtype AS ENUM
+  ( 'reviewcreated',  -- The review was created.
+    'commitsadded',   -- Commits were added to the review.
+    'batchsubmitted'  -- Changes (comments, marked files) were submitted.
+  );
+CREATE TABLE mailgenerationevents
+  ( id SERIAL PRIMARY KEY,
+    type mailgenerationeventtype NOT NULL,
+    review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    uid INTEGER REFERENCES users ON DELETE CASCADE, -- NULL => the system user
+    data TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    time TIMESTAMP NOT NULL DEFAULT NOW() );
+
+-- Commits added to a review by a push whose processing was finished after the
+-- push had been accepted (see GITHOOK["time_budget"].)  Rows are deleted once
+-- the commits have been added to the review.
+CREATE TABLE deferredreviewupdates
+  ( id SERIAL PRIMARY KEY,
+    review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    uid INTEGER REFERENCES users ON DELETE CASCADE, -- NULL => the system user
+    data TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    time TIMESTAMP NOT NULL DEFAULT NOW() );
+
 CREATE TABLE reviewmergeconfirmations
   ( id SERIAL PRIMARY KEY,
     review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
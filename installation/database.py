@@ -19,6 +19,7 @@ import shutil
 import os
 import time
 import errno
+import re
 import subprocess
 
 import installation
@@ -136,11 +137,14 @@ def install(data):
     postgresql_version_output = subprocess.check_output(
         [installation.prereqs.psql.path, "--version"])
 
-    postgresql_version = postgresql_version_output.splitlines()[0].split()[-1]
-    postgresql_version_components = postgresql_version.split(".")
+    # The output is typically "psql (PostgreSQL) 9.6.2", but distributions add
+    # their own suffixes, for instance
+    #   psql (PostgreSQL) 14.9 (Ubuntu 14.9-0ubuntu0.22.04.1)
+    postgresql_version_match = re.search(r"(\d+)\.(\d+)",
+                                         postgresql_version_output)
 
-    postgresql_major = postgresql_version_components[0]
-    postgresql_minor = postgresql_version_components[1]
+    postgresql_major = int(postgresql_version_match.group(1))
+    postgresql_minor = int(postgresql_version_match.group(2))
 
     if postgresql_major < 9 or (postgresql_major == 9 and postgresql_minor < 1):
         print
@@ -148,7 +152,7 @@ def install(data):
 Unsupported PostgreSQL version: %s
 
 ERROR: Critic requires PostgreSQL 9.1.x or later!
-""" % postgresql_version
+""" % postgresql_version_output.strip()
         return False
 
     print "Creating database ..."
@@ -0,0 +1,34 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import installation
+
+# Handles command line arguments and sets uid/gid.
+installation.utils.start_migration()
+
+dbschema = installation.utils.DatabaseSchema()
+
+if not dbschema.table_exists("repositorymaintenance"):
+    # New definitions in dbschema.git.sql.
+    dbschema.update("""
+
+CREATE TABLE repositorymaintenance
+  ( repository INTEGER PRIMARY KEY REFERENCES repositories ON DELETE CASCADE,
+    pushes INTEGER NOT NULL DEFAULT 0,
+    refs INTEGER,
+    gc_age INTEGER NOT NULL DEFAULT 0 );
+
+""")
@@ -0,0 +1,99 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import installation
+
+# Handles command line arguments and sets uid/gid.
+installation.utils.start_migration()
+
+dbschema = installation.utils.DatabaseSchema()
+
+if not dbschema.table_exists("reviewsearchtrigrams"):
+    # New definitions in dbschema.reviews.sql.
+    dbschema.update("""
+
+CREATE TYPE reviewsearchfield AS ENUM
+  ( 'summary',      -- The review summary.
+    'description',  -- The review description.
+    'branch',       -- The name of the review branch.
+    'comment',      -- The text of published comments.
+    'path'          -- The paths of files in the review.
+  );
+CREATE TABLE reviewsearchtrigrams
+  ( review INTEGER NOT NULL REFERENCES reviews ON DELETE CASCADE,
+    field reviewsearchfield NOT NULL,
+    trigram VARCHAR(3) NOT NULL );
+
+""")
+
+    # Index all existing reviews.  This mirrors the logic in
+    # reviewing/searchindex.py, which isn't importable from here.
+
+    def trigrams(text):
+        if not text:
+            return set()
+        try:
+            text = text.decode("utf-8")
+        except UnicodeDecodeError:
+            text = text.decode("latin-1")
+        text = text.lower()
+        return set(text[offset:offset + 3].encode("utf-8")
+                   for offset in range(len(text) - 2))
+
+    db = dbschema.db
+    cursor = db.cursor()
+
+    queries = {
+        "summary": """SELECT id, summary
+                        FROM reviews""",
+        "description": """SELECT id, description
+                            FROM reviews""",
+        "branch": """SELECT reviews.id, branches.name
+                       FROM reviews
+                       JOIN branches ON (branches.id=reviews.branch)""",
+        "comment": """SELECT commentchains.review, comments.comment
+                        FROM comments
+                        JOIN commentchains ON (commentchains.id=comments.chain)
+                       WHERE comments.state='current'""",
+        "path": """SELECT DISTINCT reviewfiles.review, files.path
+                     FROM reviewfiles
+                     JOIN files ON (files.id=reviewfiles.file)"""
+        }
+
+    for field, query in queries.items():
+        index = {}
+
+        cursor.execute(query)
+
+        for review_id, text in cursor.fetchall():
+            index.setdefault(review_id, set()).update(trigrams(text))
+
+        for review_id, review_trigrams in index.items():
+            cursor.executemany(
+                """INSERT INTO reviewsearchtrigrams (review, field, trigram)
+                        VALUES (%s, %s, %s)""",
+                [(review_id, field, trigram)
+                 for trigram in sorted(review_trigrams)])
+
+        db.commit()
+
+    # Create the indexes after populating the table; it's faster.
+    dbschema.update("""
+
+CREATE INDEX reviewsearchtrigrams_field_trigram ON reviewsearchtrigrams (field, trigram, review);
+CREATE INDEX reviewsearchtrigrams_review_field ON reviewsearchtrigrams (review, field);
+
+""")
@@ -191,6 +191,8 @@ def mkdirs():
     mkdir(os.path.join(data_dir, "temporary"))
     mkdir(os.path.join(data_dir, "outbox", "sent"), mode=0700)
     mkdir(os.path.join(cache_dir, "main", "highlight"))
+    mkdir(os.path.join(cache_dir, "main", "httpauth"), mode=0700)
+    mkdir(os.path.join(cache_dir, "main", "diffs"))
     mkdir(git_dir)
     mkdir(os.path.join(log_dir, "main"))
     mkdir(os.path.join(run_dir, "main", "sockets"), mode=0755)
@@ -54,6 +54,7 @@ def generate(arguments, database_path):
              config("verify_email_addresses"): arguments.testing,
              config("access_scheme"): "http",
              config("enable_access_tokens"): True,
+             config("http_authentication_cache_max_age"): 300,
              config("repository_url_types"): ["http"],
              config("default_encodings"): ["utf-8", "latin-1"],
              database("driver"): "sqlite",
@@ -192,3 +192,11 @@ DATABASES = {
 DATABASE = %(installation.config.auth_database)r
 
 ENABLE_ACCESS_TOKENS = %(installation.config.enable_access_tokens)r
+
+# Maximum age, in seconds, of cached successful HTTP authentications.  While
+# cached, the same credentials are accepted without being verified against the
+# authentication database (or access token table) again.  The cache is shared
+# by all web server processes.  Changing a user's password, or deleting an
+# access token, removes the affected cache entries immediately.  If set to
+# zero, caching is disabled altogether.
+HTTP_AUTHENTICATION_CACHE_MAX_AGE = %(installation.config.http_authentication_cache_max_age)r
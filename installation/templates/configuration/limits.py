@@ -35,3 +35,17 @@ MAXIMUM_REACHABLE_COMMITS = 4000
 # Maximum number of commits when /createreview is loaded with the
 # 'branch' URI parameter to create a review of all commits on a branch.
 MAXIMUM_REVIEW_COMMITS = 2000
+
+# Maximum total size, in bytes, of the cache of rendered file diffs.  When two
+# users look at the same diff using the same options, the second one is served
+# the diff rendered for the first one (with their own comments added on top.)
+# The least recently used entries are removed when the limit is exceeded.  If
+# set to zero, caching is disabled altogether.
+MAXIMUM_RENDERED_DIFF_CACHE_SIZE = 256 * 1024 * 1024
+
+# Maximum number of whole-file blames kept in memory, per process, by the
+# blame view.  Each entry is the blame of one file between two commits, and
+# ranges of lines in that file are served from it.  The least recently used
+# entries are removed when the limit is exceeded.  If set to zero, caching is
+# disabled altogether.
+MAXIMUM_BLAME_CACHE_ENTRIES = 64
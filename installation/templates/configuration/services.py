@@ -36,6 +36,7 @@ CHANGESET         = service(name="changeset")
 GITHOOK           = service(name="githook")
 BRANCHTRACKER     = service(name="branchtracker",     address=None)
 MAILDELIVERY      = service(name="maildelivery",      address=None)
+MAILGENERATION    = service(name="mailgeneration",    address=None)
 WATCHDOG          = service(name="watchdog",          address=None)
 MAINTENANCE       = service(name="maintenance",       address=None)
 EXTENSIONTASKS    = service(name="extensiontasks",    address=None)
@@ -52,6 +53,24 @@ CHANGESET["max_workers"] = %(installation.config.changeset.max_workers)d
 CHANGESET["rss_limit"] = 1024 ** 3
 CHANGESET["purge_at"] = (2, 15)
 
+# Maximum number of pushes processed concurrently.  Pushes to the same
+# repository are always processed one at a time, in the order they arrived.
+# Pushes beyond this limit are queued, and the pushing users are told that their
+# pushes are waiting.
+GITHOOK["max_workers"] = 4
+
+# Pushes that take longer than this (in seconds) to process are accepted as soon
+# as their ref updates have been recorded, and commits pushed to reviews are
+# then added to the reviews (changesets created, reviewers assigned, mails
+# queued) after the pushing user has been told that the push was accepted.  Set
+# to None to always finish processing first.
+GITHOOK["time_budget"] = 30
+
+# Interval (in seconds) between progress reports sent to the pushing user while
+# a push is being processed.  No progress is reported for pushes that finish
+# within the first interval.
+GITHOOK["progress_interval"] = 5
+
 # Timeout (in seconds) passed to smtplib.SMTP().
 MAILDELIVERY["timeout"] = 10
 
@@ -60,13 +79,54 @@ WATCHDOG["rss_hard_limit"] = 2 * WATCHDOG["rss_soft_limit"]
 
 MAINTENANCE["maintenance_at"] = (4, 0)
 
+# Number of repositories maintained in parallel.
+MAINTENANCE["max_workers"] = 2
+
+# Repositories are fully garbage collected (including pruning of unreachable
+# objects) every this many nightly maintenance runs.  Other nights, only
+# cheaper incremental maintenance is done, and only in repositories that have
+# changed.
+MAINTENANCE["full_gc_interval"] = 7
+
+# Maximum number of asynchronous ProcessCommits roles run concurrently, in
+# total and per extension.
+EXTENSIONTASKS["max_workers"] = 4
+EXTENSIONTASKS["max_workers_per_extension"] = 1
+
 EXTENSIONRUNNER["cached_processes"] = 5
 
+# Services that crash are restarted after a delay that starts at
+# "min_restart_delay" seconds and doubles with every crash, up to
+# "max_restart_delay" seconds.  The delay is reset once a service has been
+# running for "stable_uptime" seconds.  A service that crashes
+# "crash_loop_limit" times within "crash_loop_interval" seconds is left stopped
+# until restarted manually (e.g. via the /services page.)  These settings can
+# also be overridden per service, e.g. CHANGESET["max_restart_delay"] = 60.
+SERVICEMANAGER["min_restart_delay"] = 1
+SERVICEMANAGER["max_restart_delay"] = 300
+SERVICEMANAGER["stable_uptime"] = 60
+SERVICEMANAGER["crash_loop_limit"] = 5
+SERVICEMANAGER["crash_loop_interval"] = 600
+
+# Number of seconds a service is given to stop after being sent SIGTERM, before
+# it is sent SIGKILL.  Can also be overridden per service.
+SERVICEMANAGER["stop_timeout"] = 30
+
+# Resource limits can be set per service, and are applied (as soft limits) to
+# the service's process by the service manager:
+#
+#   "rlimit_as": maximum size of the address space, in bytes,
+#   "rlimit_cpu": maximum CPU time, in seconds, and
+#   "rlimit_nofile": maximum number of open files.
+#
+# For example: HIGHLIGHT["rlimit_as"] = 4 * 1024 ** 3
+
 SERVICEMANAGER["services"] = [HIGHLIGHT,
                               CHANGESET,
                               GITHOOK,
                               BRANCHTRACKER,
                               MAILDELIVERY,
+                              MAILGENERATION,
                               WATCHDOG,
                               MAINTENANCE,
                               EXTENSIONTASKS,
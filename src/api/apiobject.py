@@ -52,3 +52,22 @@ class APIObject(object):
            This method should not be called outside the implementation of the
            API."""
         self.__impl = impl
+
+def prefetch(critic, values, relations):
+    """Load relations of many API objects in bulk
+
+       The |values| parameter is an iterable of API objects and |relations| an
+       iterable of relation names, typically attribute names such as "owners"
+       or "author".  Where supported, each named relation is loaded for all
+       objects using a single query, so that accessing the corresponding
+       attribute of each object afterwards is cheap.  Relations that are not
+       supported by an object's type are ignored.
+
+       This is purely an optimization; the values of attributes accessed
+       afterwards are the same as if this function had not been called."""
+
+    import api.impl
+    assert isinstance(critic, api.critic.Critic)
+    values = list(values)
+    assert all(isinstance(value, APIObject) for value in values)
+    api.impl.apiobject.prefetch(critic, values, frozenset(relations))
@@ -52,6 +52,15 @@ class CommitSet(api.APIObject):
            commit timestamp order is the opposite."""
         return self._impl.getDateOrdered()
 
+    @property
+    def author_date_ordered(self):
+        """The commits in the set in author timestamp order
+
+           The return value is a generator producing api.commit.Commit objects.
+           Commits are guaranteed to precede their parents, even if the actual
+           author timestamp order is the opposite."""
+        return self._impl.getAuthorDateOrdered()
+
     @property
     def topo_ordered(self):
         """The commits in the set in "topological" order
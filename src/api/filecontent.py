@@ -22,6 +22,11 @@ class FilecontentError(api.APIError):
 class Filecontent(api.APIObject):
     """Representation of some context"""
 
+    @property
+    def sha1(self):
+        """The SHA-1 of the blob whose lines this object represents"""
+        return self._impl.sha1
+
     def getLines(self, first_row=None, last_row=None):
         assert first_row is None or isinstance(first_row, int)
         assert last_row is None or isinstance(last_row, int)
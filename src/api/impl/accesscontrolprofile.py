@@ -84,16 +84,13 @@ class AccessControlProfile(apiobject.APIObject):
              for exception_id, access_type, extension_key in cursor])
 
     @staticmethod
-    def refresh(critic, tables, cached_profiles):
-        if "accesscontrolprofiles" not in tables:
-            return
-
-        AccessControlProfile.updateAll(
-            critic,
+    def refresh(critic, modified, cached_profiles):
+        AccessControlProfile.refreshModified(
+            critic, modified, cached_profiles,
             """SELECT id, title, access_token, http, repositories, extensions
                  FROM accesscontrolprofiles
                 WHERE id=ANY (%s)""",
-            cached_profiles)
+            "accesscontrolprofiles")
 
 @AccessControlProfile.cached()
 def fetch(critic, profile_id):
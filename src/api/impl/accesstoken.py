@@ -48,16 +48,16 @@ class AccessToken(apiobject.APIObject):
         return api.accesscontrolprofile.fetch(critic, self.__profile_id)
 
     @staticmethod
-    def refresh(critic, tables, cached_tokens):
-        if not tables.intersection(("accesstokens", "accesscontrolprofiles")):
-            return
-
-        AccessToken.updateAll(
-            critic,
+    def refresh(critic, modified, cached_tokens):
+        AccessToken.refreshModified(
+            critic, modified, cached_tokens,
             """SELECT id, access_type, uid, part1, part2, title
                  FROM accesstokens
                 WHERE id=ANY (%s)""",
-            cached_tokens)
+            "accesstokens",
+            { "accesscontrolprofiles": """SELECT access_token
+                                            FROM accesscontrolprofiles
+                                           WHERE id=ANY (%s)""" })
 
 @AccessToken.cached()
 def fetch(critic, token_id):
@@ -104,26 +104,92 @@ class APIObject(object):
         return critic._impl.lookup(Implementation)
 
     @staticmethod
-    def refresh(critic, tables, cached_objects):
+    def prefetch(critic, items, relations):
+        """Load relations of many objects in bulk
+
+           The |items| parameter is a list of objects (implementations) of this
+           type, and the |relations| parameter is a set of relation names.
+           Types that support it load the named relations for all items using
+           one query per relation, and store the result in each item, so that
+           subsequent per-object accessors need not query the database.
+           Relation names that a type does not support are ignored."""
+        pass
+
+    @staticmethod
+    def refresh(critic, modified, cached_objects):
         """Refresh objects after transaction commit
 
-           The |tables| parameter is a set of database tables that were modified
-           in the transaction. The |cached_objects| parameter is a dictionary
-           mapping object ids to cached objects (wrappers) of this type."""
+           The |modified| parameter is a dictionary mapping each database table
+           that was modified in the transaction to the set of primary keys of
+           the modified rows, or to None if they are not known. The
+           |cached_objects| parameter is a dictionary mapping object ids to
+           cached objects (wrappers) of this type."""
         pass
 
     @classmethod
-    def updateAll(Implementation, critic, query, cached_objects):
+    def updateAll(Implementation, critic, query, cached_objects,
+                  object_ids=None):
         """Execute the query and update all cached objects
 
            The query must take a single parameter, which is a list of object
            ids. It will be executed with the list of ids of all cached
-           objects. Each returned row must have the id of the object as the
-           first item, and the implementation constructor must take the row
-           as a whole as arguments:
+           objects, or with |object_ids| if not None. Each returned row must
+           have the id of the object as the first item, and the implementation
+           constructor must take the row as a whole as arguments:
+
+             new_impl = Implementation(*row)
 
-             new_impl = Implementation(*row)"""
+           If |object_ids| is not None, objects whose ids are in it but are not
+           returned by the query are evicted from the cache."""
+        evict = object_ids is not None
+        if not evict:
+            object_ids = cached_objects.keys()
         cursor = critic.getDatabaseCursor()
-        cursor.execute(query, (cached_objects.keys(),))
+        cursor.execute(query, (list(object_ids),))
+        missing_ids = set(object_ids)
         for row in cursor:
             cached_objects[row[0]]._set_impl(Implementation(*row))
+            missing_ids.discard(row[0])
+        if evict:
+            for object_id in missing_ids:
+                del cached_objects[object_id]
+
+    @classmethod
+    def refreshModified(Implementation, critic, modified, cached_objects,
+                        query, table, related={}):
+        """Update the cached objects affected by a transaction
+
+           The object ids are the primary keys of |table|. The |related|
+           parameter maps other tables whose modification affect objects of
+           this type to queries that, given a list of primary keys in that
+           table, return the ids of the affected objects, or to None if the
+           table has no usable primary key. The |query| is as for updateAll().
+
+           If the modified rows in any of these tables are not known, all
+           cached objects are updated, like updateAll() does."""
+        tables = [table] + related.keys()
+        if not any(table in modified for table in tables):
+            return
+        def unknown(table):
+            return modified[table] is None \
+                or (table in related and related[table] is None)
+        if any(unknown(table) for table in tables if table in modified):
+            Implementation.updateAll(critic, query, cached_objects)
+            return
+        object_ids = set(modified.get(table, ()))
+        cursor = critic.getDatabaseCursor()
+        for related_table, related_query in related.items():
+            if related_table in modified:
+                cursor.execute(related_query, (list(modified[related_table]),))
+                object_ids.update(object_id for (object_id,) in cursor)
+        object_ids.intersection_update(cached_objects.keys())
+        if object_ids:
+            Implementation.updateAll(
+                critic, query, cached_objects, object_ids)
+
+def prefetch(critic, values, relations):
+    items_per_type = {}
+    for value in values:
+        items_per_type.setdefault(type(value._impl), []).append(value._impl)
+    for Implementation, items in items_per_type.items():
+        Implementation.prefetch(critic, items, relations)
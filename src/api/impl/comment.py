@@ -52,6 +52,7 @@ class Comment(apiobject.APIObject):
         self.__last_commit_id = last_commit_id
         self.__addressed_by_id = addressed_by_id
         self.__resolved_by_id = resolved_by_id
+        self.__replies = None
 
         self.__type = comment_type
         if comment_type == "issue":
@@ -108,7 +109,9 @@ class Comment(apiobject.APIObject):
         return location.wrap(critic)
 
     def getReplies(self, critic):
-        return api.impl.reply.fetchForComment(critic, self.id)
+        if self.__replies is None:
+            self.__replies = api.impl.reply.fetchForComment(critic, self.id)
+        return self.__replies
 
     def getAddressedBy(self, critic):
         if self.state != "addressed":
@@ -174,12 +177,73 @@ class Comment(apiobject.APIObject):
             new_location)
 
     @staticmethod
-    def refresh(critic, tables, cached_comments):
-        if not tables.intersection(("commentchains", "comments")):
-            return
+    def prefetch(critic, comments, relations):
+        user_ids = set()
+        if "author" in relations:
+            user_ids.update(comment.__author_id for comment in comments)
+        if "resolved_by" in relations:
+            user_ids.update(comment.__resolved_by_id for comment in comments
+                            if comment.state == "resolved")
+        if user_ids:
+            api.user.fetchMany(critic, user_ids=user_ids)
+
+        if "review" in relations:
+            api.review.fetchMany(
+                critic, set(comment.__review_id for comment in comments))
+
+        # Commits are looked up per repository, so group them by review first.
+        commit_ids_per_review = {}
+        def addCommitId(comment, commit_id):
+            commit_ids_per_review.setdefault(
+                comment.__review_id, set()).add(commit_id)
+
+        if "location" in relations:
+            for comment in comments:
+                if comment.__file_id is not None:
+                    if comment.side == "old":
+                        addCommitId(comment, comment.__first_commit_id)
+                    else:
+                        addCommitId(comment, comment.__last_commit_id)
+                elif comment.__first_commit_id is not None:
+                    addCommitId(comment, comment.__first_commit_id)
+        if "addressed_by" in relations:
+            for comment in comments:
+                if comment.state == "addressed":
+                    addCommitId(comment, comment.__addressed_by_id)
+        if commit_ids_per_review:
+            review_ids = list(commit_ids_per_review)
+            repositories = {}
+            commit_ids_per_repository = {}
+            for review_id, review in zip(
+                    review_ids, api.review.fetchMany(critic, review_ids)):
+                repository = review.repository
+                repositories[repository.id] = repository
+                commit_ids_per_repository.setdefault(
+                    repository.id, set()).update(
+                        commit_ids_per_review[review_id])
+            for repository_id, commit_ids \
+                    in commit_ids_per_repository.items():
+                api.commit.fetchMany(repositories[repository_id],
+                                     commit_ids=list(commit_ids))
+
+        if "replies" in relations:
+            pending = [comment for comment in comments
+                       if comment.__replies is None]
+            if pending:
+                replies = api.impl.reply.fetchForComments(
+                    critic, [comment.id for comment in pending])
+                for comment in pending:
+                    comment.__replies = replies.get(comment.id, [])
+                api.impl.reply.Reply.prefetch(
+                    critic, [reply._impl
+                             for comment in pending
+                             for reply in comment.__replies],
+                    relations & set(["author"]))
 
-        Comment.updateAll(
-            critic,
+    @staticmethod
+    def refresh(critic, modified, cached_comments):
+        Comment.refreshModified(
+            critic, modified, cached_comments,
             """SELECT commentchains.id, review, commentchains.batch,
                       commentchains.uid, type, commentchains.state,
                       origin, commentchains.time, comments.comment, file,
@@ -187,7 +251,10 @@ class Comment(apiobject.APIObject):
                  FROM commentchains
                  JOIN comments ON (comments.id=first_comment)
                 WHERE commentchains.id=ANY (%s)""",
-            cached_comments)
+            "commentchains",
+            { "comments": """SELECT DISTINCT chain
+                               FROM comments
+                              WHERE id=ANY (%s)""" })
 
 @Comment.cached(api.comment.InvalidCommentId)
 def fetch(critic, comment_id):
@@ -17,6 +17,8 @@
 import api
 import apiobject
 
+import commitorder
+
 class CommitSet(apiobject.APIObject):
     wrapper_class = api.commitset.CommitSet
 
@@ -73,57 +75,24 @@ class CommitSet(apiobject.APIObject):
         return frozenset(result)
 
     def getDateOrdered(self):
-        queue = sorted(self.commits,
-                       key=lambda commit: commit.committer.timestamp,
-                       reverse=True)
-        included = set()
+        return commitorder.dateOrdered(
+            self.commits, self.__children, self.getParentsOf,
+            lambda commit: commit.committer.timestamp)
 
-        while queue:
-            commit = queue.pop(0)
-            if commit in included:
-                continue
-            if commit in self.__children:
-                remaining_children = self.__children[commit] - included
-                if remaining_children:
-                    # Some descendants of this commit have not yet been emitted;
-                    # we have to delay this commit.  Insert the commit after the
-                    # earliest remaining descendant in the list.  This means
-                    # that as soon as we've processed all descendants, we retry
-                    # the commit.
-                    queue.insert(max(queue.index(child)
-                                     for child in remaining_children) + 1,
-                                 commit)
-                    continue
-            yield commit
-            included.add(commit)
+    def getAuthorDateOrdered(self):
+        return commitorder.dateOrdered(
+            self.commits, self.__children, self.getParentsOf,
+            lambda commit: commit.author.timestamp)
 
     def getTopoOrdered(self):
         if not self:
-            return
+            return iter(())
 
         head = set(self.heads).pop()
 
-        queue = [head]
-        included = set()
-
-        while queue:
-            commit = queue.pop(0)
-            if commit in included:
-                continue
-            if commit in self.__children and self.__children[commit] - included:
-                # Some descendants of this commit have not yet been emitted; we
-                # have to delay this commit.  We can only delay this commit if
-                # the queue is non-empty, so assert that it isn't.
-                assert queue
-                queue.append(commit)
-                continue
-            yield commit
-            included.add(commit)
-            parents = sorted((parent for parent in commit.parents
-                              if parent in self and parent not in included),
-                             key=lambda commit: commit.committer.timestamp,
-                             reverse=False)
-            queue[:0] = parents
+        return commitorder.topoOrdered(
+            self.commits, head, self.__children, self.getParentsOf,
+            lambda commit: commit.committer.timestamp)
 
     def getChildrenOf(self, commit):
         return set(self.__children.get(commit, []))
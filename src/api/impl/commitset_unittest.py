@@ -67,6 +67,14 @@ def basic(arguments):
     assert tostring(from_L.date_ordered) == "LNMKHGFEDCBA"
     assert tostring(from_J.date_ordered) == "JIHGBA"
 
+    # Author timestamps are not controlled by the test, so just check that
+    # commits precede their parents.
+    author_date_ordered = list(commitset.author_date_ordered)
+    assert len(author_date_ordered) == len(commitset)
+    for index, commit in enumerate(author_date_ordered):
+        for parent in commitset.getParentsOf(commit):
+            assert author_date_ordered.index(parent) > index
+
     assert commitset.getChildrenOf(commits["A"]) == make("BC", set)
     assert commitset.getChildrenOf(commits["B"]) == make("EG", set)
     assert commitset.getChildrenOf(commits["C"]) == make("D", set)
@@ -45,10 +45,10 @@ class Critic(object):
         self.__cache.setdefault(cls, {})[key] = value
 
     @staticmethod
-    def transactionEnded(critic, tables):
+    def transactionEnded(critic, modified):
         for Implementation, cached_objects in critic._impl.__cache.items():
             if hasattr(Implementation, "refresh"):
-                Implementation.refresh(critic, tables, cached_objects)
+                Implementation.refresh(critic, modified, cached_objects)
         return True
 
 def startSession(for_user, for_system, for_testing):
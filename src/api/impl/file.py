@@ -26,25 +26,18 @@ class File(apiobject.APIObject):
         self.path = path
 
 def _fetch_by_ids(critic, file_ids):
-    # FIXME: Optimize this to do a single database query. Currently, there will
-    # be one (fast) query per file.
     try:
-        for file_id in file_ids:
-            internal = dbutils.File.fromId(critic.database, file_id)
-            yield (int(internal), str(internal))
-    except dbutils.InvalidFileId:
-        raise api.file.InvalidFileId(file_id)
+        paths = dbutils.describe_files(critic.database, file_ids)
+    except dbutils.InvalidFileId as error:
+        raise api.file.InvalidFileId(error.file_id)
+    return ((file_id, paths[file_id]) for file_id in file_ids)
 
 def _fetch_by_paths(critic, paths, create):
-    # FIXME: Optimize this to do a single database query. Currently, there will
-    # be one (fast) query per file.
-    try:
-        for path in paths:
-            internal = dbutils.File.fromPath(
-                critic.database, path, insert=create)
-            yield (int(internal), str(internal))
-    except dbutils.InvalidPath:
-        raise api.file.InvalidPath(path)
+    file_ids = dbutils.find_paths(critic.database, paths, insert=create)
+    for path in paths:
+        if path not in file_ids:
+            raise api.file.InvalidPath(path)
+    return ((file_ids[path], path) for path in paths)
 
 @File.cached()
 def fetch(critic, file_id, path, create):
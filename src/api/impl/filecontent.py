@@ -25,14 +25,27 @@ class Filecontent(apiobject.APIObject):
     wrapper_class = api.filecontent.Filecontent
 
     def __init__(self, critic, repository, blob_sha1, file_obj):
-        diffFile = diff.File(
-            repository=repository._impl.getInternal(critic), path=file_obj.path,
-            new_sha1=blob_sha1)
-        diffFile.loadNewLines(
-            highlighted=True, request_highlight=True, highlight_mode="json")
-        self.__filecontents = diffFile.newLines(highlighted=True)
+        self.sha1 = blob_sha1
+        self.__critic = critic
+        self.__repository = repository
+        self.__file_obj = file_obj
+        self.__filecontents = None
+
+    def __loadLines(self):
+        # Loaded on demand, since it's relatively expensive, and not needed
+        # when answering a conditional request for an unmodified resource.
+        if self.__filecontents is None:
+            diffFile = diff.File(
+                repository=self.__repository._impl.getInternal(self.__critic),
+                path=self.__file_obj.path, new_sha1=self.sha1)
+            diffFile.loadNewLines(
+                highlighted=True, request_highlight=True,
+                highlight_mode="json")
+            self.__filecontents = diffFile.newLines(highlighted=True)
+        return self.__filecontents
 
     def getLines(self, first_row, last_row):
+        self.__loadLines()
         num_lines = len(self.__filecontents)
 
         actual_first_row = min(first_row, num_lines)
@@ -51,16 +51,13 @@ class RepositoryFilter(apiobject.APIObject):
         return self.__delegates
 
     @staticmethod
-    def refresh(critic, tables, cached_filters):
-        if "filters" not in tables:
-            return
-
-        RepositoryFilter.updateAll(
-            critic,
+    def refresh(critic, modified, cached_filters):
+        RepositoryFilter.refreshModified(
+            critic, modified, cached_filters,
             """SELECT id, uid, type, path, repository, delegate
                  FROM filters
                 WHERE id=ANY (%s)""",
-            cached_filters)
+            "filters")
 
 def fetchRepositoryFilter(critic, filter_id):
     cursor = critic.getDatabaseCursor()
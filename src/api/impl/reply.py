@@ -40,16 +40,22 @@ class Reply(apiobject.APIObject):
         return api.user.fetch(critic, self.__author_id)
 
     @staticmethod
-    def refresh(critic, tables, cached_replies):
-        if "comments" not in tables:
-            return
+    def prefetch(critic, replies, relations):
+        if "author" in relations and replies:
+            api.user.fetchMany(
+                critic, user_ids=set(reply.__author_id for reply in replies))
+        if "comment" in relations and replies:
+            api.comment.fetchMany(
+                critic, list(set(reply.__comment_id for reply in replies)))
 
-        Reply.updateAll(
-            critic,
+    @staticmethod
+    def refresh(critic, modified, cached_replies):
+        Reply.refreshModified(
+            critic, modified, cached_replies,
             """SELECT id, state, chain, batch, uid, time, comment
                  FROM comments
                 WHERE id=ANY (%s)""",
-            cached_replies)
+            "comments")
 
 @Reply.cached(api.reply.InvalidReplyId)
 def fetch(critic, reply_id):
@@ -89,3 +95,20 @@ def fetchForComment(critic, chain_id):
                     ORDER BY comments.batch ASC""",
                    (chain_id,))
     return list(Reply.make(critic, cursor))
+
+def fetchForComments(critic, chain_ids):
+    cursor = critic.getDatabaseCursor()
+    cursor.execute("""SELECT comments.id, comments.state, chain, comments.batch,
+                             comments.uid, comments.time, comment
+                        FROM comments
+                        JOIN commentchains ON (commentchains.id=comments.chain)
+                       WHERE comments.state='current'
+                         AND commentchains.id=ANY (%s)
+                         AND commentchains.first_comment!=comments.id
+                    ORDER BY comments.batch ASC""",
+                   (chain_ids,))
+    rows = cursor.fetchall()
+    replies = {}
+    for row, reply in zip(rows, Reply.make(critic, rows)):
+        replies.setdefault(row[2], []).append(reply)
+    return replies
@@ -14,6 +14,8 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import hashlib
+
 import api
 import apiobject
 import api.impl.filters
@@ -204,6 +206,47 @@ class Review(apiobject.APIObject):
             (self.id, commit.id))
         return bool(cursor.fetchone())
 
+    def getETag(self, critic):
+        cursor = critic.getDatabaseCursor()
+        cursor.execute(
+            """SELECT serial, state, summary, description,
+                      (SELECT MAX(id)
+                         FROM batches
+                        WHERE review=reviews.id),
+                      (SELECT COUNT(*)
+                         FROM reviewusers
+                        WHERE review=reviews.id),
+                      (SELECT COUNT(*)
+                         FROM reviewusers
+                        WHERE review=reviews.id
+                          AND owner),
+                      (SELECT COUNT(*)
+                         FROM reviewuserfiles
+                         JOIN reviewfiles ON (reviewfiles.id=reviewuserfiles.file)
+                        WHERE reviewfiles.review=reviews.id),
+                      (SELECT COUNT(*)
+                         FROM reviewfilechanges
+                         JOIN reviewfiles ON (reviewfiles.id=reviewfilechanges.file)
+                        WHERE reviewfiles.review=reviews.id),
+                      (SELECT COUNT(*)
+                         FROM commentchains
+                        WHERE review=reviews.id),
+                      (SELECT MAX(id)
+                         FROM commentchains
+                        WHERE review=reviews.id),
+                      (SELECT COUNT(*)
+                         FROM reviewrebases
+                        WHERE review=reviews.id),
+                      (SELECT MAX(id)
+                         FROM reviewrebases
+                        WHERE review=reviews.id)
+                 FROM reviews
+                WHERE id=%s""",
+            (self.id,))
+        row = cursor.fetchone()
+        return "review%d.%s" % (
+            self.id, hashlib.sha1(repr(tuple(row))).hexdigest())
+
     def getTotalProgress(self, critic):
         if self.__total_progress is None:
             cursor = critic.getDatabaseCursor()
@@ -272,6 +315,81 @@ class Review(apiobject.APIObject):
             self.__progress_per_commit = commit_change_counts
         return self.__progress_per_commit
 
+    @staticmethod
+    def prefetch(critic, reviews, relations):
+        if "watchers" in relations:
+            relations = relations | set(["owners", "assigned_reviewers",
+                                         "active_reviewers"])
+
+        cursor = critic.getDatabaseCursor()
+        user_ids = set()
+
+        def fetchUserIds(query, reviews):
+            review_ids = [review.id for review in reviews]
+            user_ids_per_review = { review_id: set()
+                                    for review_id in review_ids }
+            cursor.execute(query, (review_ids,))
+            for review_id, user_id in cursor:
+                user_ids_per_review[review_id].add(user_id)
+            user_ids.update(*user_ids_per_review.values())
+            return [frozenset(user_ids_per_review[review_id])
+                    for review_id in review_ids]
+
+        if "owners" in relations:
+            pending = [review for review in reviews
+                       if review.__owners_ids is None]
+            if pending:
+                for review, owners_ids in zip(pending, fetchUserIds(
+                        """SELECT review, uid
+                             FROM reviewusers
+                            WHERE review=ANY (%s)
+                              AND owner""",
+                        pending)):
+                    review.__owners_ids = owners_ids
+
+        if "assigned_reviewers" in relations:
+            pending = [review for review in reviews
+                       if review.__assigned_reviewers_ids is None]
+            if pending:
+                for review, reviewers_ids in zip(pending, fetchUserIds(
+                        """SELECT DISTINCT reviewfiles.review, uid
+                             FROM reviewuserfiles
+                             JOIN reviewfiles ON (reviewfiles.id=reviewuserfiles.file)
+                            WHERE reviewfiles.review=ANY (%s)""",
+                        pending)):
+                    review.__assigned_reviewers_ids = reviewers_ids
+
+        if "active_reviewers" in relations:
+            pending = [review for review in reviews
+                       if review.__active_reviewers_ids is None]
+            if pending:
+                for review, reviewers_ids in zip(pending, fetchUserIds(
+                        """SELECT DISTINCT reviewfiles.review, uid
+                             FROM reviewfilechanges
+                             JOIN reviewfiles ON (reviewfiles.id=reviewfilechanges.file)
+                            WHERE reviewfiles.review=ANY (%s)""",
+                        pending)):
+                    review.__active_reviewers_ids = reviewers_ids
+
+        if "watchers" in relations:
+            pending = [review for review in reviews
+                       if review.__watchers_ids is None]
+            if pending:
+                for review, associated_users in zip(pending, fetchUserIds(
+                        """SELECT review, uid
+                             FROM reviewusers
+                            WHERE review=ANY (%s)""",
+                        pending)):
+                    non_watchers = (review.__owners_ids |
+                                    review.__assigned_reviewers_ids |
+                                    review.__active_reviewers_ids)
+                    review.__watchers_ids = associated_users - non_watchers
+
+        if user_ids:
+            # Load all referenced users with a single query.  The user objects
+            # are cached, so getOwners() et al. will find them there.
+            api.user.fetchMany(critic, user_ids=user_ids)
+
     @classmethod
     def create(Review, critic, *args):
         review = Review(*args).wrap(critic)
@@ -135,3 +135,31 @@ def basic():
     assert any_reviews == all_reviews
 
     print "basic: ok"
+
+def prefetch():
+    import api
+
+    critic = api.critic.startSession(for_testing=True)
+    reviews = api.review.fetchAll(critic)
+
+    api.apiobject.prefetch(critic, reviews, ["owners", "assigned_reviewers",
+                                             "active_reviewers", "watchers",
+                                             "nonsense"])
+
+    # Compare against the same reviews loaded in a separate session, without
+    # prefetching.
+    reference = api.critic.startSession(for_testing=True)
+
+    for review in reviews:
+        expected = api.review.fetch(reference, review_id=review.id)
+
+        assert set(user.id for user in review.owners) \
+            == set(user.id for user in expected.owners)
+        assert set(user.id for user in review.assigned_reviewers) \
+            == set(user.id for user in expected.assigned_reviewers)
+        assert set(user.id for user in review.active_reviewers) \
+            == set(user.id for user in expected.active_reviewers)
+        assert set(user.id for user in review.watchers) \
+            == set(user.id for user in expected.watchers)
+
+    print "prefetch: ok"
@@ -128,18 +128,18 @@ class ReviewableFileChange(apiobject.APIObject):
         return self.__draft_changes
 
     @staticmethod
-    def refresh(critic, tables, cached_filechanges):
-        if not tables.intersection(("reviewfiles", "reviewfilechanges",
-                                    "reviewuserfiles")):
-            return
-
-        ReviewableFileChange.updateAll(
-            critic,
+    def refresh(critic, modified, cached_filechanges):
+        # Neither reviewfilechanges nor reviewuserfiles has an id column, so
+        # any modification of them refreshes all cached objects.
+        ReviewableFileChange.refreshModified(
+            critic, modified, cached_filechanges,
             """SELECT id, review, changeset, file, deleted, inserted,
                       reviewer
                  FROM reviewfiles
                 WHERE id=ANY (%s)""",
-            cached_filechanges)
+            "reviewfiles",
+            { "reviewfilechanges": None,
+              "reviewuserfiles": None })
 
 @ReviewableFileChange.cached(
     api.reviewablefilechange.InvalidReviewableFileChangeId)
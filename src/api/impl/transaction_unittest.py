@@ -0,0 +1,238 @@
+import time
+
+def scheduling():
+    import api
+
+    from api.transaction import Query, Function, Queries, LazyObject
+
+    def createComment(queries, text):
+        comment = LazyObject()
+        initial_comment = LazyObject()
+        queries.append(Query(
+            """INSERT
+                 INTO commentchains (review, uid, type)
+               VALUES (%s, %s, 'issue')
+            RETURNING id""",
+            (1, 1),
+            collector=comment))
+        queries.append(Query(
+            """INSERT
+                 INTO comments (chain, uid, state, comment)
+               VALUES (%s, %s, 'draft', %s)
+            RETURNING id""",
+            (comment.id, 1, text),
+            collector=initial_comment))
+        queries.append(Query(
+            """UPDATE commentchains
+                  SET first_comment=%s
+                WHERE id=%s""",
+            (initial_comment.id, comment.id)))
+        queries.append(Query(
+            """INSERT
+                 INTO commentchainlines (chain, uid, sha1)
+               VALUES (%s, %s, %s)""",
+            (comment.id, 1, "0" * 40)))
+        return comment
+
+    def statements(queries):
+        return [query.statement.split()[:3] for query in queries]
+
+    # Independent comments are grouped by statement.
+    queries = Queries()
+    for index in range(10):
+        createComment(queries, "comment %d" % index)
+    assert statements(queries) == [["INSERT", "INTO", "commentchains"],
+                                   ["INSERT", "INTO", "comments"],
+                                   ["UPDATE", "commentchains", "SET"],
+                                   ["INSERT", "INTO", "commentchainlines"]]
+
+    # An update that might touch the new rows is not moved past.
+    queries = Queries()
+    createComment(queries, "first")
+    queries.append(Query(
+        """UPDATE commentchains
+              SET state='open'
+            WHERE review=%s""",
+        (1,)))
+    createComment(queries, "second")
+    assert len(queries) == 9
+
+    # Neither are deletes, functions or locking selects.
+    for barrier in (Query("DELETE FROM commentchains WHERE id=%s", (1,)),
+                    Query("SELECT 1 FROM comments WHERE id=%s FOR UPDATE",
+                          (1,)),
+                    Function(lambda cursor: None)):
+        queries = Queries()
+        createComment(queries, "first")
+        queries.append(barrier)
+        createComment(queries, "second")
+        assert len(queries) == 9
+
+    # A query that depends on a row inserted by an earlier query with the same
+    # statement can't be merged with it.
+    queries = Queries()
+    first = LazyObject()
+    second = LazyObject()
+    statement = """INSERT
+                     INTO comments (chain, uid, state, comment, reply_to)
+                   VALUES (%s, %s, 'draft', %s, %s)
+                RETURNING id"""
+    queries.append(Query(statement, (1, 1, "first", None), collector=first))
+    queries.append(Query(statement, (1, 1, "second", first.id),
+                         collector=second))
+    assert len(queries) == 2
+
+    print "scheduling: ok"
+
+def modifications():
+    import api
+
+    from api.transaction import Query, Function, LazyObject
+
+    class Cursor(object):
+        def __init__(self):
+            self.next_id = 1
+            self.rows = []
+
+        def execute(self, statement, values):
+            if statement.rstrip().endswith("RETURNING id"):
+                count = statement.count("), (") + 1
+                self.rows = [(object_id,) for object_id
+                             in range(self.next_id, self.next_id + count)]
+                self.next_id += count
+            else:
+                self.rows = []
+
+        def executemany(self, statement, values_list):
+            for values in values_list:
+                self.execute(statement, values)
+
+        def __iter__(self):
+            return iter(self.rows)
+
+    def modified(*queries):
+        cursor = Cursor()
+        result = {}
+        for query in queries:
+            query(None, cursor, result)
+        return result
+
+    first = LazyObject()
+    second = LazyObject()
+    insert = Query(
+        """INSERT
+             INTO comments (chain, uid, state, comment)
+           VALUES (%s, %s, 'draft', %s)
+        RETURNING id""",
+        (1, 1, "first"),
+        collector=first)
+    insert.merge(Query(insert.statement, (1, 1, "second"), collector=second))
+
+    assert modified(insert) == { "comments": set([1, 2]) }
+    assert (first.object_id, second.object_id) == (1, 2)
+
+    assert modified(
+        Query("UPDATE comments SET comment=%s WHERE id=%s",
+              ("text", 10), ("text", 11)),
+        Query("DELETE FROM commentchains WHERE review=%s AND id=ANY (%s)",
+              (1, [12, 13]))) == { "comments": set([10, 11]),
+                                   "commentchains": set([12, 13]) }
+
+    # Modifications of unknown rows.
+    assert modified(
+        Query("UPDATE comments SET comment=%s WHERE id=%s", ("text", 10)),
+        Query("UPDATE comments SET state='current' WHERE batch=%s",
+              (1,))) == { "comments": None }
+    assert modified(
+        Query("DELETE FROM comments WHERE chain=%s OR id=%s",
+              (1, 1))) == { "comments": None }
+    assert modified(
+        Query("INSERT INTO commentchainlines (chain, sha1) VALUES (%s, %s)",
+              (1, "0" * 40))) == { "commentchainlines": None }
+
+    # Keys given as a tuple.
+    assert modified(
+        Query("UPDATE comments SET state='current' WHERE id=ANY (%s)",
+              ((10, 11),))) == { "comments": set([10, 11]) }
+
+    # Functions modify unknown rows in the tables they declare.
+    assert modified(
+        Function(lambda cursor: None, tables=["reviewsearchtrigrams"]),
+        Query("UPDATE comments SET comment=%s WHERE id=%s", ("text", 10))) \
+        == { "reviewsearchtrigrams": None, "comments": set([10]) }
+
+    # Locking doesn't modify anything.
+    assert modified(
+        Query("SELECT 1 FROM commentchains WHERE id=ANY (%s) FOR UPDATE",
+              ([1, 2],))) == {}
+
+    print "modifications: ok"
+
+def benchmark(arguments):
+    # Not run as part of the test suite; run manually using
+    #
+    #   python -m run_unittest api/impl/transaction_unittest.py \
+    #       --review=<branch> benchmark
+    #
+    # in the source directory.  Creates 1000 comments in a single transaction,
+    # first one row per statement and then with multi-row inserts.  Both
+    # transactions are rolled back.
+
+    import api
+
+    critic = api.critic.startSession(for_testing=True)
+    repository = api.repository.fetch(critic, name="critic")
+    branch = api.branch.fetch(
+        critic, repository=repository, name=arguments.review)
+    review = api.review.fetch(critic, branch=branch)
+    alice = api.user.fetch(critic, name="alice")
+
+    critic.setActualUser(alice)
+
+    class RollBack(Exception):
+        pass
+
+    def rollBack():
+        raise RollBack
+
+    default_rows_per_insert = api.transaction.MAXIMUM_ROWS_PER_INSERT
+
+    for rows_per_insert in (1, default_rows_per_insert):
+        api.transaction.MAXIMUM_ROWS_PER_INSERT = rows_per_insert
+
+        before = time.time()
+        try:
+            with api.transaction.Transaction(critic) as transaction:
+                modifier = transaction.modifyReview(review)
+                for index in range(1000):
+                    modifier.createComment(
+                        "note", alice, "Comment %d" % index)
+                transaction.callbacks.append(rollBack)
+        except RollBack:
+            pass
+        after = time.time()
+
+        print ("1000 comments, %d rows per insert: %.2f seconds"
+               % (rows_per_insert, after - before))
+
+    api.transaction.MAXIMUM_ROWS_PER_INSERT = default_rows_per_insert
+
+    print "benchmark: ok"
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--review")
+    parser.add_argument("tests", nargs=argparse.REMAINDER)
+
+    arguments = parser.parse_args(argv)
+
+    for test in arguments.tests:
+        if test == "scheduling":
+            scheduling()
+        elif test == "modifications":
+            modifications()
+        elif test == "benchmark":
+            benchmark(arguments)
@@ -18,6 +18,10 @@ import api
 import apiobject
 
 import dbutils
+import dbutils.generations
+
+# Process-wide cache of preference values.
+_PREFERENCES = dbutils.generations.GenerationCache("preferences")
 
 class User(apiobject.APIObject):
     wrapper_class = api.user.User
@@ -104,6 +108,23 @@ class User(apiobject.APIObject):
         raise api.user.InvalidRole(role)
 
     def getPreference(self, critic, item, user, repository):
+        user_id = None if self.isAnonymous() else user.id
+        repository_id = None if repository is None else repository.id
+
+        value, user_id, repository_id = _PREFERENCES.get(
+            critic.database, (item, user_id, repository_id),
+            lambda: User.__fetchPreference(
+                critic, item, user_id, repository_id))
+
+        if user_id is None:
+            user = None
+        if repository_id is None:
+            repository = None
+
+        return api.preference.Preference(item, value, user, repository)
+
+    @staticmethod
+    def __fetchPreference(critic, item, user_id, repository_id):
         cursor = critic.getDatabaseCursor()
         cursor.execute("SELECT type FROM preferences WHERE item=%s", (item,))
         row = cursor.fetchone()
@@ -119,14 +140,14 @@ class User(apiobject.APIObject):
         else:
             column = "string"
 
-        if not self.isAnonymous():
-            arguments.append(user.id)
+        if user_id is not None:
+            arguments.append(user_id)
             where.append("uid=%s OR uid IS NULL")
         else:
             where.append("uid IS NULL")
 
-        if repository is not None:
-            arguments.append(repository.id)
+        if repository_id is not None:
+            arguments.append(repository_id)
             where.append("repository=%s OR repository IS NULL")
         else:
             where.append("repository IS NULL")
@@ -146,27 +167,22 @@ class User(apiobject.APIObject):
         if preference_type == "boolean":
             value = bool(value)
 
-        if user_id is None:
-            user = None
-        if repository_id is None:
-            repository = None
-
-        return api.preference.Preference(item, value, user, repository)
+        return value, user_id, repository_id
 
     @staticmethod
-    def refresh(critic, tables, cached_users):
-        if not tables.intersection(("users", "useremails")):
-            return
-
-        User.updateAll(
-            critic,
+    def refresh(critic, modified, cached_users):
+        User.refreshModified(
+            critic, modified, cached_users,
             """SELECT users.id, name, fullname, status, useremails.email
                  FROM users
       LEFT OUTER JOIN useremails ON (useremails.id=users.email
                                  AND (useremails.verified IS NULL
                                    OR useremails.verified))
                 WHERE users.id=ANY (%s)""",
-            cached_users)
+            "users",
+            { "useremails": """SELECT id
+                                 FROM users
+                                WHERE email=ANY (%s)""" })
 
 @User.cached()
 def fetch(critic, user_id, name):
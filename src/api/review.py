@@ -183,6 +183,21 @@ class Review(api.APIObject):
         assert isinstance(commit, api.commit.Commit)
         return self._impl.isReviewableCommit(self.critic, commit)
 
+    @property
+    def etag(self):
+        """An opaque string that changes whenever the review changes
+
+           The string is derived from version counters and aggregates that are
+           cheap to query, rather than from the review's actual state, and is
+           intended for use as an HTTP entity tag.  It may change when the
+           review has not, but never stays the same when it has.  Since the
+           review's state includes the current user's unpublished changes,
+           the string should be combined with the user's id.
+
+           The value is not cached and reflects the state of the database at
+           the time of the access."""
+        return self._impl.getETag(self.critic)
+
     @property
     def total_progress(self):
         """Total progress made on a review
@@ -14,6 +14,8 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import re
+
 import api
 
 class Transaction(object):
@@ -80,29 +82,154 @@ class Transaction(object):
         return False
 
     def __commit(self):
+        import dbutils.generations
         if not self.items:
             return
+        tables = set(self.tables)
+        if dbutils.generations.affectedGenerations(tables):
+            tables.add("cachegenerations")
+        # Maps each modified table to the set of primary keys of modified rows,
+        # or to None if they are not known.
+        modified = {}
         try:
-            with self.critic.getUpdatingDatabaseCursor(*self.tables) as cursor:
+            with self.critic.getUpdatingDatabaseCursor(*tables) as cursor:
                 for item in self.items:
-                    item(self.critic, cursor)
+                    item(self.critic, cursor, modified)
+                    if isinstance(item, Function) and item.tables is None:
+                        # We don't know what the function modified.
+                        modified.update((table, None) for table in self.tables)
+                dbutils.generations.bumpGenerations(
+                    self.critic.database, cursor, self.tables)
                 for callback in self.callbacks:
                     callback()
         finally:
-            self.critic._impl.transactionEnded(self.critic, self.tables)
+            self.critic._impl.transactionEnded(self.critic, modified)
+
+# The maximum number of rows inserted by a single multi-row INSERT statement.
+MAXIMUM_ROWS_PER_INSERT = 1000
+
+RE_READ_TABLE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)")
+RE_INSERT_RETURNING_ID = re.compile(
+    r"^(\s*INSERT\s.*?\bVALUES\s*)(\(.*\))(\s+RETURNING\s+id\s*)$",
+    re.DOTALL)
+RE_UPDATE_BY_ID = re.compile(r"\bWHERE\s+id=%s\s*$")
+RE_RESTRICTED_BY_ID = re.compile(
+    r"\b(?:WHERE|AND)\s+id=(?:%s|ANY\s*\(%s\))\s*$")
+RE_RETURNING_ID = re.compile(r"\bRETURNING\s+id\s*$")
+
+STATEMENTS = {}
+
+def analyzeStatement(statement):
+    """Return a (command, table, read_tables) tuple describing |statement|
+
+       |command| and |table| are as returned by Database.analyzeQuery(), and
+       |read_tables| is the set of tables that the statement selects from."""
+
+    try:
+        return STATEMENTS[statement]
+    except KeyError:
+        import dbutils
+        try:
+            command, table = dbutils.Database.analyzeQuery(statement)
+        except ValueError:
+            command, table = None, None
+        read_tables = frozenset(RE_READ_TABLE.findall(statement))
+        result = STATEMENTS[statement] = (command, table, read_tables)
+        return result
+
+def recordModified(modified, table, keys):
+    """Record that rows in |table| with the primary keys |keys| were modified
+
+       If |keys| is None, which rows were modified is not known."""
+
+    if keys is None:
+        modified[table] = None
+    elif modified.setdefault(table, set()) is not None:
+        modified[table].update(keys)
+
+def lazyObjects(value, result):
+    """Add the LazyObjects that |value| depends on to |result|
+
+       None is added for lazy values of unknown origin."""
+
+    if isinstance(value, LazyObject):
+        result.add(value)
+    elif isinstance(value, LazyValue):
+        source = getattr(value.source, "__self__", None)
+        result.add(source if isinstance(source, LazyObject) else None)
+    elif isinstance(value, (set, list, tuple)):
+        for element in value:
+            lazyObjects(element, result)
 
 class Query(object):
     def __init__(self, statement, *values, **kwargs):
         self.statement = statement
         self.__values = list(values)
         self.collector = kwargs.get("collector")
+        self.__collectors = [self.collector] * len(self.__values)
+        self.__dependencies = set()
+        for values in self.__values:
+            lazyObjects(values, self.__dependencies)
 
     def merge(self, query):
         if self.statement == query.statement \
-                and not self.collector \
-                and not query.collector:
+                and bool(self.collector) == bool(query.collector) \
+                and not self.__produces(query.__dependencies):
             self.__values.extend(query.__values)
+            self.__collectors.extend(query.__collectors)
+            self.__dependencies.update(query.__dependencies)
+            return True
+        return False
+
+    def __produces(self, dependencies):
+        return None in dependencies \
+            or any(collector in dependencies for collector in self.__collectors)
+
+    def __updatesCreatedRowsOnly(self):
+        # True if this query updates rows by id, and only rows that were
+        # inserted earlier in the transaction, and thus can't be a row inserted
+        # by another query.
+        if not RE_UPDATE_BY_ID.search(self.statement):
+            return False
+        for values in self.__values:
+            dependencies = set()
+            lazyObjects(values[-1], dependencies)
+            if not dependencies or None in dependencies:
+                return False
+        return True
+
+    def commutesWith(self, query):
+        """Return true if |query| can be executed before this query
+
+           This is the case if |query| doesn't depend on the ids of objects
+           created by this query, and the two don't touch the same tables,
+           except for inserts of new rows into the same table, and inserts of
+           new rows into a table whose other rows the other query updates
+           by id.  This assumes that ids are never changed."""
+
+        if not isinstance(query, Query):
+            return False
+        if self.__produces(query.__dependencies) \
+                or query.__produces(self.__dependencies):
+            return False
+
+        command, table, read_tables = analyzeStatement(self.statement)
+        query_command, query_table, query_read_tables = \
+            analyzeStatement(query.statement)
+
+        if command not in ("INSERT", "UPDATE") \
+                or query_command not in ("INSERT", "UPDATE"):
+            return False
+        if table in query_read_tables or query_table in read_tables:
+            return False
+        if table != query_table:
             return True
+        if command == "INSERT" and query_command == "INSERT":
+            return True
+        if command == "INSERT":
+            return query.__updatesCreatedRowsOnly()
+        if query_command == "INSERT":
+            return self.__updatesCreatedRowsOnly()
         return False
 
     @property
@@ -118,19 +245,103 @@ class Query(object):
         for values in self.__values:
             yield evaluate(values)
 
-    def __call__(self, critic, cursor):
-        if self.collector:
-            for values in self.values:
+    def __call__(self, critic, cursor, modified):
+        import configuration
+
+        command, table, _ = analyzeStatement(self.statement)
+
+        if command not in ("INSERT", "UPDATE", "DELETE"):
+            modify = lambda keys: None
+        elif RE_RETURNING_ID.search(self.statement):
+            modify = lambda keys: recordModified(modified, table, keys)
+        else:
+            modify = lambda keys: recordModified(modified, table, None)
+
+        if not self.collector:
+            values = list(self.values)
+            cursor.executemany(self.statement, values)
+            if command in ("UPDATE", "DELETE") \
+                    and RE_RESTRICTED_BY_ID.search(self.statement) \
+                    and not re.search(r"\bOR\b", self.statement):
+                # The last value is the id, or a list of ids, of the only
+                # rows that can have been modified.
+                for row in values:
+                    keys = row[-1]
+                    recordModified(
+                        modified, table,
+                        keys if isinstance(keys, (list, tuple)) else [keys])
+            else:
+                modify(None)
+            return
+
+        match = RE_INSERT_RETURNING_ID.match(self.statement)
+
+        if not match or len(self.__values) == 1 \
+                or configuration.database.DRIVER != "postgresql":
+            # SQLite's RETURNING emulation only supports single-row inserts.
+            for values, collector in zip(self.values, self.__collectors):
                 cursor.execute(self.statement, values)
                 for row in cursor:
-                    self.collector(*row)
-        else:
-            cursor.executemany(self.statement, self.values)
+                    modify([row[0]])
+                    collector(*row)
+            return
+
+        prefix, row, suffix = match.groups()
+        values = list(self.values)
+
+        for offset in range(0, len(values), MAXIMUM_ROWS_PER_INSERT):
+            chunk = values[offset:offset + MAXIMUM_ROWS_PER_INSERT]
+            cursor.execute(
+                prefix + ", ".join([row] * len(chunk)) + suffix,
+                [value for values in chunk for value in values])
+            # Ids are assigned in the order the rows are listed, which is not
+            # necessarily the order in which they are returned.
+            object_ids = sorted(object_id for (object_id,) in cursor)
+            assert len(object_ids) == len(chunk)
+            modify(object_ids)
+            collectors = self.__collectors[offset:offset + len(chunk)]
+            for collector, object_id in zip(collectors, object_ids):
+                collector(object_id)
+
+class Function(object):
+    """Transaction item that calls a function with the updating cursor
+
+       Used for updates that can't be expressed as a fixed SQL statement.  The
+       function is called with the cursor as its only argument, in the order
+       the item was added relative to other items.
+
+       The |tables| argument lists the tables that the function modifies, in
+       unknown rows.  If it is None, all tables modified by the transaction
+       are assumed to have been modified by the function."""
+
+    statement = None
+
+    def __init__(self, function, tables=None):
+        self.function = function
+        self.tables = tables
+
+    def merge(self, query):
+        return False
+
+    def commutesWith(self, query):
+        return False
+
+    def __call__(self, critic, cursor, modified):
+        self.function(cursor)
+        for table in self.tables or ():
+            recordModified(modified, table, None)
 
 class Queries(list):
     def append(self, query):
-        if self and self[-1].merge(query):
-            return
+        # Merge the query into the closest earlier query with the same
+        # statement, if it can be moved ahead of all queries in between.  This
+        # groups queries by statement, so that for instance creating many
+        # comments executes one statement per table rather than one per row.
+        for item in reversed(self):
+            if item.merge(query):
+                return
+            if not item.commutesWith(query):
+                break
         super(Queries, self).append(query)
 
     def extend(self, queries):
@@ -39,6 +39,13 @@ class ModifyAccessToken(object):
                     WHERE id=%s""",
                 (self.access_token.id,)))
 
+        if isinstance(self.access_token, api.accesstoken.AccessToken):
+            def revokeCachedCredentials():
+                import auth
+                auth.CREDENTIAL_CACHE.revokeAccessToken(self.access_token.id)
+
+            self.transaction.callbacks.append(revokeCachedCredentials)
+
     def modifyProfile(self):
         from accesscontrolprofile import ModifyAccessControlProfile
         assert self.access_token.profile
@@ -18,6 +18,7 @@ import api
 
 import dbutils
 import gitutils
+import reviewing.searchindex
 
 from reviewing.comment.propagate import Propagation
 
@@ -285,6 +286,13 @@ class ModifyReview(object):
                     WHERE id=ANY (%s)""",
                 (batch.id, ids(unpublished_changes.written_replies))))
 
+        self.transaction.tables.add("reviewsearchtrigrams")
+        self.transaction.items.append(
+            api.transaction.Function(
+                lambda cursor: reviewing.searchindex.indexComments(
+                    cursor, self.review.id, batch.evaluate()),
+                tables=["reviewsearchtrigrams"]))
+
         self.transaction.tables.add("commentchainlines")
         self.transaction.items.append(
             api.transaction.Query(
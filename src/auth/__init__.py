@@ -123,6 +123,12 @@ from database import AuthenticationError, AuthenticationFailed, Database
 
 DATABASE = None
 
+from credentialcache import CredentialCache
+
+CREDENTIAL_CACHE = CredentialCache(
+    os.path.join(configuration.paths.CACHE_DIR, "httpauth"),
+    configuration.auth.HTTP_AUTHENTICATION_CACHE_MAX_AGE)
+
 import databases
 
 from provider import Provider
@@ -19,6 +19,7 @@ import re
 import base
 import auth
 import configuration
+import dbutils.generations
 
 class AccessDenied(Exception):
     """Raised by AccessControl checks on failure"""
@@ -112,7 +113,6 @@ class AccessControlProfile(object):
 
     @staticmethod
     def forUser(db, user, authentication_labels=()):
-        cursor = db.readonly_cursor()
         if user.isSystem():
             # The system user can always do everything.
             return AccessControlProfile("allow")
@@ -128,6 +128,22 @@ class AccessControlProfile(object):
                         HTTPException("POST", "validatelogin")
                     ])
                 return profile
+            cache_key = ("anonymous",)
+        else:
+            cache_key = ("user", user.id, tuple(sorted(authentication_labels)))
+        profile_id = _CACHE.get(
+            db, cache_key,
+            lambda: AccessControlProfile.__findProfileId(
+                db, user, authentication_labels))
+        if profile_id is None:
+            # By default, allow everything.
+            return AccessControlProfile("allow")
+        return AccessControlProfile.fromId(db, profile_id)
+
+    @staticmethod
+    def __findProfileId(db, user, authentication_labels):
+        cursor = db.readonly_cursor()
+        if user.isAnonymous():
             cursor.execute("""SELECT profile
                                 FROM useraccesscontrolprofiles
                                WHERE access_type='anonymous'""")
@@ -152,13 +168,22 @@ class AccessControlProfile(object):
                                  AND uid IS NULL""")
             row = cursor.fetchone()
         if not row:
-            # By default, allow everything.
-            return AccessControlProfile("allow")
+            return None
         profile_id, = row
-        return AccessControlProfile.fromId(db, profile_id)
+        return profile_id
 
     @staticmethod
     def fromId(db, profile_id):
+        """Return the profile with the given id
+
+           Profiles are cached across sessions, and the returned object must
+           not be modified."""
+        return _CACHE.get(
+            db, ("profile", profile_id),
+            lambda: AccessControlProfile.__load(db, profile_id))
+
+    @staticmethod
+    def __load(db, profile_id):
         cursor = db.readonly_cursor()
         cursor.execute(
             """SELECT http, repositories, extensions
@@ -195,6 +220,9 @@ class AccessControlProfile(object):
 
         return profile
 
+# Process-wide cache of profiles and of the profile ids that apply to users.
+_CACHE = dbutils.generations.GenerationCache("accesscontrol")
+
 class AccessControl(object):
     @staticmethod
     def forRequest(db, req):
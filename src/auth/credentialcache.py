@@ -0,0 +1,198 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import errno
+import hmac
+import json
+import time
+import hashlib
+import tempfile
+
+class CredentialCache(object):
+    """Short-lived cache of successfully verified HTTP credentials
+
+       Entries are stored as individual files in a directory, which makes the
+       cache shared between all WSGI processes running as the Critic system
+       user.  File names are keyed hashes (HMAC-SHA256) of the credentials,
+       using a randomly generated secret stored in the same directory, so the
+       credentials themselves are never stored, and can't be derived from the
+       file names without also reading the secret.
+
+       Each entry records the (Critic) user and/or access token that the
+       credentials authenticated as, which is what revokeUser() and
+       revokeAccessToken() use to find the entries to remove when a password is
+       changed or an access token is deleted.
+
+       The cache is an optimization only; any file system error simply makes
+       it behave as if the entry in question wasn't cached."""
+
+    SECRET_FILENAME = ".secret"
+    TEMPORARY_PREFIX = ".tmp"
+
+    def __init__(self, directory, max_age):
+        self.directory = directory
+        # A max age of zero (or less) means the cache is disabled.
+        self.max_age = max_age
+        self.__secret = None
+
+    def __ensureDirectory(self):
+        try:
+            os.makedirs(self.directory, 0700)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def __getSecret(self):
+        if self.__secret is not None:
+            return self.__secret
+
+        path = os.path.join(self.directory, CredentialCache.SECRET_FILENAME)
+
+        try:
+            with open(path, "rb") as secret_file:
+                secret = secret_file.read()
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            secret = None
+
+        if not secret:
+            self.__ensureDirectory()
+            # Write the secret to a temporary file and then link it into place,
+            # so that concurrent processes agree on one secret, and never read
+            # a partially written one.
+            fd, temporary_path = tempfile.mkstemp(
+                prefix=CredentialCache.TEMPORARY_PREFIX, dir=self.directory)
+            try:
+                os.write(fd, os.urandom(32))
+                os.close(fd)
+                try:
+                    os.link(temporary_path, path)
+                except OSError as error:
+                    if error.errno != errno.EEXIST:
+                        raise
+            finally:
+                os.unlink(temporary_path)
+            with open(path, "rb") as secret_file:
+                secret = secret_file.read()
+
+        self.__secret = secret
+        return secret
+
+    def __path(self, namespace, username, password):
+        key = hmac.new(self.__getSecret(),
+                       "\0".join([namespace, username, password]),
+                       hashlib.sha256).hexdigest()
+        return os.path.join(self.directory, key)
+
+    def __read(self, path):
+        try:
+            with open(path, "r") as entry_file:
+                return json.load(entry_file)
+        except (IOError, ValueError):
+            return None
+
+    def __remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def get(self, namespace, username, password):
+        """Return cached data for the credentials, or None
+
+           The |namespace| argument should identify the authentication database
+           that verified the credentials, so that entries from one database are
+           never used by another."""
+        if self.max_age <= 0:
+            return None
+        try:
+            path = self.__path(namespace, username, password)
+        except (IOError, OSError):
+            return None
+        entry = self.__read(path)
+        if entry is None:
+            return None
+        if entry["expires"] < time.time():
+            self.__remove(path)
+            return None
+        return entry["data"]
+
+    def set(self, namespace, username, password, data, user_id=None,
+            token_id=None):
+        """Cache |data| for the credentials
+
+           The |user_id| and |token_id| arguments identify the user and access
+           token the credentials belong to, for revocation purposes."""
+        if self.max_age <= 0:
+            return
+        entry = { "expires": time.time() + self.max_age,
+                  "user_id": user_id,
+                  "token_id": token_id,
+                  "data": data }
+        try:
+            path = self.__path(namespace, username, password)
+            fd, temporary_path = tempfile.mkstemp(
+                prefix=CredentialCache.TEMPORARY_PREFIX, dir=self.directory)
+            try:
+                with os.fdopen(fd, "w") as entry_file:
+                    json.dump(entry, entry_file)
+                os.rename(temporary_path, path)
+            except:
+                self.__remove(temporary_path)
+                raise
+        except (IOError, OSError):
+            pass
+
+    def discard(self, namespace, username, password):
+        """Remove any cached entry for the credentials"""
+        try:
+            self.__remove(self.__path(namespace, username, password))
+        except (IOError, OSError):
+            pass
+
+    def __revoke(self, predicate):
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+        now = time.time()
+        for filename in filenames:
+            if filename == CredentialCache.SECRET_FILENAME \
+                    or filename.startswith(CredentialCache.TEMPORARY_PREFIX):
+                continue
+            path = os.path.join(self.directory, filename)
+            entry = self.__read(path)
+            # Also remove expired and unreadable entries while we're at it.
+            if entry is None or entry["expires"] < now or predicate(entry):
+                self.__remove(path)
+
+    def revokeUser(self, user_id):
+        """Remove all cached entries for the user
+
+           Called when the user's password is changed."""
+        self.__revoke(lambda entry: entry["user_id"] == user_id)
+
+    def revokeAccessToken(self, token_id):
+        """Remove all cached entries for the access token
+
+           Called when the access token is deleted."""
+        self.__revoke(lambda entry: entry["token_id"] == token_id)
+
+    def purge(self):
+        """Remove all expired cached entries"""
+        self.__revoke(lambda entry: False)
@@ -0,0 +1,74 @@
+def basic():
+    import os
+    import shutil
+    import tempfile
+    import time
+
+    from auth.credentialcache import CredentialCache
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = CredentialCache(os.path.join(directory, "cache"), 60)
+
+        assert cache.get("internal", "alice", "secret") is None
+
+        cache.set("internal", "alice", "secret", { "value": 1 }, user_id=1)
+        cache.set("internal", "bob", "secret", { "value": 2 }, user_id=2)
+        cache.set("accesstokens", "part1", "part2", { "value": 3 },
+                  user_id=1, token_id=10)
+
+        assert cache.get("internal", "alice", "secret") == { "value": 1 }
+        assert cache.get("internal", "bob", "secret") == { "value": 2 }
+        assert cache.get("accesstokens", "part1", "part2") == { "value": 3 }
+
+        # Wrong password, or wrong database.
+        assert cache.get("internal", "alice", "wrong") is None
+        assert cache.get("ldap", "alice", "secret") is None
+
+        # Credentials are never stored in plain text.
+        for filename in os.listdir(cache.directory):
+            if filename == CredentialCache.SECRET_FILENAME:
+                continue
+            with open(os.path.join(cache.directory, filename)) as entry_file:
+                contents = entry_file.read()
+            assert "alice" not in filename and "alice" not in contents
+            assert "secret" not in contents
+
+        # A separate cache object (e.g. in another process) shares entries.
+        other = CredentialCache(os.path.join(directory, "cache"), 60)
+        assert other.get("internal", "alice", "secret") == { "value": 1 }
+
+        cache.revokeAccessToken(10)
+
+        assert cache.get("accesstokens", "part1", "part2") is None
+        assert cache.get("internal", "alice", "secret") == { "value": 1 }
+
+        cache.revokeUser(1)
+
+        assert cache.get("internal", "alice", "secret") is None
+        assert cache.get("internal", "bob", "secret") == { "value": 2 }
+
+        cache.discard("internal", "bob", "secret")
+
+        assert cache.get("internal", "bob", "secret") is None
+
+        # Expired entries are ignored, and removed by purge().
+        expiring = CredentialCache(os.path.join(directory, "cache"), 0.1)
+        expiring.set("internal", "carol", "secret", { "value": 4 }, user_id=3)
+        assert expiring.get("internal", "carol", "secret") == { "value": 4 }
+        time.sleep(0.2)
+        assert expiring.get("internal", "carol", "secret") is None
+        expiring.set("internal", "carol", "secret", { "value": 4 }, user_id=3)
+        time.sleep(0.2)
+        expiring.purge()
+        assert os.listdir(cache.directory) == [CredentialCache.SECRET_FILENAME]
+
+        # A max age of zero disables the cache.
+        disabled = CredentialCache(os.path.join(directory, "cache"), 0)
+        disabled.set("internal", "alice", "secret", { "value": 1 }, user_id=1)
+        assert disabled.get("internal", "alice", "secret") is None
+    finally:
+        shutil.rmtree(directory)
+
+    print "basic: ok"
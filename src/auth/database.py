@@ -14,6 +14,8 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import auth
+import dbutils
 import configuration
 
 class AuthenticationError(Exception):
@@ -100,10 +102,29 @@ class Database(object):
         if not self.supportsHTTPAuthentication():
             raise AuthenticationFailed("HTTP authentication not supported")
 
+        cached_data = auth.CREDENTIAL_CACHE.get(self.name, username, password)
+        if cached_data is not None:
+            try:
+                user = dbutils.User.fromId(db, cached_data["user_id"])
+            except dbutils.InvalidUserId:
+                auth.CREDENTIAL_CACHE.discard(self.name, username, password)
+            else:
+                db.setUser(user, cached_data["authentication_labels"])
+                return
+
         fields = self.getFields()
         self.authenticate(db, { fields[0][1]: username,
                                 fields[1][1]: password })
 
+        # Skip the (typically expensive) verification of these credentials for
+        # a while.  This matters mostly for clients like git that send many
+        # requests in quick succession, all with the same credentials.
+        auth.CREDENTIAL_CACHE.set(
+            self.name, username, password,
+            { "user_id": db.user.id,
+              "authentication_labels": sorted(db.authentication_labels) },
+            user_id=db.user.id)
+
     def supportsPasswordChange(self):
         """Returns true if password changing is supported"""
         return False
@@ -37,28 +37,41 @@ class AccessTokens(auth.Database):
         return True
 
     def performHTTPAuthentication(self, db, username, password):
-        cursor = db.readonly_cursor()
-        cursor.execute("""SELECT id, access_type, uid
-                            FROM accesstokens
-                           WHERE part1=%s
-                             AND part2=%s""",
-                       (username, password))
-        row = cursor.fetchone()
-
-        if row:
+        import api
+
+        token = auth.CREDENTIAL_CACHE.get(self.name, username, password)
+
+        if token is not None:
+            try:
+                access_token = api.accesstoken.fetch(
+                    db.critic, token["token_id"])
+            except api.accesstoken.InvalidAccessTokenId:
+                # The token has been deleted and the cache entry somehow
+                # survived the revocation.
+                auth.CREDENTIAL_CACHE.discard(self.name, username, password)
+                token = None
+
+        if token is None:
+            cursor = db.readonly_cursor()
+            cursor.execute("""SELECT id, access_type, uid
+                                FROM accesstokens
+                               WHERE part1=%s
+                                 AND part2=%s""",
+                           (username, password))
+            row = cursor.fetchone()
+
+            if not row:
+                return self.authdb.performHTTPAuthentication(
+                    db, username, password)
+
             token_id, access_type, user_id = row
 
-            if access_type == "anonymous":
-                db.setUser(dbutils.User.makeAnonymous())
-            elif access_type == "system":
-                db.setUser(dbutils.User.makeSystem())
-            else:
+            if access_type == "user":
                 user = dbutils.User.fromId(db, user_id)
-                authentication_labels = self.getAuthenticationLabels(user)
-                db.setUser(user, authentication_labels)
-
-            import api
-            db.critic.setAccessToken(api.accesstoken.fetch(db.critic, token_id))
+                authentication_labels = sorted(
+                    self.getAuthenticationLabels(user))
+            else:
+                authentication_labels = []
 
             cursor.execute("""SELECT id
                                 FROM accesscontrolprofiles
@@ -66,13 +79,30 @@ class AccessTokens(auth.Database):
                            (token_id,))
             row = cursor.fetchone()
 
-            if row:
-                profile_id, = row
-                db.addProfile(auth.AccessControlProfile.fromId(db, profile_id))
+            token = { "token_id": token_id,
+                      "access_type": access_type,
+                      "user_id": user_id,
+                      "authentication_labels": authentication_labels,
+                      "profile_id": row[0] if row else None }
+
+            auth.CREDENTIAL_CACHE.set(self.name, username, password, token,
+                                      user_id=user_id, token_id=token_id)
+
+            access_token = api.accesstoken.fetch(db.critic, token_id)
+
+        if token["access_type"] == "anonymous":
+            db.setUser(dbutils.User.makeAnonymous())
+        elif token["access_type"] == "system":
+            db.setUser(dbutils.User.makeSystem())
+        else:
+            db.setUser(dbutils.User.fromId(db, token["user_id"]),
+                       token["authentication_labels"])
 
-            return
+        db.critic.setAccessToken(access_token)
 
-        return self.authdb.performHTTPAuthentication(db, username, password)
+        if token["profile_id"] is not None:
+            db.addProfile(auth.AccessControlProfile.fromId(
+                db, token["profile_id"]))
 
     def supportsPasswordChange(self):
         return self.authdb.supportsPasswordChange()
@@ -66,5 +66,7 @@ class Internal(auth.Database):
             cursor.execute("UPDATE users SET password=%s WHERE id=%s",
                            (auth.hashPassword(new_pw), user.id))
 
+        auth.CREDENTIAL_CACHE.revokeUser(user.id)
+
 if configuration.auth.DATABASE == "internal":
     auth.DATABASE = Internal()
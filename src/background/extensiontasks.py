@@ -17,6 +17,7 @@
 import sys
 import os
 import time
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), "..")))
 
@@ -24,6 +25,7 @@ import configuration
 import dbutils
 import background.utils
 import extensions.role.filterhook
+import extensions.role.processcommits
 
 class ExtensionTasks(background.utils.BackgroundProcess):
     def __init__(self):
@@ -31,6 +33,81 @@ class ExtensionTasks(background.utils.BackgroundProcess):
 
         super(ExtensionTasks, self).__init__(service=service)
 
+        self.max_workers = service["max_workers"]
+        self.max_workers_per_extension = service["max_workers_per_extension"]
+
+        # Maps ProcessCommits event id to the time when it should next be
+        # attempted.
+        self.__retry_at = {}
+
+    def processCommits(self):
+        now = time.time()
+
+        with dbutils.Database.forSystem() as db:
+            cursor = db.cursor()
+            cursor.execute("""SELECT id, extension, attempts
+                                FROM extensionprocesscommitsevents
+                               WHERE NOT failed
+                            ORDER BY id ASC""")
+
+            pending_events = [(event_id, extension_id, attempts)
+                              for event_id, extension_id, attempts in cursor
+                              if self.__retry_at.get(event_id, 0) <= now]
+
+        if not pending_events:
+            return
+
+        # Events are processed by a number of worker threads, while making
+        # sure that a single extension isn't running more than its share of
+        # them concurrently.
+        lock = threading.Lock()
+        running = {}
+
+        def nextEvent():
+            with lock:
+                for index, event in enumerate(pending_events):
+                    extension_id = event[1]
+                    count = running.get(extension_id, 0)
+                    if count < self.max_workers_per_extension:
+                        running[extension_id] = count + 1
+                        del pending_events[index]
+                        return event
+            return None, None, None
+
+        def finishedEvent(extension_id):
+            with lock:
+                running[extension_id] -= 1
+
+        def worker():
+            with dbutils.Database.forSystem() as db:
+                while not self.terminated:
+                    event_id, extension_id, attempts = nextEvent()
+                    if event_id is None:
+                        # Either all events are processed, or the remaining
+                        # ones are waiting for other workers to finish.
+                        break
+
+                    try:
+                        retry_at = extensions.role.processcommits \
+                            .attemptProcessCommitsEvent(
+                                db, event_id, attempts, self)
+                    finally:
+                        finishedEvent(extension_id)
+
+                    with lock:
+                        if retry_at is None:
+                            self.__retry_at.pop(event_id, None)
+                        else:
+                            self.__retry_at[event_id] = retry_at
+
+        workers = [threading.Thread(target=worker)
+                   for _ in range(min(self.max_workers, len(pending_events)))]
+
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
     def run(self):
         if not configuration.extensions.ENABLED:
             self.info("service stopping: extension support not enabled")
@@ -66,11 +143,17 @@ class ExtensionTasks(background.utils.BackgroundProcess):
 
                 db.commit()
 
+            self.processCommits()
+
             timeout = self.run_maintenance()
 
             if timeout is None:
                 timeout = 86400
 
+            if self.__retry_at:
+                next_retry = min(self.__retry_at.values()) - time.time()
+                timeout = max(0, min(timeout, next_retry))
+
             self.debug("sleeping %d seconds" % timeout)
 
             self.signal_idle_state()
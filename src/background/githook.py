@@ -22,6 +22,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), ".
 
 import configuration
 import background.utils
+import background.pushqueue
 import dbutils
 import auth
 
@@ -63,6 +64,17 @@ def slave():
         sys_stdout.write(json_encode({ "status": "error", "error": message }))
         sys.exit(0)
 
+    def emit(record):
+        # Intermediate records are terminated by a line-break, so that the
+        # githook service can process them as they arrive.  The final record
+        # is not.
+        sys_stdout.write(json_encode(record) + "\n")
+        sys_stdout.flush()
+
+    def emitProgress(progress):
+        progress["status"] = "progress"
+        emit(progress)
+
     db = dbutils.Database.forUser()
 
     try:
@@ -138,10 +150,32 @@ def slave():
 
         multiple = (len(delete_branches) + len(update_branches) + len(create_branches) + len(delete_tags) + len(update_tags) + len(create_tags)) > 1
         info = []
+        errors = []
+
+        # Finish review updates that earlier pushes deferred but failed to
+        # finish, before anything else is added to the reviews.  Their output
+        # is not meant for this user.  Pushes of only keepalive and temporary
+        # refs are made by Critic itself, while another push to the repository
+        # is being processed, and leave them alone.
+        if delete_branches or update_branches or create_branches \
+                or delete_tags or update_tags or create_tags:
+            errors.extend(index.finishDeferredReviewUpdates(db, repository))
+
+            sys.stdout.seek(0)
+            sys.stdout.truncate()
+
+        index.progress = index.PushProgress(
+            emit=emitProgress,
+            time_budget=configuration.services.GITHOOK["time_budget"],
+            interval=configuration.services.GITHOOK["progress_interval"])
+
+        index.progress.setPhase("processing commits")
 
         for sha1 in commits_to_process:
             index.processCommits(db, repository, sha1)
 
+        index.progress.setPhase("updating refs")
+
         for name, old in delete_branches:
             index.deleteBranch(db, user, repository, name, old)
             info.append("branch deleted: %s" % name)
@@ -167,11 +201,31 @@ def slave():
             index.createTag(db, user, repository, name, new)
             info.append("tag created: %s (%s)" % (name, new[:8]))
 
-        sys_stdout.write(json_encode({ "status": "ok", "accept": True, "output": sys.stdout.getvalue(), "info": info }))
+        # Let the maintenance service know that the repository has changed.
+        db.cursor().execute("""UPDATE repositorymaintenance
+                                  SET pushes=pushes + 1
+                                WHERE repository=%s""",
+                            (repository.id,))
+
+        if index.progress.deferred:
+            # The ref updates, and the deferred review updates, are committed
+            # before the push is accepted.  The review updates are finished
+            # afterwards; if that fails, they are attempted again by the next
+            # push to the repository.
+            db.commit()
+
+            emit({ "status": "accepted", "output": sys.stdout.getvalue(), "info": info })
+
+            sys.stdout.seek(0)
+            sys.stdout.truncate()
+
+            errors.extend(index.finishDeferredReviewUpdates(db, repository))
+
+        sys_stdout.write(json_encode({ "status": "ok", "accept": True, "output": sys.stdout.getvalue(), "info": info, "errors": errors }))
 
         db.commit()
     except index.IndexException as exception:
-        sys_stdout.write(json_encode({ "status": "ok", "accept": False, "output": exception.message, "info": info }))
+        sys_stdout.write(json_encode({ "status": "ok", "accept": False, "output": exception.message, "info": info, "errors": errors }))
     except SystemExit:
         raise
     except:
@@ -188,11 +242,54 @@ Request:
     finally:
         db.close()
 
+def formatProgress(record):
+    details = []
+    if record["commits"]:
+        details.append("%d commits processed" % record["commits"])
+    if record["changesets"]:
+        details.append("%d changesets queued" % record["changesets"])
+    details.append("%d seconds" % record["elapsed"])
+    return "Critic: %s (%s)" % (record["phase"], ", ".join(details))
+
 class GitHookServer(background.utils.PeerServer):
     class ChildProcess(background.utils.PeerServer.ChildProcess):
         def __init__(self, server, client):
             super(GitHookServer.ChildProcess, self).__init__(server, [sys.executable, sys.argv[0], "--slave"])
             self.__client = client
+            self.repository_name = client.repository_name()
+            self.queued = not client.is_internal()
+            self.__accepted = False
+
+        def handle_partial_input(self, _file, data):
+            # Relay intermediate records (progress reports and acceptance of a
+            # push whose review updates were deferred) as soon as they arrive.
+            # The final record, which isn't terminated by a line-break, is left
+            # for handle_input().
+            while "\n" in data:
+                line, rest = data.split("\n", 1)
+                try:
+                    record = json_decode(line)
+                except ValueError:
+                    break
+                if not isinstance(record, dict) \
+                        or record.get("status") not in ("progress", "accepted"):
+                    break
+                data = rest
+                if record["status"] == "progress":
+                    # Progress of the deferred review updates is of no
+                    # interest to a client that has already gone.
+                    if not self.__accepted:
+                        self.__client.write(formatProgress(record) + "\n")
+                else:
+                    for item in record["info"]:
+                        self.server.info(item)
+                    self.server.info("push accepted; finishing deferred review updates")
+                    if record["output"]:
+                        self.__client.write(record["output"].strip() + "\n")
+                    self.__client.write("ok\n")
+                    self.__client.close()
+                    self.__accepted = True
+            return data
 
         def handle_input(self, _file, data):
             try:
@@ -201,6 +298,20 @@ class GitHookServer(background.utils.PeerServer):
                 result = { "status": "error",
                            "error": ("invalid response:\n" +
                                      background.utils.indent(data)) }
+            if result["status"] == "ok":
+                for error in result["errors"]:
+                    self.server.error(error)
+            if self.__accepted:
+                # The client has already been told that the push was accepted
+                # and is gone, so all that remains is to log the outcome.
+                if result["status"] == "ok":
+                    if result["output"]:
+                        self.server.info("output after acceptance:\n" +
+                                         background.utils.indent(
+                                             result["output"]))
+                else:
+                    self.server.error(result.get("error") or result["message"])
+                return
             if result["status"] == "ok":
                 for item in result["info"]:
                     self.server.info(item)
@@ -250,10 +361,34 @@ been sent to the system administrator(s).
                              % (self.__request["user_name"],
                                 self.__request["repository_name"]))
 
+            if self.is_internal():
+                self.server.startInternalPush(self)
+            else:
+                self.server.queuePush(self)
+
+        def repository_name(self):
+            return self.__request["repository_name"]
+
+        def is_internal(self):
+            # Pushes that only update keepalive and temporary refs are made by
+            # Critic itself, typically from within the processing of another
+            # push to the same repository (rebase replays and merge replays
+            # push their result to a keepalive ref.)  Queuing them behind that
+            # push would deadlock, and since they never update branches or
+            # tags, there is no ordering to preserve.
+            return all(ref["name"].startswith(("refs/keepalive/",
+                                               "refs/temporary/"))
+                       for ref in self.__request["refs"])
+
+        def startProcessing(self):
+            if self.is_finished():
+                # The pushing user gave up while the push was queued.
+                return None
             child_process = GitHookServer.ChildProcess(self.server, self)
             child_process.write(json_encode(self.__request))
             child_process.close()
             self.server.add_peer(child_process)
+            return child_process
 
         def destroy(self):
             self.server.info("session ended: %s / %s"
@@ -261,16 +396,62 @@ been sent to the system administrator(s).
                                 self.__request["repository_name"]))
 
     def __init__(self):
-        super(GitHookServer, self).__init__(service=configuration.services.GITHOOK)
+        service = configuration.services.GITHOOK
+        super(GitHookServer, self).__init__(service=service)
+        self.__pushes = background.pushqueue.PushQueue(
+            service.get("max_workers", 4))
 
     def startup(self):
         super(GitHookServer, self).startup()
 
         os.chmod(configuration.services.GITHOOK["address"], 0770)
 
+        self.__writeStatus()
+
     def handle_peer(self, peersocket, peeraddress):
         return GitHookServer.Client(self, peersocket)
 
+    def peer_destroyed(self, peer):
+        if isinstance(peer, GitHookServer.ChildProcess):
+            self.count("pushes_processed")
+            if peer.returncode:
+                self.count("pushes_failed")
+            if peer.queued:
+                self.__pushes.finished(peer.repository_name)
+                self.__startPushes()
+
+    def startInternalPush(self, client):
+        client.startProcessing()
+
+    def queuePush(self, client):
+        ahead = self.__pushes.add(client.repository_name(), client)
+        if client not in self.__startPushes():
+            if ahead:
+                client.write("Critic: waiting for %d earlier push%s to %s\n"
+                             % (ahead, "es" if ahead > 1 else "",
+                                client.repository_name()))
+            else:
+                client.write("Critic: waiting for pushes to other "
+                             "repositories to finish\n")
+
+    def __startPushes(self):
+        started = []
+        while True:
+            clients = self.__pushes.start()
+            if not clients:
+                break
+            for client in clients:
+                child_process = client.startProcessing()
+                if child_process:
+                    started.append(client)
+                else:
+                    self.__pushes.finished(client.repository_name())
+        self.__writeStatus()
+        return started
+
+    def __writeStatus(self):
+        self.update_status(**self.__pushes.status())
+
 def start_service():
     server = GitHookServer()
     return server.start()
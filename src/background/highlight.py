@@ -27,6 +27,8 @@ from textutils import json_decode, json_encode
 if "--json-job" in sys.argv[1:]:
     def perform_job():
         import syntaxhighlight.generate
+        import syntaxhighlight.context
+        import dbutils
 
         request = json_decode(sys.stdin.read())
         request["highlighted"] = syntaxhighlight.generate.generateHighlight(
@@ -34,13 +36,21 @@ if "--json-job" in sys.argv[1:]:
             sha1=request["sha1"],
             language=request["language"],
             mode=request["mode"])
+
+        # Import the code contexts here, rather than in the server process
+        # when the job has finished, so that the server's event loop isn't
+        # blocked while they are inserted into the database.
+        if request["highlighted"]:
+            with dbutils.Database.forSystem() as db:
+                request["contexts"] = syntaxhighlight.context.importCodeContexts(
+                    db, request["sha1"], request["language"], request["mode"])
+
         sys.stdout.write(json_encode(request))
 
     background.utils.call("highlight_job", perform_job)
 else:
     import background.utils
     from syntaxhighlight import isHighlighted
-    from syntaxhighlight.context import importCodeContexts
 
     import configuration
     import dbutils
@@ -51,8 +61,6 @@ else:
 
             super(HighlightServer, self).__init__(service)
 
-            self.db = dbutils.Database.forSystem()
-
             if "compact_at" in service:
                 hour, minute = service["compact_at"]
                 self.register_maintenance(hour=hour, minute=minute, callback=self.__compact)
@@ -74,7 +82,7 @@ else:
             failed = "" if "error" not in result else " (failed!)"
             self.info("finished: %s:%s (%s) in %s [pid=%d]%s" % (request["path"], request["sha1"][:8], request["language"], request["repository_path"], job.pid, failed))
 
-            ncontexts = importCodeContexts(self.db, request["sha1"], request["language"])
+            ncontexts = result.get("contexts")
 
             if ncontexts: self.debug("  added %d code contexts" % ncontexts)
             else: self.debug("  no code contexts added")
@@ -0,0 +1,146 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), "..")))
+
+import configuration
+import dbutils
+import mailutils
+import background.utils
+import reviewing.mailgeneration
+
+# Number of times generating the mails for an event is attempted before the
+# event is dropped.
+MAXIMUM_ATTEMPTS = 5
+
+# Delay (in seconds) before the first retry; doubled for each further retry.
+RETRY_DELAY = 30
+
+class MailGeneration(background.utils.BackgroundProcess):
+    def __init__(self):
+        service = configuration.services.MAILGENERATION
+
+        super(MailGeneration, self).__init__(service=service)
+
+        # Maps event id to the time when it should next be attempted.
+        self.__retry_at = {}
+
+    def __discardMails(self, pending_mails):
+        for filename in pending_mails:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+
+    def __processEvent(self, db, event_id, attempts):
+        cursor = db.cursor()
+        pending_mails = []
+
+        try:
+            reviewing.mailgeneration.generateMails(db, event_id, pending_mails)
+        except Exception:
+            self.exception()
+
+            db.rollback()
+            self.__discardMails(pending_mails)
+
+            attempts += 1
+
+            if attempts >= MAXIMUM_ATTEMPTS:
+                self.error("dropping event %d after %d failed attempts"
+                           % (event_id, attempts))
+                cursor.execute("""DELETE FROM mailgenerationevents
+                                        WHERE id=%s""",
+                               (event_id,))
+                self.__retry_at.pop(event_id, None)
+            else:
+                cursor.execute("""UPDATE mailgenerationevents
+                                     SET attempts=%s
+                                   WHERE id=%s""",
+                               (attempts, event_id))
+                self.__retry_at[event_id] = \
+                    time.time() + RETRY_DELAY * 2 ** (attempts - 1)
+
+            db.commit()
+        else:
+            # Delete the event before handing the mails over to the mail
+            # delivery service; if the commit fails, the mails are discarded and
+            # generated again later instead of being sent twice.
+            cursor.execute("""DELETE FROM mailgenerationevents
+                                    WHERE id=%s""",
+                           (event_id,))
+
+            try:
+                db.commit()
+            except Exception:
+                self.__discardMails(pending_mails)
+                raise
+
+            self.__retry_at.pop(event_id, None)
+
+            mailutils.sendPendingMails(pending_mails)
+
+            self.debug("generated %d mails for event %d"
+                       % (len(pending_mails), event_id))
+
+    def run(self):
+        while not self.terminated:
+            self.interrupted = False
+
+            with dbutils.Database.forSystem() as db:
+                cursor = db.cursor()
+                cursor.execute("""SELECT id, attempts
+                                    FROM mailgenerationevents
+                                ORDER BY id ASC""")
+
+                now = time.time()
+
+                for event_id, attempts in cursor.fetchall():
+                    if self.terminated:
+                        break
+                    if self.__retry_at.get(event_id, 0) <= now:
+                        self.__processEvent(db, event_id, attempts)
+
+            timeout = self.run_maintenance()
+
+            if timeout is None:
+                timeout = 86400
+
+            if self.__retry_at:
+                next_retry = min(self.__retry_at.values()) - time.time()
+                timeout = max(0, min(timeout, next_retry))
+
+            self.debug("sleeping %d seconds" % timeout)
+
+            self.signal_idle_state()
+
+            before = time.time()
+
+            time.sleep(timeout)
+
+            if self.interrupted:
+                self.debug("sleep interrupted after %.2f seconds"
+                           % (time.time() - before))
+
+def start_service():
+    mailgeneration = MailGeneration()
+    return mailgeneration.start()
+
+background.utils.call("mailgeneration", start_service)
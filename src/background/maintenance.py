@@ -16,8 +16,11 @@
 
 import sys
 import os
+import re
 import time
 import shutil
+import subprocess
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), "..")))
 
@@ -25,6 +28,45 @@ import configuration
 import dbutils
 import gitutils
 import background.utils
+import auth
+
+def getGitVersion():
+    output = subprocess.check_output([configuration.executables.GIT, "--version"])
+    match = re.search(r"(\d+)\.(\d+)", output)
+    if not match:
+        return (0, 0)
+    return (int(match.group(1)), int(match.group(2)))
+
+def maintainRepository(repository, full_gc, git_version):
+    repository.packKeepaliveRefs()
+
+    if full_gc:
+        repository.run("gc", "--prune=1 day", "--quiet")
+        return
+
+    # Incremental maintenance: pack loose objects, and keep the number of packs
+    # down without rewriting the big packs every night.
+    if git_version >= (2, 33):
+        repository.run("repack", "-d", "--geometric=2", "--quiet")
+    else:
+        repository.run("repack", "-d", "--quiet")
+
+    if git_version >= (2, 21):
+        repository.run("multi-pack-index", "write")
+
+    if git_version >= (2, 24):
+        repository.run("commit-graph", "write", "--reachable", "--split")
+    elif git_version >= (2, 18):
+        repository.run("commit-graph", "write", "--reachable")
+
+def hasNewObjects(repository):
+    """Return true if the repository has loose objects or multiple packs
+
+       If it doesn't, nothing has been added to it since the last full garbage
+       collect, so running another one would be a waste of time."""
+    output = repository.run("count-objects", "-v")
+    counts = dict(line.split(": ", 1) for line in output.splitlines())
+    return int(counts["count"]) > 0 or int(counts["packs"]) > 1
 
 class Maintenance(background.utils.BackgroundProcess):
     def __init__(self):
@@ -32,6 +74,9 @@ class Maintenance(background.utils.BackgroundProcess):
 
         super(Maintenance, self).__init__(service=service)
 
+        self.max_workers = service["max_workers"]
+        self.full_gc_interval = service["full_gc_interval"]
+
         hour, minute = service["maintenance_at"]
         self.register_maintenance(hour=hour, minute=minute, callback=self.__maintenance)
 
@@ -46,6 +91,140 @@ class Maintenance(background.utils.BackgroundProcess):
 
         super(Maintenance, self).run()
 
+    def __archiveBranches(self, db, repository_id, branch_ids):
+        repository = gitutils.Repository.fromId(db, repository_id)
+        branches = [dbutils.Branch.fromId(db, branch_id, repository=repository)
+                    for branch_id in branch_ids]
+
+        self.info("archiving branches in: " + repository.name)
+
+        try:
+            # Archive all branches using a single ref transaction.
+            archived = dbutils.Branch.archiveMultiple(db, repository, branches)
+        except Exception:
+            self.exception(as_warning=True)
+
+            # Most likely the ref transaction failed, in which case no refs
+            # were updated.  Fall back to archiving the branches one at a time,
+            # so that a single problematic branch doesn't prevent the others
+            # from being archived.
+            archived = []
+            for branch in branches:
+                try:
+                    branch.archive(db)
+                except Exception:
+                    self.exception(as_warning=True)
+                else:
+                    archived.append(branch)
+
+        for branch in archived:
+            self.info("  " + branch.name)
+
+        repository.stopBatch()
+
+    def __maintainRepositories(self, db):
+        cursor = db.cursor()
+
+        # Make sure every repository has a row in 'repositorymaintenance'.
+        # Repositories added since the last run will have a NULL ref count,
+        # which makes sure they are maintained this time.
+        cursor.execute("""INSERT INTO repositorymaintenance (repository)
+                               SELECT id
+                                 FROM repositories
+                                WHERE id NOT IN (SELECT repository
+                                                   FROM repositorymaintenance)""")
+        db.commit()
+
+        cursor.execute("""SELECT repositories.id, repositories.name,
+                                 repositorymaintenance.pushes,
+                                 repositorymaintenance.refs,
+                                 repositorymaintenance.gc_age
+                            FROM repositories
+                            JOIN repositorymaintenance ON (repositorymaintenance.repository=repositories.id)
+                        ORDER BY repositories.id""")
+
+        git_version = getGitVersion()
+
+        pending = []
+        idle = []
+
+        for repository_id, repository_name, pushes, refs, gc_age in cursor.fetchall():
+            repository = gitutils.Repository.fromId(db, repository_id)
+
+            full_gc = gc_age + 1 >= self.full_gc_interval
+
+            try:
+                current_refs = len(repository.listrefs("refs/"))
+                is_idle = pushes == 0 and refs == current_refs
+                if is_idle and full_gc:
+                    # A full garbage collect is due, but is only worth running
+                    # if there are new objects.  Otherwise, it's postponed
+                    # until the repository is next modified.
+                    is_idle = not hasNewObjects(repository)
+            except Exception:
+                self.exception("repository maintenance failed: %s"
+                               % repository_name)
+                continue
+
+            if is_idle:
+                self.debug("repository idle: %s" % repository_name)
+                idle.append(repository_id)
+            else:
+                pending.append((repository, pushes, full_gc))
+
+        cursor.execute("""UPDATE repositorymaintenance
+                             SET gc_age=gc_age + 1
+                           WHERE repository=ANY (%s)""",
+                       (idle,))
+        db.commit()
+
+        finished = []
+        lock = threading.Lock()
+
+        def worker():
+            while not self.terminated:
+                with lock:
+                    if not pending:
+                        return
+                    repository, pushes, full_gc = pending.pop(0)
+
+                self.debug("repository %s: %s"
+                           % ("GC" if full_gc else "maintenance",
+                              repository.name))
+
+                try:
+                    maintainRepository(repository, full_gc, git_version)
+                    refs = len(repository.listrefs("refs/"))
+                except Exception:
+                    self.exception("repository maintenance failed: %s"
+                                   % repository.name)
+                else:
+                    with lock:
+                        finished.append((repository.id, pushes, refs, full_gc))
+                finally:
+                    repository.stopBatch()
+
+        # Maintain a bounded number of repositories in parallel.  The actual
+        # work is done by Git processes, so threads are sufficient.
+        workers = [threading.Thread(target=worker)
+                   for _ in range(min(self.max_workers, len(pending)))]
+
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        # Subtract the number of pushes we saw rather than resetting the count,
+        # so that pushes that happened while we were busy aren't forgotten.
+        cursor.executemany("""UPDATE repositorymaintenance
+                                 SET pushes=pushes - %s,
+                                     refs=%s,
+                                     gc_age=CASE WHEN %s THEN 0 ELSE gc_age + 1 END
+                               WHERE repository=%s""",
+                           [(pushes, refs, full_gc, repository_id)
+                            for repository_id, pushes, refs, full_gc in finished])
+        db.commit()
+
     def __maintenance(self):
         with dbutils.Database.forSystem() as db:
             cursor = db.cursor()
@@ -65,33 +244,24 @@ class Maintenance(background.utils.BackgroundProcess):
 
             # Execute scheduled review branch archivals.
             if configuration.base.ARCHIVE_REVIEW_BRANCHES:
-                repository = None
-
-                cursor.execute("""SELECT branches.repository, branches.id, branches.name
+                cursor.execute("""SELECT branches.repository, branches.id
                                     FROM scheduledreviewbrancharchivals
                                     JOIN reviews ON (reviews.id=scheduledreviewbrancharchivals.review)
                                     JOIN branches ON (branches.id=reviews.branch)
                                    WHERE scheduledreviewbrancharchivals.deadline <= NOW()
                                      AND reviews.state IN ('closed', 'dropped')
                                      AND NOT branches.archived
-                                ORDER BY branches.repository""",
+                                ORDER BY branches.repository, branches.id""",
                                for_update=True)
 
-                for repository_id, branch_id, branch_name in cursor:
-                    if not repository or repository.id != repository_id:
-                        if repository:
-                            repository.stopBatch()
-                        repository = gitutils.Repository.fromId(db, repository_id)
-                        self.info("archiving branches in: " + repository.name)
+                branch_ids_per_repository = {}
+                for repository_id, branch_id in cursor.fetchall():
+                    branch_ids_per_repository.setdefault(
+                        repository_id, []).append(branch_id)
 
-                    self.info("  " + branch_name)
-
-                    branch = dbutils.Branch.fromId(db, branch_id, repository=repository)
-
-                    try:
-                        branch.archive(db)
-                    except Exception:
-                        self.exception(as_warning=True)
+                for repository_id, branch_ids in sorted(
+                        branch_ids_per_repository.items()):
+                    self.__archiveBranches(db, repository_id, branch_ids)
 
                 # Since NOW() returns the same value each time within a single
                 # transaction, this is guaranteed to delete only the set of
@@ -102,21 +272,18 @@ class Maintenance(background.utils.BackgroundProcess):
 
                 db.commit()
 
-            # Run a garbage collect in all Git repositories, to keep them neat
-            # and tidy.  Also pack keepalive refs.
-            cursor.execute("SELECT name FROM repositories")
-            for (repository_name,) in cursor:
-                self.debug("repository GC: %s" % repository_name)
-                try:
-                    repository = gitutils.Repository.fromName(db, repository_name)
-                    repository.packKeepaliveRefs()
-                    repository.run("gc", "--prune=1 day", "--quiet")
-                    repository.stopBatch()
-                except Exception:
-                    self.exception("repository GC failed: %s" % repository_name)
+            # Garbage collect the Git repositories, to keep them neat and tidy.
+            # Also pack keepalive refs.
+            self.__maintainRepositories(db)
+
+            if self.terminated:
+                return
 
-                if self.terminated:
-                    return
+            # Remove expired entries from the HTTP authentication credential
+            # cache.  Entries are otherwise only removed when the same
+            # credentials are used again, or when revoked.
+            self.debug("purging expired cached credentials")
+            auth.CREDENTIAL_CACHE.purge()
 
             if configuration.extensions.ENABLED:
                 now = time.time()
@@ -0,0 +1,120 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import collections
+import time
+
+class PushQueue(object):
+    """Scheduler for pushes handled by the githook service
+
+       At most |max_running| pushes are processed at any one time, and at most
+       one push per repository, so that updates of the same ref are always
+       processed in the order they arrived.  Repositories with queued pushes
+       take turns, so that a burst of pushes to one repository doesn't starve
+       pushes to other repositories."""
+
+    class Push(object):
+        def __init__(self, repository_name, job, queued):
+            self.repository_name = repository_name
+            self.job = job
+            self.queued = queued
+            self.started = None
+
+    def __init__(self, max_running, clock=time.time):
+        self.max_running = max_running
+        self.__clock = clock
+        # Queued pushes per repository, in order of arrival.
+        self.__queued = {}
+        # Repositories with queued pushes but no running push, in the order in
+        # which they should be served.
+        self.__ready = collections.deque()
+        # Running pushes per repository.
+        self.__running = {}
+        self.__started_count = 0
+        self.__total_wait = 0.0
+        self.__maximum_wait = 0.0
+
+    def add(self, repository_name, job):
+        """Queue |job| for |repository_name|
+
+           Returns the number of pushes that must finish before it can start,
+           not counting pushes to other repositories."""
+        push = PushQueue.Push(repository_name, job, self.__clock())
+        queued = self.__queued.setdefault(repository_name, collections.deque())
+        queued.append(push)
+        if len(queued) == 1 and repository_name not in self.__running:
+            self.__ready.append(repository_name)
+        return len(queued) - 1 + (repository_name in self.__running)
+
+    def start(self):
+        """Return list of jobs that should be started now"""
+        jobs = []
+        now = self.__clock()
+        while self.__ready and len(self.__running) < self.max_running:
+            repository_name = self.__ready.popleft()
+            queued = self.__queued[repository_name]
+            push = queued.popleft()
+            if not queued:
+                del self.__queued[repository_name]
+            push.started = now
+            self.__running[repository_name] = push
+            wait = now - push.queued
+            self.__started_count += 1
+            self.__total_wait += wait
+            self.__maximum_wait = max(self.__maximum_wait, wait)
+            jobs.append(push.job)
+        return jobs
+
+    def finished(self, repository_name):
+        """Record that the running push to |repository_name| has finished
+
+           Call start() afterwards to start the pushes this made room for."""
+        del self.__running[repository_name]
+        if repository_name in self.__queued:
+            # Go to the back of the line, behind repositories that have been
+            # waiting while this repository's push was running.
+            self.__ready.append(repository_name)
+
+    def status(self):
+        """Return a JSON compatible summary of the queue's state
+
+           Per repository, the time (as returned by the clock) at which the
+           running push was started, and at which the oldest queued push was
+           queued, is included rather than durations, since the summary may be
+           read a while after it was produced."""
+        repositories = {}
+        for repository_name, push in self.__running.items():
+            repositories[repository_name] = {
+                "running_since": push.started,
+                "queued": 0,
+                "queued_since": None }
+        for repository_name, queued in self.__queued.items():
+            repository = repositories.setdefault(
+                repository_name, { "running_since": None })
+            repository["queued"] = len(queued)
+            repository["queued_since"] = queued[0].queued
+        if self.__started_count:
+            average_wait = self.__total_wait / self.__started_count
+        else:
+            average_wait = 0.0
+        return { "max_running": self.max_running,
+                 "running": len(self.__running),
+                 "queued": sum(len(queued)
+                               for queued in self.__queued.values()),
+                 "started": self.__started_count,
+                 "average_wait": average_wait,
+                 "maximum_wait": self.__maximum_wait,
+                 "repositories": repositories }
@@ -0,0 +1,51 @@
+def scheduling():
+    import background.pushqueue
+
+    now = [0.0]
+    queue = background.pushqueue.PushQueue(2, clock=lambda: now[0])
+
+    assert queue.add("a", "a1") == 0
+    assert queue.add("a", "a2") == 1
+    assert queue.add("a", "a3") == 2
+    assert queue.add("b", "b1") == 0
+    assert queue.add("c", "c1") == 0
+
+    # At most one push per repository, and at most two in total.
+    assert queue.start() == ["a1", "b1"]
+    assert queue.start() == []
+
+    status = queue.status()
+    assert status["running"] == 2
+    assert status["queued"] == 3
+    assert status["repositories"]["a"]["queued"] == 2
+    assert status["repositories"]["a"]["running_since"] == 0.0
+    assert status["repositories"]["c"]["running_since"] is None
+    assert status["repositories"]["c"]["queued_since"] == 0.0
+
+    now[0] = 10.0
+
+    # Repository "c" has been waiting longer than "a"'s next push, and gets
+    # the free slot first.
+    queue.finished("a")
+    assert queue.start() == ["c1"]
+    assert queue.add("c", "c2") == 1
+
+    queue.finished("b")
+    assert queue.start() == ["a2"]
+
+    queue.finished("c")
+    queue.finished("a")
+    assert queue.start() == ["c2", "a3"]
+
+    queue.finished("c")
+    queue.finished("a")
+    assert queue.start() == []
+
+    status = queue.status()
+    assert status["running"] == 0
+    assert status["queued"] == 0
+    assert status["started"] == 6
+    assert status["maximum_wait"] == 10.0
+    assert status["repositories"] == {}
+
+    print "scheduling: ok"
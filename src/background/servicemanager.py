@@ -29,83 +29,13 @@ STARTUP_SYNC_TIMEOUT = 30
 
 if "--slave" in sys.argv:
     import background.utils
+    import background.supervision
 
     class ServiceManager(background.utils.PeerServer):
         # The master process manages our pid file, so tell our base class to
         # leave it alone.
         manage_pidfile = False
 
-        class Service(object):
-            class Process(background.utils.PeerServer.ChildProcess):
-                def __init__(self, service, input_data):
-                    super(ServiceManager.Service.Process, self).__init__(
-                        service.manager, [sys.executable, "-m", service.module],
-                        stderr=subprocess.STDOUT)
-
-                    self.__service = service
-                    self.__output = None
-                    if input_data:
-                        self.write(json.dumps(input_data))
-                    self.close()
-
-                def handle_input(self, _file, data):
-                    self.__output = data
-
-                def destroy(self):
-                    super(ServiceManager.Service.Process, self).destroy()
-                    self.__service.stopped(self.returncode, self.__output)
-
-            def __init__(self, manager, service_data):
-                self.manager = manager
-                self.name = service_data["name"]
-                self.module = service_data["module"]
-                self.started = None
-                self.process = None
-                self.callbacks = []
-
-            def signal_callbacks(self, event):
-                self.callbacks = filter(lambda callback: callback(event), self.callbacks)
-
-            def start(self, input_data):
-                self.process = ServiceManager.Service.Process(self, input_data)
-                self.started = time.time()
-                self.manager.add_peer(self.process)
-                self.manager.info("%s: started (pid=%d)" % (self.name, self.process.pid))
-                self.input_data = input_data
-                self.signal_callbacks("started")
-
-            def restart(self, callback=None):
-                if callback:
-                    self.callbacks.append(callback)
-                self.start(self.input_data)
-
-            def stop(self, callback=None):
-                if callback:
-                    self.callbacks.append(callback)
-                if self.process:
-                    self.manager.info("%s: sending process SIGTERM" % self.name)
-                    self.process.kill(signal.SIGTERM)
-
-            def stopped(self, returncode, output):
-                restart = not self.manager.terminated and not self.manager.restart_requested
-                if returncode != 0:
-                    message = "%s: exited with returncode %d" % (self.name, returncode)
-                    if output:
-                        message += "\n" + background.utils.indent(output)
-                    if time.time() - self.started < 1:
-                        message += "\n  Process restarted less than 1 second ago; not restarting."
-                        restart = False
-                    self.manager.error(message)
-                else:
-                    self.manager.info("%s: exited normally" % self.name)
-                    if not self.callbacks:
-                        restart = False
-                self.process = None
-                if restart:
-                    self.restart()
-                else:
-                    self.signal_callbacks("stopped")
-
         class Client(background.utils.PeerServer.SocketPeer):
             def __init__(self, manager, peersocket):
                 super(ServiceManager.Client, self).__init__(manager, peersocket)
@@ -129,16 +59,29 @@ if "--slave" in sys.argv:
                                     "error": "invalid input: expected object" })
 
                 if request.get("query") == "status":
+                    child_counts = background.supervision.getChildCounts()
                     services = { "manager": { "module": "background.servicemanager",
                                               "uptime": time.time() - self.__manager.started,
-                                              "pid": os.getpid() }}
+                                              "pid": os.getpid(),
+                                              "state": "running",
+                                              "resources": background.supervision.sampleProcess(
+                                                  os.getpid(), child_counts) }}
 
                     for service in self.__manager.services:
-                        uptime = time.time() - service.started if service.started else -1
-                        pid = service.process.pid if service.process else -1
-                        services[service.name] = { "module": service.module,
-                                                   "uptime": uptime,
-                                                   "pid": pid }
+                        services[service.name] = service.status(child_counts)
+
+                        # Services report their own counters and additional
+                        # status (such as the githook service's push queue) by
+                        # writing it to a file next to their pid file; see
+                        # BackgroundProcess.update_status().
+                        try:
+                            with open(service.status_path) as status_file:
+                                status = background.utils.json_decode(
+                                    status_file.read())
+                        except (EnvironmentError, ValueError):
+                            pass
+                        else:
+                            services[service.name]["status"] = status
 
                     return result({ "status": "ok", "services": services })
                 elif request.get("command") == "restart":
@@ -152,6 +95,9 @@ if "--slave" in sys.argv:
                     for service in self.__manager.services:
                         if service.name == request.get("service"):
                             self.__manager.info("%s: restart requested" % service.name)
+                            # Restarted manually, so forget about earlier
+                            # crashes, and restart immediately.
+                            service.policy.reset()
                             def callback(event):
                                 self.send_response({ "status": "ok",
                                                      "event": event })
@@ -171,6 +117,7 @@ if "--slave" in sys.argv:
             self.input_data = input_data
             self.services = []
             self.started = time.time()
+            self.stop_timeout = service.get("stop_timeout", 30)
 
         def handle_peer(self, peersocket, peeraddress):
             return ServiceManager.Client(self, peersocket)
@@ -183,7 +130,8 @@ if "--slave" in sys.argv:
                 with open(starting_path, "w") as starting:
                     starting.write("%s\n" % time.ctime())
 
-                service = ServiceManager.Service(self, service_data)
+                service = background.supervision.Service(
+                    self, service_data, configuration.services.SERVICEMANAGER)
                 service.start(self.input_data.get(service.name))
                 self.services.append(service)
 
@@ -191,6 +139,19 @@ if "--slave" in sys.argv:
             for service in self.services:
                 service.stop()
 
+            # Give the services a chance to stop cleanly, but don't wait
+            # forever for services that hang.
+            deadline = time.time() + max([service.stop_timeout
+                                          for service in self.services] or [0])
+            for service in self.services:
+                while service.process and service.process.process.poll() is None:
+                    if time.time() > deadline:
+                        self.warning("%s: still running after SIGTERM; "
+                                     "sending process SIGKILL" % service.name)
+                        service.process.kill(signal.SIGKILL)
+                        break
+                    time.sleep(0.1)
+
             super(ServiceManager, self).shutdown()
 
         def requestRestart(self):
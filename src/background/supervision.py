@@ -0,0 +1,351 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import collections
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+import background.utils
+
+# Service configuration keys and the resource limits they set.
+RESOURCE_LIMITS = [("rlimit_as", resource.RLIMIT_AS),
+                   ("rlimit_cpu", resource.RLIMIT_CPU),
+                   ("rlimit_nofile", resource.RLIMIT_NOFILE)]
+
+class RestartPolicy(object):
+    """Decides when to restart a service that crashed
+
+       The delay before restarting starts at |min_delay| seconds and doubles
+       with every crash, up to |max_delay| seconds.  It is reset once the
+       service has been running for |stable_uptime| seconds.  A service that
+       crashes |crash_loop_limit| times within |crash_loop_interval| seconds is
+       considered to be in a crash loop, and is not restarted automatically
+       again until reset() is called."""
+
+    def __init__(self, min_delay=1, max_delay=300, stable_uptime=60,
+                 crash_loop_limit=5, crash_loop_interval=600):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.stable_uptime = stable_uptime
+        self.crash_loop_limit = crash_loop_limit
+        self.crash_loop_interval = crash_loop_interval
+        self.crashes = 0
+        self.crash_loop = False
+        self.__delay = None
+        self.__recent = collections.deque()
+
+    @staticmethod
+    def fromConfiguration(service_data, defaults):
+        """Create a policy from a service's (or the service manager's) settings"""
+        def setting(name, default):
+            return service_data.get(name, defaults.get(name, default))
+        return RestartPolicy(
+            min_delay=setting("min_restart_delay", 1),
+            max_delay=setting("max_restart_delay", 300),
+            stable_uptime=setting("stable_uptime", 60),
+            crash_loop_limit=setting("crash_loop_limit", 5),
+            crash_loop_interval=setting("crash_loop_interval", 600))
+
+    def crashed(self, now, uptime):
+        """Record a crash at |now| after |uptime| seconds of running
+
+           Returns the number of seconds to wait before restarting, or None if
+           the service should not be restarted."""
+        self.crashes += 1
+        self.__recent.append(now)
+        while self.__recent[0] < now - self.crash_loop_interval:
+            self.__recent.popleft()
+        if len(self.__recent) >= self.crash_loop_limit:
+            self.crash_loop = True
+            return None
+        if self.__delay is None or uptime >= self.stable_uptime:
+            self.__delay = self.min_delay
+        else:
+            self.__delay = min(self.__delay * 2, self.max_delay)
+        return self.__delay
+
+    def reset(self):
+        """Forget about earlier crashes (e.g. when restarted manually)"""
+        self.crash_loop = False
+        self.__delay = None
+        self.__recent.clear()
+
+def getResourceLimits(service_data):
+    """Return a dictionary of the resource limits configured for a service"""
+    return dict((name, service_data[name]) for name, _ in RESOURCE_LIMITS
+                if service_data.get(name) is not None)
+
+def applyResourceLimits(limits):
+    """Set the resource limits in |limits| for the current process
+
+       Only the soft limits are set, and never above the hard limits.  Meant
+       to be called in a child process before it executes the service, e.g. as
+       a subprocess.Popen() 'preexec_fn'."""
+    for name, limit in RESOURCE_LIMITS:
+        if name not in limits:
+            continue
+        soft, hard = resource.getrlimit(limit)
+        value = limits[name]
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, hard))
+
+def getChildCounts():
+    """Return a dictionary mapping pids to their number of child processes"""
+    counts = collections.Counter()
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % name) as stat_file:
+                stat = stat_file.read()
+        except EnvironmentError:
+            # The process exited after we listed /proc.
+            continue
+        # The command name (2nd field) is in parentheses and might contain
+        # spaces, so split after the last closing parenthesis.  The parent's
+        # pid is the 2nd field after it.
+        counts[int(stat[stat.rindex(")") + 2:].split()[1])] += 1
+    return counts
+
+def sampleProcess(pid, child_counts=None):
+    """Return resource usage of a process, or None if it doesn't exist
+
+       The returned dictionary contains the process's current and peak
+       resident set size ("rss" and "max_rss", in bytes), its consumed CPU time
+       ("cpu", user and system, in seconds), its number of open file
+       descriptors ("fds") and its number of child processes ("children").
+       Pass the result of getChildCounts() as |child_counts| when sampling
+       several processes."""
+    try:
+        with open("/proc/%d/stat" % pid) as stat_file:
+            stat = stat_file.read()
+        with open("/proc/%d/status" % pid) as status_file:
+            status = status_file.read()
+        fds = len(os.listdir("/proc/%d/fd" % pid))
+    except EnvironmentError:
+        return None
+
+    # Fields after the command name, starting with the 3rd field (state.)
+    fields = stat[stat.rindex(")") + 2:].split()
+    utime, stime = int(fields[11]), int(fields[12])
+
+    memory = {}
+    for line in status.splitlines():
+        words = line.split()
+        if words and words[0] in ("VmRSS:", "VmHWM:"):
+            # Always in kB.
+            memory[words[0][:-1]] = int(words[1]) * 1024
+
+    if child_counts is None:
+        child_counts = getChildCounts()
+
+    return { "rss": memory.get("VmRSS", 0),
+             "max_rss": memory.get("VmHWM", 0),
+             "cpu": float(utime + stime) / os.sysconf("SC_CLK_TCK"),
+             "fds": fds,
+             "children": child_counts.get(pid, 0) }
+
+class Timer(background.utils.PeerServer.Peer):
+    """Peer without files that calls a callback after a delay"""
+
+    def __init__(self, manager, delay, callback):
+        super(Timer, self).__init__(
+            manager, None, deadline=time.time() + delay)
+        self.__callback = callback
+
+    def timed_out(self):
+        super(Timer, self).timed_out()
+        if self.__callback:
+            self.__callback()
+
+    def cancel(self):
+        # Let the manager get rid of the timer as soon as possible.
+        self.__callback = None
+        self.deadline = 0
+
+class Service(object):
+    """A service supervised by the service manager
+
+       |manager| is the background.utils.PeerServer running the service's
+       process and timers.  It must also have 'terminated', 'restart_requested'
+       and 'stop_timeout' attributes.  |defaults| are the service manager's
+       settings, used for settings missing in |service_data|."""
+
+    class Process(background.utils.PeerServer.ChildProcess):
+        def __init__(self, service, input_data):
+            limits = service.limits
+            super(Service.Process, self).__init__(
+                service.manager, service.command,
+                stderr=subprocess.STDOUT,
+                preexec_fn=lambda: applyResourceLimits(limits))
+
+            self.__service = service
+            self.__output = None
+            if input_data:
+                self.write(json.dumps(input_data))
+            self.close()
+
+        def handle_input(self, _file, data):
+            self.__output = data
+
+        def destroy(self):
+            super(Service.Process, self).destroy()
+            self.__service.stopped(self.returncode, self.__output)
+
+    def __init__(self, manager, service_data, defaults):
+        self.manager = manager
+        self.name = service_data["name"]
+        self.module = service_data["module"]
+        self.command = [sys.executable, "-m", self.module]
+        self.status_path = service_data["pidfile_path"] + ".status"
+        self.stop_timeout = service_data.get(
+            "stop_timeout", manager.stop_timeout)
+        self.policy = RestartPolicy.fromConfiguration(
+            service_data, defaults)
+        self.limits = getResourceLimits(service_data)
+        self.started = None
+        self.process = None
+        self.stopping = False
+        self.restarts = 0
+        self.restart_timer = None
+        self.kill_timer = None
+        self.last_exit = None
+        self.callbacks = []
+
+    def signal_callbacks(self, event):
+        self.callbacks = filter(lambda callback: callback(event), self.callbacks)
+
+    def cancel_restart(self):
+        if self.restart_timer:
+            self.restart_timer.cancel()
+            self.restart_timer = None
+
+    def start(self, input_data):
+        self.cancel_restart()
+        self.process = Service.Process(self, input_data)
+        self.started = time.time()
+        self.stopping = False
+        self.manager.add_peer(self.process)
+        self.manager.info("%s: started (pid=%d)" % (self.name, self.process.pid))
+        self.input_data = input_data
+        self.signal_callbacks("started")
+
+    def restart(self, callback=None):
+        if callback:
+            self.callbacks.append(callback)
+        self.restarts += 1
+        self.start(self.input_data)
+
+    def stop(self, callback=None):
+        if callback:
+            self.callbacks.append(callback)
+        self.cancel_restart()
+        if self.process:
+            self.manager.info("%s: sending process SIGTERM" % self.name)
+            self.stopping = True
+            self.process.kill(signal.SIGTERM)
+            if not self.kill_timer:
+                process = self.process
+                def kill():
+                    self.kill_timer = None
+                    if self.process is process:
+                        self.manager.warning(
+                            "%s: still running %d seconds after SIGTERM; "
+                            "sending process SIGKILL"
+                            % (self.name, self.stop_timeout))
+                        process.kill(signal.SIGKILL)
+                self.kill_timer = Timer(
+                    self.manager, self.stop_timeout, kill)
+                self.manager.add_peer(self.kill_timer)
+
+    def stopped(self, returncode, output):
+        if self.kill_timer:
+            self.kill_timer.cancel()
+            self.kill_timer = None
+        now = time.time()
+        restart = not self.manager.terminated and not self.manager.restart_requested
+        delay = 0
+        self.last_exit = { "returncode": returncode,
+                           "time": now }
+        if returncode != 0 and not self.stopping:
+            message = "%s: exited with returncode %d" % (self.name, returncode)
+            if output:
+                message += "\n" + background.utils.indent(output)
+            delay = self.policy.crashed(now, now - self.started)
+            if delay is None:
+                message += ("\n  Crashed %d times within %d seconds; "
+                            "not restarting."
+                            % (self.policy.crash_loop_limit,
+                               self.policy.crash_loop_interval))
+                restart = False
+            elif restart and not self.callbacks:
+                message += "\n  Restarting in %d seconds." % delay
+            self.manager.error(message)
+        else:
+            self.manager.info("%s: exited normally" % self.name)
+            if not self.callbacks:
+                restart = False
+        self.process = None
+        self.stopping = False
+        if restart:
+            if self.callbacks or not delay:
+                # Restart explicitly requested; don't wait.
+                self.restart()
+            else:
+                self.restart_timer = Timer(
+                    self.manager, delay, self.restart)
+                self.manager.add_peer(self.restart_timer)
+        else:
+            self.signal_callbacks("stopped")
+
+    def state(self):
+        if self.process:
+            return "stopping" if self.stopping else "running"
+        elif self.restart_timer:
+            return "restarting"
+        elif self.policy.crash_loop:
+            return "crash-loop"
+        else:
+            return "stopped"
+
+    def status(self, child_counts):
+        now = time.time()
+        pid = self.process.pid if self.process else -1
+        if self.process:
+            resources = sampleProcess(
+                pid, child_counts)
+        else:
+            resources = None
+        if self.restart_timer:
+            restart_in = max(0, self.restart_timer.deadline - now)
+        else:
+            restart_in = None
+        return { "module": self.module,
+                 "uptime": now - self.started if self.process else -1,
+                 "pid": pid,
+                 "state": self.state(),
+                 "restarts": self.restarts,
+                 "crashes": self.policy.crashes,
+                 "restart_in": restart_in,
+                 "last_exit": self.last_exit,
+                 "limits": self.limits,
+                 "resources": resources }
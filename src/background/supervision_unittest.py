@@ -0,0 +1,310 @@
+import os
+import signal
+import subprocess
+import sys
+
+# Dummy services used to exercise supervision.
+CRASHING_SERVICE = "import sys; sys.exit(1)"
+LEAKING_SERVICE = """\
+leaked = []
+while True:
+    leaked.append(" " * 1024 ** 2)
+"""
+HANGING_SERVICE = """\
+import subprocess, sys, time
+files = [open("/dev/null") for _ in range(10)]
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+sys.stdout.write("ready\\n")
+sys.stdout.flush()
+time.sleep(60)
+"""
+IGNORING_SERVICE = """\
+import signal, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+open(%r, "w").close()
+time.sleep(60)
+"""
+
+def startDummyService(source, limits={}):
+    import background.supervision
+
+    def preexec():
+        # Start a new process group, so that the service can be killed along
+        # with any processes it starts.
+        os.setpgid(0, 0)
+        background.supervision.applyResourceLimits(limits)
+
+    return subprocess.Popen(
+        [sys.executable, "-c", source],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=preexec)
+
+def createManager(path):
+    import background.utils
+
+    class DummyManager(background.utils.PeerServer):
+        """Service manager stand-in that runs until a condition is met"""
+
+        manage_pidfile = False
+
+        def __init__(self):
+            super(DummyManager, self).__init__(
+                service={ "name": "dummymanager",
+                          "logfile_path": os.path.join(path, "manager.log"),
+                          "pidfile_path": os.path.join(path, "manager.pid"),
+                          "address": os.path.join(path, "manager.socket") },
+                send_administrator_mails=False)
+            self.stop_timeout = 1
+            self.messages = []
+            self.until = None
+            self.startup()
+
+        def error(self, message):
+            self.messages.append(message)
+            super(DummyManager, self).error(message)
+
+        def warning(self, message):
+            self.messages.append(message)
+            super(DummyManager, self).warning(message)
+
+        def peer_destroyed(self, peer):
+            if self.until and self.until():
+                self.terminated = True
+
+        def runUntil(self, until=None, timeout=30):
+            """Run until |until| returns true, or until there are no peers
+               left if a restart has been requested"""
+            def timed_out(signum, frame):
+                raise AssertionError("still running after %d seconds" % timeout)
+            self.until = until
+            self.terminated = False
+            signal.signal(signal.SIGALRM, timed_out)
+            signal.alarm(timeout)
+            try:
+                self.run()
+            finally:
+                signal.alarm(0)
+
+    return DummyManager()
+
+def createService(manager, path, source, **service_data):
+    import background.supervision
+
+    service_data.update({ "name": "dummy",
+                          "module": "dummy",
+                          "pidfile_path": os.path.join(path, "dummy.pid") })
+
+    service = background.supervision.Service(manager, service_data, {})
+    service.command = [sys.executable, "-c", source]
+    service.start(None)
+    return service
+
+def killService(service):
+    if service and service.process:
+        service.process.kill(signal.SIGKILL)
+        service.process.process.wait()
+
+def backoff():
+    import background.supervision
+
+    policy = background.supervision.RestartPolicy(
+        min_delay=1, max_delay=8, stable_uptime=60,
+        crash_loop_limit=6, crash_loop_interval=100)
+
+    # Delay doubles with each crash that happens soon after starting, up to
+    # the maximum delay.
+    assert policy.crashed(0, 0) == 1
+    assert policy.crashed(10, 1) == 2
+    assert policy.crashed(20, 1) == 4
+    assert policy.crashed(30, 1) == 8
+    assert policy.crashed(40, 1) == 8
+
+    # After running for a while, the delay starts over.  Crashes older than
+    # the crash loop interval are forgotten.
+    assert policy.crashed(200, 150) == 1
+    assert not policy.crash_loop
+
+    for now in range(201, 205):
+        assert policy.crashed(now, 0) is not None
+
+    # The sixth crash within 100 seconds means we're in a crash loop.
+    assert policy.crashed(205, 0) is None
+    assert policy.crash_loop
+    assert policy.crashes == 11
+
+    policy.reset()
+    assert not policy.crash_loop
+    assert policy.crashed(206, 0) == 1
+
+    # A real crashing dummy service.
+    process = startDummyService(CRASHING_SERVICE)
+    process.communicate()
+    assert process.returncode == 1
+
+    print "backoff: ok"
+
+def limits():
+    import background.supervision
+
+    assert background.supervision.getResourceLimits(
+        { "name": "dummy", "rlimit_as": 256 * 1024 ** 2, "rlimit_cpu": None }) \
+        == { "rlimit_as": 256 * 1024 ** 2 }
+
+    # A service leaking memory hits its address space limit and crashes,
+    # rather than consuming all memory on the system.
+    process = startDummyService(LEAKING_SERVICE,
+                                { "rlimit_as": 256 * 1024 ** 2 })
+    _, stderr = process.communicate()
+    assert process.returncode != 0
+    assert "MemoryError" in stderr, stderr
+
+    process = startDummyService(
+        "import resource; print resource.getrlimit(resource.RLIMIT_NOFILE)[0]",
+        { "rlimit_nofile": 64 })
+    stdout, _ = process.communicate()
+    assert int(stdout) == 64
+
+    print "limits: ok"
+
+def sampling():
+    import background.supervision
+
+    process = startDummyService(HANGING_SERVICE)
+
+    try:
+        assert process.stdout.readline() == "ready\n"
+
+        sample = background.supervision.sampleProcess(process.pid)
+
+        assert sample["rss"] > 0
+        assert sample["max_rss"] >= sample["rss"]
+        assert sample["cpu"] >= 0
+        # stdin, stdout, stderr and the ten opened files.
+        assert sample["fds"] >= 13, sample
+        assert sample["children"] == 1, sample
+
+        child_counts = background.supervision.getChildCounts()
+        assert child_counts[process.pid] == 1
+        assert background.supervision.sampleProcess(
+            process.pid, child_counts) is not None
+    finally:
+        # Kill the service's child process too.
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+    # No sample for processes that don't exist (anymore.)
+    assert background.supervision.sampleProcess(process.pid) is None
+
+    print "sampling: ok"
+
+def restart():
+    import shutil
+    import tempfile
+
+    path = tempfile.mkdtemp()
+    manager = createManager(path)
+    service = None
+
+    try:
+        service = createService(manager, path, CRASHING_SERVICE,
+                                min_restart_delay=1)
+        exits = []
+
+        def crashed(count):
+            def until():
+                if service.last_exit not in exits:
+                    exits.append(service.last_exit)
+                return len(exits) == count and service.state() == "restarting"
+            return until
+
+        # The crashed service is restarted after a delay, by a timer.
+        manager.runUntil(crashed(1))
+
+        assert service.restarts == 0
+        assert service.restart_timer.deadline >= exits[0]["time"] + 1
+        assert "Restarting in 1 seconds." in manager.messages[-1], \
+            manager.messages
+
+        manager.runUntil(crashed(2))
+
+        assert service.restarts == 1
+        assert service.started >= exits[0]["time"] + 1
+        assert exits[1]["returncode"] == 1
+        assert service.status({})["restart_in"] > 1
+        assert "Restarting in 2 seconds." in manager.messages[-1], \
+            manager.messages
+
+        # Requesting a restart of the manager cancels the pending restart,
+        # rather than waiting for it.
+        manager.requestRestart()
+        service.stop()
+
+        manager.runUntil(timeout=5)
+
+        assert service.restarts == 1
+        assert service.state() == "stopped"
+    finally:
+        killService(service)
+        shutil.rmtree(path)
+
+    print "restart: ok"
+
+def stop():
+    import shutil
+    import tempfile
+    import time
+
+    import background.supervision
+
+    path = tempfile.mkdtemp()
+    manager = createManager(path)
+
+    def ignoringService():
+        ready_path = os.path.join(path, "ready")
+        if os.path.exists(ready_path):
+            os.unlink(ready_path)
+        service = createService(manager, path, IGNORING_SERVICE % ready_path,
+                                stop_timeout=1)
+        while not os.path.exists(ready_path):
+            time.sleep(0.05)
+        return service
+
+    service = None
+
+    try:
+        # A service that ignores SIGTERM is sent SIGKILL once its stop timeout
+        # has passed, and is not restarted.
+        service = ignoringService()
+        stopped_at = time.time()
+        service.stop()
+
+        manager.runUntil(lambda: service.state() == "stopped")
+
+        assert time.time() - stopped_at >= 1
+        assert service.last_exit["returncode"] == -signal.SIGKILL
+        assert service.kill_timer is None
+        assert service.restarts == 0
+        assert any("sending process SIGKILL" in message
+                   for message in manager.messages), manager.messages
+
+        # A requested restart of the manager is held off by timers until they
+        # have fired (or been cancelled.)
+        service = ignoringService()
+        stopped_at = time.time()
+        manager.requestRestart()
+        service.stop()
+
+        fired = []
+        manager.add_peer(background.supervision.Timer(
+            manager, 2, lambda: fired.append(time.time())))
+
+        manager.runUntil()
+
+        assert time.time() - stopped_at >= 2
+        assert fired and fired[0] - stopped_at >= 2
+        assert service.last_exit["returncode"] == -signal.SIGKILL
+        assert service.state() == "stopped"
+    finally:
+        killService(service)
+        shutil.rmtree(path)
+
+    print "stop: ok"
@@ -88,6 +88,7 @@ class BackgroundProcess(object):
         self.__maintenance_hooks = []
         self.__logger = logger
         self.__pidfile_path = service["pidfile_path"]
+        self.__status = { "counters": {} }
         self.__create_pidfile()
 
         signal.signal(signal.SIGHUP, self.__handle_SIGHUP)
@@ -145,6 +146,36 @@ class BackgroundProcess(object):
     def __stopped(self):
         self.info("service stopped")
         self.__delete_pidfile()
+        try: os.unlink(self.__pidfile_path + ".status")
+        except OSError: pass
+
+    def __write_status(self):
+        # Read by the service manager when asked for the status of services.
+        status_path = self.__pidfile_path + ".status"
+        try:
+            with open(status_path + ".tmp", "w") as status_file:
+                status_file.write(json_encode(self.__status))
+            os.rename(status_path + ".tmp", status_path)
+        except EnvironmentError:
+            self.exception(as_warning=True)
+
+    def update_status(self, **values):
+        """Update the service specific status reported by the service manager
+
+           The values must be JSON compatible.  The key "counters" is reserved
+           for counters updated using count()."""
+        assert "counters" not in values
+        self.__status.update(values)
+        self.__write_status()
+
+    def count(self, name, amount=1):
+        """Increment a counter reported by the service manager
+
+           Counters are reported as part of the service's status, and are reset
+           when the service restarts."""
+        counters = self.__status["counters"]
+        counters[name] = counters.get(name, 0) + amount
+        self.__write_status()
 
     def start(self):
         try:
@@ -156,6 +187,7 @@ class BackgroundProcess(object):
                 return 1
 
             self.__signal_started()
+            self.__write_status()
 
             try:
                 return self.run() or 0
@@ -355,7 +387,16 @@ class PeerServer(BackgroundProcess):
                     self.__read_closed[index] = True
                     self.handle_input(readfile, self.__read_data[index])
                     break
-                self.__read_data[index] += read
+                self.__read_data[index] = self.handle_partial_input(
+                    readfile, self.__read_data[index] + read)
+
+        def handle_partial_input(self, _file, data):
+            """Called with the data read so far, before all has been read
+
+               Returns the data not consumed, which is kept and eventually
+               passed to handle_input() along with the rest.  By default, no
+               data is consumed."""
+            return data
 
         def writing_done(self, writing):
             writing.close()
@@ -530,7 +571,9 @@ class PeerServer(BackgroundProcess):
                     else:
                         timeout_seconds = min(timeout_seconds, deadline_seconds)
 
-                if timeout_seconds:
+                # Note: A timeout of zero (a peer deadline that has already
+                # passed) means poll without blocking, not block indefinitely.
+                if timeout_seconds is not None:
                     timeout_ms = timeout_seconds * 1000
                 else:
                     timeout_ms = None
@@ -664,6 +707,9 @@ class JSONJobServer(PeerServer):
                 result = self.request.copy()
                 result["error"] = value
             for client in self.clients: client.add_result(result)
+            self.server.count("jobs_completed")
+            if "error" in result:
+                self.server.count("jobs_failed")
             self.server.request_finished(self, self.request, result)
 
     class JobClient(PeerServer.SocketPeer):
@@ -684,6 +730,9 @@ class JSONJobServer(PeerServer):
         def has_requests(self):
             return bool(self.__pending_requests)
 
+        def pending_count(self):
+            return len(self.__pending_requests)
+
         def get_request(self):
             return self.__pending_requests.pop()
 
@@ -739,6 +788,11 @@ class JSONJobServer(PeerServer):
                 self.add_peer(job)
                 self.request_started(job, request)
 
+        self.update_status(
+            queued=sum(client.pending_count()
+                       for client in self.__clients_with_requests),
+            running=len(self.__started_requests))
+
     def add_requests(self, client):
         assert client.has_requests()
         self.__clients_with_requests.append(client)
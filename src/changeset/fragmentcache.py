@@ -0,0 +1,157 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+
+import os
+import errno
+import time
+import zlib
+import hashlib
+import tempfile
+
+class FragmentCache(object):
+    """Bounded on-disk cache of rendered HTML fragments
+
+       Entries are stored as individual (zlib compressed) files in a directory,
+       named by the SHA-1 of the key components they were rendered from, which
+       makes the cache shared between all WSGI processes running as the Critic
+       system user.  A cache hit updates the entry's modification time, and
+       when the total size of all entries exceeds the configured maximum, the
+       least recently used entries are removed.
+
+       The cache is an optimization only; any file system error simply makes
+       it behave as if the entry in question wasn't cached."""
+
+    TEMPORARY_PREFIX = ".tmp"
+    PRUNED_FILENAME = ".pruned"
+
+    # Minimum number of seconds between automatic pruning of the cache, which
+    # is triggered by adding entries to it.
+    PRUNE_INTERVAL = 10 * 60
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        # A max size of zero (or less) means the cache is disabled.
+        self.max_size = max_size
+
+    def __path(self, key):
+        digest = hashlib.sha1("\0".join(map(str, key))).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def __remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return the cached fragment for |key|, or None
+
+           The |key| argument should be a sequence of values whose string
+           representations together identify everything the fragment depends
+           on."""
+        if self.max_size <= 0:
+            return None
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as entry_file:
+                data = entry_file.read()
+            os.utime(path, None)
+            return zlib.decompress(data)
+        except (IOError, OSError, zlib.error):
+            return None
+
+    def set(self, key, fragment):
+        """Cache the rendered |fragment| (a string) for |key|"""
+        if self.max_size <= 0:
+            return
+        path = self.__path(key)
+        try:
+            section = os.path.dirname(path)
+            try:
+                os.makedirs(section, 0750)
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            fd, temporary_path = tempfile.mkstemp(
+                prefix=FragmentCache.TEMPORARY_PREFIX, dir=section)
+            try:
+                with os.fdopen(fd, "wb") as entry_file:
+                    entry_file.write(zlib.compress(fragment))
+                os.rename(temporary_path, path)
+            except:
+                self.__remove(temporary_path)
+                raise
+        except (IOError, OSError):
+            return
+        self.__maybePrune()
+
+    def __maybePrune(self):
+        path = os.path.join(self.directory, FragmentCache.PRUNED_FILENAME)
+        try:
+            if time.time() - os.stat(path).st_mtime < FragmentCache.PRUNE_INTERVAL:
+                return
+        except OSError:
+            pass
+        try:
+            # Touch the time stamp before pruning, so that concurrent processes
+            # are unlikely to all start pruning at the same time.
+            open(path, "w").close()
+        except IOError:
+            return
+        self.prune()
+
+    def prune(self):
+        """Remove least recently used entries until the cache fits
+
+           Returns the number of removed entries."""
+        now = time.time()
+        entries = []
+        total_size = 0
+        try:
+            sections = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for section in sections:
+            if len(section) != 2:
+                continue
+            section_path = os.path.join(self.directory, section)
+            try:
+                filenames = os.listdir(section_path)
+            except OSError:
+                continue
+            for filename in filenames:
+                path = os.path.join(section_path, filename)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                if filename.startswith(FragmentCache.TEMPORARY_PREFIX):
+                    # Left-overs from processes that died while writing.
+                    if now - status.st_mtime > 60 * 60:
+                        self.__remove(path)
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+                total_size += status.st_size
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            self.__remove(path)
+            total_size -= size
+            removed += 1
+        return removed
@@ -0,0 +1,50 @@
+def basic():
+    import os
+    import shutil
+    import tempfile
+    import time
+
+    from changeset.fragmentcache import FragmentCache
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = FragmentCache(os.path.join(directory, "cache"), 1024 * 1024)
+
+        assert cache.get([1, 2, "style='horizontal'"]) is None
+
+        cache.set([1, 2, "style='horizontal'"], "<table>horizontal</table>")
+        cache.set([1, 2, "style='vertical'"], "<table>vertical</table>")
+
+        assert cache.get([1, 2, "style='horizontal'"]) \
+            == "<table>horizontal</table>"
+        assert cache.get([1, 2, "style='vertical'"]) \
+            == "<table>vertical</table>"
+        assert cache.get([1, 3, "style='vertical'"]) is None
+
+        # A separate cache object (e.g. in another process) shares entries.
+        other = FragmentCache(os.path.join(directory, "cache"), 1024 * 1024)
+        assert other.get([1, 2, "style='vertical'"]) \
+            == "<table>vertical</table>"
+
+        # Nothing is removed while the cache fits.
+        assert cache.prune() == 0
+
+        # When it doesn't, the least recently used entries are removed.
+        small = FragmentCache(os.path.join(directory, "cache"), 1)
+        past = time.time() - 60
+        for index in range(3):
+            cache.set(["prune", index], os.urandom(1024))
+        os.utime(cache._FragmentCache__path(["prune", 0]), (past, past))
+        assert small.prune() > 0
+        assert cache.get(["prune", 0]) is None
+
+        # A max size of zero disables the cache.
+        disabled = FragmentCache(os.path.join(directory, "cache"), 0)
+        disabled.set(["disabled"], "<table></table>")
+        assert cache.get(["disabled"]) is None
+        assert disabled.get([1, 2, "style='horizontal'"]) is None
+    finally:
+        shutil.rmtree(directory)
+
+    print "basic: ok"
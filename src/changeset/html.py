@@ -14,20 +14,24 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import os
 import re
 import itertools
 import urllib
 
 from time import strftime
-from bisect import bisect_right
+from cStringIO import StringIO
 
 import textutils
 import dbutils
 import diff
 import diff.context
 import changeset.utils as changeset_utils
+import changeset.fragmentcache as changeset_fragmentcache
 import reviewing.comment as review_comment
 import htmlutils
+import syntaxhighlight
+import syntaxhighlight.context
 import configuration
 
 from htmlutils import jsify, Generator, Text, HTML, stripStylesheet
@@ -35,34 +39,12 @@ from htmlutils import jsify, Generator, Text, HTML, stripStylesheet
 re_tag = re.compile("<([bi]) class='?([a-z]+)'?>")
 re_tailws = re.compile("^(.*?)(\s+)((?:<[^>]+>)*)$")
 
-class CodeContexts:
-    class Context:
-        def __init__(self, first_line, last_line, description):
-            self.first_line = first_line
-            self.last_line = last_line
-            self.description = description
-
-        def __cmp__(self, index):
-            return cmp(self.first_line, index)
-
-    def __init__(self, db, sha1, first_line, last_line):
-        cursor = db.cursor()
-        cursor.execute("""SELECT first_line, last_line, context
-                            FROM codecontexts
-                           WHERE sha1=%s
-                             AND first_line<=%s
-                             AND last_line>=%s
-                        ORDER BY first_line ASC, last_line DESC""",
-                       (sha1, last_line, first_line))
-        self.contexts = [CodeContexts.Context(first_line, last_line, description) for first_line, last_line, description in cursor]
-
-    def find(self, linenr):
-        index = bisect_right(self.contexts, linenr)
-        if index:
-            context = self.contexts[index - 1]
-            if context.last_line >= linenr:
-                return context.description
-        return None
+# Cache of the user-independent part of rendered file diffs, that is,
+# everything renderFile() outputs.  Comments, and the review state of files,
+# are rendered separately (and client-side) and are applied on top of it.
+RENDERED_FILE_CACHE = changeset_fragmentcache.FragmentCache(
+    os.path.join(configuration.paths.CACHE_DIR, "diffs"),
+    configuration.limits.MAXIMUM_RENDERED_DIFF_CACHE_SIZE)
 
 def expandHTML(db, file, old_offset, new_offset, lines, target):
     if old_offset == 1: where = 'top'
@@ -198,6 +180,48 @@ changeset[parent_index].reviewableFiles = { %s };
     if compact: return re.sub(r"\B\s+\B|\b\s+\B|\B\s+\b", "", data_script).strip()
     else: return data_script.strip()
 
+def renderedFileKey(base_key, file, first_file, options, comment_chains):
+    """Return the RENDERED_FILE_CACHE key for the rendered file, or None
+
+       None is returned if the rendered file can't be cached, which is the case
+       if any of the options is a callback, since we can't know what those
+       add to the output."""
+
+    key = base_key + [file.id, first_file]
+
+    for name, value in sorted(options.items()):
+        if name == "commit":
+            value = value.sha1
+        elif value is not None \
+                and not isinstance(value, (bool, int, long, basestring)):
+            return None
+        key.append("%s=%r" % (name, value))
+
+    # Comment chains affect which lines are included as context, so the
+    # locations of the chains (but nothing else about them) are part of the
+    # key.  In practice, most users see the same set of comment chains.
+    locations = []
+    for chain in comment_chains:
+        if chain.comments:
+            locations.append((chain.lines_by_sha1.get(file.old_sha1),
+                              chain.lines_by_sha1.get(file.new_sha1)))
+    key.append(repr(sorted(locations)))
+
+    return key
+
+def isFullyHighlighted(file):
+    """Return True unless syntax highlighting of the file is still pending
+
+       Files without a recognized language count as fully highlighted."""
+
+    for side, sha1, mode in (("old", file.old_sha1, file.old_mode),
+                             ("new", file.new_sha1, file.new_mode)):
+        if sha1 and sha1 != "0" * 40 and mode != "160000":
+            language = file.getLanguage(use_content=side)
+            if language and not syntaxhighlight.isHighlighted(sha1, language):
+                return False
+    return True
+
 def render(db, target, user, repository, changeset, review=None, review_mode=None,
            context_lines=3, style="horizontal", wrap=True, options={}, parent_index=None):
     addResources(db, user, repository, review, options.get("compact", False),
@@ -223,9 +247,14 @@ table.file > tbody.lines > tr > td.line {
     if review:
         comment_chain_script = ""
 
+        comment_chains_per_file_id = review_comment.loadCommentChainsPerFile(
+            db, review, user,
+            [file for file in changeset.files if file.hasChanges() and not file.wasRemoved()],
+            changeset=changeset, local_comments_only=local_comments_only)
+
         for file in changeset.files:
             if file.hasChanges() and not file.wasRemoved():
-                comment_chains = review_comment.loadCommentChains(db, review, user, file=file, changeset=changeset, local_comments_only=local_comments_only)
+                comment_chains = comment_chains_per_file_id.get(file.id)
                 if comment_chains:
                     comment_chains_per_file[file.path] = comment_chains
 
@@ -253,8 +282,37 @@ table.file > tbody.lines > tr > td.line {
         if limit != 0 and limit < len(changeset.files):
             del local_options["expand"]
 
+    if RENDERED_FILE_CACHE.max_size > 0:
+        base_key = [dbutils.getInstalledSHA1(db),
+                    changeset.id,
+                    repository.id,
+                    review.id if review else None,
+                    context_lines,
+                    changeset.conflicts,
+                    user.getPreference(db, "commit.diff.collapseSimpleHunks"),
+                    configuration.limits.MAXIMUM_ADDED_LINES_RECOGNIZED,
+                    configuration.limits.MAXIMUM_ADDED_LINES_UNRECOGNIZED]
+    else:
+        base_key = None
+
     for index, file in enumerate(changeset.files):
         if file.hasChanges():
+            first_file = index == 0
+
+            if base_key is not None:
+                key = renderedFileKey(
+                    base_key, file, first_file, local_options,
+                    comment_chains_per_file.get(file.path, []))
+            else:
+                key = None
+
+            if key is not None:
+                rendered = RENDERED_FILE_CACHE.get(key)
+                if rendered is not None:
+                    target.innerHTML(rendered)
+                    yield target
+                    continue
+
             if not file.wasRemoved() and not file.isBinaryChanges():
                 file.loadOldLines(True, request_highlight=True)
                 file.loadNewLines(True, request_highlight=True)
@@ -269,7 +327,18 @@ table.file > tbody.lines > tr > td.line {
             else:
                 file.macro_chunks = []
 
-            renderFile(db, target, user, review, file, first_file=index == 0, options=local_options, conflicts=changeset.conflicts, add_resources=False)
+            if key is not None and isFullyHighlighted(file):
+                fragment = htmlutils.Fragment()
+                renderFile(db, Generator(fragment, None), user, review, file, first_file=first_file, options=local_options, conflicts=changeset.conflicts, add_resources=False)
+
+                output = StringIO()
+                fragment.render(output, pretty=False)
+                rendered = output.getvalue()
+
+                RENDERED_FILE_CACHE.set(key, rendered)
+                target.innerHTML(rendered)
+            else:
+                renderFile(db, target, user, review, file, first_file=first_file, options=local_options, conflicts=changeset.conflicts, add_resources=False)
 
             file.clean()
 
@@ -544,9 +613,8 @@ def renderFile(db, target, user, review, file, first_file=False, options={}, con
         else:
             tabify = lambda line: line
 
-        code_contexts = CodeContexts(db, file.new_sha1,
-                                     file.macro_chunks[0].lines[0].new_offset,
-                                     file.macro_chunks[-1].lines[-1].new_offset)
+        code_contexts = syntaxhighlight.context.loadCodeContexts(
+            db, [file.new_sha1])[file.new_sha1]
 
         blocks = [("[%d,%d]" % (macro_chunk.lines[0].new_offset, macro_chunk.lines[-1].new_offset))
                   for macro_chunk in file.macro_chunks]
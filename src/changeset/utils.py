@@ -16,11 +16,11 @@
 
 from subprocess import Popen as process, PIPE
 from sys import argv, stderr, exit
-import re
-from dbutils import find_file, describe_file
+from dbutils import find_file, describe_file, describe_files
 import gitutils
 import syntaxhighlight
 import syntaxhighlight.request
+import syntaxhighlight.context
 from diffutils import expandWithContext
 from htmlutils import htmlify, jsify
 from time import strftime
@@ -201,7 +201,7 @@ def createChangeset(db, user, repository, commit=None, from_commit=None, to_comm
 
                 changesets.append(changeset)
         else:
-            changes = diff.parse.parseDifferences(repository, from_commit=from_commit, to_commit=to_commit, filter_paths=[describe_file(db, file_id) for file_id in filtered_file_ids])[from_commit.sha1]
+            changes = diff.parse.parseDifferences(repository, from_commit=from_commit, to_commit=to_commit, filter_paths=sorted(describe_files(db, filtered_file_ids).values()))[from_commit.sha1]
 
             dbutils.find_files(db, changes)
 
@@ -231,11 +231,4 @@ def createChangeset(db, user, repository, commit=None, from_commit=None, to_comm
     return changesets
 
 def getCodeContext(db, sha1, line, minimized=False):
-    cursor = db.cursor()
-    cursor.execute("SELECT context FROM codecontexts WHERE sha1=%s AND first_line<=%s AND last_line>=%s ORDER BY first_line DESC LIMIT 1", [sha1, line, line])
-    row = cursor.fetchone()
-    if row:
-        context = row[0]
-        if minimized: context = re.sub("\\(.*(?:\\)|...$)", "(...)", context)
-        return context
-    else: return None
+    return syntaxhighlight.context.getCodeContexts(db, [(sha1, line)], minimized)[0]
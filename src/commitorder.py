@@ -0,0 +1,151 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""Ordering of sets of commits
+
+   The functions in this module are shared by the API's commit sets
+   (api.impl.commitset) and the legacy commit sets (log.commitset).  They
+   operate on arbitrary commit objects, and are given the relations between the
+   commits in the set as arguments:
+
+     children: dictionary mapping commits to the set of their children that are
+               members of the set of commits being ordered.  May contain other
+               keys, e.g. for the tails of the set.
+
+     parents:  callable that, given a commit in the set, returns a list of its
+               parents that are also members of the set, in the commit's own
+               order.
+
+   Given a set of n commits, topoOrdered() runs in O(n log n) time.  So does
+   dateOrdered(), plus time proportional to the number of times commits are
+   delayed because their timestamps are more recent than their children's."""
+
+import collections
+
+# Initial spacing of the labels that give the positions of queued commits.
+LABEL_SPACING = 2 ** 32
+
+def dateOrdered(commits, children, parents, timestamp):
+    """Generate commits in descending timestamp order
+
+       The |timestamp| callable is called once per commit to produce its sort
+       key.  Commits are guaranteed to precede their parents, even if the actual
+       timestamp order is the opposite.  A commit that would otherwise precede
+       one of its children is instead emitted immediately after its last
+       remaining child.
+
+       Conceptually, this processes a queue of all commits, initially sorted
+       by timestamp, and moves each commit that has not-yet-emitted children to
+       the position right after the last of them.  (Commits moved to right
+       after the same commit end up in the reverse order of moving.)  The queue
+       is a linked list, in which each commit has an integer label that sorts
+       like its position, so that the last remaining child of a commit is found
+       without searching the queue."""
+
+    ordered = sorted(commits, key=timestamp, reverse=True)
+
+    # Next commit in the queue, per commit.
+    following = {}
+    # Labels of the queued commits.  Emitted commits are removed.
+    labels = {}
+    # Number of children not yet emitted, per commit.
+    remaining = {}
+
+    for index, commit in enumerate(ordered):
+        following[commit] = ordered[index + 1] \
+            if index + 1 < len(ordered) else None
+        labels[commit] = index * LABEL_SPACING
+        remaining[commit] = len(children.get(commit, ()))
+
+    def relabel(anchor):
+        # Spread out the labels of the commits following |anchor| until there
+        # is room for a commit right after it.  The number of commits relabeled
+        # grows with the density of labels, so that relabeling the same area
+        # over and over again is avoided.
+        base = labels[anchor]
+        relabeled = []
+        commit = following[anchor]
+        while commit is not None \
+                and labels[commit] - base <= 2 * (len(relabeled) + 1) ** 2:
+            relabeled.append(commit)
+            commit = following[commit]
+        if commit is None:
+            upper = base + (len(relabeled) + 1) * LABEL_SPACING
+        else:
+            upper = labels[commit]
+        step = (upper - base) // (len(relabeled) + 1)
+        for index, commit in enumerate(relabeled):
+            labels[commit] = base + (index + 1) * step
+
+    first = ordered[0] if ordered else None
+
+    while first is not None:
+        commit = first
+        first = following[commit]
+        if remaining[commit]:
+            anchor = max((child for child in children[commit]
+                          if child in labels),
+                         key=labels.get)
+            after = following[anchor]
+            if after is None:
+                labels[commit] = labels[anchor] + LABEL_SPACING
+            else:
+                if labels[after] - labels[anchor] < 2:
+                    relabel(anchor)
+                labels[commit] = (labels[anchor] + labels[after]) // 2
+            following[anchor] = commit
+            following[commit] = after
+            continue
+        del labels[commit]
+        yield commit
+        for parent in parents(commit):
+            remaining[parent] -= 1
+
+def topoOrdered(commits, head, children, parents, timestamp):
+    """Generate commits reachable from |head| in "topological" order
+
+       Commits are guaranteed to precede their parents, and as far as possible
+       immediately precede their parent.  Of a commit's parents, the one with
+       the oldest timestamp is followed first.
+
+       All commits in the set must be reachable from |head|."""
+
+    remaining = dict((commit, len(children.get(commit, ())))
+                     for commit in commits)
+    included = set()
+    queue = collections.deque([head])
+
+    while queue:
+        commit = queue.popleft()
+        if commit in included:
+            continue
+        if remaining[commit]:
+            # Some descendants of this commit have not yet been emitted; we have
+            # to delay this commit.  It is queued again, at the front, when the
+            # last of its children is emitted, so there's no need to keep it in
+            # the queue until then.  Its children are reached through the rest
+            # of the queue, so assert that it isn't empty.
+            assert queue
+            continue
+        yield commit
+        included.add(commit)
+        commit_parents = parents(commit)
+        for parent in commit_parents:
+            remaining[parent] -= 1
+        queue.extendleft(reversed(
+            sorted((parent for parent in commit_parents
+                    if parent not in included),
+                   key=timestamp)))
@@ -0,0 +1,212 @@
+import random
+import time
+
+class Commit(object):
+    def __init__(self, name, parents, timestamp):
+        self.name = name
+        self.parents = parents
+        self.timestamp = timestamp
+    def __repr__(self):
+        return self.name
+
+class CommitSet(object):
+    def __init__(self, commits):
+        self.commits = set(commits)
+        self.children = {}
+        for commit in self.commits:
+            for parent in commit.parents:
+                self.children.setdefault(parent, set()).add(commit)
+        self.heads = set(commit for commit in self.commits
+                         if not self.children.get(commit))
+
+    def parents(self, commit):
+        return [parent for parent in commit.parents
+                if parent in self.commits]
+
+    def dateOrdered(self):
+        import commitorder
+        return commitorder.dateOrdered(
+            self.commits, self.children, self.parents,
+            lambda commit: commit.timestamp)
+
+    def topoOrdered(self):
+        import commitorder
+        return commitorder.topoOrdered(
+            self.commits, next(iter(self.heads)), self.children, self.parents,
+            lambda commit: commit.timestamp)
+
+    # Straight-forward (but quadratic) reference implementations.
+
+    def referenceDateOrdered(self):
+        queue = sorted(self.commits,
+                       key=lambda commit: commit.timestamp,
+                       reverse=True)
+        included = set()
+
+        while queue:
+            commit = queue.pop(0)
+            if commit in included:
+                continue
+            if commit in self.children:
+                remaining_children = self.children[commit] - included
+                if remaining_children:
+                    queue.insert(max(queue.index(child)
+                                     for child in remaining_children) + 1,
+                                 commit)
+                    continue
+            yield commit
+            included.add(commit)
+
+    def referenceTopoOrdered(self):
+        queue = [next(iter(self.heads))]
+        included = set()
+
+        while queue:
+            commit = queue.pop(0)
+            if commit in included:
+                continue
+            if commit in self.children and self.children[commit] - included:
+                assert queue
+                queue.append(commit)
+                continue
+            yield commit
+            included.add(commit)
+            parents = sorted((parent for parent in commit.parents
+                              if parent in self.commits
+                              and parent not in included),
+                             key=lambda commit: commit.timestamp)
+            queue[:0] = parents
+
+def generate(count, seed, skew=0, merge_probability=0.2):
+    """Generate a random history of |count| commits, returning the last one
+
+       Commit timestamps are increasing, except for a random skew of up to
+       |skew| in either direction."""
+    generator = random.Random(seed)
+    commits = []
+    for index in range(count):
+        parents = []
+        if commits:
+            # Mostly extend one of the most recent commits, to keep the number
+            # of heads down.
+            parents.append(commits[max(0, index - generator.randint(1, 3))])
+            if generator.random() < merge_probability:
+                other = commits[generator.randint(0, index - 1)]
+                if other not in parents:
+                    parents.append(other)
+        timestamp = index * 10 + generator.randint(-skew, skew)
+        commits.append(Commit("c%d" % index, parents, timestamp))
+    # Merge all heads, to make a single-headed set.
+    parents = set(commits)
+    for commit in commits:
+        parents.difference_update(commit.parents)
+    commits.append(Commit("head", sorted(parents, key=commits.index),
+                          count * 10))
+    return commits
+
+def basic():
+    def tostring(commits):
+        return "".join(commit.name for commit in commits)
+
+    # Same history as in api/impl/commitset_unittest.py.
+    commits = {}
+    def commit(name, parents, timestamp):
+        commits[name] = Commit(name, [commits[parent] for parent in parents],
+                               timestamp)
+    commit("X", "", 0)
+    commit("Y", "", 10)
+    commit("A", "X", 20)
+    commit("B", "A", 30)
+    commit("C", "A", 40)
+    commit("D", "C", 50)
+    commit("E", "DB", 60)
+    commit("F", "E", 70)
+    commit("G", "BY", 80)
+    commit("H", "G", 90)
+    commit("I", "H", 100)
+    commit("J", "I", 110)
+    commit("K", "H", 120)
+    commit("M", "FK", 140)
+    commit("N", "M", 150)
+    commit("L", "N", 130)
+
+    from_L = CommitSet(commits[name] for name in "LNMFEDCKHGBA")
+    from_J = CommitSet(commits[name] for name in "JIHGBA")
+
+    assert tostring(from_L.topoOrdered()) == "LNMFEDCKHGBA"
+    assert tostring(from_J.topoOrdered()) == "JIHGBA"
+
+    assert tostring(from_L.dateOrdered()) == "LNMKHGFEDCBA"
+    assert tostring(from_J.dateOrdered()) == "JIHGBA"
+
+    # Compare with the reference implementations on random histories, with
+    # and without clock skew.
+    for seed in range(200):
+        skew = 0 if seed % 2 else 40
+        commitset = CommitSet(generate(60, seed, skew=skew))
+
+        date_ordered = list(commitset.dateOrdered())
+        assert date_ordered == list(commitset.referenceDateOrdered()), seed
+
+        topo_ordered = list(commitset.topoOrdered())
+        assert topo_ordered == list(commitset.referenceTopoOrdered()), seed
+
+        for ordered in (date_ordered, topo_ordered):
+            assert len(ordered) == len(commitset.commits)
+            position = dict((commit, index)
+                            for index, commit in enumerate(ordered))
+            for commit in ordered:
+                for parent in commitset.parents(commit):
+                    assert position[commit] < position[parent]
+
+    # A long history whose timestamps go backwards, so that every commit is
+    # delayed over and over again.
+    commits = []
+    for index in range(300):
+        commits.append(Commit("c%d" % index, commits[-1:], -index))
+    commitset = CommitSet(commits)
+
+    assert list(commitset.dateOrdered()) == commits[::-1]
+    assert list(commitset.referenceDateOrdered()) == commits[::-1]
+    assert list(commitset.topoOrdered()) == commits[::-1]
+
+    print "basic: ok"
+
+def relabeling():
+    import commitorder
+
+    # With minimal spacing between the initial labels, delaying commits means
+    # relabeling the queue most of the time.
+    label_spacing = commitorder.LABEL_SPACING
+    commitorder.LABEL_SPACING = 2
+
+    try:
+        for seed in range(50):
+            commitset = CommitSet(generate(200, seed, skew=3000,
+                                           merge_probability=0.5))
+            assert list(commitset.dateOrdered()) \
+                == list(commitset.referenceDateOrdered()), seed
+    finally:
+        commitorder.LABEL_SPACING = label_spacing
+
+    print "relabeling: ok"
+
+def benchmark():
+    # Not run as part of the test suite; run manually using
+    #
+    #   python -m run_unittest commitorder_unittest.py benchmark
+    #
+    # in the source directory.
+
+    for skew in (0, 40, 2000):
+        commitset = CommitSet(generate(50000, 0, skew=skew))
+
+        for name in ("dateOrdered", "referenceDateOrdered",
+                     "topoOrdered", "referenceTopoOrdered"):
+            before = time.time()
+            count = sum(1 for _ in getattr(commitset, name)())
+            after = time.time()
+            print ("%s: %d commits, skew=%d: %.2f seconds"
+                   % (name, count, skew, after - before))
+
+    print "benchmark: ok"
@@ -24,7 +24,8 @@ from dbutils.user import InvalidUserId, NoSuchUser, User
 from dbutils.review import NoSuchReview, ReviewState, Review
 from dbutils.branch import Branch
 from dbutils.paths import (InvalidFileId, InvalidPath, File, find_file,
-                           find_files, describe_file)
+                           find_files, find_paths, describe_file,
+                           describe_files)
 from dbutils.timezones import (loadTimezones, updateTimezones, sortedTimezones,
                                adjustTimestamp)
 from dbutils.system import (getInstalledSHA1, getURLPrefix,
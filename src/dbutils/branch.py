@@ -185,6 +185,63 @@ class Branch(object):
 
         self.archived = True
 
+    @staticmethod
+    def archiveMultiple(db, repository, branches):
+        """Archive several branches in the same repository
+
+           Unlike calling archive() on each branch, this keeps alive the head
+           commits and deletes the refs of all the branches in a single ref
+           transaction.  Returns the list of branches that were archived."""
+
+        import gitutils
+
+        current_refs = repository.listrefs("refs/heads/")
+        updates = []
+        archived = []
+        # Branches often share head commits, but a ref can only be updated
+        # once per ref transaction.
+        keepalive_sha1s = set()
+
+        for branch in branches:
+            ref_name = "refs/heads/" + branch.name
+
+            try:
+                head = branch.getHead(db)
+            except gitutils.GitReferenceError:
+                # The head commit appears to be missing from the repository.
+                head = None
+
+            if head is None:
+                # Nothing to keep alive; leave the ref alone, like archive().
+                pass
+            elif ref_name not in current_refs:
+                # Branch doesn't exist.  Pretend it's been archived already.
+                keepalive_sha1s.add(head.sha1)
+            elif current_refs[ref_name] != head.sha1:
+                # Branch points to the wrong commit.  Don't delete the ref.
+                continue
+            else:
+                keepalive_sha1s.add(head.sha1)
+                updates.append((ref_name, None, head.sha1))
+
+            archived.append(branch)
+
+        updates.extend((gitutils.KEEPALIVE_REF_PREFIX + sha1, sha1, None)
+                       for sha1 in sorted(keepalive_sha1s))
+
+        repository.updaterefs(updates)
+
+        cursor = db.cursor()
+        cursor.execute("""UPDATE branches
+                             SET archived=TRUE
+                           WHERE id=ANY (%s)""",
+                       ([branch.id for branch in archived],))
+
+        for branch in archived:
+            branch.archived = True
+
+        return archived
+
     def resurrect(self, db):
         self.repository.createref("refs/heads/" + self.name, self.getHead(db))
 
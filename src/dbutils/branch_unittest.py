@@ -0,0 +1,64 @@
+def archivemultiple():
+    import time
+
+    import api
+    import dbutils
+    import gitutils
+
+    critic = api.critic.startSession(for_testing=True)
+
+    class Branch(object):
+        # Stands in for dbutils.Branch, which would need rows in the branches
+        # table.  Only what archiveMultiple() uses is implemented.
+        def __init__(self, branch_id, name, head):
+            self.id = branch_id
+            self.name = name
+            self.head = head
+            self.archived = False
+
+        def getHead(self, db):
+            return self.head
+
+    with dbutils.Database.forTesting(critic) as db:
+        repository = api.repository.fetchAll(critic)[0]._impl.getInternal(
+            critic)
+
+        head = gitutils.Commit.fromSHA1(
+            db, repository, repository.revparse("HEAD"))
+        parent = gitutils.Commit.fromSHA1(db, repository, head.parents[0])
+
+        prefix = "archivemultiple/%d/" % time.time()
+
+        for name in ("same1", "same2", "wrong"):
+            repository.run("update-ref", "refs/heads/" + prefix + name,
+                           head.sha1)
+
+        # Non-existing branch ids, so that no rows are actually updated.
+        branches = [Branch(-1, prefix + "same1", head),
+                    Branch(-2, prefix + "same2", head),
+                    Branch(-3, prefix + "wrong", parent),
+                    Branch(-4, prefix + "missing", parent)]
+
+        # Two branches with the same head means two keepalive updates of the
+        # same ref, unless they are de-duplicated.  The branch that doesn't
+        # point to the expected commit is left alone.
+        archived = dbutils.Branch.archiveMultiple(db, repository, branches)
+
+        assert [branch.name for branch in archived] \
+            == [prefix + "same1", prefix + "same2", prefix + "missing"]
+        assert all(branch.archived for branch in archived)
+
+        assert sorted(repository.listrefs("refs/heads/" + prefix)) \
+            == ["refs/heads/" + prefix + "wrong"]
+
+        keepalive_refs = repository.listrefs(gitutils.KEEPALIVE_REF_PREFIX)
+        for commit in (head, parent):
+            name = gitutils.KEEPALIVE_REF_PREFIX + commit.sha1
+            assert keepalive_refs.get(name) == commit.sha1, name
+
+        repository.updaterefs([("refs/heads/" + prefix + "wrong", None,
+                                head.sha1)])
+
+        db.rollback()
+
+    print "archivemultiple: ok"
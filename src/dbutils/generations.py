@@ -0,0 +1,124 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import threading
+
+# Generation counters and the tables whose modification invalidate them.  Each
+# counter has a row in the 'cachegenerations' table, which is incremented in
+# the same transaction as the modification, so that every process notices the
+# change (by reading the counter) as soon as the modification is committed.
+GENERATIONS = {
+    "accesscontrol": frozenset(["accesscontrolprofiles",
+                                "accesscontrol_http",
+                                "accesscontrol_repositories",
+                                "accesscontrol_extensions",
+                                "useraccesscontrolprofiles",
+                                "labeledaccesscontrolprofiles"]),
+    "extensions": frozenset(["extensions",
+                             "extensionversions",
+                             "extensioninstalls"]),
+    "preferences": frozenset(["preferences",
+                              "userpreferences"])
+}
+
+def affectedGenerations(tables):
+    """Return the names of the generations affected by modifying |tables|"""
+    return set(name for name, generation_tables in GENERATIONS.items()
+               if generation_tables.intersection(tables))
+
+def getGeneration(db, name):
+    """Return the current value of the named generation counter
+
+       All counters are read with a single query the first time one is needed
+       in a transaction, and then remembered until the transaction is committed
+       or rolled back (or bumpGenerations() is called.)  Long-lived sessions
+       thus notice modifications committed by other processes as soon as they
+       start a new transaction."""
+    generations = db.storage["CacheGenerations"]
+    if generations is None:
+        cursor = db.readonly_cursor()
+        cursor.execute("""SELECT name, generation
+                            FROM cachegenerations""")
+        generations = db.storage["CacheGenerations"] = dict(cursor)
+
+        def transactionCallback(event):
+            db.storage["CacheGenerations"] = None
+            return False
+
+        db.registerTransactionCallback(transactionCallback)
+    return generations[name]
+
+def bumpGenerations(db, cursor, tables):
+    """Increment the generation counters affected by modifying |tables|
+
+       The |cursor| should be the cursor used to modify the tables, so that the
+       increment is part of the same transaction.  If it is an updating cursor,
+       it must have been created with 'cachegenerations' as one of its tables.
+
+       Returns true if any generation counter was incremented."""
+    names = affectedGenerations(tables)
+    if not names:
+        return False
+    cursor.execute("""UPDATE cachegenerations
+                         SET generation=generation+1
+                       WHERE name=ANY (%s)""",
+                   (sorted(names),))
+    # Re-read all counters the next time one is needed in this session.
+    db.storage["CacheGenerations"] = None
+    return True
+
+class GenerationCache(object):
+    """Process-wide cache invalidated by a generation counter
+
+       Cached values are shared by all sessions in the process, and are all
+       discarded as soon as a session observes a generation other than the one
+       they were fetched in.  Values must therefore only depend on the contents
+       of the tables associated with the generation counter, and must not be
+       modified by callers."""
+
+    def __init__(self, name, max_size=10000):
+        assert name in GENERATIONS
+        self.name = name
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__generation = None
+        self.__values = {}
+
+    def get(self, db, key, fetch):
+        """Return the cached value for |key|, calling |fetch| on cache miss
+
+           The |fetch| callable is called with no arguments."""
+        generation = getGeneration(db, self.name)
+        with self.__lock:
+            if generation != self.__generation:
+                self.__values.clear()
+                self.__generation = generation
+            elif key in self.__values:
+                return self.__values[key]
+        value = fetch()
+        with self.__lock:
+            # Note: The generation might have changed while we were fetching,
+            # in which case the value is not cached.
+            if generation == self.__generation:
+                if len(self.__values) >= self.max_size:
+                    self.__values.clear()
+                self.__values[key] = value
+        return value
+
+    def clear(self):
+        with self.__lock:
+            self.__values.clear()
+            self.__generation = None
@@ -0,0 +1,98 @@
+def basic():
+    import api
+    import dbutils
+    import dbutils.generations
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+
+    cache = dbutils.generations.GenerationCache("preferences")
+    fetched = []
+
+    def fetch(value):
+        def fetch():
+            fetched.append(value)
+            return value
+        return fetch
+
+    assert cache.get(db, "key", fetch(1)) == 1
+    assert cache.get(db, "key", fetch(2)) == 1
+    assert fetched == [1]
+
+    generation = dbutils.generations.getGeneration(db, "preferences")
+
+    # Modifying unrelated tables doesn't affect the generation.
+    with db.updating_cursor("cachegenerations") as cursor:
+        assert not dbutils.generations.bumpGenerations(
+            db, cursor, ["reviews"])
+
+    assert dbutils.generations.getGeneration(db, "preferences") == generation
+    assert cache.get(db, "key", fetch(3)) == 1
+
+    with db.updating_cursor("cachegenerations") as cursor:
+        assert dbutils.generations.bumpGenerations(
+            db, cursor, ["userpreferences"])
+
+    assert dbutils.generations.getGeneration(db, "preferences") \
+        == generation + 1
+    assert cache.get(db, "key", fetch(4)) == 4
+    assert fetched == [1, 4]
+
+    # Other sessions (e.g. in other processes) observe the new generation.
+    other_critic = api.critic.startSession(for_testing=True)
+    assert dbutils.generations.getGeneration(
+        other_critic.database, "preferences") == generation + 1
+
+    # A bump that is rolled back doesn't affect the generation.
+    try:
+        with db.updating_cursor("cachegenerations") as cursor:
+            dbutils.generations.bumpGenerations(
+                db, cursor, ["accesscontrolprofiles"])
+            raise Exception
+    except Exception:
+        pass
+
+    accesscontrol = dbutils.generations.getGeneration(db, "accesscontrol")
+    assert dbutils.generations.getGeneration(
+        other_critic.database, "accesscontrol") == accesscontrol
+
+    print "basic: ok"
+
+def transactions():
+    import api
+    import dbutils
+    import dbutils.generations
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+
+    other_critic = api.critic.startSession(for_testing=True)
+    other_db = other_critic.database
+
+    generation = dbutils.generations.getGeneration(db, "preferences")
+
+    with other_db.updating_cursor("cachegenerations") as cursor:
+        assert dbutils.generations.bumpGenerations(
+            other_db, cursor, ["userpreferences"])
+
+    # The counters are read once per transaction.
+    assert dbutils.generations.getGeneration(db, "preferences") == generation
+
+    db.commit()
+
+    assert dbutils.generations.getGeneration(db, "preferences") \
+        == generation + 1
+
+    with other_db.updating_cursor("cachegenerations") as cursor:
+        assert dbutils.generations.bumpGenerations(
+            other_db, cursor, ["userpreferences"])
+
+    assert dbutils.generations.getGeneration(db, "preferences") \
+        == generation + 1
+
+    db.rollback()
+
+    assert dbutils.generations.getGeneration(db, "preferences") \
+        == generation + 2
+
+    print "transactions: ok"
@@ -14,9 +14,16 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import collections
+import hashlib
+import threading
+
+import dbaccess
+
 class InvalidFileId(Exception):
     def __init__(self, file_id):
         super(InvalidFileId, self).__init__("Invalid file id: %d" % file_id)
+        self.file_id = file_id
 
 class InvalidPath(Exception):
     pass
@@ -43,36 +50,182 @@ class File(object):
             raise InvalidPath("Path does not exist: %s" % path)
         return File(file_id, path)
 
-def find_file(db, path, insert=True):
-    path = path.lstrip("/")
+# The maximum number of times inserting new paths is attempted, when conflicting
+# with paths inserted by concurrent transactions.
+MAXIMUM_INSERT_ATTEMPTS = 5
+
+# The maximum number of paths cached by each process.
+MAXIMUM_CACHED_PATHS = 50000
 
+# Process-wide cache of rows in the files table, mapping ids to paths (with the
+# least recently used first) and paths to ids.  Rows in the files table are
+# never modified or deleted, so cached entries never become stale.  Rows
+# inserted by the current transaction are kept in the session's
+# storage["Files"] until the transaction is committed, and only then added
+# here, since they are gone if the transaction is rolled back.
+PATH_BY_ID = collections.OrderedDict()
+ID_BY_PATH = {}
+CACHE_LOCK = threading.Lock()
+
+def cache_files(rows):
+    with CACHE_LOCK:
+        for file_id, path in rows:
+            PATH_BY_ID.pop(file_id, None)
+            PATH_BY_ID[file_id] = path
+            ID_BY_PATH[path] = file_id
+        while len(PATH_BY_ID) > MAXIMUM_CACHED_PATHS:
+            _, path = PATH_BY_ID.popitem(last=False)
+            del ID_BY_PATH[path]
+
+def encode_path(path):
+    # Paths are cached and compared as UTF-8 encoded byte strings, so that a
+    # unicode and a str path are treated as the same path.
+    if isinstance(path, unicode):
+        return path.encode("utf-8")
+    return path
+
+def normalize_path(path):
+    """Return |path| in the form it is stored in the files table"""
+    path = encode_path(path).lstrip("/")
     if path.endswith("/"):
         raise InvalidPath("Trailing path separator: %r" % path)
+    return path
+
+def md5(path):
+    return hashlib.md5(encode_path(path)).hexdigest()
+
+def find_paths(db, paths, insert=True):
+    """Return a dictionary mapping each path in |paths| to its file id
+
+       Paths not already in the files table are inserted, or, if |insert| is
+       false, left out of the returned dictionary.  Leading path separators
+       are ignored, and InvalidPath is raised for paths with a trailing path
+       separator.  At most one query is executed to look up paths, and one
+       to insert new paths, plus one to look up the inserted paths' ids."""
+
+    normalized = dict((path, normalize_path(path)) for path in paths)
+    file_ids = find_normalized_paths(db, set(normalized.values()), insert)
+    return dict((path, file_ids[normalized_path])
+                for path, normalized_path in normalized.items()
+                if normalized_path in file_ids)
+
+def find_normalized_paths(db, paths, insert):
+    pending = db.storage["Files"]
+    found = {}
+
+    with CACHE_LOCK:
+        for path in paths:
+            file_id = pending.get(path)
+            if file_id is None:
+                file_id = ID_BY_PATH.get(path)
+                if file_id is None:
+                    continue
+                PATH_BY_ID[file_id] = PATH_BY_ID.pop(file_id)
+            found[path] = file_id
+
+    missing = paths - set(found)
+
+    if not missing:
+        return found
 
     cursor = db.cursor()
-    cursor.execute("SELECT id, path FROM files WHERE MD5(path)=MD5(%s)", (path,))
 
-    row = cursor.fetchone()
+    def lookup(paths):
+        cursor.execute("""SELECT id, path
+                            FROM files
+                           WHERE MD5(path)=ANY (%s)""",
+                       ([md5(path) for path in paths],))
+        rows = [(file_id, encode_path(found_path))
+                for file_id, found_path in cursor]
+        for file_id, found_path in rows:
+            assert found_path in paths, \
+                "MD5 collision in files table: %r" % found_path
+            found[found_path] = file_id
+        return rows
 
-    if row:
-        file_id, found_path = row
-        assert path == found_path, "MD5 collision in files table: %r != %r" % (path, found_path)
-        return file_id
+    cache_files(lookup(missing))
+    missing -= set(found)
 
-    if insert:
-        cursor.execute("INSERT INTO files (path) VALUES (%s) RETURNING id", (path,))
-        return cursor.fetchone()[0]
+    if missing and insert:
+        # If another transaction inserts some of the same paths concurrently,
+        # the conflicting inserts wait for it to finish, and then fail if it
+        # committed.  The inserts are then rolled back to the savepoint and
+        # attempted again, this time skipping the paths the other transaction
+        # inserted; the lookup below finds its rows instead.  (INSERT ... ON
+        # CONFLICT DO NOTHING would do this, but requires PostgreSQL 9.5.)
+        for attempt in range(MAXIMUM_INSERT_ATTEMPTS):
+            cursor.execute("SAVEPOINT find_paths")
+            try:
+                cursor.executemany("""INSERT INTO files (path)
+                                           SELECT %s
+                                            WHERE NOT EXISTS (SELECT 1
+                                                                FROM files
+                                                               WHERE MD5(path)=%s)""",
+                                   [(path, md5(path)) for path in sorted(missing)])
+            except dbaccess.IntegrityError:
+                cursor.execute("ROLLBACK TO SAVEPOINT find_paths")
+                if attempt == MAXIMUM_INSERT_ATTEMPTS - 1:
+                    raise
+            else:
+                cursor.execute("RELEASE SAVEPOINT find_paths")
+                break
 
-    return None
+        if not pending:
+            def transactionCallback(event):
+                if event == "commit":
+                    cache_files((file_id, path)
+                                for path, file_id in pending.items())
+                pending.clear()
+                return False
+
+            db.registerTransactionCallback(transactionCallback)
+
+        pending.update((path, file_id) for file_id, path in lookup(missing))
+
+    return found
+
+def find_file(db, path, insert=True):
+    return find_paths(db, [path], insert).get(path)
 
 def find_files(db, files):
+    file_ids = find_paths(db, [file.path for file in files])
     for file in files:
-        file.id = find_file(db, file.path)
+        file.id = file_ids[file.path]
+
+def describe_files(db, file_ids):
+    """Return a dictionary mapping each file id in |file_ids| to its path
+
+       At most one query is executed, to look up ids not already cached."""
+
+    file_ids = set(file_ids)
+    found = {}
+
+    with CACHE_LOCK:
+        for file_id in file_ids:
+            path = PATH_BY_ID.pop(file_id, None)
+            if path is not None:
+                PATH_BY_ID[file_id] = path
+                found[file_id] = path
+
+    missing = file_ids - set(found)
+
+    if missing:
+        cursor = db.cursor()
+        cursor.execute("SELECT id, path FROM files WHERE id=ANY (%s)",
+                       (sorted(missing),))
+        rows = cursor.fetchall()
+        # Rows inserted by the current transaction are cached once it is
+        # committed.
+        pending = db.storage["Files"]
+        cache_files((file_id, path) for file_id, path in rows
+                    if path not in pending)
+        found.update(rows)
+
+        for file_id in sorted(missing):
+            if file_id not in found:
+                raise InvalidFileId(file_id)
+
+    return found
 
 def describe_file(db, file_id):
-    cursor = db.cursor()
-    cursor.execute("SELECT path FROM files WHERE id=%s", (file_id,))
-    row = cursor.fetchone()
-    if not row:
-        raise InvalidFileId(file_id)
-    return row[0]
+    return describe_files(db, [file_id])[file_id]
@@ -0,0 +1,129 @@
+def paths():
+    import time
+    import api
+    import dbutils
+    import dbutils.paths
+
+    critic = api.critic.startSession(for_testing=True)
+
+    # Use paths that are unique to this run, so that none of them are already
+    # in the files table.
+    prefix = "paths_unittest/%f/" % time.time()
+    committed = [prefix + "committed/%d" % index for index in range(10)]
+    rolled_back = [prefix + "rolled_back/%d" % index for index in range(10)]
+
+    with dbutils.Database.forTesting(critic) as db:
+        assert dbutils.find_paths(db, committed, insert=False) == {}
+
+        file_ids = dbutils.find_paths(db, committed)
+        assert sorted(file_ids.keys()) == sorted(committed)
+        assert len(set(file_ids.values())) == len(committed)
+
+        # Not cached process-wide until the transaction is committed.
+        assert committed[0] not in dbutils.paths.ID_BY_PATH
+        assert dbutils.find_paths(db, committed) == file_ids
+
+        db.commit()
+
+        assert dbutils.paths.ID_BY_PATH[committed[0]] == file_ids[committed[0]]
+
+        paths = dbutils.describe_files(db, file_ids.values())
+        assert paths == dict((file_id, path)
+                             for path, file_id in file_ids.items())
+
+        dbutils.find_paths(db, rolled_back)
+        db.rollback()
+
+        assert rolled_back[0] not in dbutils.paths.ID_BY_PATH
+        assert dbutils.find_paths(db, rolled_back, insert=False) == {}
+
+        # Check that the cached ids are the right ones.
+        dbutils.paths.PATH_BY_ID.clear()
+        dbutils.paths.ID_BY_PATH.clear()
+
+        assert dbutils.find_paths(db, committed, insert=False) == file_ids
+
+        max_file_id = max(file_ids.values())
+
+        try:
+            dbutils.describe_files(db, [max_file_id, max_file_id + 1000000])
+        except dbutils.InvalidFileId as error:
+            assert error.file_id == max_file_id + 1000000
+        else:
+            assert False, "InvalidFileId not raised"
+
+    print "paths: ok"
+
+def normalization():
+    import time
+    import api
+    import dbutils
+
+    critic = api.critic.startSession(for_testing=True)
+
+    prefix = "paths_unittest/%f/" % time.time()
+
+    with dbutils.Database.forTesting(critic) as db:
+        # Leading path separators are ignored, and str and unicode paths are
+        # the same path.
+        path = prefix + "\xc3\xa5"
+        file_ids = dbutils.find_paths(
+            db, [path, "/" + path, path.decode("utf-8")])
+        assert len(file_ids) == 3
+        assert len(set(file_ids.values())) == 1
+
+        assert dbutils.find_file(db, "//" + path) == file_ids[path]
+        assert dbutils.describe_file(db, file_ids[path]) == path
+
+        db.commit()
+
+        for path in [prefix, prefix + "dir/"]:
+            try:
+                dbutils.find_file(db, path)
+            except dbutils.InvalidPath:
+                pass
+            else:
+                assert False, "InvalidPath not raised for %r" % path
+
+    print "normalization: ok"
+
+def concurrent():
+    import threading
+    import time
+    import api
+    import dbutils
+
+    critic = api.critic.startSession(for_testing=True)
+
+    prefix = "paths_unittest/%f/" % time.time()
+    shared = prefix + "shared"
+    other = prefix + "other"
+
+    with dbutils.Database.forTesting(critic) as first_db:
+        with dbutils.Database.forTesting(critic) as second_db:
+            file_id = dbutils.find_file(first_db, shared)
+
+            file_ids = {}
+
+            def insert():
+                file_ids.update(dbutils.find_paths(second_db, [shared, other]))
+
+            # The second insert of |shared| blocks until the first transaction
+            # is committed, then fails, and is attempted again.
+            thread = threading.Thread(target=insert)
+            thread.start()
+
+            time.sleep(1)
+            first_db.commit()
+
+            thread.join()
+
+            assert file_ids[shared] == file_id
+            assert file_ids[other] != file_id
+
+            second_db.commit()
+
+            assert dbutils.find_paths(first_db, [other], insert=False) \
+                == { other: file_ids[other] }
+
+    print "concurrent: ok"
@@ -572,14 +572,18 @@ class Review(object):
         db.cursor().execute("UPDATE trackedbranches SET disabled=TRUE WHERE repository=%s AND local_name=%s", (self.repository.id, self.branch.name))
 
     def setSummary(self, db, summary):
+        import reviewing.searchindex
         self.serial += 1
         self.summary = summary
         db.cursor().execute("UPDATE reviews SET summary=%s, serial=%s WHERE id=%s", [self.summary, self.serial, self.id])
+        reviewing.searchindex.replaceInIndex(db.cursor(), self.id, "summary", [self.summary])
 
     def setDescription(self, db, description):
+        import reviewing.searchindex
         self.serial += 1
         self.description = description
         db.cursor().execute("UPDATE reviews SET description=%s, serial=%s WHERE id=%s", [self.description, self.serial, self.id])
+        reviewing.searchindex.replaceInIndex(db.cursor(), self.id, "description", [self.description])
 
     def addOwner(self, db, owner):
         if not owner in self.owners:
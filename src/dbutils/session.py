@@ -23,7 +23,10 @@ class Session(object):
                          "User": {},
                          "Commit": {},
                          "CommitUserTime": {},
-                         "Timezones": {} }
+                         "Timezones": {},
+                         "CodeContexts": {},
+                         "Files": {},
+                         "CacheGenerations": None }
         self.profiling = {}
 
         self.__user = None
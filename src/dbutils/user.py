@@ -16,6 +16,7 @@
 
 import os
 import base
+import dbutils.generations
 
 def _preferenceCacheKey(item, repository, filter_id):
     cache_key = item
@@ -25,6 +26,9 @@ def _preferenceCacheKey(item, repository, filter_id):
         cache_key += ":r%d" % repository.id
     return cache_key
 
+# Process-wide cache of preference values.
+_PREFERENCES = dbutils.generations.GenerationCache("preferences")
+
 class InvalidUserId(base.Error):
     def __init__(self, user_id):
         super(InvalidUserId, self).__init__("Invalid user id: %d" % user_id)
@@ -88,29 +92,50 @@ class User(object):
 
     def loadPreferences(self, db):
         if not self.preferences:
-            cursor = db.cursor()
-            cursor.execute("""SELECT uid, item, type, integer, string
-                                FROM preferences
-                                JOIN userpreferences USING (item)
-                               WHERE (uid=%s OR uid IS NULL)
-                                 AND repository IS NULL
-                                 AND filter IS NULL""",
-                           (self.id,))
-
-            rows = sorted(cursor, key=lambda row: row[0], reverse=True)
-
-            for _, item, preference_type, integer, string in rows:
-                cache_key = _preferenceCacheKey(item, None, None)
-                if cache_key not in self.preferences:
-                    if preference_type == "boolean":
-                        self.preferences[cache_key] = bool(integer)
-                    elif preference_type == "integer":
-                        self.preferences[cache_key] = integer
-                    else:
-                        self.preferences[cache_key] = string
+            preferences = _PREFERENCES.get(
+                db, ("load", self.id), lambda: User.__loadPreferences(db, self))
+            self.preferences.update(preferences)
+
+    @staticmethod
+    def __loadPreferences(db, user):
+        cursor = db.cursor()
+        cursor.execute("""SELECT uid, item, type, integer, string
+                            FROM preferences
+                            JOIN userpreferences USING (item)
+                           WHERE (uid=%s OR uid IS NULL)
+                             AND repository IS NULL
+                             AND filter IS NULL""",
+                       (user.id,))
+
+        rows = sorted(cursor, key=lambda row: row[0], reverse=True)
+        preferences = {}
+
+        for _, item, preference_type, integer, string in rows:
+            cache_key = _preferenceCacheKey(item, None, None)
+            if cache_key not in preferences:
+                if preference_type == "boolean":
+                    preferences[cache_key] = bool(integer)
+                elif preference_type == "integer":
+                    preferences[cache_key] = integer
+                else:
+                    preferences[cache_key] = string
+
+        return preferences
 
     @staticmethod
     def fetchPreference(db, item, user=None, repository=None, filter_id=None):
+        if user is not None and not user.isAnonymous():
+            user_id = user.id
+        else:
+            user_id = None
+        repository_id = repository.id if repository is not None else None
+        return _PREFERENCES.get(
+            db, ("fetch", item, user_id, repository_id, filter_id),
+            lambda: User.__fetchPreference(
+                db, item, user, repository, filter_id))
+
+    @staticmethod
+    def __fetchPreference(db, item, user, repository, filter_id):
         cursor = db.cursor()
         cursor.execute("SELECT type FROM preferences WHERE item=%s", (item,))
         row = cursor.fetchone()
@@ -232,6 +257,8 @@ class User(object):
                                        VALUES (%s, %s, %s, %s, %s, %s)""",
                                (item, user_id, repository_id, filter_id, integer, string))
 
+            dbutils.generations.bumpGenerations(db, cursor, ["userpreferences"])
+
             if user is not None:
                 cache_key = _preferenceCacheKey(item, repository, filter_id)
                 if cache_key in user.preferences:
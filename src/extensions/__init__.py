@@ -24,5 +24,6 @@ def getExtensionInstallPath(sha1):
     return os.path.join(configuration.extensions.INSTALL_DIR, sha1)
 
 import manifest
+import registry
 import extension
 import resource
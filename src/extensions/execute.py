@@ -18,6 +18,7 @@ import errno
 import os
 import socket
 import subprocess
+import threading
 import time
 
 import configuration
@@ -58,8 +59,13 @@ class ProcessFailure(ProcessException):
         self.returncode = returncode
         self.stderr = stderr
 
-def executeProcess(db, manifest, role_name, script, function, extension_id,
+def prepareProcess(db, manifest, role_name, script, function, extension_id,
                    user_id, argv, timeout, stdin=None, rlimit_rss=256):
+    """Check access and prepare a request for the extension runner service
+
+       The returned request is passed to runProcess(), which doesn't access
+       the database, and can thus be called from any thread."""
+
     # If |user_id| is not the same as |db.user|, then one user's access of the
     # system is triggering an extension on behalf of another user.  This will
     # for instance happen when one user is adding changes to a review,
@@ -118,6 +124,13 @@ def executeProcess(db, manifest, role_name, script, function, extension_id,
     if stdin is not None:
         stdin_data += stdin
 
+    return { "stdin": stdin_data,
+             "flavor": flavor,
+             "timeout": timeout }
+
+def runProcess(request):
+    timeout = request["timeout"]
+
     # Double the timeout. Timeouts are primarily handled by the extension runner
     # service, which returns an error response on timeout. This deadline here is
     # thus mostly to catch the extension runner service itself timing out.
@@ -127,11 +140,7 @@ def executeProcess(db, manifest, role_name, script, function, extension_id,
         connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         connection.settimeout(max(0, deadline - time.time()))
         connection.connect(configuration.services.EXTENSIONRUNNER["address"])
-        connection.sendall(json_encode({
-            "stdin": stdin_data,
-            "flavor": flavor,
-            "timeout": timeout
-        }))
+        connection.sendall(json_encode(request))
         connection.shutdown(socket.SHUT_WR)
 
         data = ""
@@ -169,3 +178,40 @@ def executeProcess(db, manifest, role_name, script, function, extension_id,
         raise ProcessFailure(data["returncode"], data["stderr"])
 
     return data["stdout"]
+
+def runProcesses(requests):
+    """Run the processes requested by |requests| concurrently
+
+       Returns a list containing, for each request, either the output of the
+       process or the exception raised by runProcess().  Each process is
+       subject to its own timeout, so the total time is bounded by the longest
+       timeout rather than by the sum of them."""
+
+    results = [None] * len(requests)
+
+    def run(index, request):
+        try:
+            results[index] = runProcess(request)
+        except Exception as error:
+            results[index] = error
+
+    if len(requests) == 1:
+        run(0, requests[0])
+        return results
+
+    threads = [threading.Thread(target=run, args=(index, request))
+               for index, request in enumerate(requests)]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results
+
+def executeProcess(db, manifest, role_name, script, function, extension_id,
+                   user_id, argv, timeout, stdin=None, rlimit_rss=256):
+    return runProcess(prepareProcess(
+        db, manifest, role_name, script, function, extension_id, user_id, argv,
+        timeout, stdin, rlimit_rss))
@@ -22,7 +22,7 @@ import dbutils
 import htmlutils
 
 from extensions.manifest import Manifest, ManifestError
-from extensions import getExtensionInstallPath
+from extensions import getExtensionInstallPath, registry
 
 class ExtensionError(Exception):
     def __init__(self, message, extension=None):
@@ -39,7 +39,8 @@ class Extension(object):
 
         self.__author_name = author_name
         self.__extension_name = extension_name
-        self.__manifest = {}
+        # Manifest of the live version.
+        self.__manifest = None
 
         if author_name:
             try:
@@ -114,60 +115,56 @@ class Extension(object):
         return self.__path
 
     def getVersions(self):
-        import configuration
-
-        try:
-            output = subprocess.check_output(
-                [configuration.executables.GIT, "for-each-ref",
-                 "--format=%(refname)", "refs/heads/version/"],
-                stderr=subprocess.STDOUT, cwd=self.__path)
-        except subprocess.CalledProcessError:
-            # Not a git repository => no versions (except "Live").
-            return []
-
-        versions = []
-        for ref in output.splitlines():
-            if ref.startswith("refs/heads/version/"):
-                versions.append(ref[len("refs/heads/version/"):])
-        return versions
+        return sorted(registry.getVersionRefs(self.__path))
 
     def getManifest(self, version=None, sha1=None):
         import configuration
 
-        path = self.__path
-        source = None
-
         if sha1 is not None:
-            if sha1 in self.__manifest:
-                return self.__manifest[sha1]
-
-            install_path = getExtensionInstallPath(sha1)
-            with open(os.path.join(install_path, "MANIFEST")) as manifest_file:
-                source = manifest_file.read()
-
-            path = "<snapshot of commit %s>" % sha1[:8]
-        elif version in self.__manifest:
-            return self.__manifest[version]
-
-        if source is None and version is not None:
-            source = subprocess.check_output(
-                [configuration.executables.GIT, "cat-file", "blob",
-                 "version/%s:MANIFEST" % version],
-                cwd=self.__path)
-
-        manifest = Manifest(path, source)
-        manifest.read()
-
-        if sha1 is not None:
-            self.__manifest[sha1] = manifest
-        else:
-            self.__manifest[version] = manifest
-
-        return manifest
+            def load():
+                install_path = getExtensionInstallPath(sha1)
+                with open(os.path.join(install_path, "MANIFEST")) as manifest_file:
+                    source = manifest_file.read()
+
+                manifest = Manifest("<snapshot of commit %s>" % sha1[:8], source)
+                manifest.read()
+                return manifest
+
+            # The snapshot of a commit never changes, so its manifest can be
+            # shared by all Extension objects in the process.
+            return registry.getVersionData(("snapshot", sha1), load)
+
+        if version is not None:
+            def load():
+                source = subprocess.check_output(
+                    [configuration.executables.GIT, "cat-file", "blob",
+                     "version/%s:MANIFEST" % version],
+                    cwd=self.__path)
+
+                manifest = Manifest(self.__path, source)
+                manifest.read()
+                return manifest
+
+            # Versions are branches, so cache the manifest by the commit the
+            # branch currently references.
+            return registry.getVersionData(
+                ("version", self.__path, version, self.getCurrentSHA1(version)),
+                load)
+
+        if self.__manifest is None:
+            manifest = Manifest(self.__path)
+            manifest.read()
+            self.__manifest = manifest
+
+        return self.__manifest
 
     def getCurrentSHA1(self, version):
         import configuration
 
+        sha1 = registry.getVersionRefs(self.__path).get(version)
+        if sha1 is not None:
+            return sha1
+
         return subprocess.check_output(
             [configuration.executables.GIT, "rev-parse", "--verify",
              "version/%s" % version],
@@ -267,13 +264,7 @@ class Extension(object):
 
     @staticmethod
     def fromId(db, extension_id):
-        cursor = db.cursor()
-        cursor.execute("""SELECT users.name, extensions.name
-                            FROM extensions
-                 LEFT OUTER JOIN users ON (users.id=extensions.author)
-                           WHERE extensions.id=%s""",
-                       (extension_id,))
-        row = cursor.fetchone()
+        row = registry.getExtensionName(db, extension_id)
         if not row:
             raise ExtensionError("Invalid extension id: %d" % extension_id)
         author_name, extension_name = row
@@ -293,38 +284,12 @@ class Extension(object):
 
         The list of installs is ordered by precedence; most significant install
         first, least significant install last.
+
+        The installs are cached by the extension registry, so this is normally
+        just a dictionary lookup.
         """
 
-        cursor = db.cursor()
-        cursor.execute("""SELECT extensioninstalls.id, extensioninstalls.extension,
-                                 extensionversions.id, extensionversions.sha1,
-                                 extensioninstalls.uid IS NULL
-                            FROM extensioninstalls
-                 LEFT OUTER JOIN extensionversions ON (extensionversions.id=extensioninstalls.version)
-                           WHERE uid=%s OR uid IS NULL
-                        ORDER BY uid NULLS FIRST""",
-                       (user.id if user else None,))
-
-        install_per_extension = {}
-
-        # Since we ordered by 'uid' with nulls ("universal installs") first,
-        # we'll overwrite universal installs with per-user installs, as intended.
-        for install_id, extension_id, version_id, version_sha1, is_universal in cursor:
-            install_per_extension[extension_id] = (install_id, version_id,
-                                                   version_sha1, is_universal)
-
-        installs = [(install_id, extension_id, version_id, version_sha1, is_universal)
-                    for extension_id, (install_id, version_id, version_sha1, is_universal)
-                    in install_per_extension.items()]
-
-        # Sort installs by install id, higher first.  This means a later install
-        # takes precedence over an earlier, if they both handle the same path.
-        installs.sort(reverse=True)
-
-        # Drop the install_id; it is not relevant past this point.
-        return [(extension_id, version_id, version_sha1, is_universal)
-                for _, extension_id, version_id, version_sha1, is_universal
-                in installs]
+        return list(registry.getInstalls(db, user.id if user else None))
 
     @staticmethod
     def getUpdatedExtensions(db, user):
@@ -365,25 +330,38 @@ class Extension(object):
                         os.access(manifest_path, os.R_OK)):
                     continue
 
-                extensions.append(Extension(user_name, extension_name))
+                extensions.append((user_name, extension_name))
 
             return extensions
 
-        extensions = search(None, configuration.extensions.SYSTEM_EXTENSIONS_DIR)
+        def scan():
+            extensions = search(None, configuration.extensions.SYSTEM_EXTENSIONS_DIR)
 
-        if configuration.extensions.USER_EXTENSIONS_DIR:
-            cursor = db.cursor()
-            cursor.execute("SELECT name FROM users WHERE status!='retired' ORDER BY name ASC")
+            if configuration.extensions.USER_EXTENSIONS_DIR:
+                cursor = db.cursor()
+                cursor.execute("SELECT name FROM users WHERE status!='retired' ORDER BY name ASC")
 
-            for (user_name,) in cursor:
-                try:
-                    pwd_entry = pwd.getpwnam(user_name)
-                except KeyError:
-                    continue
+                for (user_name,) in cursor:
+                    try:
+                        pwd_entry = pwd.getpwnam(user_name)
+                    except KeyError:
+                        continue
 
-                user_dir = os.path.join(
-                    pwd_entry.pw_dir, configuration.extensions.USER_EXTENSIONS_DIR)
+                    user_dir = os.path.join(
+                        pwd_entry.pw_dir, configuration.extensions.USER_EXTENSIONS_DIR)
 
-                extensions.extend(search(user_name, user_dir))
+                    extensions.extend(search(user_name, user_dir))
+
+            return extensions
+
+        extensions = []
+
+        for user_name, extension_name in registry.findExtensions(db, scan):
+            try:
+                extensions.append(Extension(user_name, extension_name))
+            except ExtensionError:
+                # The extension directory was removed or made inaccessible
+                # since the search.
+                continue
 
         return extensions
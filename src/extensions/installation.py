@@ -15,6 +15,7 @@
 # the License.
 
 import auth
+import dbutils.generations
 
 from extensions.extension import Extension, ExtensionError
 
@@ -120,6 +121,9 @@ def doInstallExtension(db, user, extension, version):
                            VALUES (%s, %s, %s)""",
                    (user_id, extension_id, version_id))
 
+    # Make other processes reload their cached extension installs.
+    dbutils.generations.bumpGenerations(db, cursor, ["extensioninstalls"])
+
 def doUninstallExtension(db, user, extension):
     extension_id = extension.getExtensionID(db)
 
@@ -139,6 +143,8 @@ def doUninstallExtension(db, user, extension):
                                   AND extension=%s""",
                        (extension_id,))
 
+    dbutils.generations.bumpGenerations(db, cursor, ["extensioninstalls"])
+
 def getExtension(author_name, extension_name):
     """Create an Extension object ignoring whether it is valid"""
     try:
@@ -95,6 +95,10 @@ class PageRole(URLRole):
 class InjectRole(URLRole):
     def __init__(self, location, pattern):
         URLRole.__init__(self, location, pattern)
+        self.cached = False
+        self.cached_per_user = False
+        self.cached_per_path = False
+        self.cached_max_age = None
 
     def name(self):
         return "Inject"
@@ -103,7 +107,19 @@ class InjectRole(URLRole):
         if Role.process(self, name, value, location):
             return True
         if name == "cached":
-            # Ignored for compatibility with extensions that use it.
+            if value.lower() in ("true", "yes", "false", "no"):
+                # Ignored for compatibility with extensions that use it.
+                return True
+            for item in re.split(r"[\s,]+", value.strip().lower()):
+                if item == "user":
+                    self.cached_per_user = True
+                elif item == "path":
+                    self.cached_per_path = True
+                elif item.isdigit() and int(item) > 0:
+                    self.cached_max_age = int(item)
+                else:
+                    raise ManifestError("%s: manifest error: invalid 'cached' value %r: expected 'user', 'path' and/or a number of seconds" % (location, item))
+            self.cached = True
             return True
         return False
 
@@ -118,10 +134,23 @@ class InjectRole(URLRole):
 class ProcessCommitsRole(Role):
     def __init__(self, location):
         Role.__init__(self, location)
+        self.synchronous = False
 
     def name(self):
         return "ProcessCommits"
 
+    def process(self, name, value, location):
+        if Role.process(self, name, value, location):
+            return True
+        if name == "synchronous":
+            value = value.lower()
+            if value in ("true", "yes"):
+                self.synchronous = True
+            elif value not in ("false", "no"):
+                raise ManifestError("%s: manifest error: valid values for 'synchronous' are 'true'/'yes' and 'false'/'no'" % location)
+            return True
+        return False
+
     def install(self, db, version_id):
         role_id = Role.install(self, db, version_id)
         cursor = db.cursor()
@@ -0,0 +1,304 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import collections
+import os
+import subprocess
+import threading
+import time
+
+import dbutils.generations
+
+# Extension installs and extension ids, shared by all sessions in the process.
+# Invalidated via the "extensions" generation counter, which is bumped by
+# doInstallExtension() and doUninstallExtension().
+INSTALLS = dbutils.generations.GenerationCache("extensions")
+
+# The maximum number of extension versions whose manifests and roles are cached
+# by each process.
+MAXIMUM_CACHED_VERSIONS = 1000
+
+# Manifests and roles of extension versions, keyed by version SHA-1 or version
+# id, least recently used first.  Neither ever changes once the version has
+# been installed, so cached entries never become stale.
+VERSIONS = collections.OrderedDict()
+VERSIONS_LOCK = threading.Lock()
+
+# The maximum age, in seconds, of the list of extensions returned by
+# findExtensions().  Extensions are added and removed by creating or deleting
+# directories, which doesn't bump any generation counter.
+MAXIMUM_SCAN_AGE = 30
+
+SCAN_LOCK = threading.Lock()
+SCAN = { "generation": None, "timestamp": None, "extensions": None }
+
+# Version refs of extension repositories, mapping extension paths to (signature,
+# refs) tuples.  See getVersionRefs().
+REFS = {}
+REFS_LOCK = threading.Lock()
+
+class VersionRoles(object):
+    def __init__(self):
+        self.page = []
+        self.inject = []
+        self.processcommits = []
+
+def getVersionData(key, fetch):
+    """Return the cached version data for |key|, calling |fetch| on cache miss
+
+       Exceptions raised by |fetch| are propagated, and nothing is cached."""
+    with VERSIONS_LOCK:
+        try:
+            value = VERSIONS.pop(key)
+        except KeyError:
+            pass
+        else:
+            VERSIONS[key] = value
+            return value
+    value = fetch()
+    with VERSIONS_LOCK:
+        VERSIONS[key] = value
+        while len(VERSIONS) > MAXIMUM_CACHED_VERSIONS:
+            VERSIONS.popitem(last=False)
+    return value
+
+def getInstalls(db, user_id):
+    """Return a tuple of the extension installs in effect for a user
+
+       See Extension.getInstalls() for a description of the returned value."""
+
+    def fetch_all():
+        cursor = db.readonly_cursor()
+        cursor.execute("""SELECT extensioninstalls.id, extensioninstalls.uid,
+                                 extensioninstalls.extension,
+                                 extensionversions.id, extensionversions.sha1
+                            FROM extensioninstalls
+                 LEFT OUTER JOIN extensionversions ON (extensionversions.id=extensioninstalls.version)""")
+        return tuple(cursor)
+
+    def fetch():
+        installs = INSTALLS.get(db, "installs", fetch_all)
+        install_per_extension = {}
+
+        # Process universal installs first, so that they are overwritten by
+        # per-user installs, as intended.
+        for universal in (True, False):
+            for (install_id, install_uid, extension_id,
+                 version_id, version_sha1) in installs:
+                if universal:
+                    if install_uid is not None:
+                        continue
+                elif install_uid is None or install_uid != user_id:
+                    continue
+                install_per_extension[extension_id] = (
+                    install_id, version_id, version_sha1, universal)
+
+        # Sort installs by install id, higher first.  This means a later
+        # install takes precedence over an earlier, if they both handle the
+        # same path.
+        return tuple(
+            (extension_id, version_id, version_sha1, is_universal)
+            for _, extension_id, version_id, version_sha1, is_universal
+            in sorted(((install_id, extension_id, version_id, version_sha1,
+                        is_universal)
+                       for extension_id, (install_id, version_id,
+                                          version_sha1, is_universal)
+                       in install_per_extension.items()),
+                      reverse=True))
+
+    return INSTALLS.get(db, ("installs", user_id), fetch)
+
+def getExtensionName(db, extension_id):
+    """Return (author_name, extension_name) for the identified extension
+
+       The author name is None for system extensions.  Returns None if there
+       is no such extension."""
+
+    def fetch():
+        cursor = db.readonly_cursor()
+        cursor.execute("""SELECT users.name, extensions.name
+                            FROM extensions
+                 LEFT OUTER JOIN users ON (users.id=extensions.author)
+                           WHERE extensions.id=%s""",
+                       (extension_id,))
+        return cursor.fetchone()
+
+    return INSTALLS.get(db, ("extension", extension_id), fetch)
+
+def getRoles(db, version_ids):
+    """Return a dictionary mapping version ids to VersionRoles objects
+
+       All versions whose roles are not already cached are fetched using a
+       single query."""
+
+    roles = {}
+    missing = []
+
+    with VERSIONS_LOCK:
+        for version_id in version_ids:
+            key = ("roles", version_id)
+            try:
+                value = VERSIONS.pop(key)
+            except KeyError:
+                missing.append(version_id)
+            else:
+                VERSIONS[key] = roles[version_id] = value
+
+    if missing:
+        fetched = dict((version_id, VersionRoles()) for version_id in missing)
+
+        cursor = db.readonly_cursor()
+        cursor.execute("""SELECT extensionroles.version, extensionroles.script,
+                                 extensionroles.function,
+                                 extensionpageroles.path,
+                                 extensioninjectroles.path,
+                                 extensionprocesscommitsroles.role IS NOT NULL
+                            FROM extensionroles
+                 LEFT OUTER JOIN extensionpageroles
+                                 ON (extensionpageroles.role=extensionroles.id)
+                 LEFT OUTER JOIN extensioninjectroles
+                                 ON (extensioninjectroles.role=extensionroles.id)
+                 LEFT OUTER JOIN extensionprocesscommitsroles
+                                 ON (extensionprocesscommitsroles.role=extensionroles.id)
+                           WHERE extensionroles.version=ANY (%s)
+                        ORDER BY extensionroles.id ASC""",
+                       (missing,))
+
+        for (version_id, script, function, page_path, inject_path,
+             is_processcommits) in cursor:
+            version_roles = fetched[version_id]
+            if page_path is not None:
+                version_roles.page.append((script, function, page_path))
+            if inject_path is not None:
+                version_roles.inject.append((script, function, inject_path))
+            if is_processcommits:
+                version_roles.processcommits.append((script, function))
+
+        with VERSIONS_LOCK:
+            for version_id, version_roles in fetched.items():
+                VERSIONS[("roles", version_id)] = roles[version_id] \
+                    = version_roles
+            while len(VERSIONS) > MAXIMUM_CACHED_VERSIONS:
+                VERSIONS.popitem(last=False)
+
+    return roles
+
+def getInstalledManifest(sha1):
+    """Return the manifest of the installed snapshot of a version
+
+       This is the manifest extension processes are started with, whose path
+       is the snapshot's directory."""
+
+    from extensions import getExtensionInstallPath
+    from extensions.manifest import Manifest
+
+    return getVersionData(
+        ("manifest", sha1),
+        lambda: Manifest.load(getExtensionInstallPath(sha1)))
+
+def findExtensions(db, scan):
+    """Return a list of (user_name, extension_name) tuples
+
+       The |scan| callable is called with no arguments to actually search for
+       extensions, at most once every MAXIMUM_SCAN_AGE seconds, or when an
+       extension has been installed or uninstalled."""
+
+    generation = dbutils.generations.getGeneration(db, "extensions")
+    now = time.time()
+
+    with SCAN_LOCK:
+        if SCAN["generation"] == generation \
+                and SCAN["timestamp"] > now - MAXIMUM_SCAN_AGE:
+            return SCAN["extensions"]
+
+    extensions = scan()
+
+    with SCAN_LOCK:
+        SCAN["generation"] = generation
+        SCAN["timestamp"] = now
+        SCAN["extensions"] = extensions
+
+    return extensions
+
+def getRefsSignature(path):
+    """Return a value that changes whenever a version ref might have changed
+
+       The signature consists of the modification times of the repository's
+       packed refs and of the loose refs (and directories) under
+       refs/heads/version/, which is much cheaper to compute than running
+       git."""
+
+    git_dir = os.path.join(path, ".git")
+    if not os.path.isdir(git_dir):
+        git_dir = path
+
+    signature = []
+
+    try:
+        status = os.stat(os.path.join(git_dir, "packed-refs"))
+    except OSError:
+        signature.append(None)
+    else:
+        signature.append((status.st_ino, status.st_mtime, status.st_size))
+
+    refs_dir = os.path.join(git_dir, "refs", "heads", "version")
+
+    for dirpath, dirnames, filenames in os.walk(refs_dir):
+        for name in [""] + sorted(filenames):
+            try:
+                status = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            signature.append((os.path.join(dirpath, name), status.st_ino,
+                              status.st_mtime))
+        dirnames.sort()
+
+    return tuple(signature)
+
+def getVersionRefs(path):
+    """Return a dictionary mapping version names to SHA-1s
+
+       The versions of an extension are the branches named version/*.  The
+       result is cached until getRefsSignature() returns a different value."""
+
+    import configuration
+
+    signature = getRefsSignature(path)
+
+    with REFS_LOCK:
+        cached = REFS.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    try:
+        output = subprocess.check_output(
+            [configuration.executables.GIT, "for-each-ref",
+             "--format=%(objectname) %(refname)", "refs/heads/version/"],
+            stderr=subprocess.STDOUT, cwd=path)
+    except subprocess.CalledProcessError:
+        # Not a git repository => no versions (except "Live").
+        output = ""
+
+    refs = {}
+    for line in output.splitlines():
+        sha1, _, ref = line.partition(" ")
+        if ref.startswith("refs/heads/version/"):
+            refs[ref[len("refs/heads/version/"):]] = sha1
+
+    with REFS_LOCK:
+        REFS[path] = (signature, refs)
+
+    return refs
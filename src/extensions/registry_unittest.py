@@ -0,0 +1,127 @@
+def installs():
+    import api
+    import dbutils
+    import dbutils.generations
+    import extensions.registry
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+
+    def legacy_installs(user_id):
+        cursor = db.readonly_cursor()
+        cursor.execute("""SELECT extensioninstalls.id, extensioninstalls.extension,
+                                 extensionversions.id, extensionversions.sha1,
+                                 extensioninstalls.uid IS NULL
+                            FROM extensioninstalls
+                 LEFT OUTER JOIN extensionversions ON (extensionversions.id=extensioninstalls.version)
+                           WHERE uid=%s OR uid IS NULL
+                        ORDER BY uid NULLS FIRST""",
+                       (user_id,))
+        install_per_extension = {}
+        for install_id, extension_id, version_id, version_sha1, is_universal \
+                in cursor:
+            install_per_extension[extension_id] = (
+                install_id, version_id, version_sha1, is_universal)
+        return tuple(
+            (extension_id, version_id, version_sha1, is_universal)
+            for install_id, extension_id, version_id, version_sha1, is_universal
+            in sorted(((install_id, extension_id, version_id, version_sha1,
+                        is_universal)
+                       for extension_id, (install_id, version_id,
+                                          version_sha1, is_universal)
+                       in install_per_extension.items()),
+                      reverse=True))
+
+    cursor = db.readonly_cursor()
+    cursor.execute("SELECT id FROM users")
+    user_ids = [None] + [user_id for (user_id,) in cursor]
+
+    for user_id in user_ids:
+        assert extensions.registry.getInstalls(db, user_id) \
+            == legacy_installs(user_id)
+
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return ()
+
+    # The installs are now cached.
+    extensions.registry.INSTALLS.get(db, "installs", fetch)
+    assert not fetched
+
+    # Bumping the generation counter (as installing or uninstalling an
+    # extension does) discards them.
+    with db.updating_cursor("cachegenerations") as cursor:
+        assert dbutils.generations.bumpGenerations(
+            db, cursor, ["extensioninstalls"])
+
+    extensions.registry.INSTALLS.get(db, "installs", fetch)
+    assert fetched
+
+    for user_id in user_ids:
+        assert extensions.registry.getInstalls(db, user_id) \
+            == legacy_installs(user_id)
+
+    print "installs: ok"
+
+def refs():
+    import os
+    import shutil
+    import subprocess
+    import tempfile
+
+    import configuration
+    import extensions.registry
+
+    path = tempfile.mkdtemp()
+
+    def git(*args):
+        return subprocess.check_output(
+            [configuration.executables.GIT,
+             "-c", "user.name=Registry Test",
+             "-c", "user.email=registry@example.org"] + list(args),
+            cwd=path).strip()
+
+    try:
+        # Not a git repository => no versions.
+        assert extensions.registry.getVersionRefs(path) == {}
+
+        git("init", "--quiet")
+        with open(os.path.join(path, "MANIFEST"), "w") as manifest:
+            manifest.write("Author = Registry Test\n")
+        git("add", "MANIFEST")
+        git("commit", "--quiet", "-m", "first")
+        first_sha1 = git("rev-parse", "HEAD")
+        git("branch", "version/1.0")
+
+        assert extensions.registry.getVersionRefs(path) \
+            == { "1.0": first_sha1 }
+
+        # Unchanged refs => git is not run again.
+        check_output = extensions.registry.subprocess.check_output
+        def fail(*args, **kwargs):
+            raise AssertionError("git was run")
+        extensions.registry.subprocess.check_output = fail
+        try:
+            assert extensions.registry.getVersionRefs(path) \
+                == { "1.0": first_sha1 }
+        finally:
+            extensions.registry.subprocess.check_output = check_output
+
+        git("commit", "--quiet", "--allow-empty", "-m", "second")
+        second_sha1 = git("rev-parse", "HEAD")
+        git("branch", "version/2.0")
+
+        assert extensions.registry.getVersionRefs(path) \
+            == { "1.0": first_sha1, "2.0": second_sha1 }
+
+        git("pack-refs", "--all")
+        git("branch", "--force", "version/1.0", second_sha1)
+
+        assert extensions.registry.getVersionRefs(path) \
+            == { "1.0": second_sha1, "2.0": second_sha1 }
+    finally:
+        shutil.rmtree(path)
+
+    print "refs: ok"
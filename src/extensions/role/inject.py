@@ -14,7 +14,10 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import collections
 import re
+import threading
+import time
 import urlparse
 
 import configuration
@@ -24,9 +27,10 @@ from htmlutils import jsify
 from request import decodeURIComponent
 from textutils import json_decode, json_encode
 
-from extensions import getExtensionInstallPath
+from extensions import registry
 from extensions.extension import Extension, ExtensionError
-from extensions.execute import ProcessTimeout, ProcessFailure, executeProcess
+from extensions.execute import (ProcessTimeout, ProcessFailure, prepareProcess,
+                                runProcesses)
 from extensions.manifest import Manifest, ManifestError, InjectRole
 
 class InjectError(Exception):
@@ -149,9 +153,63 @@ def processLine(paths, line):
 
     return (command, value)
 
-def execute(db, req, user, document, links, injected, profiler=None):
-    cursor = db.cursor()
+# The maximum number of inject role outputs cached by each process.
+MAXIMUM_CACHED_OUTPUTS = 1000
+
+# Output of inject roles that are declared as cached in the extension's
+# MANIFEST, mapping cache keys to (expires, output) tuples, least recently used
+# first.  Only output from installed extension versions is cached, and the
+# cache keys include the version's SHA-1, so installing a different version of
+# an extension bypasses any output cached for the previous version.
+OUTPUT_CACHE = collections.OrderedDict()
+OUTPUT_CACHE_LOCK = threading.Lock()
+
+def getCachedOutput(key):
+    with OUTPUT_CACHE_LOCK:
+        try:
+            expires, output = OUTPUT_CACHE.pop(key)
+        except KeyError:
+            return None
+        if expires is not None and expires < time.time():
+            return None
+        OUTPUT_CACHE[key] = (expires, output)
+        return output
+
+def setCachedOutput(key, max_age, output):
+    expires = time.time() + max_age if max_age else None
+    with OUTPUT_CACHE_LOCK:
+        OUTPUT_CACHE.pop(key, None)
+        OUTPUT_CACHE[key] = (expires, output)
+        while len(OUTPUT_CACHE) > MAXIMUM_CACHED_OUTPUTS:
+            OUTPUT_CACHE.popitem(last=False)
+
+def construct_query(query):
+    if not query:
+        return "null"
+
+    params = urlparse.parse_qs(query, keep_blank_values=True)
+
+    for key in params:
+        values = params[key]
+        if len(values) == 1:
+            if not values[0]:
+                params[key] = None
+            else:
+                params[key] = values[0]
+
+    return ("Object.freeze({ raw: %s, params: Object.freeze(%s) })"
+            % (json_encode(query), json_encode(params)))
 
+class Handler(object):
+    def __init__(self, path, output=None, request_index=None, cache_key=None,
+                 max_age=None):
+        self.path = path
+        self.output = output
+        self.request_index = request_index
+        self.cache_key = cache_key
+        self.max_age = max_age
+
+def execute(db, req, user, document, links, injected, profiler=None):
     installs = Extension.getInstalls(db, user)
 
     def get_matching_path(path_regexp):
@@ -162,30 +220,34 @@ def execute(db, req, user, document, links, injected, profiler=None):
         else:
             return None, None
 
-    query = None
+    installed_roles = registry.getRoles(
+        db, [version_id for _, version_id, _, _ in installs
+             if version_id is not None])
+
+    # First check access and look up cached output for all matching handlers,
+    # then run the remaining handlers concurrently, and finally process the
+    # output in the order of the installs.
+    injections = []
+    requests = []
 
     for extension_id, version_id, version_sha1, is_universal in installs:
-        handlers = []
+        extension = None
+        matching = []
 
         try:
             if version_id is not None:
-                cursor.execute("""SELECT script, function, path
-                                    FROM extensionroles
-                                    JOIN extensioninjectroles ON (role=id)
-                                   WHERE version=%s
-                                ORDER BY id ASC""",
-                               (version_id,))
-
-                for script, function, path_regexp in cursor:
+                for script, function, path_regexp \
+                        in installed_roles[version_id].inject:
                     path, query = get_matching_path(path_regexp)
                     if path is not None:
-                        handlers.append((path, query, script, function))
+                        matching.append(
+                            (path, query, script, function, path_regexp))
 
-                if not handlers:
+                if not matching:
                     continue
 
                 extension = Extension.fromId(db, extension_id)
-                manifest = Manifest.load(getExtensionInstallPath(version_sha1))
+                manifest = registry.getInstalledManifest(version_sha1)
             else:
                 extension = Extension.fromId(db, extension_id)
                 manifest = Manifest.load(extension.getPath())
@@ -194,51 +256,95 @@ def execute(db, req, user, document, links, injected, profiler=None):
                     if isinstance(role, InjectRole):
                         path, query = get_matching_path(role.regexp)
                         if path is not None:
-                            handlers.append((path, query, role.script, role.function))
+                            matching.append((path, query, role.script,
+                                             role.function, role.regexp))
 
-                if not handlers:
+                if not matching:
                     continue
 
-            def construct_query(query):
-                if not query:
-                    return "null"
-
-                params = urlparse.parse_qs(query, keep_blank_values=True)
-
-                for key in params:
-                    values = params[key]
-                    if len(values) == 1:
-                        if not values[0]:
-                            params[key] = None
-                        else:
-                            params[key] = values[0]
-
-                return ("Object.freeze({ raw: %s, params: Object.freeze(%s) })"
-                        % (json_encode(query), json_encode(params)))
-
-            preferences = None
-            commands = []
+            roles = dict(((role.script, role.function, role.regexp), role)
+                         for role in manifest.roles
+                         if isinstance(role, InjectRole))
+            handlers = []
+            pending = []
 
-            for path, query, script, function in handlers:
+            for path, query, script, function, path_regexp in matching:
                 argv = "[%s, %s]" % (jsify(path), construct_query(query))
 
                 try:
-                    stdout_data = executeProcess(
+                    request = prepareProcess(
                         db, manifest, "inject", script, function, extension_id, user.id, argv,
                         configuration.extensions.SHORT_TIMEOUT)
-                except ProcessTimeout as error:
-                    raise InjectError(error.message)
-                except ProcessFailure as error:
-                    if error.returncode < 0:
-                        raise InjectError("Process terminated by signal %d." % -error.returncode)
-                    else:
-                        raise InjectError("Process returned %d.\n%s" % (error.returncode, error.stderr))
                 except AccessDenied:
                     raise InjectIgnored()
 
+                role = roles.get((script, function, path_regexp))
+
+                if version_sha1 is not None and role and role.cached:
+                    cache_key = (version_sha1, script, function, path_regexp,
+                                 user.id if role.cached_per_user else None,
+                                 (path, query) if role.cached_per_path else None)
+                    output = getCachedOutput(cache_key)
+                    if output is not None:
+                        handlers.append(Handler(path, output=output))
+                        continue
+                    handlers.append(Handler(
+                        path, request_index=len(requests) + len(pending),
+                        cache_key=cache_key, max_age=role.cached_max_age))
+                else:
+                    handlers.append(Handler(
+                        path, request_index=len(requests) + len(pending)))
+
+                pending.append(request)
+
+            requests.extend(pending)
+            injections.append((extension, handlers))
+        except ExtensionError as error:
+            document.comment("\n\n[%s] Extension error:\nInvalid extension:\n%s\n\n"
+                             % (error.extension.getKey(), error.message))
+        except ManifestError as error:
+            document.comment("\n\n[%s] Extension error:\nInvalid MANIFEST:\n%s\n\n"
+                             % (extension.getKey(), error.message))
+        except InjectIgnored:
+            pass
+
+    if profiler:
+        profiler.check("inject: prepare")
+
+    results = runProcesses(requests)
+
+    if profiler:
+        profiler.check("inject: execute")
+
+    for extension, handlers in injections:
+        try:
+            preferences = None
+            commands = []
+
+            for handler in handlers:
+                if handler.request_index is None:
+                    stdout_data = handler.output
+                else:
+                    stdout_data = results[handler.request_index]
+
+                    if isinstance(stdout_data, ProcessTimeout):
+                        raise InjectError(stdout_data.message)
+                    elif isinstance(stdout_data, ProcessFailure):
+                        error = stdout_data
+                        if error.returncode < 0:
+                            raise InjectError("Process terminated by signal %d." % -error.returncode)
+                        else:
+                            raise InjectError("Process returned %d.\n%s" % (error.returncode, error.stderr))
+                    elif isinstance(stdout_data, Exception):
+                        raise stdout_data
+
                 for line in stdout_data.splitlines():
                     if line.strip():
-                        commands.append(processLine(path, line.strip()))
+                        commands.append(processLine(handler.path, line.strip()))
+
+                if handler.cache_key is not None:
+                    setCachedOutput(
+                        handler.cache_key, handler.max_age, stdout_data)
 
             for command, value in commands:
                 if command == "script":
@@ -265,14 +371,6 @@ def execute(db, req, user, document, links, injected, profiler=None):
 
             if profiler:
                 profiler.check("inject: %s" % extension.getKey())
-        except ExtensionError as error:
-            document.comment("\n\n[%s] Extension error:\nInvalid extension:\n%s\n\n"
-                             % (error.extension.getKey(), error.message))
-        except ManifestError as error:
-            document.comment("\n\n[%s] Extension error:\nInvalid MANIFEST:\n%s\n\n"
-                             % (extension.getKey(), error.message))
         except InjectError as error:
             document.comment("\n\n[%s] Extension error:\n%s\n\n"
                              % (extension.getKey(), error.message))
-        except InjectIgnored:
-            pass
@@ -22,16 +22,17 @@ import configuration
 from htmlutils import jsify
 from request import decodeURIComponent
 
-from extensions import getExtensionInstallPath
+from extensions import registry
 from extensions.extension import Extension, ExtensionError
 from extensions.execute import ProcessTimeout, ProcessFailure, executeProcess
 from extensions.manifest import Manifest, ManifestError, PageRole
 from extensions.utils import renderTutorial
 
 def execute(db, req, user):
-    cursor = db.cursor()
-
     installs = Extension.getInstalls(db, user)
+    installed_roles = registry.getRoles(
+        db, [version_id for _, version_id, _, _ in installs
+             if version_id is not None])
 
     argv = None
     stdin_data = None
@@ -40,22 +41,15 @@ def execute(db, req, user):
         handlers = []
 
         if version_id is not None:
-            cursor.execute("""SELECT script, function, path
-                                FROM extensionroles
-                                JOIN extensionpageroles ON (role=id)
-                               WHERE version=%s
-                            ORDER BY id ASC""",
-                           (version_id,))
-
-            for script, function, path_regexp in cursor:
+            for script, function, path_regexp \
+                    in installed_roles[version_id].page:
                 if re.match(path_regexp, req.path):
                     handlers.append((script, function))
 
             if not handlers:
                 continue
 
-            extension_path = getExtensionInstallPath(version_sha1)
-            manifest = Manifest.load(extension_path)
+            manifest = registry.getInstalledManifest(version_sha1)
         else:
             try:
                 extension = Extension.fromId(db, extension_id)
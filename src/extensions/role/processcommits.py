@@ -15,24 +15,112 @@
 # the License.
 
 import re
+import time
 
 import configuration
+import dbutils
 import gitutils
+import mailutils
 
 import log.commitset
 import changeset.utils
 
-from extensions import getExtensionInstallPath
+from extensions import registry
 from extensions.extension import Extension
-from extensions.execute import ProcessTimeout, ProcessFailure, executeProcess
+from extensions.execute import ProcessException, ProcessTimeout, ProcessFailure, executeProcess
 from extensions.manifest import Manifest, ManifestError, ProcessCommitsRole
+from extensions.role.filterhook import signalExtensionTasksService
+
+# Number of times a queued ProcessCommits role is attempted before the event is
+# marked as failed.
+MAXIMUM_ATTEMPTS = 5
+
+# Delay (in seconds) before the first retry; doubled for each further retry.
+RETRY_DELAY = 30
+
+def getArguments(review_id, changeset_id, commit_ids):
+    if changeset_id is not None:
+        changeset_arg = "repository.getChangeset(%d)" % changeset_id
+    else:
+        changeset_arg = "null"
+
+    commits_arg = "[%s]" % ",".join(
+        [("repository.getCommit(%d)" % commit_id)
+         for commit_id in commit_ids])
+
+    argv = """
+
+(function ()
+ {
+   var review = new critic.Review(%(review_id)d);
+   var repository = review.repository;
+   var changeset = %(changeset)s;
+   var commitset = new critic.CommitSet(%(commits)s);
+
+   return [review, changeset, commitset];
+ })()
+
+""" % { "review_id": review_id,
+        "changeset": changeset_arg,
+        "commits": commits_arg }
+
+    return re.sub("[ \n]+", " ", argv.strip())
+
+def runHandler(db, user, extension_id, manifest, script, function, argv, timeout):
+    """Run a ProcessCommits handler
+
+       Returns a tuple (stdout, error), where |error| is None if the handler
+       ran successfully, and |stdout| is None if it didn't."""
+
+    try:
+        return executeProcess(
+            db, manifest, "processcommits", script, function, extension_id,
+            user.id, argv, timeout), None
+    except ProcessTimeout as error:
+        return None, error.message
+    except ProcessFailure as error:
+        if error.returncode < 0:
+            return None, "Process terminated by signal %d." % -error.returncode
+        else:
+            return None, "Process returned %d.\n%s" % (error.returncode, error.stderr)
+    except ProcessException as error:
+        return None, error.message
+
+def queueProcessCommitsEvent(db, extension_id, user, review, script, function,
+                             changeset_id, commit_ids):
+    # The system user (e.g. the branch tracker updating a tracked review) has
+    # no row in the users table, so it's recorded as NULL.
+    user_id = None if user.isSystem() else user.id
 
-def execute(db, user, review, all_commits, old_head, new_head, output):
     cursor = db.cursor()
+    cursor.execute("""INSERT INTO extensionprocesscommitsevents
+                                    (extension, uid, review, changeset, script, function)
+                           VALUES (%s, %s, %s, %s, %s, %s)
+                        RETURNING id""",
+                   (extension_id, user_id, review.id, changeset_id, script,
+                    function))
+
+    event_id, = cursor.fetchone()
+
+    cursor.executemany("""INSERT INTO extensionprocesscommitscommits
+                                        (event, commit)
+                               VALUES (%s, %s)""",
+                       [(event_id, commit_id) for commit_id in commit_ids])
 
+    def transactionCallback(event):
+        if event == "commit":
+            signalExtensionTasksService()
+
+    db.registerTransactionCallback(transactionCallback)
+
+def execute(db, user, review, all_commits, old_head, new_head, output):
     installs = Extension.getInstalls(db, user)
+    installed_roles = registry.getRoles(
+        db, [version_id for _, version_id, _, _ in installs
+             if version_id is not None])
 
     data = None
+    queued = False
 
     for extension_id, version_id, version_sha1, is_universal in installs:
         handlers = []
@@ -40,20 +128,12 @@ def execute(db, user, review, all_commits, old_head, new_head, output):
         extension = Extension.fromId(db, extension_id)
 
         if version_id is not None:
-            cursor.execute("""SELECT script, function
-                                FROM extensionroles
-                                JOIN extensionprocesscommitsroles ON (role=id)
-                               WHERE version=%s
-                            ORDER BY id ASC""",
-                           (version_id,))
-
-            handlers.extend(cursor)
+            handlers.extend(installed_roles[version_id].processcommits)
 
             if not handlers:
                 continue
 
-            extension_path = getExtensionInstallPath(version_sha1)
-            manifest = Manifest.load(extension_path)
+            manifest = registry.getInstalledManifest(version_sha1)
         else:
             manifest = Manifest.load(extension.getPath())
 
@@ -64,6 +144,11 @@ def execute(db, user, review, all_commits, old_head, new_head, output):
             if not handlers:
                 continue
 
+        synchronous = set((role.script, role.function)
+                          for role in manifest.roles
+                          if isinstance(role, ProcessCommitsRole)
+                          and role.synchronous)
+
         if data is None:
             commitset = log.commitset.CommitSet(all_commits)
 
@@ -76,21 +161,23 @@ def execute(db, user, review, all_commits, old_head, new_head, output):
                 tail = gitutils.Commit.fromSHA1(db, review.repository, tails.pop())
                 changeset_id = changeset.utils.createChangeset(
                     db, user, review.repository, from_commit=tail, to_commit=new_head)[0].id
-                changeset_arg = "repository.getChangeset(%d)" % changeset_id
             else:
-                changeset_arg = "null"
+                changeset_id = None
 
-            commits_arg = "[%s]" % ",".join(
-                [("repository.getCommit(%d)" % commit.getId(db))
-                 for commit in all_commits])
+            commit_ids = [commit.getId(db) for commit in all_commits]
 
-            data = { "review_id": review.id,
-                     "changeset": changeset_arg,
-                     "commits": commits_arg }
+            data = (changeset_id, commit_ids)
+
+        changeset_id, commit_ids = data
 
         for script, function in handlers:
-            class Error(Exception):
-                pass
+            if (script, function) not in synchronous:
+                # Asynchronous handler: run by the extension tasks service,
+                # which mails any output to the user.
+                queueProcessCommitsEvent(db, extension_id, user, review, script,
+                                         function, changeset_id, commit_ids)
+                queued = True
+                continue
 
             def print_header():
                 header = "%s::%s()" % (script, function)
@@ -98,38 +185,155 @@ def execute(db, user, review, all_commits, old_head, new_head, output):
                                  % (extension.getName(), header,
                                     extension.getName(), "=" * len(header)))
 
-            try:
-                argv = """
+            stdout_data, error = runHandler(
+                db, user, extension_id, manifest, script, function,
+                getArguments(review.id, changeset_id, commit_ids),
+                configuration.extensions.SHORT_TIMEOUT)
 
-(function ()
- {
-   var review = new critic.Review(%(review_id)d);
-   var repository = review.repository;
-   var changeset = %(changeset)s;
-   var commitset = new critic.CommitSet(%(commits)s);
+            if error is not None:
+                print_header()
+                print >>output, "[%s] Extension error: %s" % (extension.getName(), error)
+            elif stdout_data.strip():
+                print_header()
+                for line in stdout_data.splitlines():
+                    print >>output, "[%s] %s" % (extension.getName(), line)
 
-   return [review, changeset, commitset];
- })()
+    if queued:
+        db.commit()
 
-""" % data
-                argv = re.sub("[ \n]+", " ", argv.strip())
-
-                try:
-                    stdout_data = executeProcess(
-                        db, manifest, "processcommits", script, function, extension_id, user.id,
-                        argv, configuration.extensions.SHORT_TIMEOUT)
-                except ProcessTimeout as error:
-                    raise Error(error.message)
-                except ProcessError as error:
-                    if error.returncode < 0:
-                        raise Error("Process terminated by signal %d." % -error.returncode)
-                    else:
-                        raise Error("Process returned %d.\n%s" % (error.returncode, error.stderr))
-
-                if stdout_data.strip():
-                    print_header()
-                    for line in stdout_data.splitlines():
-                        print >>output, "[%s] %s" % (extension.getName(), line)
-            except Error as error:
-                print_header()
-                print >>output, "[%s] Extension error: %s" % (extension.getName(), error.message)
+def processProcessCommitsEvent(db, event_id, logfn):
+    cursor = db.cursor()
+
+    cursor.execute("""SELECT extension, uid, review, changeset, script, function
+                        FROM extensionprocesscommitsevents
+                       WHERE id=%s""",
+                   (event_id,))
+
+    (extension_id, user_id, review_id, changeset_id,
+     script, function) = cursor.fetchone()
+
+    if user_id is None:
+        user = dbutils.User.makeSystem()
+    else:
+        user = dbutils.User.fromId(db, user_id)
+
+    for install_extension_id, _, version_sha1, _ in Extension.getInstalls(db, user):
+        if install_extension_id == extension_id:
+            break
+    else:
+        # Invalid event (user no longer has the extension installed); do
+        # nothing.  The event will be deleted by the caller.
+        return
+
+    extension = Extension.fromId(db, extension_id)
+
+    try:
+        if version_sha1 is not None:
+            manifest = registry.getInstalledManifest(version_sha1)
+        else:
+            manifest = Manifest.load(extension.getPath())
+    except ManifestError:
+        return
+
+    for role in manifest.roles:
+        if isinstance(role, ProcessCommitsRole) \
+                and (role.script, role.function) == (script, function):
+            break
+    else:
+        # Invalid event (installed version of extension doesn't have the role
+        # anymore); do nothing.  The event will be deleted by the caller.
+        return
+
+    cursor.execute("""SELECT commit
+                        FROM extensionprocesscommitscommits
+                       WHERE event=%s""",
+                   (event_id,))
+    commit_ids = [commit_id for (commit_id,) in cursor]
+
+    argv = getArguments(review_id, changeset_id, commit_ids)
+
+    logfn("argv=%r" % argv)
+    logfn("script=%r" % script)
+    logfn("function=%r" % function)
+
+    stdout_data, error = runHandler(
+        db, user, extension_id, manifest, script, function, argv,
+        configuration.extensions.LONG_TIMEOUT)
+
+    if error is not None:
+        output = "Extension error: %s" % error
+    elif stdout_data.strip():
+        output = stdout_data
+    else:
+        return
+
+    if user.isSystem():
+        # Nobody to mail the output to.
+        logfn("output:\n%s" % output)
+        return
+
+    review = dbutils.Review.fromId(db, review_id)
+
+    body = """\
+The extension %(extension.title)s processed the commits added to the review
+
+  r/%(review.id)d "%(review.summary)s"
+
+and produced the following output:
+
+  %(output)s
+
+-- critic"""
+
+    body = body % { "extension.title": extension.getTitle(db),
+                    "review.id": review.id,
+                    "review.summary": review.summary,
+                    "output": "\n  ".join(output.splitlines()) }
+
+    mailutils.sendMessage(
+        recipients=[user],
+        subject="%s: r/%d" % (extension.getTitle(db), review.id),
+        body=body)
+
+def attemptProcessCommitsEvent(db, event_id, attempts, service):
+    """Attempt to process a queued ProcessCommits event
+
+       The event is deleted if it is processed.  Otherwise its attempt counter
+       is incremented, and once MAXIMUM_ATTEMPTS attempts have failed, it is
+       marked as failed, and kept so that the system administrator can find
+       out what went wrong.  Returns the time at which the event should next
+       be attempted, or None if it shouldn't.  Messages are logged via
+       |service|, the extension tasks service."""
+
+    cursor = db.cursor()
+
+    try:
+        processProcessCommitsEvent(db, event_id, service.debug)
+    except Exception:
+        service.exception()
+        db.rollback()
+
+        attempts += 1
+
+        if attempts >= MAXIMUM_ATTEMPTS:
+            service.error("giving up on event %d after %d failed attempts"
+                          % (event_id, attempts))
+            retry_at = None
+        else:
+            retry_at = time.time() + RETRY_DELAY * 2 ** (attempts - 1)
+
+        cursor.execute("""UPDATE extensionprocesscommitsevents
+                             SET attempts=%s,
+                                 failed=%s
+                           WHERE id=%s""",
+                       (attempts, retry_at is None, event_id))
+    else:
+        cursor.execute("""DELETE FROM extensionprocesscommitsevents
+                                WHERE id=%s""",
+                       (event_id,))
+
+        retry_at = None
+
+    db.commit()
+
+    return retry_at
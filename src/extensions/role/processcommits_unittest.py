@@ -0,0 +1,100 @@
+def events():
+    import time
+    import api
+    import dbutils
+    import extensions.role.processcommits as processcommits
+
+    critic = api.critic.startSession(for_testing=True)
+
+    class Service(object):
+        def __init__(self):
+            self.errors = []
+        def debug(self, message):
+            pass
+        def exception(self):
+            pass
+        def error(self, message):
+            self.errors.append(message)
+
+    with dbutils.Database.forTesting(critic) as db:
+        cursor = db.cursor()
+
+        # Events are inserted directly, rather than via
+        # queueProcessCommitsEvent(), so that the extension tasks service isn't
+        # woken up to process them while they are being tested.  They are
+        # queued for an extension that nobody has installed, which is an event
+        # that is processed (and deleted) without running anything.
+        cursor.execute("""INSERT INTO extensions (author, name)
+                               VALUES (NULL, %s)
+                            RETURNING id""",
+                       ("processcommits_unittest_%d" % time.time(),))
+        extension_id, = cursor.fetchone()
+
+        cursor.execute("SELECT id FROM reviews ORDER BY id ASC LIMIT 1")
+        review_id, = cursor.fetchone()
+
+        def queue():
+            cursor.execute("""INSERT INTO extensionprocesscommitsevents
+                                            (extension, uid, review, script,
+                                             function)
+                                   VALUES (%s, NULL, %s, 'test.js', 'test')
+                                RETURNING id""",
+                           (extension_id, review_id))
+            event_id, = cursor.fetchone()
+            db.commit()
+            return event_id
+
+        def fetch(event_id):
+            cursor.execute("""SELECT attempts, failed
+                                FROM extensionprocesscommitsevents
+                               WHERE id=%s""",
+                           (event_id,))
+            return cursor.fetchone()
+
+        try:
+            service = Service()
+
+            # Processed events are deleted.
+            event_id = queue()
+            assert processcommits.attemptProcessCommitsEvent(
+                db, event_id, 0, service) is None
+            assert fetch(event_id) is None
+
+            def failing(db, event_id, logfn):
+                raise Exception("failing")
+
+            process = processcommits.processProcessCommitsEvent
+            processcommits.processProcessCommitsEvent = failing
+
+            try:
+                event_id = queue()
+
+                # Failed attempts are retried after a delay that is doubled
+                # for each further attempt.
+                for attempts in range(processcommits.MAXIMUM_ATTEMPTS - 1):
+                    before = time.time()
+                    retry_at = processcommits.attemptProcessCommitsEvent(
+                        db, event_id, attempts, service)
+                    delay = processcommits.RETRY_DELAY * 2 ** attempts
+                    assert before + delay <= retry_at <= time.time() + delay
+                    assert fetch(event_id) == (attempts + 1, False)
+
+                assert service.errors == []
+
+                # After the last attempt, the event is kept, marked as failed.
+                assert processcommits.attemptProcessCommitsEvent(
+                    db, event_id, processcommits.MAXIMUM_ATTEMPTS - 1,
+                    service) is None
+                assert fetch(event_id) == (processcommits.MAXIMUM_ATTEMPTS,
+                                           True)
+                assert len(service.errors) == 1
+            finally:
+                processcommits.processProcessCommitsEvent = process
+        finally:
+            db.rollback()
+            cursor.execute("""DELETE FROM extensions
+                                    WHERE id=%s""",
+                           (extension_id,))
+            db.commit()
+
+    print "events: ok"
@@ -26,13 +26,14 @@ import shutil
 import stat
 import contextlib
 import base64
+import bisect
+import collections
 
 import base
 import configuration
 import textutils
 import htmlutils
 import communicate
-import diff.parse
 
 re_author_committer = re.compile("(.*) <(.*)> ([0-9]+ [-+][0-9]+)")
 re_sha1 = re.compile("^[A-Za-z0-9]{40}$")
@@ -146,6 +147,7 @@ class Repository:
         self.__batchCheck = None
         self.__cacheBlobs = False
         self.__cacheDisabled = False
+        self.__trees = collections.OrderedDict()
 
         if db:
             self.__db = db
@@ -374,6 +376,23 @@ class Repository:
 
         return git_object
 
+    def getTree(self, sha1):
+        """Return the Tree object with the given SHA-1
+
+           Parsed trees are memoized per repository, so that resolving paths
+           in many commits shares all unchanged subtrees."""
+
+        if self.__cacheDisabled:
+            return Tree.fromSHA1(self, sha1)
+
+        tree = self.__trees.pop(sha1, None)
+        if tree is None:
+            tree = Tree.fromSHA1(self, sha1)
+            while len(self.__trees) >= MAXIMUM_CACHED_TREES:
+                self.__trees.popitem(last=False)
+        self.__trees[sha1] = tree
+        return tree
+
     def run(self, command, *arguments, **kwargs):
         return self.runCustom(self.path, command, *arguments, **kwargs)
 
@@ -504,6 +523,39 @@ class Repository:
             args.append(str(value))
         self.run(*args)
 
+    def updaterefs(self, updates):
+        """
+        Update several refs in a single transaction
+
+        Each item in the list |updates| is a tuple (name, new_value,
+        old_value), where new_value is None to delete the ref, and old_value is
+        None if the ref's current value should not be checked.  Either all refs
+        are updated, or a GitCommandError is raised and none are.
+        """
+
+        commands = []
+        for name, new_value, old_value in updates:
+            assert name.startswith("refs/")
+            if new_value is None:
+                command = "delete %s" % name
+            else:
+                command = "update %s %s" % (name, new_value)
+            if old_value is not None:
+                command += " %s" % old_value
+            commands.append(command + "\n")
+        if commands:
+            self.run("update-ref", "--stdin", input="".join(commands))
+
+    def listrefs(self, prefix):
+        """
+        Return a dictionary mapping names of refs under |prefix| to SHA-1s
+        """
+
+        output = self.run("for-each-ref", "--format=%(objectname) %(refname)",
+                          prefix)
+        return dict((name, sha1) for sha1, _, name in
+                    (line.partition(" ") for line in output.splitlines()))
+
     def keepalive(self, commit):
         sha1 = str(commit)
         self.run("update-ref", KEEPALIVE_REF_PREFIX + sha1, sha1)
@@ -1078,6 +1130,19 @@ class Commit:
             commit = Commit.fromSHA1(db, repository, sha1, commit_id)
         return commit
 
+    @staticmethod
+    def fromIds(db, repository, commit_ids):
+        cache = db.storage["Commit"]
+        need_fetch = [commit_id for commit_id in commit_ids
+                      if commit_id not in cache]
+        if need_fetch:
+            cursor = db.cursor()
+            cursor.execute("SELECT id, sha1 FROM commits WHERE id=ANY (%s)",
+                           (need_fetch,))
+            for commit_id, sha1 in cursor.fetchall():
+                Commit.fromSHA1(db, repository, sha1, commit_id)
+        return [cache.get(commit_id) for commit_id in commit_ids]
+
     @staticmethod
     def fromAPI(api_commit):
         return Commit.fromSHA1(api_commit.critic.database,
@@ -1188,12 +1253,11 @@ class Commit:
     def isDirectory(self, path):
         return self.getTree(path) is not None
 
-RE_LSTREE_LINE = re.compile(
-    "(?P<mode>[0-9]{6}) (?P<type>blob|tree|commit) (?P<sha1>[0-9a-f]{40}) +"
-    "(?P<size>[0-9]+|-)\t(?P<quote>[\"']?)(?P<name>.*)(?P=quote)$")
+# Maximum number of parsed tree objects memoized by each Repository object.
+MAXIMUM_CACHED_TREES = 10000
 
 class Tree:
-    class Entry:
+    class Entry(object):
         class Mode(int):
             def __new__(cls, value):
                 return super(Tree.Entry.Mode, cls).__new__(cls, int(value, 8))
@@ -1210,15 +1274,22 @@ class Tree:
                     flags = ["---", "--x", "-w-", "-wx", "r--", "r-x", "rw-", "rwx"]
                     return string + flags[(self & 0700) >> 6] + flags[(self & 070) >> 3] + flags[self & 07]
 
-        def __init__(self, name, mode, type, sha1, size):
-            if len(name) > 2 and name[0] in ('"', "'") and name[-1] == name[0]:
-                name = diff.parse.demunge(name[1:-1])
-
+        def __init__(self, name, mode, type, sha1, size, repository=None):
             self.name = name
             self.mode = Tree.Entry.Mode(mode)
             self.type = type
             self.sha1 = sha1
-            self.size = size
+            self.__size = size
+            self.__repository = repository
+
+        @property
+        def size(self):
+            # The size of blobs is looked up on demand, since it's rarely
+            # needed, and requires an extra round-trip to 'git cat-file'.
+            if self.__size is None and self.__repository and self.type == "blob":
+                self.__size = self.__repository.fetch(
+                    self.sha1, fetchData=False).size
+            return self.__size
 
         def __str__(self):
             return self.name
@@ -1254,63 +1325,47 @@ class Tree:
     def fromPath(commit, path):
         assert path[0] == "/"
 
-        if path == "/":
-            what = commit.sha1
-        else:
-            if path[-1] != "/": path += "/"
-            what = "%s:%s" % (commit.sha1, path[1:])
+        if isinstance(path, unicode):
+            path = path.encode("utf-8")
 
-        entries = []
+        repository = commit.repository
+        tree = repository.getTree(commit.tree)
 
-        try:
-            lstree_output = commit.repository.run("ls-tree", "-l", what)
-        except GitCommandError as error:
-            if error.output == "fatal: Not a valid object name %s" % what:
+        for name in path.split("/"):
+            if not name:
+                continue
+            entry = tree.get(name)
+            if entry is None or entry.type != "tree":
                 return None
-            raise
-
-        for line in lstree_output.splitlines():
-            match = RE_LSTREE_LINE.match(line)
-
-            assert match, "Unexpected output from 'git ls-tree': %r" % line
+            tree = repository.getTree(entry.sha1)
 
-            name = match.group("name")
-            if match.group("quote"):
-                name = diff.parse.demunge(name)
-
-            if match.group("type") == "blob":
-                size = int(match.group("size"))
-            else:
-                size = None
-
-            entries.append(Tree.Entry(name=name,
-                                      mode=match.group("mode"),
-                                      type=match.group("type"),
-                                      sha1=match.group("sha1"),
-                                      size=size))
-
-        return Tree(entries)
+        return tree
 
     @staticmethod
     def fromSHA1(repository, sha1):
         data = repository.fetch(sha1).data
         entries = []
+        offset = 0
 
-        while len(data):
-            space = data.index(" ")
+        while offset < len(data):
+            space = data.index(" ", offset)
             null = data.index("\0", space + 1)
 
-            mode = data[:space]
+            mode = data[offset:space]
             name = data[space + 1:null]
+            sha1 = data[null + 1:null + 21].encode("hex")
 
-            sha1_binary = data[null + 1:null + 21]
-            sha1 = "".join([("%02x" % ord(c)) for c in sha1_binary])
-
-            entry_object = repository.fetch(sha1, fetchData=False)
+            if stat.S_ISDIR(int(mode, 8)):
+                entry_type = "tree"
+            elif int(mode, 8) == 0160000:
+                entry_type = "commit"
+            else:
+                entry_type = "blob"
 
-            entries.append(Tree.Entry(name, mode, entry_object.type, sha1, entry_object.size))
+            entries.append(Tree.Entry(name, mode, entry_type, sha1, None,
+                                      repository))
 
-            data = data[null + 21:]
+            offset = null + 21
 
         return Tree(entries)
 
@@ -1331,31 +1386,59 @@ def getTaggedCommit(repository, sha1):
 
         sha1 = git_object.data.split("\n", 1)[0].split(" ", 1)[-1]
 
-class Blame:
-    def __init__(self, from_commit, to_commit):
-        assert from_commit.repository == to_commit.repository
+class FileBlame:
+    """Blame of a whole file, run-length encoded
 
-        self.repository = from_commit.repository
-        self.from_commit = from_commit
-        self.to_commit = to_commit
-        self.commits = []
-        self.__commit_ids = {}
+       The commits are stored as a list of (sha1, author_name, author_email)
+       tuples, and the lines as a list of runs: consecutive lines blamed on
+       the same commit.  Each run is represented by its first line, in
+       |run_starts|, and the index of its commit, in |run_commits|; it ends
+       where the next run starts (or at |line_count|.)"""
 
-    def blame(self, db, path, first_line, last_line):
-        output = self.repository.run("blame",
-                                     "--porcelain",
-                                     "-L", "%d,%d" % (first_line, last_line),
-                                     "%s..%s" % (self.from_commit.sha1, self.to_commit.sha1),
-                                     "--", path)
+    def __init__(self, commits, run_starts, run_commits, line_count):
+        self.commits = commits
+        self.run_starts = run_starts
+        self.run_commits = run_commits
+        self.line_count = line_count
+
+    def lines(self, first_line, last_line):
+        """Return (line, commit_index) tuples for the lines in the range"""
+
+        first_line = max(first_line, 1)
+        last_line = min(last_line, self.line_count)
+        if first_line > last_line:
+            return []
+
+        run_index = bisect.bisect_right(self.run_starts, first_line) - 1
+        result = []
+        line = first_line
+
+        while line <= last_line:
+            if run_index + 1 < len(self.run_starts):
+                run_end = self.run_starts[run_index + 1] - 1
+            else:
+                run_end = self.line_count
+            commit_index = self.run_commits[run_index]
+            for line in xrange(line, min(run_end, last_line) + 1):
+                result.append((line, commit_index))
+            line = run_end + 1
+            run_index += 1
+
+        return result
+
+    @staticmethod
+    def fromPorcelain(output):
+        commits = []
+        commit_indexes = {}
+        run_starts = []
+        run_commits = []
+        line_count = 0
 
         inlines = iter(output.splitlines())
-        lines = []
 
         try:
             while True:
                 sha1, original_line, current_line = inlines.next().split(" ")[:3]
-
-                original_line = int(original_line)
                 current_line = int(current_line)
 
                 author = None
@@ -1365,27 +1448,109 @@ class Blame:
                 while not line.startswith("\t"):
                     if line.startswith("author "): author = line[7:]
                     elif line.startswith("author-mail "): author_email = line[13:-1]
-                    elif line.startswith("summary "): pass
                     line = inlines.next()
 
-                if sha1 not in self.__commit_ids:
-                    commit = Commit.fromSHA1(db, self.repository, sha1)
+                commit_index = commit_indexes.get(sha1)
+                if commit_index is None:
+                    commit_index = commit_indexes[sha1] = len(commits)
+                    commits.append((sha1, author, author_email))
 
-                    self.__commit_ids[sha1] = len(self.commits)
-                    self.commits.append({ "sha1": sha1,
-                                          "author_name": author,
-                                          "author_email": author_email,
-                                          "summary": commit.niceSummary(),
-                                          "message": commit.message,
-                                          "original": sha1 == self.from_commit.sha1,
-                                          "current": sha1 == self.to_commit.sha1 })
+                # Lines are output in order, so a line either extends the
+                # current run or starts a new one.
+                if not run_commits or run_commits[-1] != commit_index \
+                        or current_line != line_count + 1:
+                    run_starts.append(current_line)
+                    run_commits.append(commit_index)
 
-                lines.append({ "offset": current_line,
-                               "commit": self.__commit_ids[sha1] })
+                line_count = current_line
         except StopIteration:
             pass
 
-        return lines
+        return FileBlame(commits, run_starts, run_commits, line_count)
+
+# Process-wide cache of whole-file blames, keyed on (repository path, from
+# SHA-1, to SHA-1, path).  Since the key only contains SHA-1s, the entries
+# never become stale; the least recently used ones are simply evicted once
+# there are more than limits.MAXIMUM_BLAME_CACHE_ENTRIES of them.
+BLAME_CACHE = collections.OrderedDict()
+BLAME_CACHE_LOCK = threading.Lock()
+
+def getFileBlame(repository, from_sha1, to_sha1, path):
+    key = (repository.path, from_sha1, to_sha1, path)
+
+    with BLAME_CACHE_LOCK:
+        file_blame = BLAME_CACHE.pop(key, None)
+        if file_blame is not None:
+            BLAME_CACHE[key] = file_blame
+            return file_blame
+
+    output = repository.run("blame",
+                            "--porcelain",
+                            "%s..%s" % (from_sha1, to_sha1),
+                            "--", path)
+
+    file_blame = FileBlame.fromPorcelain(output)
+    maximum_entries = configuration.limits.MAXIMUM_BLAME_CACHE_ENTRIES
+
+    if maximum_entries > 0:
+        with BLAME_CACHE_LOCK:
+            BLAME_CACHE[key] = file_blame
+            while len(BLAME_CACHE) > maximum_entries:
+                BLAME_CACHE.popitem(last=False)
+
+    return file_blame
+
+class Blame:
+    def __init__(self, from_commit, to_commit):
+        assert from_commit.repository == to_commit.repository
+
+        self.repository = from_commit.repository
+        self.from_commit = from_commit
+        self.to_commit = to_commit
+        self.commits = []
+        self.__commit_ids = {}
+
+    def __addCommits(self, db, file_blame, commit_indexes):
+        new_commits = [file_blame.commits[commit_index]
+                       for commit_index in sorted(commit_indexes)
+                       if file_blame.commits[commit_index][0] not in self.__commit_ids]
+
+        if not new_commits:
+            return
+
+        # Fetch all commits not already cached using a single 'git cat-file
+        # --batch' process, instead of one fetch per commit.
+        cache = db.storage["Commit"]
+        need_fetch = dict((sha1, None) for sha1, _, _ in new_commits
+                          if sha1 not in cache)
+        if len(need_fetch) > 1:
+            FetchCommits(self.repository, need_fetch).getCommits(db)
+
+        for sha1, author, author_email in new_commits:
+            commit = cache.get(sha1)
+            if commit is None:
+                commit = Commit.fromSHA1(db, self.repository, sha1)
+
+            self.__commit_ids[sha1] = len(self.commits)
+            self.commits.append({ "sha1": sha1,
+                                  "author_name": author,
+                                  "author_email": author_email,
+                                  "summary": commit.niceSummary(),
+                                  "message": commit.message,
+                                  "original": sha1 == self.from_commit.sha1,
+                                  "current": sha1 == self.to_commit.sha1 })
+
+    def blame(self, db, path, first_line, last_line):
+        file_blame = getFileBlame(self.repository, self.from_commit.sha1,
+                                  self.to_commit.sha1, path)
+
+        lines = file_blame.lines(first_line, last_line)
+
+        self.__addCommits(db, file_blame, set(commit_index for _, commit_index in lines))
+
+        return [{ "offset": line,
+                  "commit": self.__commit_ids[file_blame.commits[commit_index][0]] }
+                for line, commit_index in lines]
 
 class FetchCommits(threading.Thread):
     def __init__(self, repository, sha1s):
@@ -51,3 +51,92 @@ def keepalives():
                                              % (chain_before, chain_after))
 
     print "keepalives: ok"
+
+def blame():
+    import gitutils
+
+    def group(sha1, original_line, current_line, author=None):
+        header = ["%s %d %d" % (sha1, original_line, current_line)]
+        if author:
+            header.extend(["author %s" % author,
+                           "author-mail <%s@example.org>" % author.lower(),
+                           "summary Some commit"])
+        return header + ["\tline %d" % current_line]
+
+    A = "a" * 40
+    B = "b" * 40
+
+    output = "\n".join(group(A, 1, 1, "Alice") +
+                       group(A, 2, 2) +
+                       group(B, 1, 3, "Bob") +
+                       group(B, 2, 4) +
+                       group(B, 3, 5) +
+                       group(A, 3, 6) +
+                       group(A, 4, 7))
+
+    file_blame = gitutils.FileBlame.fromPorcelain(output)
+
+    assert file_blame.commits == [(A, "Alice", "alice@example.org"),
+                                  (B, "Bob", "bob@example.org")]
+    assert file_blame.run_starts == [1, 3, 6], file_blame.run_starts
+    assert file_blame.run_commits == [0, 1, 0], file_blame.run_commits
+    assert file_blame.line_count == 7
+
+    expected = [None, 0, 0, 1, 1, 1, 0, 0]
+
+    for first_line in range(1, 8):
+        for last_line in range(first_line, 8):
+            lines = file_blame.lines(first_line, last_line)
+            assert lines == [(line, expected[line])
+                             for line in range(first_line, last_line + 1)], \
+                ((first_line, last_line), lines)
+
+    # Ranges extending past the end of the file are truncated.
+    assert file_blame.lines(6, 100) == [(6, 0), (7, 0)]
+    assert file_blame.lines(8, 10) == []
+
+    print "blame: ok"
+
+def trees():
+    # Make sure path resolution via memoized tree objects agrees with what
+    # 'git ls-tree' says about the same paths.
+
+    import api
+    import gitutils
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+
+    for repository in api.repository.fetchAll(critic):
+        repository = repository._impl.getInternal(critic)
+        commit = gitutils.Commit.fromSHA1(
+            db, repository, repository.revparse("HEAD"))
+
+        lstree_output = repository.run("ls-tree", "-r", "-t", "-l", "-z",
+                                       commit.sha1)
+
+        for line in lstree_output.split("\0"):
+            if not line:
+                continue
+
+            details, path = line.split("\t", 1)
+            mode, object_type, sha1, size = details.split()
+
+            entry = commit.getFileEntry(path)
+
+            assert entry is not None, path
+            assert entry.type == object_type, (path, entry.type)
+            assert entry.sha1 == sha1, (path, entry.sha1)
+            assert int(entry.mode) == int(mode, 8), (path, entry.mode)
+
+            if object_type == "blob":
+                assert entry.size == int(size), (path, entry.size)
+            else:
+                assert entry.size is None, (path, entry.size)
+
+            assert commit.isDirectory(path) == (object_type == "tree"), path
+
+        assert commit.getFileEntry("no/such/file") is None
+        assert not commit.isDirectory("no/such/directory")
+
+    print "trees: ok"
@@ -15,6 +15,7 @@
 # the License.
 
 import sys
+import time
 
 from subprocess import Popen as process, PIPE
 from re import compile, split
@@ -53,6 +54,61 @@ def timestamp(time):
 class IndexException(Exception):
     pass
 
+class PushProgress(object):
+    """Progress of the push being processed
+
+       The githook service replaces the module-level |progress| object with
+       one that reports progress records to the pushing user while the push
+       is processed, and that has a time budget after which commits added to
+       reviews are deferred until the push has been accepted.  Outside of the
+       githook service, the default object does nothing."""
+
+    def __init__(self, emit=None, time_budget=None, interval=None):
+        self.__emit = emit
+        self.__started = time.time()
+        self.__time_budget = time_budget
+        self.__interval = interval or 0
+        self.__last_report = self.__started
+        self.phase = None
+        self.commits = 0
+        self.changesets = 0
+        self.deferred = False
+
+    def __report(self):
+        # Reports are emitted at most once per interval, and not at all
+        # during the first interval, so that quick pushes are not cluttered
+        # with progress output.
+        if not self.__emit:
+            return
+        now = time.time()
+        if now - self.__last_report < self.__interval:
+            return
+        self.__last_report = now
+        self.__emit({ "phase": self.phase,
+                      "commits": self.commits,
+                      "changesets": self.changesets,
+                      "elapsed": int(now - self.__started) })
+
+    def setPhase(self, phase):
+        self.phase = phase
+        self.commits = 0
+        self.changesets = 0
+        self.__report()
+
+    def processedCommits(self, count=1):
+        self.commits += count
+        self.__report()
+
+    def queuedChangesets(self, count):
+        self.changesets += count
+        self.__report()
+
+    def overBudget(self):
+        return (self.__time_budget is not None
+                and time.time() - self.__started > self.__time_budget)
+
+progress = PushProgress()
+
 def processCommits(db, repository, sha1):
     sha1 = repository.run("rev-parse", "--verify", "--quiet", sha1 + "^{commit}").strip()
 
@@ -107,6 +163,7 @@ perhaps pushing to the wrong repository?""" % count)
                 new_commit = True
 
             commits.add(sha1)
+            progress.processedCommits()
 
             if new_commit:
                 edges_values.extend([(parent_sha1, commit.sha1) for parent_sha1 in set(commit.parents)])
@@ -790,7 +847,12 @@ included in the review are too.
 
 Perhaps you should request a new review of the follow-up commits?""")
 
-        reviewing.utils.addCommitsToReview(db, user, review, all_commits, commitset=commits, tracked_branch=tracked_branch)
+        added = reviewing.utils.addCommitsToReview(db, user, review, all_commits, commitset=commits, tracked_branch=tracked_branch, deferrable=True)
+
+        if not added:
+            deferReviewUpdate(db, user, review, all_commits,
+                              [commit for commit in all_commits if commit.sha1 in commits],
+                              old, new, tracked_branch)
 
     reachable_values = [(branch.id, sha1) for sha1 in reversed(commit_list) if sha1 in commits]
 
@@ -799,12 +861,119 @@ Perhaps you should request a new review of the follow-up commits?""")
 
     db.commit()
 
-    if configuration.extensions.ENABLED and review:
+    if configuration.extensions.ENABLED and review and added:
         extensions.role.processcommits.execute(db, user, review, all_commits,
                                                gitutils.Commit.fromSHA1(db, repository, old),
                                                gitutils.Commit.fromSHA1(db, repository, new),
                                                sys.stdout)
 
+def deferReviewUpdate(db, user, review, all_commits, commits, old, new, tracked_branch):
+    """Record commits to be added to a review after the push has been accepted
+
+       The record is inserted in the same transaction as the branch update, so
+       that the review's branch never points at commits that neither have been
+       added to the review nor are about to be.  |commits| are the commits that
+       passed addCommitsToReview()'s checks, and |all_commits| the ones passed
+       on to extensions' ProcessCommits roles."""
+
+    # The system user (e.g. the branch tracker updating a tracked review) has
+    # no row in the users table, so it's recorded as NULL.
+    user_id = None if user.isSystem() else user.id
+
+    data = { "all_commits": [commit.getId(db) for commit in all_commits],
+             "commits": [commit.getId(db) for commit in commits],
+             "old": old,
+             "new": new,
+             "tracked_branch": tracked_branch }
+
+    cursor = db.cursor()
+    cursor.execute("""INSERT INTO deferredreviewupdates (review, uid, data)
+                           VALUES (%s, %s, %s)""",
+                   (review.id, user_id, textutils.json_encode(data)))
+
+    print """\
+%d commit%s will be added to the review at:
+  %s
+once the push has been accepted.""" % (len(commits), "s" if len(commits) > 1 else "",
+                                       review.getURL(db))
+
+    progress.deferred = True
+
+# Number of times a deferred review update is attempted before it is left for
+# the system administrator to look into.
+MAXIMUM_DEFERRED_ATTEMPTS = 5
+
+def finishDeferredReviewUpdates(db, repository):
+    """Finish deferred review updates of reviews in the repository
+
+       Each update is finished and deleted in its own transaction.  An update
+       that fails is left in place, with its attempt counter incremented, and
+       is attempted again by the next push to the repository.  Returns a list
+       of error messages, one per failed update."""
+
+    import traceback
+
+    cursor = db.cursor()
+    cursor.execute("""SELECT deferredreviewupdates.id, deferredreviewupdates.review,
+                             deferredreviewupdates.uid, deferredreviewupdates.data,
+                             deferredreviewupdates.attempts
+                        FROM deferredreviewupdates
+                        JOIN reviews ON (reviews.id=deferredreviewupdates.review)
+                        JOIN branches ON (branches.id=reviews.branch)
+                       WHERE branches.repository=%s
+                         AND deferredreviewupdates.attempts<%s
+                    ORDER BY deferredreviewupdates.id ASC""",
+                   (repository.id, MAXIMUM_DEFERRED_ATTEMPTS))
+
+    errors = []
+
+    for update_id, review_id, user_id, data, attempts in cursor.fetchall():
+        try:
+            review = dbutils.Review.fromId(db, review_id)
+            if user_id is None:
+                user = dbutils.User.makeSystem()
+            else:
+                user = dbutils.User.fromId(db, user_id)
+            data = textutils.json_decode(data)
+            all_commits = gitutils.Commit.fromIds(
+                db, repository, data["all_commits"])
+
+            progress.setPhase("adding commits to review")
+
+            reviewing.utils.addConfirmedCommitsToReview(
+                db, user, review,
+                gitutils.Commit.fromIds(db, repository, data["commits"]),
+                tracked_branch=data["tracked_branch"])
+
+            db.cursor().execute("""DELETE FROM deferredreviewupdates
+                                         WHERE id=%s""",
+                                (update_id,))
+            db.commit()
+        except Exception:
+            db.rollback()
+            db.cursor().execute("""UPDATE deferredreviewupdates
+                                      SET attempts=attempts + 1
+                                    WHERE id=%s""",
+                                (update_id,))
+            db.commit()
+            errors.append("deferred update %d of r/%d failed:\n%s"
+                          % (update_id, review_id, traceback.format_exc()))
+            continue
+
+        if configuration.extensions.ENABLED:
+            try:
+                extensions.role.processcommits.execute(
+                    db, user, review, all_commits,
+                    gitutils.Commit.fromSHA1(db, repository, data["old"]),
+                    gitutils.Commit.fromSHA1(db, repository, data["new"]),
+                    sys.stdout)
+            except Exception:
+                errors.append("ProcessCommits for deferred update %d of r/%d "
+                              "failed:\n%s"
+                              % (update_id, review_id, traceback.format_exc()))
+
+    return errors
+
 def deleteBranch(db, user, repository, name, old):
     try:
         update(repository.path, "refs/heads/" + name, old, None)
@@ -15,11 +15,13 @@
 # the License.
 
 import contextlib
+import hashlib
 import itertools
 import re
 
 import api
 import auth
+import dbutils
 import request
 import textutils
 
@@ -247,13 +249,14 @@ def registerHandler(path, resource_class):
 def PrimaryResource(resource_class):
     assert hasattr(resource_class, "name")
     assert hasattr(resource_class, "value_class")
-    for name in ("single", "multiple", "create", "update", "delete"):
+    for name in ("single", "multiple", "create", "update", "delete", "etag"):
         if not hasattr(resource_class, name):
             setattr(resource_class, name, None)
-    for name in ("exceptions", "objects", "lists", "maps"):
+    for name in ("exceptions", "objects", "lists", "maps", "relations"):
         if not hasattr(resource_class, name):
             setattr(resource_class, name, ())
-    for name in ("anonymous_create", "anonymous_update", "anonymous_delete"):
+    for name in ("anonymous_create", "anonymous_update", "anonymous_delete",
+                 "immutable"):
         if not hasattr(resource_class, name):
             setattr(resource_class, name, False)
     if not hasattr(resource_class, "resource_id"):
@@ -320,6 +323,20 @@ def from_parameter(resource_path, parameter_name, parameters):
         raise PathError("Invalid parameter: %s=%s: %s"
                         % (parameter_name, parameter_value, error.message))
 
+def prefetch(parameters, resource_class, values):
+    """Load the relations of many values before serializing them
+
+       Resource classes list the fields in their JSON output that reference
+       other API objects in their 'relations' attribute.  Those of them that
+       were requested are loaded in bulk for all values, so that producing the
+       JSON for each value doesn't run a set of queries per value."""
+    if len(values) < 2:
+        return
+    relations = [relation for relation in resource_class.relations
+                 if parameters.hasField(resource_class.name, relation)]
+    if relations:
+        api.apiobject.prefetch(parameters.critic, values, relations)
+
 def sorted_by_id(items):
     return sorted(items, key=lambda item: item.id)
 
@@ -345,6 +362,69 @@ def getAPIVersion(req):
 
     return api_version
 
+# Cache-Control header values for responses with an ETag header.  Immutable
+# resources can be cached for as long as the client wishes, while others must
+# be revalidated (cheaply, using If-None-Match) on every use.
+CACHE_CONTROL_IMMUTABLE = "private, max-age=31536000"
+CACHE_CONTROL_REVALIDATE = "private, no-cache"
+
+def getETag(critic, req, parameters, resource_class, value, values):
+    """Return an entity tag for the requested value(s), or None
+
+       The entity tag is computed from validators returned by the resource
+       class's etag() method, without producing the actual resource JSON, so
+       that conditional requests for unchanged resources are cheap."""
+
+    if not resource_class.etag:
+        return None
+
+    # The resource class's validators don't cover linked resources, nor the
+    # debug output.
+    if req.getParameter("include", None) is not None or parameters.debug:
+        return None
+
+    if value is not None:
+        values = [value]
+
+    validators = []
+    try:
+        for value in values:
+            validator = resource_class.etag(value, parameters)
+            if validator is None:
+                return None
+            validators.append(validator)
+    except resource_class.exceptions:
+        # Leave it to finishGET() to report the error.
+        return None
+
+    effective_user = critic.effective_user
+    components = [dbutils.getInstalledSHA1(critic.database),
+                  "anonymous" if effective_user.is_anonymous
+                  else "user%d" % effective_user.id,
+                  resource_class.name]
+    components.extend(validators)
+
+    return '"%s"' % hashlib.sha1("\0".join(components)).hexdigest()
+
+def matchesETag(req, etag):
+    if_none_match = req.getRequestHeader("If-None-Match")
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+def addCacheHeaders(req, resource_class, etag):
+    req.addResponseHeader("ETag", etag)
+    if resource_class.immutable:
+        req.addResponseHeader("Cache-Control", CACHE_CONTROL_IMMUTABLE)
+    else:
+        req.addResponseHeader("Cache-Control", CACHE_CONTROL_REVALIDATE)
+
 def finishGET(critic, req, parameters, resource_class, value, values):
     assert (value is None) != (values is None)
 
@@ -352,8 +432,11 @@ def finishGET(critic, req, parameters, resource_class, value, values):
 
     try:
         if values is not None:
+            values = list(values)
             values_json = []
 
+            prefetch(parameters, resource_class, values)
+
             for value in values:
                 try:
                     values_json.append(resource_class.json(value, parameters))
@@ -400,6 +483,9 @@ def finishGET(critic, req, parameters, resource_class, value, values):
 
             for resource_type, linked_values in linked.linked_per_type.items():
                 resource_class = lookup([api_version, resource_type])
+                linked_values = list(linked_values)
+
+                prefetch(parameters, resource_class, linked_values)
 
                 for linked_value in linked_values:
                     try:
@@ -561,6 +647,11 @@ def handleRequestInternal(critic, req):
     context = None
     resource_class = None
 
+    # Set to false if the final resource is a list produced by multiple(),
+    # which includes values that an entity tag computed from the listed values
+    # would not cover, such as the absence of values that don't exist yet.
+    conditional = True
+
     while True:
         next_component = path.pop(0)
 
@@ -640,7 +731,9 @@ def handleRequestInternal(critic, req):
                     values = resource_class.multiple(parameters)
                 if isinstance(values, resource_class.value_class):
                     value, values = values, None
-                elif not parameters.range_accessed:
+                else:
+                    conditional = False
+                if values is not None and not parameters.range_accessed:
                     begin, end = parameters.getRange()
                     values = itertools.islice(values, begin, end)
                 break
@@ -651,7 +744,19 @@ def handleRequestInternal(critic, req):
         values = list(values)
 
     if req.method == "GET":
-        return finishGET(critic, req, parameters, resource_class, value, values)
+        if conditional:
+            etag = getETag(
+                critic, req, parameters, resource_class, value, values)
+        else:
+            etag = None
+        if etag is not None and matchesETag(req, etag):
+            addCacheHeaders(req, resource_class, etag)
+            raise request.NotModified()
+        result = finishGET(
+            critic, req, parameters, resource_class, value, values)
+        if etag is not None:
+            addCacheHeaders(req, resource_class, etag)
+        return result
     elif req.method == "POST":
         return finishPOST(
             critic, req, parameters, resource_class, value, values, data)
@@ -81,6 +81,14 @@ class Changesets(object):
                 "review_state": review_state(review)
             })
 
+    @staticmethod
+    def etag(value, parameters):
+        validator = "changeset%d" % value.id
+        review = jsonapi.deduce("v1/reviews", parameters)
+        if review:
+            validator += "." + review.etag
+        return validator
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) changesets.
@@ -25,6 +25,8 @@ class Comments(object):
     contexts = (None, "reviews")
     value_class = (api.comment.Comment, api.comment.Issue, api.comment.Note)
     exceptions = (api.comment.CommentError, api.reply.ReplyError)
+    relations = ("review", "author", "resolved_by", "replies", "location",
+                 "addressed_by")
 
     @staticmethod
     def json(value, parameters):
@@ -28,6 +28,7 @@ class Commits(object):
     contexts = (None, "repositories", "changesets")
     value_class = api.commit.Commit
     exceptions = (api.commit.CommitError, api.repository.InvalidRef)
+    immutable = True
 
     @staticmethod
     def json(value, parameters):
@@ -77,6 +78,10 @@ class Commits(object):
                           "author": userAndTimestamp(value.author),
                           "committer": userAndTimestamp(value.committer) })
 
+    @staticmethod
+    def etag(value, parameters):
+        return value.sha1
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) commits from a Git repository.
@@ -25,6 +25,7 @@ class Filecontents(object):
     contexts = (None, "repositories")
     value_class = api.filecontent.Filecontent
     exceptions = (api.filecontent.FilecontentError,)
+    immutable = True
 
     @staticmethod
     def json(value, parameters):
@@ -51,6 +52,12 @@ class Filecontents(object):
         return parameters.filtered(
             "filecontents", {"lines": dict_lines})
 
+    @staticmethod
+    def etag(value, parameters):
+        # The syntax highlighting depends on the file's path, which is part of
+        # the request URL, so the blob SHA-1 suffices here.
+        return value.sha1
+
     @staticmethod
     def multiple(parameters):
         """TODO: add documentation"""
@@ -99,6 +99,17 @@ class Filediffs(object):
                 "new_count": value.new_count
             })
 
+    @staticmethod
+    def etag(value, parameters):
+        if jsonapi.deduce("v1/comments", parameters) is not None:
+            return None
+        validator = "filediff%d.%d" % (value.filechange.changeset.id,
+                                       value.filechange.file.id)
+        review = jsonapi.deduce("v1/reviews", parameters)
+        if review is not None:
+            validator += "." + review.etag
+        return validator
+
     @staticmethod
     def single(parameters, argument):
         """TODO: add documentation"""
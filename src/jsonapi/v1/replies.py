@@ -25,6 +25,7 @@ class Replies(object):
     contexts = (None, "comments")
     value_class = api.reply.Reply
     exceptions = (api.comment.CommentError, api.reply.ReplyError)
+    relations = ("author",)
 
     @staticmethod
     def json(value, parameters):
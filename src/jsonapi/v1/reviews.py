@@ -25,6 +25,8 @@ class Reviews(object):
     value_class = api.review.Review
     exceptions = (api.review.InvalidReviewId, api.repository.RepositoryError)
     lists = ("issues", "notes")
+    relations = ("owners", "active_reviewers", "assigned_reviewers",
+                 "watchers")
 
     @staticmethod
     def json(value, parameters):
@@ -102,6 +104,10 @@ class Reviews(object):
                          "progress_per_commit":
                              change_counts_as_dict(value.progress_per_commit)})
 
+    @staticmethod
+    def etag(value, parameters):
+        return value.etag
+
     @staticmethod
     def single(parameters, argument):
         """Retrieve one (or more) reviews in this system.
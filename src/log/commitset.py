@@ -15,6 +15,7 @@
 # the License.
 
 import gitutils
+import commitorder
 
 class CommitSet:
     def __init__(self, commits):
@@ -39,6 +40,9 @@ class CommitSet:
         # Tails: parent commits not included in the set.
         self.__tails = parents - commit_set
 
+        # Computed on demand by __getReachability().
+        self.__reachability = None
+
     def __contains__(self, commit):
         return str(commit) in self.__commits
 
@@ -74,34 +78,49 @@ class CommitSet:
     def getParents(self, commit):
         return set([self.__commits[sha1] for sha1 in commit.parents if sha1 in self.__commits])
 
+    def getDateOrdered(self):
+        """Return a generator producing the commits in committer timestamp
+order, with commits guaranteed to precede their parents."""
+        return commitorder.dateOrdered(
+            self.__commits.values(), self.__children, self.__getParentsList,
+            lambda commit: commit.committer.time)
+
+    def getAuthorDateOrdered(self):
+        """Return a generator producing the commits in author timestamp order,
+with commits guaranteed to precede their parents."""
+        return commitorder.dateOrdered(
+            self.__commits.values(), self.__children, self.__getParentsList,
+            lambda commit: commit.author.time)
+
+    def getTopoOrdered(self):
+        """Return a generator producing the commits in "topological" order.  The
+set must have a single head."""
+        if not self.__commits:
+            return iter(())
+        assert len(self.__heads) == 1
+        return commitorder.topoOrdered(
+            self.__commits.values(), next(iter(self.__heads)), self.__children,
+            self.__getParentsList, lambda commit: commit.committer.time)
+
+    def __getParentsList(self, commit):
+        return [self.__commits[sha1] for sha1 in commit.parents
+                if sha1 in self.__commits]
+
     def getFilteredTails(self, repository):
         """Return a set containing each tail commit of the set of commits that isn't an
 ancestor of another tail commit of the set.  If the tail commits of the set
 are all different commits on an upstream branch, then this will return only
 the latest one."""
 
-        candidates = self.getTails()
-        result = set()
-
-        while candidates:
-            tail = candidates.pop()
-
-            eliminated = set()
-            for other in candidates:
-                base = repository.mergebase([tail, other])
-                if base == tail:
-                    # Tail is an ancestor of other: tail should not be included
-                    # in the returned set.
-                    break
-                elif base == other:
-                    # Other is an ancestor of tail: other should not be included
-                    # in the returned set.
-                    eliminated.add(other)
-            else:
-                result.add(tail)
-            candidates -= eliminated
-
-        return result
+        tails = self.getTails()
+
+        if len(tails) < 2:
+            return tails
+
+        # A single 'git merge-base --independent' does what would otherwise
+        # take one 'git merge-base' per pair of tails.
+        return set(repository.run(
+            "merge-base", "--independent", *sorted(tails)).split())
 
     def getTailsFrom(self, commit):
         """
@@ -131,35 +150,81 @@ the latest one."""
 
         return tails
 
+    def __getReachability(self):
+        """Return a (ancestors, commits) tuple where 'ancestors' maps each commit
+in the set to a bitset (an integer) with a bit set for each of its ancestors in
+the set, including itself, and 'commits' maps each bit number back to a commit.
+
+Computed once per commit set, in a single pass over the commits with parents
+visited before children."""
+
+        if self.__reachability is None:
+            ancestors = {}
+            commits = []
+
+            for head in self.__commits.values():
+                stack = [(head, False)]
+
+                while stack:
+                    commit, parents_done = stack.pop()
+
+                    if commit in ancestors:
+                        continue
+                    elif parents_done:
+                        mask = 1 << len(commits)
+                        for parent in self.__getParentsList(commit):
+                            mask |= ancestors[parent]
+                        ancestors[commit] = mask
+                        commits.append(commit)
+                    else:
+                        stack.append((commit, True))
+                        stack.extend((parent, False)
+                                     for parent in self.__getParentsList(commit)
+                                     if parent not in ancestors)
+
+            self.__reachability = ancestors, commits
+
+        return self.__reachability
+
     def getCommonAncestors(self, commit):
         """Return a set of each commit in this set that is an ancestor of each parent of
 'commit' (which must be a member of the set) or None if the parents of 'commit'
-have no common ancestor within this set."""
+have no common ancestor within this set.
+
+Only the nearest common ancestors, as seen from the last parent, are returned:
+the last parent itself, if it is a common ancestor, or otherwise the common
+ancestors that are parents of ancestors of the last parent that are not common
+ancestors."""
 
         common_ancestors = set()
-        branches = []
 
         for sha1 in commit.parents:
             if sha1 not in self.__commits: return common_ancestors
-            branches.append(set())
 
-        for index, sha1 in enumerate(commit.parents):
-            stack = set([sha1])
-            branch = branches[index]
+        ancestors, commits = self.__getReachability()
 
-            while stack:
-                commit = self.__commits.get(stack.pop())
+        common = reduce(lambda mask, sha1: mask & ancestors[sha1],
+                        commit.parents, -1)
+        last_parent = self.__commits[commit.parents[-1]]
 
-                if commit and commit not in branch:
-                    branch.add(commit)
+        def bit(commit):
+            # A commit's own bit is the highest bit set in its bitset, since
+            # ancestors are numbered before descendants.
+            return 1 << (ancestors[commit].bit_length() - 1)
 
-                    for other_index, other_branch in enumerate(branches):
-                        if commit not in other_branch: break
-                    else:
-                        common_ancestors.add(commit)
-                        continue
+        if common & bit(last_parent):
+            common_ancestors.add(last_parent)
+        else:
+            uncommon = ancestors[last_parent] & ~common
 
-                    stack.update(set(commit.parents))
+            while uncommon:
+                lowest = uncommon & -uncommon
+                uncommon ^= lowest
+
+                for parent in self.__getParentsList(
+                        commits[lowest.bit_length() - 1]):
+                    if common & bit(parent):
+                        common_ancestors.add(parent)
 
         return common_ancestors
 
@@ -220,44 +285,57 @@ have no common ancestor within this set."""
 
     @staticmethod
     def fromRange(db, from_commit, to_commit, commits=None):
-        repository = to_commit.repository
-        commits = set()
+        """Return a commit set containing the commits in the range
+'from_commit'..'to_commit', or None if the range contains merges with ancestors
+not included in the range.
 
-        class NotPossible(Exception): pass
+The parent graph of the whole range is read from a single 'git rev-list
+--parents', and any commits not already loaded are fetched using a single 'git
+cat-file --batch'.  If 'commits' is not None, it is a commit set (or similar)
+from which already loaded commits are taken."""
 
-        if commits:
-            def getCommit(sha1):
-                return commits[sha1]
-        else:
-            def getCommit(sha1):
-                return gitutils.Commit.fromSHA1(db, repository, sha1)
-
-        def process(iter_commit):
-            while iter_commit != from_commit and iter_commit not in commits:
-                commits.add(iter_commit)
-
-                if len(iter_commit.parents) > 1:
-                    # A merge commit.  Check if 'from_commit' is an ancestor of
-                    # all its parents.  If not, we don't support constructing a
-                    # commit-set from this range of commits (not because it is
-                    # particularly difficult, but because such a commit-set
-                    # would contain "unexpected" merged-in commits.)
-
-                    if from_commit.isAncestorOf(repository.mergebase(iter_commit)):
-                        map(process, [getCommit(sha1) for sha1 in iter_commit.parents])
-                        return
-                    else:
-                        raise NotPossible
-                elif iter_commit.parents:
-                    iter_commit = getCommit(iter_commit.parents[0])
-                else:
-                    return
+        repository = to_commit.repository
 
         if from_commit == to_commit:
             return CommitSet([to_commit])
 
-        try:
-            process(to_commit)
-            return CommitSet(commits)
-        except NotPossible:
-            return None
+        if from_commit is None:
+            argv = [to_commit.sha1]
+        else:
+            argv = ["^" + from_commit.sha1, to_commit.sha1]
+
+        parents = {}
+
+        for line in repository.run("rev-list", "--parents", *argv).splitlines():
+            sha1s = line.split()
+            parents[sha1s[0]] = sha1s[1:]
+
+        # Every commit in the range must be a descendant of 'from_commit'
+        # without any other commits (that is, ancestors of 'from_commit')
+        # merged in along the way.  We don't support constructing a commit-set
+        # from a range with such merges (not because it is particularly
+        # difficult, but because such a commit-set would contain "unexpected"
+        # merged-in commits.)
+        for parent_sha1s in parents.values():
+            for parent_sha1 in parent_sha1s:
+                if parent_sha1 not in parents and parent_sha1 != from_commit:
+                    return None
+
+        def getCommit(sha1):
+            if commits is not None:
+                commit = commits.get(sha1)
+                if commit is not None:
+                    return commit
+            commit = cache.get(sha1)
+            if commit is None:
+                commit = gitutils.Commit.fromSHA1(db, repository, sha1)
+            return commit
+
+        cache = db.storage["Commit"]
+        need_fetch = dict((sha1, None) for sha1 in parents
+                          if sha1 not in cache
+                          and (commits is None or sha1 not in commits))
+        if len(need_fetch) > 1:
+            gitutils.FetchCommits(repository, need_fetch).getCommits(db)
+
+        return CommitSet(map(getCommit, parents))
@@ -0,0 +1,122 @@
+class Commit(object):
+    def __init__(self, sha1, *parents):
+        self.sha1 = sha1
+        self.parents = list(parents)
+    def __hash__(self):
+        return hash(self.sha1)
+    def __eq__(self, other):
+        return self.sha1 == str(other)
+    def __ne__(self, other):
+        return self.sha1 != str(other)
+    def __str__(self):
+        return self.sha1
+
+def commonancestors():
+    import log.commitset
+
+    #   H
+    #   |\
+    #   F G
+    #   | |\
+    #   D E |
+    #   |/ /
+    #   C  |
+    #   | /
+    #   B
+    #   |
+    #   A
+    #   |
+    #  (X)
+    commits = [Commit("A", "X"),
+               Commit("B", "A"),
+               Commit("C", "B"),
+               Commit("D", "C"),
+               Commit("E", "C"),
+               Commit("F", "D"),
+               Commit("G", "E", "B"),
+               Commit("H", "F", "G"),
+               # Merge of two unrelated parents, one outside the set.
+               Commit("I", "H", "Y")]
+
+    commit_set = log.commitset.CommitSet(commits)
+
+    def common(sha1):
+        return set(map(str, commit_set.getCommonAncestors(commit_set[sha1])))
+
+    assert common("G") == set(["B"])
+    assert common("H") == set(["B", "C"])
+    assert common("I") == set()
+
+    # Merge where the last parent is an ancestor of the first.
+    commit_set = log.commitset.CommitSet(commits + [Commit("J", "H", "D")])
+    assert common("J") == set(["D"])
+
+    print "commonancestors: ok"
+
+def fromrange():
+    import api
+    import gitutils
+    import log.commitset
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+
+    for repository in api.repository.fetchAll(critic):
+        repository = repository._impl.getInternal(critic)
+
+        first_parents = repository.run(
+            "rev-list", "--first-parent", "--max-count=20", "HEAD").split()
+
+        to_commit = gitutils.Commit.fromSHA1(db, repository, first_parents[0])
+
+        for from_sha1 in first_parents[1:]:
+            from_commit = gitutils.Commit.fromSHA1(db, repository, from_sha1)
+            commit_set = log.commitset.CommitSet.fromRange(
+                db, from_commit, to_commit)
+
+            if commit_set is None:
+                continue
+
+            expected = set(repository.run(
+                "rev-list", "%s..%s" % (from_sha1, to_commit.sha1)).split())
+
+            assert set(commit.sha1 for commit in commit_set) == expected
+            assert commit_set.getTails() == set([from_sha1])
+
+    print "fromrange: ok"
+
+def ordering():
+    import log.commitset
+
+    class Time(object):
+        def __init__(self, time):
+            self.time = time
+
+    def commit(sha1, parents, committer_time, author_time):
+        commit = Commit(sha1, *parents)
+        commit.committer = Time(committer_time)
+        commit.author = Time(author_time)
+        return commit
+
+    #   D
+    #   |\
+    #   B C
+    #   |/
+    #   A
+    commit_set = log.commitset.CommitSet([commit("A", "", 1, 1),
+                                          commit("B", "A", 3, 5),
+                                          commit("C", "A", 2, 3),
+                                          commit("D", "BC", 4, 4)])
+
+    def tostring(commits):
+        return "".join(map(str, commits))
+
+    assert tostring(commit_set.getDateOrdered()) == "DBCA"
+    # B is authored after D, but must still follow it.
+    assert tostring(commit_set.getAuthorDateOrdered()) == "DBCA"
+    # Of D's parents, the one with the oldest timestamp is followed first.
+    assert tostring(commit_set.getTopoOrdered()) == "DCBA"
+
+    assert tostring(log.commitset.CommitSet([]).getTopoOrdered()) == ""
+
+    print "ordering: ok"
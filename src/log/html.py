@@ -21,6 +21,7 @@ from time import time, mktime, strftime, localtime
 
 import re
 import log.commitset
+import log.layout
 
 def formatWhen(when):
     def relative_time(delta, time_unit_singular):
@@ -48,9 +49,6 @@ def linkToCommit(commit, overrides={}):
         return "%s?review=%d" % (commit.sha1[:8], review.id)
     return "%s/%s" % (commit.repository.name, commit.sha1)
 
-re_remote_into_local = re.compile("^Merge (?:branch|commit) '([^']+)' of [^ ]+ into \\1$")
-re_side_into_main = re.compile("^Merge (?:remote )?(?:branch|commit) '[^']+' into .+$")
-re_octopus = re.compile("^Merge ((?:(?:branches|,| and) '[^']+')+) into [^ ]+$")
 
 class WhenColumn:
     def className(self, db, commit):
@@ -143,6 +141,8 @@ def render(db, target, title, branch=None, commits=None, columns=DEFAULT_COLUMNS
     tails = commit_set.getTails()
 
     rebase_old_heads = set()
+    rebase_heads = {}
+    rebase_ids = ()
 
     if rebases:
         class Rebase(object):
@@ -163,6 +163,9 @@ def render(db, target, title, branch=None, commits=None, columns=DEFAULT_COLUMNS
         # of the order in which the rebases were made.
         rebases = [Rebase(*rebase) for rebase in sorted(rebases)]
         rebase_old_heads = set(rebase.old_head for rebase in rebases)
+        rebase_heads = dict((rebase.old_head.sha1, rebase.old_head)
+                            for rebase in rebases)
+        rebase_ids = tuple(rebase.id for rebase in rebases)
         heads -= rebase_old_heads
 
         assert 0 <= len(heads) <= 1
@@ -246,45 +249,67 @@ def render(db, target, title, branch=None, commits=None, columns=DEFAULT_COLUMNS
 
     cursor = db.cursor()
 
+    # Set of (parent, child) commit id pairs of the review's changesets that
+    # aren't empty, loaded using a single query the first time it's needed.
+    non_empty_changesets = []
+
     def emptyChangeset(child, parent=None):
-        if parent is None:
-            cursor.execute("""SELECT 1
-                                FROM fileversions
-                                JOIN changesets ON (changesets.id=fileversions.changeset)
+        if not non_empty_changesets:
+            cursor.execute("""SELECT changesets.parent, changesets.child
+                                FROM changesets
                                 JOIN reviewchangesets ON (reviewchangesets.changeset=changesets.id)
-                               WHERE changesets.child=%s
-                                 AND reviewchangesets.review=%s""",
-                           (child.getId(db), review.id))
+                               WHERE reviewchangesets.review=%s
+                                 AND EXISTS (SELECT 1
+                                               FROM fileversions
+                                              WHERE fileversions.changeset=changesets.id)""",
+                           (review.id,))
+            pairs = set(cursor)
+            non_empty_changesets.append(
+                (pairs, set(child_id for _, child_id in pairs)))
+
+        pairs, child_ids = non_empty_changesets[0]
+
+        if parent is None:
+            return child.getId(db) not in child_ids
         else:
-            cursor.execute("""SELECT 1
-                                FROM fileversions
-                                JOIN changesets ON (changesets.id=fileversions.changeset)
-                                JOIN reviewchangesets ON (reviewchangesets.changeset=changesets.id)
-                               WHERE changesets.parent=%s
-                                 AND changesets.child=%s
-                                 AND reviewchangesets.review=%s""",
-                           (parent.getId(db), child.getId(db), review.id))
-        return not cursor.fetchone()
+            return (parent.getId(db), child.getId(db)) not in pairs
+
+    def isListed(commit):
+        return listed_commits is None or commit.getId(db) in listed_commits
+
+    def getCommit(sha1):
+        return commit_set.get(sha1) or rebase_heads[sha1]
+
+    def emit(target, section, align='right', table=None, hidden=False):
+        if hidden:
+            # The section isn't displayed, but its commits still count as
+            # displayed.
+            for item in section.items:
+                if isinstance(item, log.layout.Row):
+                    processed.add(getCommit(item.sha1))
+                else:
+                    emit(None, item.section, hidden=True)
+            return table
 
-    def inner(target, head, tails, align='right', title=None, table=None, silent_if_empty=set(), upstream=None):
         if not table:
             table = target.table('log', align=align, cellspacing=0)
 
             for width, column in columns: table.col(width=('%d%%' % width))
 
-            if title:
+            if section.title:
                 thead = table.thead()
                 row = thead.tr("title")
                 header = row.td("h1", colspan=len(columns)).h1()
-                header.text(title)
+                header.text(section.title)
                 if callable(title_right):
                     title_right(db, header.span("right"))
 
                 row = thead.tr('headings')
                 for width, column in columns:
                     column.heading(row.td(column.className(db, None)))
-            elif head is None or head in tails:
-                if upstream:
+            elif section.base_merge:
+                if section.upstream_sha1:
+                    upstream = Commit.fromSHA1(db, repository, section.upstream_sha1)
                     tag = upstream.findInterestingTag(db)
                     if tag: what = tag
                     else: what = upstream.sha1[:8]
@@ -294,169 +319,22 @@ def render(db, target, title, branch=None, commits=None, columns=DEFAULT_COLUMNS
                 thead = table.thead()
                 row = thead.tr('basemerge')
                 row.td(colspan=len(columns), align='center').text(message)
-                return (None, None, None, False)
+                return table
 
         tbody = table.tbody()
-        commit = head
-
-        last_commit = None
-        skipped = True
-
-        while commit and commit not in tails:
-            suppress = False
-            optional_merge = False
-            listed = listed_commits is None or commit.getId(db) in listed_commits
-
-            if commit in silent_if_empty and emptyChangeset(commit):
-                # This is a clean automatically generated merge commit; pretend it isn't here at all.
-                suppress = True
-
-            if not suppress and not listed:
-                suppress = len(commit.parents) == 1
-                optional_merge = not suppress
-
-            if not suppress: commit_tr = output(tbody, commit)
-            else: commit_tr = None
-
-            if listed: skipped = False
-            last_commit = commit
-
-            if len(commit.parents) == 0:
-                break
-            elif len(commit.parents) == 1:
-                commit = commit_set.get(commit.parents[0])
-            elif len(commit.parents) > 1:
-                if len(commit.parents) > 2:
-                    common_ancestors = commit_set.getCommonAncestors(commit)
-                    match = re_octopus.match(commit.message.split("\n", 1)[0])
-
-                    if match:
-                        titles = re.findall("'([^']+)'", match.group(1))
-                        if len(titles) != len(commit.parents):
-                            titles = None
-                    else:
-                        titles = None
-
-                    for index, sha1 in enumerate(commit.parents):
-                        if sha1 in commit_set:
-                            sublog = tbody.tr('sublog')
-                            inner_last_commit, inner_table, inner_tail, inner_skipped = inner(sublog.td(colspan=len(columns)), commit_set[sha1], common_ancestors, title=titles and titles[index] or None)
-                            if inner_skipped:
-                                sublog.remove()
-                                if optional_merge and commit_tr: commit_tr.remove()
-
-                    if not common_ancestors: return (None, None, None, False)
-
-                    commit = common_ancestors.pop()
-                    continue
-
-                parent1_sha1 = commit.parents[0]
-                parent2_sha1 = commit.parents[1]
-
-                parent1 = commit_set.get(parent1_sha1)
-                parent2 = commit_set.get(parent2_sha1)
-
-                # TODO: Try to remember what this code actually does, and why...
-                if parent1_sha1 in rebase_old_heads:
-                    if parent2:
-                        sublog = tbody.tr('sublog')
-                        inner_last_commit, inner_table, inner_tail, inner_skipped = \
-                            inner(sublog.td(colspan=len(columns)), parent2, tails)
-                        if inner_skipped:
-                            sublog.remove()
-                            if optional_merge and commit_tr: commit_tr.remove()
-                    return (commit, table, parent1_sha1, False)
-                elif parent2_sha1 in rebase_old_heads:
-                    if parent1:
-                        sublog = tbody.tr('sublog')
-                        inner_last_commit, inner_table, inner_tail, inner_skipped = \
-                            inner(sublog.td(colspan=len(columns)), parent1, tails)
-                        if inner_skipped:
-                            sublog.remove()
-                            if optional_merge and commit_tr: commit_tr.remove()
-                    return (commit, table, parent2_sha1, False)
-
-                if parent1 and parent2:
-                    common_ancestors = commit_set.getCommonAncestors(commit)
-
-                    merged_remote_into_local = re_remote_into_local.match(commit.summary()) or re_side_into_main.match(commit.summary())
-
-                    def rankPaths(commit, tails):
-                        shortest = None
-                        shortest_length = len(commit_set)
-                        longest = None
-                        longest_length = 0
-
-                        for sha1 in commit.parents:
-                            parent = commit_set[sha1]
-
-                            counted = set()
-                            pending = set([parent])
-
-                            while pending:
-                                candidate = pending.pop()
-
-                                if candidate in counted: continue
-                                if candidate in tails: continue
-
-                                counted.add(candidate)
-                                pending.update(commit_set.getParents(candidate))
-
-                            length = len(counted)
-
-                            if length < shortest_length:
-                                shortest = parent
-                                shortest_length = length
-                            if length >= longest_length:
-                                longest = parent
-                                longest_length = length
-
-                        return shortest, shortest_length, longest, longest_length
-
-                    show_merged, shortest_length, show_normal, longest_length = rankPaths(commit, common_ancestors | tails)
-                    display_parallel = False
-
-                    if merged_remote_into_local and shortest_length * 2 > longest_length:
-                        if len(common_ancestors) == 1 and len(commit_set.filtered([commit]).getTails()) == 1:
-                            display_parallel = True
-                        else:
-                            show_merged = parent2
-                            show_normal = parent1
-
-                    if display_parallel:
-                        all_empty = True
-
-                        for sha1 in commit.parents:
-                            sublog = tbody.tr('sublog')
-                            inner_last_commit, inner_table, inner_tail, inner_skipped = inner(sublog.td(colspan=len(columns)), commit_set[sha1], common_ancestors | tails)
-                            if inner_skipped:
-                                sublog.remove()
-                            else:
-                                all_empty = False
-
-                        if all_empty and optional_merge and commit_tr: commit_tr.remove()
-
-                        commit = common_ancestors.pop()
-                    else:
-                        sublog = tbody.tr('sublog')
-                        inner_last_commit, inner_table, inner_tail, inner_skipped = inner(sublog.td(colspan=len(columns)), show_merged, common_ancestors | tails)
-                        if inner_skipped:
-                            sublog.remove()
-                            if optional_merge and commit_tr: commit_tr.remove()
 
-                        commit = show_normal
+        for item in section.items:
+            if isinstance(item, log.layout.Row):
+                if item.removed:
+                    processed.add(getCommit(item.sha1))
                 else:
-                    if parent1: upstream_sha1 = parent2_sha1
-                    else: upstream_sha1 = parent1_sha1
-
-                    if not commit in silent_if_empty:
-                        # Merge with the base branch.
-                        inner(tbody.tr('sublog').td(colspan=len(columns)), None, None, upstream=Commit.fromSHA1(db, repository, upstream_sha1))
-
-                    if parent1: commit = parent1
-                    else: commit = parent2
+                    output(tbody, getCommit(item.sha1))
+            elif item.removed:
+                emit(None, item.section, hidden=True)
+            else:
+                emit(tbody.tr('sublog').td(colspan=len(columns)), item.section)
 
-        return (last_commit, table, last_commit.parents[0] if last_commit and last_commit.parents else None, skipped)
+        return table
 
     class_name = "paleyellow log"
 
@@ -558,20 +436,47 @@ def render(db, target, title, branch=None, commits=None, columns=DEFAULT_COLUMNS
                                    "author": rebase.user,
                                    "replayed_rebase": rebase.replayed_rebase })
 
+    layout = log.layout.Layout(
+        commit_set, rebase_old_heads, isListed, emptyChangeset)
+
+    if review:
+        # The layout of a review's log is fully determined by the commits, the
+        # rebases and the listed commits, so it can be reused by later
+        # requests that render the same log.
+        sections = log.layout.getCachedSections(
+            (review.id,
+             frozenset(commit.sha1 for commit in commit_set),
+             rebase_ids,
+             frozenset(listed_commits) if listed_commits is not None else None))
+    else:
+        sections = {}
+
     while True:
         # 'local_tails' is the set of commits that, when reached, should make
-        # inner() stop outputting commits and instead return.  This set of
-        # commits contains all the "tails" of the whole commit-set we're
-        # rendering (in the 'tails' set here), as well as the "new head" of the
-        # next rebase to be output.
+        # the layout stop listing commits in the section.  This set of commits
+        # contains all the "tails" of the whole commit-set we're rendering (in
+        # the 'tails' set here), as well as the "new head" of the next rebase
+        # to be output.
 
         local_tails = tails.copy()
 
         if rebases:
             local_tails.add(rebases[-1].new_head)
 
-        last_commit, table, tail, skipped = inner(
-            target, head, local_tails, 'center', title, table, silent_if_empty)
+        section_key = (head.sha1, frozenset(map(str, local_tails)))
+        section = sections.get(section_key)
+
+        if section is None:
+            section = sections[section_key] = layout.section(
+                head, local_tails, silent_if_empty)
+
+        emit(target, section, 'center', table)
+
+        if section.last_commit_sha1:
+            last_commit = getCommit(section.last_commit_sha1)
+        else:
+            last_commit = None
+        tail = section.tail_sha1
 
         if rebases:
             rebase = rebases.pop()
@@ -0,0 +1,298 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import collections
+import re
+import threading
+
+re_remote_into_local = re.compile("^Merge (?:branch|commit) '([^']+)' of [^ ]+ into \\1$")
+re_side_into_main = re.compile("^Merge (?:remote )?(?:branch|commit) '[^']+' into .+$")
+re_octopus = re.compile("^Merge ((?:(?:branches|,| and) '[^']+')+) into [^ ]+$")
+
+class Row(object):
+    """A commit row in a section"""
+
+    def __init__(self, sha1):
+        self.sha1 = sha1
+        self.removed = False
+
+class Sublog(object):
+    """A nested section, displayed as a row in its parent section"""
+
+    def __init__(self, section):
+        self.section = section
+        self.removed = False
+
+class Section(object):
+    """The layout of one table of commits in a log
+
+       The items are Row and Sublog objects, in display order.  Items marked
+       as removed are not displayed, but the commits in them still count as
+       displayed.  A "base merge" section is displayed as a single line
+       stating that the base branch was merged in, instead of commits.
+
+       Only SHA-1s are stored, so that a layout can be cached and reused with
+       Commit objects (and a database connection) from a later request."""
+
+    def __init__(self, title=None):
+        self.title = title
+        self.items = []
+        self.base_merge = False
+        self.upstream_sha1 = None
+        self.last_commit_sha1 = None
+        self.tail_sha1 = None
+        self.skipped = True
+
+    def addRow(self, commit):
+        row = Row(commit.sha1)
+        self.items.append(row)
+        return row
+
+    def addSublog(self, section):
+        sublog = Sublog(section)
+        self.items.append(sublog)
+        return sublog
+
+class Layout(object):
+    """Computes the nested display structure of a log
+
+       The structure is computed without producing any HTML, using the commit
+       set's precomputed reachability information to find the common ancestors
+       of merges.  |is_listed| and |is_empty| are called with a commit and
+       should return whether the commit should be listed, and whether it has
+       an empty changeset, respectively."""
+
+    def __init__(self, commit_set, rebase_old_heads, is_listed, is_empty):
+        self.commit_set = commit_set
+        self.rebase_old_heads = rebase_old_heads
+        self.is_listed = is_listed
+        self.is_empty = is_empty
+
+    def section(self, head, tails, silent_if_empty=frozenset(), title=None,
+                nested=False):
+        commit_set = self.commit_set
+        section = Section(title)
+
+        if nested and not title and (head is None or head in tails):
+            section.base_merge = True
+            section.skipped = False
+            return section
+
+        commit = head
+        last_commit = None
+        skipped = True
+
+        def finish(last_commit, skipped):
+            if last_commit:
+                section.last_commit_sha1 = last_commit.sha1
+                if last_commit.parents:
+                    section.tail_sha1 = last_commit.parents[0]
+            section.skipped = skipped
+            return section
+
+        def sublog(head, tails, title=None):
+            return section.addSublog(self.section(head, tails, title=title,
+                                                  nested=True))
+
+        while commit and commit not in tails:
+            suppress = False
+            optional_merge = False
+            listed = self.is_listed(commit)
+
+            if commit in silent_if_empty and self.is_empty(commit):
+                # This is a clean automatically generated merge commit; pretend
+                # it isn't here at all.
+                suppress = True
+
+            if not suppress and not listed:
+                suppress = len(commit.parents) == 1
+                optional_merge = not suppress
+
+            if not suppress: row = section.addRow(commit)
+            else: row = None
+
+            def removeSublog(item):
+                item.removed = True
+                if optional_merge and row: row.removed = True
+
+            if listed: skipped = False
+            last_commit = commit
+
+            if len(commit.parents) == 0:
+                break
+            elif len(commit.parents) == 1:
+                commit = commit_set.get(commit.parents[0])
+            elif len(commit.parents) > 1:
+                if len(commit.parents) > 2:
+                    common_ancestors = commit_set.getCommonAncestors(commit)
+                    match = re_octopus.match(commit.message.split("\n", 1)[0])
+
+                    if match:
+                        titles = re.findall("'([^']+)'", match.group(1))
+                        if len(titles) != len(commit.parents):
+                            titles = None
+                    else:
+                        titles = None
+
+                    for index, sha1 in enumerate(commit.parents):
+                        if sha1 in commit_set:
+                            item = sublog(commit_set[sha1], common_ancestors,
+                                          title=titles and titles[index] or None)
+                            if item.section.skipped:
+                                removeSublog(item)
+
+                    if not common_ancestors:
+                        return finish(None, False)
+
+                    commit = common_ancestors.pop()
+                    continue
+
+                parent1_sha1 = commit.parents[0]
+                parent2_sha1 = commit.parents[1]
+
+                parent1 = commit_set.get(parent1_sha1)
+                parent2 = commit_set.get(parent2_sha1)
+
+                if parent1_sha1 in self.rebase_old_heads:
+                    if parent2:
+                        item = sublog(parent2, tails)
+                        if item.section.skipped:
+                            removeSublog(item)
+                    section.last_commit_sha1 = commit.sha1
+                    section.tail_sha1 = parent1_sha1
+                    section.skipped = False
+                    return section
+                elif parent2_sha1 in self.rebase_old_heads:
+                    if parent1:
+                        item = sublog(parent1, tails)
+                        if item.section.skipped:
+                            removeSublog(item)
+                    section.last_commit_sha1 = commit.sha1
+                    section.tail_sha1 = parent2_sha1
+                    section.skipped = False
+                    return section
+
+                if parent1 and parent2:
+                    common_ancestors = commit_set.getCommonAncestors(commit)
+
+                    merged_remote_into_local = re_remote_into_local.match(commit.summary()) or re_side_into_main.match(commit.summary())
+
+                    show_merged, shortest_length, show_normal, longest_length = \
+                        self.__rankPaths(commit, common_ancestors | tails)
+                    display_parallel = False
+
+                    if merged_remote_into_local and shortest_length * 2 > longest_length:
+                        if len(common_ancestors) == 1 and len(commit_set.getTailsFrom(commit)) == 1:
+                            display_parallel = True
+                        else:
+                            show_merged = parent2
+                            show_normal = parent1
+
+                    if display_parallel:
+                        all_empty = True
+
+                        for sha1 in commit.parents:
+                            item = sublog(commit_set[sha1],
+                                          common_ancestors | tails)
+                            if item.section.skipped:
+                                item.removed = True
+                            else:
+                                all_empty = False
+
+                        if all_empty and optional_merge and row:
+                            row.removed = True
+
+                        commit = common_ancestors.pop()
+                    else:
+                        item = sublog(show_merged, common_ancestors | tails)
+                        if item.section.skipped:
+                            removeSublog(item)
+
+                        commit = show_normal
+                else:
+                    if parent1: upstream_sha1 = parent2_sha1
+                    else: upstream_sha1 = parent1_sha1
+
+                    if not commit in silent_if_empty:
+                        # Merge with the base branch.
+                        base_merge = Section()
+                        base_merge.base_merge = True
+                        base_merge.upstream_sha1 = upstream_sha1
+                        base_merge.skipped = False
+                        section.addSublog(base_merge)
+
+                    if parent1: commit = parent1
+                    else: commit = parent2
+
+        return finish(last_commit, skipped)
+
+    def __rankPaths(self, commit, tails):
+        commit_set = self.commit_set
+
+        shortest = None
+        shortest_length = len(commit_set)
+        longest = None
+        longest_length = 0
+
+        for sha1 in commit.parents:
+            parent = commit_set[sha1]
+
+            counted = set()
+            pending = [parent]
+
+            while pending:
+                candidate = pending.pop()
+
+                if candidate in counted: continue
+                if candidate in tails: continue
+
+                counted.add(candidate)
+                pending.extend(commit_set.getParents(candidate))
+
+            length = len(counted)
+
+            if length < shortest_length:
+                shortest = parent
+                shortest_length = length
+            if length >= longest_length:
+                longest = parent
+                longest_length = length
+
+        return shortest, shortest_length, longest, longest_length
+
+# The maximum number of review logs whose layouts are cached.
+MAXIMUM_CACHED_LAYOUTS = 64
+
+# Process-wide cache of computed sections per review log.  The key identifies
+# the set of commits, the rebases and the listed commits, and never becomes
+# stale since all of those are immutable for a given key; the least recently
+# used entries are simply evicted.
+LAYOUT_CACHE = collections.OrderedDict()
+LAYOUT_CACHE_LOCK = threading.Lock()
+
+def getCachedSections(key):
+    """Return a dictionary in which computed sections should be stored
+
+       The same dictionary is returned for the same key, until it is evicted
+       from the cache."""
+    with LAYOUT_CACHE_LOCK:
+        sections = LAYOUT_CACHE.pop(key, None)
+        if sections is None:
+            sections = {}
+        LAYOUT_CACHE[key] = sections
+        while len(LAYOUT_CACHE) > MAXIMUM_CACHED_LAYOUTS:
+            LAYOUT_CACHE.popitem(last=False)
+        return sections
@@ -240,6 +240,8 @@ def passwd(argv):
 
     db.commit()
 
+    auth.CREDENTIAL_CACHE.revokeUser(dbutils.User.fromName(db, name).id)
+
     if hashed_password:
         print "%s: password changed" % name
     else:
@@ -19,8 +19,8 @@ import profiling
 
 from operation import Operation, OperationResult, Optional
 from reviewing.comment import CommentChain, createCommentChain, createComment
-from reviewing.mail import sendPendingMails
-from reviewing.utils import generateMailsForBatch
+from reviewing.mailgeneration import queueBatchSubmitted
+from reviewing.searchindex import indexComments
 
 class ReviewStateChange(Operation):
     def __init__(self):
@@ -450,27 +450,28 @@ class SubmitChanges(Operation):
 
         profiler.check("comments draft=>current")
 
+        indexComments(cursor, review.id, batch_id)
+
+        profiler.check("search index")
+
         # Associate the submitting user with the review if he isn't already.
         cursor.execute("SELECT 1 FROM reviewusers WHERE review=%s AND uid=%s", (review.id, user.id))
         if not cursor.fetchone():
             cursor.execute("INSERT INTO reviewusers (review, uid) VALUES (%s, %s)", (review.id, user.id))
 
-        generate_emails = profiler.start("generate emails")
-
         is_accepted = review.state == "open" and review.accepted(db)
-        pending_mails = generateMailsForBatch(db, batch_id, was_accepted, is_accepted, profiler=profiler)
 
-        generate_emails.stop()
+        # The mails are generated by the mailgeneration service once the
+        # transaction has been committed.
+        queueBatchSubmitted(db, user, review, batch_id, was_accepted, is_accepted)
+
+        profiler.check("queue emails")
 
         review.incrementSerial(db)
         db.commit()
 
         profiler.check("commit transaction")
 
-        sendPendingMails(pending_mails)
-
-        profiler.check("finished")
-
         if user.getPreference(db, "debug.profiling.submitChanges"):
             return OperationResult(batch_id=batch_id,
                                    serial=review.serial,
@@ -17,6 +17,7 @@
 import gitutils
 import htmlutils
 import diff
+import syntaxhighlight.context
 
 from operation import Operation, OperationResult
 
@@ -33,21 +34,7 @@ class FetchLines(Operation):
 
     def process(self, db, user, repository_id, path, sha1, ranges, tabify):
         repository = gitutils.Repository.fromId(db, repository_id)
-        cursor = db.cursor()
-
-        def getContext(offset):
-            cursor.execute("""SELECT context
-                                FROM codecontexts
-                               WHERE sha1=%s
-                                 AND %s BETWEEN first_line AND last_line
-                            ORDER BY first_line DESC
-                               LIMIT 1""",
-                           (sha1, offset))
-
-            row = cursor.fetchone()
-
-            if row: return row[0]
-            else: return None
+        code_contexts = syntaxhighlight.context.loadCodeContexts(db, [sha1])[sha1]
 
         file = diff.File(repository=repository, path=path, new_sha1=sha1)
         file.loadNewLines(highlighted=True, request_highlight=True)
@@ -57,7 +44,7 @@ class FetchLines(Operation):
             indenttabsmode = file.getIndentTabsMode()
 
         def processRange(offset, count, context):
-            if context: context = getContext(offset)
+            if context: context = code_contexts.find(offset)
             else: context = None
 
             # Offset is a 1-based line number.
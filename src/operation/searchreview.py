@@ -20,6 +20,7 @@ import urllib
 import configuration
 import dbutils
 import gitutils
+import reviewing.searchindex as review_searchindex
 
 from operation import Operation, OperationResult, OperationFailure
 
@@ -39,6 +40,38 @@ def pathToSQLRegExp(path):
     pattern += re.sub("\*\*/|\*|\?", lambda match: replacements[match.group()], escaped)
     return pattern
 
+# Candidate sets bigger than this are not used to restrict the search query.
+# Such a restriction would not be very selective, and passing huge arrays of
+# review ids to the database is slow (and with SQLite, not even possible.)
+MAXIMUM_CANDIDATES = 500
+
+def findCandidates(db, filters):
+    """Return the set of reviews that can possibly match all filters
+
+       Returns None if the search index can't narrow the search down enough to
+       be useful.  Filters are processed in order of increasing estimated
+       number of matches, and each one only looks at the candidates left by
+       the previous ones."""
+
+    cursor = db.cursor()
+    estimated = []
+
+    for index, search_filter in enumerate(filters):
+        estimate = search_filter.estimate(cursor)
+        if estimate is not None:
+            estimated.append((estimate, index, search_filter))
+
+    candidates = None
+
+    for estimate, _, search_filter in sorted(estimated):
+        if candidates is None and estimate > MAXIMUM_CANDIDATES:
+            break
+        candidates = search_filter.candidates(cursor, candidates)
+        if not candidates:
+            break
+
+    return candidates
+
 class Query(object):
     def __init__(self, parent=None):
         if not parent:
@@ -65,6 +98,9 @@ class InvalidFilter(Exception):
         self.message = message
 
 class Filter(object):
+    # Field in the search index, if the filter can be evaluated using it.
+    index_field = None
+
     def __init__(self, db, value):
         self.db = db
         self.value = value
@@ -73,24 +109,62 @@ class Filter(object):
         pass
     def filter(self, db, review):
         return True
-
-class SummaryFilter(Filter):
+    def requiredTrigrams(self):
+        return review_searchindex.patternTrigrams(self.value)
+    def estimate(self, cursor):
+        if self.index_field is None:
+            return None
+        required_trigrams = self.requiredTrigrams()
+        if not required_trigrams:
+            return None
+        return review_searchindex.estimateMatches(
+            cursor, self.index_field, required_trigrams)
+    def candidates(self, cursor, candidates):
+        return review_searchindex.findMatches(
+            cursor, self.index_field, self.requiredTrigrams(), candidates)
+
+class LikeFilter(Filter):
+    def requiredTrigrams(self):
+        # '_' is not escaped by globToSQLPattern(), and thus matches any
+        # character, so it can't be part of a required trigram.
+        return review_searchindex.patternTrigrams(self.value.replace("_", "?"))
+
+class SummaryFilter(LikeFilter):
+    index_field = "summary"
     def contribute(self, query):
         query.conditions.append("reviews.summary LIKE %s")
         query.arguments.append(globToSQLPattern(self.value))
 
-class DescriptionFilter(Filter):
+class DescriptionFilter(LikeFilter):
+    index_field = "description"
     def contribute(self, query):
         query.conditions.append("reviews.description LIKE %s")
         query.arguments.append(globToSQLPattern(self.value))
 
+class CommentFilter(LikeFilter):
+    index_field = "comment"
+    def contribute(self, query):
+        query.conditions.append("""EXISTS (SELECT 1
+                                              FROM commentchains
+                                              JOIN comments ON (comments.chain=commentchains.id)
+                                             WHERE commentchains.review=reviews.id
+                                               AND comments.state='current'
+                                               AND comments.comment LIKE %s)""")
+        query.arguments.append(globToSQLPattern(self.value))
+
 class BranchFilter(Filter):
+    index_field = "branch"
+    def requiredTrigrams(self):
+        return review_searchindex.patternTrigrams(self.value.lstrip("/"))
     def contribute(self, query):
         query.addTable("branches", "branches.id=reviews.branch")
         query.conditions.append("branches.name ~ %s")
         query.arguments.append(pathToSQLRegExp(self.value))
 
 class PathFilter(Filter):
+    index_field = "path"
+    def requiredTrigrams(self):
+        return review_searchindex.patternTrigrams(self.value.lstrip("/"))
     def contribute(self, query):
         query.addTable("reviewfiles", "reviewfiles.review=reviews.id")
         query.addTable("files", "files.id=reviewfiles.file")
@@ -165,6 +239,17 @@ class RepositoryFilter(Filter):
 class OrFilter(Filter):
     def __init__(self, filters):
         self.filters = filters
+    def estimate(self, cursor):
+        estimates = [search_filter.estimate(cursor)
+                     for search_filter in self.filters]
+        if None in estimates:
+            return None
+        return sum(estimates)
+    def candidates(self, cursor, candidates):
+        result = set()
+        for search_filter in self.filters:
+            result.update(search_filter.candidates(cursor, candidates))
+        return result
     def contribute(self, query):
         conditions = []
         for search_filter in self.filters:
@@ -194,6 +279,8 @@ class SearchReview(Operation):
                     filter_classes = [DescriptionFilter]
                 elif keyword == "text":
                     filter_classes = [SummaryFilter, DescriptionFilter]
+                elif keyword == "comment":
+                    filter_classes = [CommentFilter]
                 elif keyword in ("branch", "b"):
                     filter_classes = [BranchFilter]
                 elif keyword in ("path", "p"):
@@ -215,7 +302,8 @@ class SearchReview(Operation):
                         code="invalidkeyword",
                         title="Invalid keyword: %r" % keyword,
                         message=("Supported keywords are summary, description, "
-                                 "text, branch, path, user, owner and reviewer."))
+                                 "text, comment, branch, path, user, owner and "
+                                 "reviewer."))
 
                 if re.match("([\"']).*\\1$", value):
                     value = value[1:-1]
@@ -269,6 +357,17 @@ class SearchReview(Operation):
 
         query_params = Query()
 
+        candidates = findCandidates(db, filters)
+
+        if candidates is not None:
+            if not candidates:
+                return OperationResult(
+                    reviews=[],
+                    query_string=urllib.urlencode(url_terms))
+
+            query_params.conditions.append("reviews.id=ANY (%s)")
+            query_params.arguments.append(sorted(candidates))
+
         for search_filter in filters:
             search_filter.contribute(query_params)
 
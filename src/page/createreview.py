@@ -74,7 +74,7 @@ def generateReviewersAndWatchersTable(db, repository, target, all_reviewers, all
         table.tr("watchers").td("spacer", colspan=3)
 
     def formatFiles(files):
-        return diff.File.eliminateCommonPrefixes(sorted([dbutils.describe_file(db, file_id) for file_id in files]))
+        return diff.File.eliminateCommonPrefixes(sorted(dbutils.describe_files(db, files).values()))
 
     for team in teams:
         if team is not None:
@@ -92,8 +92,11 @@ def renderShowBatch(req, db, user):
     def renderFiles(title, cursor):
         files = []
 
-        for file_id, delete_count, insert_count in cursor.fetchall():
-            files.append((dbutils.describe_file(db, file_id), delete_count, insert_count))
+        rows = cursor.fetchall()
+        paths = dbutils.describe_files(db, [file_id for file_id, _, _ in rows])
+
+        for file_id, delete_count, insert_count in rows:
+            files.append((paths[file_id], delete_count, insert_count))
 
         paths = []
         deleted = []
@@ -147,14 +150,13 @@ def renderShowBatch(req, db, user):
     renderFiles("Unreviewed:", cursor)
 
     def renderChains(title, cursor, replies):
-        all_chains = [review_comment.CommentChain.fromId(db, chain_id, user, review=review)
-                      for (chain_id,) in cursor]
+        all_chains = review_comment.CommentChain.fromIds(
+            db, [chain_id for (chain_id,) in cursor], user, review=review)
 
         if not all_chains:
             return
 
-        for chain in all_chains:
-            chain.loadComments(db, user)
+        review_comment.loadCommentsForChains(db, all_chains, user)
 
         issue_chains = filter(lambda chain: chain.type == "issue", all_chains)
         draft_issues = filter(lambda chain: chain.state == "draft", issue_chains)
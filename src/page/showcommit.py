@@ -726,7 +726,7 @@ def commitRangeFromReview(db, user, review, filter_value, file_ids):
             if filter_value == "files":
                 files_in_review &= file_ids
 
-            paths_in_review = set(dbutils.describe_file(db, file_id) for file_id in files_in_review)
+            paths_in_review = set(dbutils.describe_files(db, files_in_review).values())
             paths_in_upstreams = set()
 
             for tail in tails:
@@ -1195,9 +1195,13 @@ def renderShowCommit(req, db, user):
                 if file.id in all_files_local:
                     all_files_local.remove(file.id)
 
+            if file_ids:
+                all_files_local &= file_ids
+
+            paths = dbutils.describe_files(db, all_files_local)
+
             for file_id in all_files_local:
-                if not file_ids or file_id in file_ids:
-                    changeset.files.append(diff.File(file_id, dbutils.describe_file(db, file_id), None, None, repository))
+                changeset.files.append(diff.File(file_id, paths[file_id], None, None, repository))
 
             if review_filter == "pending":
                 def isPending(file): return file.id in pending_files
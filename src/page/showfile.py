@@ -140,10 +140,11 @@ def renderShowFile(req, db, user):
 
         comment_chain_script = ""
 
-        for (chain_id,) in cursor.fetchall():
-            chain = review_comment.CommentChain.fromId(db, chain_id, user, review=review)
-            chain.loadComments(db, user)
+        chains = review_comment.CommentChain.fromIds(
+            db, [chain_id for (chain_id,) in cursor.fetchall()], user, review=review)
+        review_comment.loadCommentsForChains(db, chains, user)
 
+        for chain in chains:
             comment_chain_script += "commentChains.push(%s);\n" % chain.getJSConstructor(file_sha1)
 
         if comment_chain_script:
@@ -1037,7 +1037,7 @@ def renderShowReview(req, db, user):
             return getModuleFromFile(repository, filename) or filename
 
         def formatFiles(files):
-            paths = sorted([dbutils.describe_file(db, file_id) for file_id in files])
+            paths = sorted(dbutils.describe_files(db, files).values())
             if granularity == "file":
                 return diff.File.eliminateCommonPrefixes(paths)
             else:
@@ -54,7 +54,7 @@ def renderShowReviewLog(req, db, user):
     reviewed_reviewers = review_utils.getReviewedReviewers(db, review)
 
     def formatFiles(files):
-        paths = sorted([dbutils.describe_file(db, file_id) for file_id in files])
+        paths = sorted(dbutils.describe_files(db, files).values())
         if granularity == "file":
             return diff.File.eliminateCommonPrefixes(paths)
         else:
@@ -100,39 +100,7 @@ class CommentChain:
         return self
 
     def loadComments(self, db, user, include_draft_comments=True):
-        if include_draft_comments:
-            if self.state == "draft":
-                draft_user_id = self.user.id
-            else:
-                draft_user_id = user.id
-        else:
-            draft_user_id = None
-
-        cursor = db.cursor()
-        cursor.execute("""SELECT comments.id,
-                                 comments.batch,
-                                 comments.state,
-                                 comments.uid,
-                                 comments.time,
-                                 comments.comment,
-                                 comments.code,
-                                 commentstoread.uid IS NOT NULL AS unread
-                            FROM comments
-                 LEFT OUTER JOIN commentstoread ON (comments.id=commentstoread.comment AND commentstoread.uid=%s)
-                           WHERE comments.chain=%s
-                             AND ((comments.state='draft' AND comments.uid=%s) OR comments.state='current')
-                        ORDER BY comments.batch ASC""",
-                       (user.id, self.id, draft_user_id))
-        last = None
-        for comment_id, batch_id, comment_state, author_id, time, comment, code, unread in cursor.fetchall():
-            author = dbutils.User.fromId(db, author_id)
-            adjusted_time = user.adjustTimestamp(db, time)
-            when = user.formatTimestamp(db, time)
-            comment = Comment(self, batch_id, comment_id, comment_state, author,
-                              adjusted_time, when, comment, code, unread)
-            if comment_state == 'draft': last = comment
-            else: self.comments.append(comment)
-        if last: self.comments.append(last)
+        loadCommentsForChains(db, [self], user, include_draft_comments)
 
     def when(self):
         return self.comments[0].when
@@ -243,92 +211,211 @@ class CommentChain:
 
     @staticmethod
     def fromId(db, id, user, review=None, skip=None):
-        cursor = db.cursor()
-        cursor.execute("SELECT review, batch, uid, type, state, origin, file, first_commit, last_commit, closed_by, addressed_by FROM commentchains WHERE id=%s", [id])
-        row = cursor.fetchone()
-        if not row:
+        chains = CommentChain.fromIds(db, [id], user, review=review, skip=skip)
+        if not chains:
             return None
-        else:
-            review_id, batch_id, user_id, type, state, origin, file_id, first_commit_id, last_commit_id, closed_by_id, addressed_by_id = row
+        return chains[0]
+
+    @staticmethod
+    def fromIds(db, ids, user, review=None, skip=None):
+        """Load several comment chains using a fixed number of queries
+
+           Returns a list of CommentChain objects in the same order as |ids|.
+           Ids of non-existing comment chains are skipped."""
+
+        ids = list(ids)
+        if not ids:
+            return []
+
+        cursor = db.cursor()
+        cursor.execute("""SELECT id, review, batch, uid, type, state, origin,
+                                 file, first_commit, last_commit, closed_by,
+                                 addressed_by
+                            FROM commentchains
+                           WHERE id=ANY (%s)""",
+                       (ids,))
+        rows = dict((row[0], row[1:]) for row in cursor.fetchall())
+
+        draft_changes = {}
+        if user is not None:
+            cursor.execute("""SELECT chain, from_type, to_type,
+                                     from_state, to_state,
+                                     from_last_commit, to_last_commit,
+                                     from_addressed_by, to_addressed_by
+                                FROM commentchainchanges
+                               WHERE chain=ANY (%s)
+                                 AND uid=%s
+                                 AND state='draft'""",
+                           (rows.keys(), user.id))
+            for row in cursor:
+                draft_changes.setdefault(row[0], []).append(row[1:])
+
+        reviews = {}
+        if review is not None:
+            reviews[review.id] = review
+
+        chain_data = []
+        user_ids = set()
+        commit_ids_per_review = {}
+
+        for id in ids:
+            if id not in rows:
+                continue
+
+            review_id, batch_id, user_id, type, state, origin, file_id, first_commit_id, last_commit_id, closed_by_id, addressed_by_id = rows[id]
             type_is_draft = False
             state_is_draft = False
             last_commit_is_draft = False
             addressed_by_is_draft = False
 
-            if user is not None:
-                cursor.execute("""SELECT from_type, to_type,
-                                         from_state, to_state,
-                                         from_last_commit, to_last_commit,
-                                         from_addressed_by, to_addressed_by
-                                    FROM commentchainchanges
-                                   WHERE chain=%s
-                                     AND uid=%s
-                                     AND state='draft'""",
-                               [id, user.id])
-
-                for from_type, to_type, from_state, to_state, from_last_commit_id, to_last_commit_id, from_addressed_by_id, to_addressed_by_id in cursor:
-                    if from_state == state:
-                        state = to_state
-                        state_is_draft = True
-                        if to_state != "open":
-                            closed_by_id = user.id
-                    if from_type == type:
-                        type = to_type
-                        type_is_draft = True
-                    if from_last_commit_id == last_commit_id:
-                        last_commit_id = from_last_commit_id
-                        last_commit_is_draft = True
-                    if from_addressed_by_id == addressed_by_id:
-                        addressed_by_id = to_addressed_by_id
-                        addressed_by_is_draft = True
+            for from_type, to_type, from_state, to_state, from_last_commit_id, to_last_commit_id, from_addressed_by_id, to_addressed_by_id in draft_changes.get(id, []):
+                if from_state == state:
+                    state = to_state
+                    state_is_draft = True
+                    if to_state != "open":
+                        closed_by_id = user.id
+                if from_type == type:
+                    type = to_type
+                    type_is_draft = True
+                if from_last_commit_id == last_commit_id:
+                    last_commit_id = from_last_commit_id
+                    last_commit_is_draft = True
+                if from_addressed_by_id == addressed_by_id:
+                    addressed_by_id = to_addressed_by_id
+                    addressed_by_is_draft = True
 
             if review is None:
-                review = dbutils.Review.fromId(db, review_id)
+                if review_id not in reviews:
+                    reviews[review_id] = dbutils.Review.fromId(db, review_id)
             else:
                 assert review.id == review_id
 
+            chain_data.append((id, reviews[review_id], batch_id, user_id, type, state, origin, file_id, first_commit_id, last_commit_id, closed_by_id, addressed_by_id, type_is_draft, state_is_draft, last_commit_is_draft, addressed_by_is_draft))
+
+            user_ids.add(user_id)
+            if closed_by_id:
+                user_ids.add(closed_by_id)
+            commit_ids_per_review.setdefault(review_id, set()).update(
+                filter(None, (first_commit_id, last_commit_id, addressed_by_id)))
+
+        # Load all referenced users and commits in bulk; the single-object
+        # lookups below then find them in the per-session caches.
+        dbutils.User.fromIds(db, list(user_ids))
+
+        if not skip or 'commits' not in skip:
+            for review_id, commit_ids in commit_ids_per_review.items():
+                gitutils.Commit.fromIds(db, reviews[review_id].repository, list(commit_ids))
+
+        chains = []
+
+        for (id, chain_review, batch_id, user_id, type, state, origin, file_id, first_commit_id, last_commit_id, closed_by_id, addressed_by_id, type_is_draft, state_is_draft, last_commit_is_draft, addressed_by_is_draft) in chain_data:
             first_commit = last_commit = addressed_by = None
 
             if not skip or 'commits' not in skip:
-                if first_commit_id: first_commit = gitutils.Commit.fromId(db, review.repository, first_commit_id)
-                if last_commit_id: last_commit = gitutils.Commit.fromId(db, review.repository, last_commit_id)
-                if addressed_by_id: addressed_by = gitutils.Commit.fromId(db, review.repository, addressed_by_id)
+                if first_commit_id: first_commit = gitutils.Commit.fromId(db, chain_review.repository, first_commit_id)
+                if last_commit_id: last_commit = gitutils.Commit.fromId(db, chain_review.repository, last_commit_id)
+                if addressed_by_id: addressed_by = gitutils.Commit.fromId(db, chain_review.repository, addressed_by_id)
 
             if closed_by_id: closed_by = dbutils.User.fromId(db, closed_by_id)
             else: closed_by = None
 
-            chain = CommentChain(id, dbutils.User.fromId(db, user_id), review,
-                                 batch_id, type, state, origin, file_id,
-                                 first_commit, last_commit, closed_by, addressed_by,
-                                 type_is_draft=type_is_draft,
-                                 state_is_draft=state_is_draft,
-                                 last_commit_is_draft=last_commit_is_draft,
-                                 addressed_by_is_draft=addressed_by_is_draft)
+            chains.append(CommentChain(id, dbutils.User.fromId(db, user_id), chain_review,
+                                       batch_id, type, state, origin, file_id,
+                                       first_commit, last_commit, closed_by, addressed_by,
+                                       type_is_draft=type_is_draft,
+                                       state_is_draft=state_is_draft,
+                                       last_commit_is_draft=last_commit_is_draft,
+                                       addressed_by_is_draft=addressed_by_is_draft))
+
+        if chains and (not skip or 'lines' not in skip):
+            chains_by_id = dict((chain.id, chain) for chain in chains)
 
-            if not skip or 'lines' not in skip:
+            draft_user_ids = {}
+            for chain in chains:
                 if chain.state == "draft":
-                    draft_user_id = chain.user.id
+                    draft_user_ids[chain.id] = chain.user.id
                 elif user is not None:
-                    draft_user_id = user.id
+                    draft_user_ids[chain.id] = user.id
                 else:
-                    draft_user_id = None
+                    draft_user_ids[chain.id] = None
+
+            cursor.execute("""SELECT chain, sha1, first_line, last_line,
+                                     state, uid
+                                FROM commentchainlines
+                               WHERE chain=ANY (%s)
+                                 AND (state='current' OR uid=ANY (%s))""",
+                           (chains_by_id.keys(),
+                            list(set(user_id for user_id in draft_user_ids.values()
+                                     if user_id is not None))))
+
+            for chain_id, sha1, first_line, last_line, lines_state, lines_user_id in cursor.fetchall():
+                draft_user_id = draft_user_ids[chain_id]
+                if lines_state == 'current' or (draft_user_id is not None and lines_user_id == draft_user_id):
+                    chains_by_id[chain_id].setLines(sha1, first_line, last_line - first_line + 1)
 
-                cursor.execute("""SELECT sha1, first_line, last_line
-                                    FROM commentchainlines
-                                   WHERE chain=%s
-                                     AND (state='current' OR uid=%s)""",
-                               (id, draft_user_id))
+        return chains
 
-                for sha1, first_line, last_line in cursor.fetchall():
-                    chain.setLines(sha1, first_line, last_line - first_line + 1)
+def loadCommentsForChains(db, chains, user, include_draft_comments=True):
+    """Load the comments of several comment chains using one query
 
-            return chain
+       This is the bulk version of CommentChain.loadComments()."""
+
+    if not chains:
+        return
+
+    draft_user_ids = {}
+    for chain in chains:
+        if include_draft_comments:
+            if chain.state == "draft":
+                draft_user_ids[chain.id] = chain.user.id
+            else:
+                draft_user_ids[chain.id] = user.id
+        else:
+            draft_user_ids[chain.id] = None
 
-def loadCommentChains(db, review, user, file=None, changeset=None, commit=None, local_comments_only=False):
-    result = []
     cursor = db.cursor()
+    cursor.execute("""SELECT comments.chain,
+                             comments.id,
+                             comments.batch,
+                             comments.state,
+                             comments.uid,
+                             comments.time,
+                             comments.comment,
+                             comments.code,
+                             commentstoread.uid IS NOT NULL AS unread
+                        FROM comments
+             LEFT OUTER JOIN commentstoread ON (comments.id=commentstoread.comment AND commentstoread.uid=%s)
+                       WHERE comments.chain=ANY (%s)
+                         AND ((comments.state='draft' AND comments.uid=ANY (%s)) OR comments.state='current')
+                    ORDER BY comments.batch ASC""",
+                   (user.id, [chain.id for chain in chains],
+                    list(set(user_id for user_id in draft_user_ids.values()
+                             if user_id is not None))))
+    rows = cursor.fetchall()
+
+    dbutils.User.fromIds(db, list(set(row[4] for row in rows)))
+
+    chains_by_id = dict((chain.id, chain) for chain in chains)
+    last_per_chain = {}
+
+    for chain_id, comment_id, batch_id, comment_state, author_id, time, comment, code, unread in rows:
+        chain = chains_by_id[chain_id]
+        if comment_state == 'draft' and author_id != draft_user_ids[chain_id]:
+            continue
+        author = dbutils.User.fromId(db, author_id)
+        adjusted_time = user.adjustTimestamp(db, time)
+        when = user.formatTimestamp(db, time)
+        comment = Comment(chain, batch_id, comment_id, comment_state, author,
+                          adjusted_time, when, comment, code, unread)
+        if comment_state == 'draft': last_per_chain[chain_id] = comment
+        else: chain.comments.append(comment)
+
+    for chain in chains:
+        if chain.id in last_per_chain:
+            chain.comments.append(last_per_chain[chain.id])
 
-    chain_ids = None
+def loadCommentChains(db, review, user, file=None, changeset=None, commit=None, local_comments_only=False):
+    cursor = db.cursor()
 
     if file is None and changeset is None and commit is None:
         cursor.execute("SELECT id FROM commentchains WHERE review=%s AND file IS NULL", [review.id])
@@ -342,13 +429,48 @@ def loadCommentChains(db, review, user, file=None, changeset=None, commit=None,
                                AND state!='empty')
                         GROUP BY id""",
                        [review.id, commit.getId(db), user.id])
-    elif local_comments_only:
-        cursor.execute("""SELECT DISTINCT commentchains.id
+    else:
+        if file is not None: files = [file]
+        else: files = changeset.files
+
+        chains_per_file = loadCommentChainsPerFile(db, review, user, files, changeset, local_comments_only)
+        return sorted(itertools.chain(*chains_per_file.values()), key=lambda chain: chain.id)
+
+    chain_ids = set(chain_id for (chain_id,) in cursor.fetchall())
+
+    chains = CommentChain.fromIds(db, sorted(chain_ids), user, review=review)
+    loadCommentsForChains(db, chains, user)
+    return chains
+
+def loadCommentChainsPerFile(db, review, user, files, changeset=None, local_comments_only=False):
+    """Load the comment chains in a review that apply to a set of files
+
+       The |files| argument should be a list of diff.File objects (or other
+       objects with 'id', 'old_sha1' and 'new_sha1' attributes.)  A file's
+       comment chains are those whose lines are recorded against either of the
+       two versions of the file.  If |local_comments_only| is true, only
+       comment chains created in or addressed by |changeset| are included.
+
+       Returns a dictionary mapping file ids to lists of comment chains, with
+       lines and comments loaded, ordered by chain id.  Files without comment
+       chains are not included.  The number of queries executed does not
+       depend on the number of files or comment chains."""
+
+    files = [file for file in files if file is not None]
+    if not files:
+        return {}
+
+    cursor = db.cursor()
+    file_ids = list(set(file.id for file in files))
+
+    if local_comments_only:
+        cursor.execute("""SELECT DISTINCT commentchains.id, commentchains.file,
+                                          commentchainlines.sha1
                             FROM commentchains
                             JOIN commentchainlines ON (commentchainlines.chain=commentchains.id)
                             JOIN fileversions ON (fileversions.file=commentchains.file)
                            WHERE commentchains.review=%s
-                             AND commentchains.file=%s
+                             AND commentchains.file=ANY (%s)
                              AND commentchains.state!='empty'
                              AND ((commentchains.first_commit=%s AND commentchains.last_commit=%s)
                                OR commentchains.addressed_by=%s)
@@ -356,44 +478,46 @@ def loadCommentChains(db, review, user, file=None, changeset=None, commit=None,
                              AND (commentchainlines.sha1=fileversions.old_sha1
                                OR commentchainlines.sha1=fileversions.new_sha1)
                              AND (commentchainlines.state='current'
-                               OR commentchainlines.uid=%s)
-                        ORDER BY commentchains.id ASC""",
-                       (review.id, file.id, changeset.parent.getId(db), changeset.child.getId(db), changeset.child.getId(db), changeset.id, user.id))
+                               OR commentchainlines.uid=%s)""",
+                       (review.id, file_ids, changeset.parent.getId(db), changeset.child.getId(db), changeset.child.getId(db), changeset.id, user.id))
+        # The join with 'fileversions' already restricts the lines to the
+        # file versions in the changeset.
+        sha1s_per_file = None
     else:
-        chain_ids = set()
+        cursor.execute("""SELECT DISTINCT commentchains.id, commentchains.file,
+                                          commentchainlines.sha1
+                            FROM commentchains
+                            JOIN commentchainlines ON (commentchainlines.chain=commentchains.id)
+                           WHERE commentchains.review=%s
+                             AND commentchains.file=ANY (%s)
+                             AND commentchains.state!='empty'
+                             AND (commentchains.state!='draft' OR commentchains.uid=%s)
+                             AND commentchainlines.sha1=ANY (%s)
+                             AND (commentchainlines.state='current'
+                               OR commentchainlines.uid=%s)""",
+                       (review.id, file_ids, user.id,
+                        list(set(sha1 for file in files for sha1 in (file.old_sha1, file.new_sha1))),
+                        user.id))
+        sha1s_per_file = {}
+        for file in files:
+            sha1s_per_file.setdefault(file.id, set()).update((file.old_sha1, file.new_sha1))
 
-        if file is not None: files = [file]
-        else: files = changeset.files
+    chain_ids_per_file = {}
+    for chain_id, file_id, sha1 in cursor.fetchall():
+        if sha1s_per_file is None or sha1 in sha1s_per_file[file_id]:
+            chain_ids_per_file.setdefault(file_id, set()).add(chain_id)
 
-        for file in files:
-            cursor.execute("""SELECT id
-                                FROM commentchains
-                                JOIN commentchainlines ON (commentchainlines.chain=commentchains.id)
-                               WHERE commentchains.review=%s
-                                 AND commentchains.file=%s
-                                 AND commentchains.state!='empty'
-                                 AND (commentchains.state!='draft' OR commentchains.uid=%s)
-                                 AND (commentchainlines.sha1=%s
-                                   OR commentchainlines.sha1=%s)
-                                 AND (commentchainlines.state='current'
-                                   OR commentchainlines.uid=%s)""",
-                           (review.id, file.id, user.id, file.old_sha1, file.new_sha1, user.id))
-
-            for (chain_id,) in cursor.fetchall():
-                chain_ids.add(chain_id)
-
-    if chain_ids is None:
-        chain_ids = set()
-
-        for (chain_id,) in cursor.fetchall():
-            chain_ids.add(chain_id)
-
-    for chain_id in sorted(chain_ids):
-        chain = CommentChain.fromId(db, chain_id, user, review=review)
-        chain.loadComments(db, user)
-        result.append(chain)
-
-    return result
+    all_chain_ids = set()
+    for chain_ids in chain_ids_per_file.values():
+        all_chain_ids.update(chain_ids)
+
+    chains = CommentChain.fromIds(db, sorted(all_chain_ids), user, review=review)
+    loadCommentsForChains(db, chains, user)
+
+    chains_by_id = dict((chain.id, chain) for chain in chains)
+
+    return dict((file_id, [chains_by_id[chain_id] for chain_id in sorted(chain_ids) if chain_id in chains_by_id])
+                for file_id, chain_ids in chain_ids_per_file.items())
 
 def createCommentChain(db, user, review, chain_type, commit=None, origin=None, file=None, parent=None, child=None, offset=None, count=None):
     import reviewing.comment.propagate
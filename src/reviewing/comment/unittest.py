@@ -0,0 +1,75 @@
+def bulk():
+    import api
+    import dbutils
+    import diff
+    import reviewing.comment
+
+    critic = api.critic.startSession(for_testing=True)
+    db = critic.database
+    cursor = db.cursor()
+
+    cursor.execute("""SELECT reviews.id
+                        FROM reviews
+                        JOIN branches ON (branches.id=reviews.branch)
+                       WHERE branches.name=%s""",
+                   ("r/100-reviewing/001-comment.basic",))
+    review = dbutils.Review.fromId(db, cursor.fetchone()[0])
+    user = dbutils.User.fromName(db, "alice")
+
+    cursor.execute("""SELECT DISTINCT fileversions.file,
+                                      fileversions.old_sha1,
+                                      fileversions.new_sha1
+                        FROM fileversions
+                        JOIN reviewchangesets ON (reviewchangesets.changeset=fileversions.changeset)
+                       WHERE reviewchangesets.review=%s""",
+                   (review.id,))
+    files = [diff.File(file_id, old_sha1=old_sha1, new_sha1=new_sha1,
+                       repository=review.repository)
+             for file_id, old_sha1, new_sha1 in cursor.fetchall()]
+
+    assert files
+
+    chains_per_file = reviewing.comment.loadCommentChainsPerFile(
+        db, review, user, files)
+
+    assert chains_per_file
+
+    for file in files:
+        # The chains each file should have, computed the straight-forward way.
+        cursor.execute("""SELECT DISTINCT commentchains.id
+                            FROM commentchains
+                            JOIN commentchainlines ON (commentchainlines.chain=commentchains.id)
+                           WHERE commentchains.review=%s
+                             AND commentchains.file=%s
+                             AND commentchains.state!='empty'
+                             AND (commentchains.state!='draft' OR commentchains.uid=%s)
+                             AND (commentchainlines.sha1=%s
+                               OR commentchainlines.sha1=%s)
+                             AND (commentchainlines.state='current'
+                               OR commentchainlines.uid=%s)""",
+                       (review.id, file.id, user.id, file.old_sha1,
+                        file.new_sha1, user.id))
+        expected_ids = sorted(chain_id for (chain_id,) in cursor.fetchall())
+
+        chains = chains_per_file.get(file.id, [])
+        assert [chain.id for chain in chains] == expected_ids
+
+        for chain in chains:
+            assert chain.file_id == file.id
+            assert (file.old_sha1 in chain.lines_by_sha1 or
+                    file.new_sha1 in chain.lines_by_sha1)
+
+            # Loaded in bulk, the chain should be identical to when loaded on
+            # its own.
+            single = reviewing.comment.CommentChain.fromId(
+                db, chain.id, user, review=review)
+            single.loadComments(db, user)
+
+            assert chain.type == single.type
+            assert chain.state == single.state
+            assert chain.user.id == single.user.id
+            assert chain.lines == single.lines
+            assert [comment.id for comment in chain.comments] \
+                == [comment.id for comment in single.comments]
+
+    print "bulk: ok"
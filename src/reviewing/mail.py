@@ -217,6 +217,63 @@ def renderChainInMail(db, to_user, chain, focus_comment, new_state, new_type, li
 
     return result
 
+class RenderCache(object):
+    """Cache of mail content shared between the recipients of an event
+
+       Mails about a single event (e.g. a submitted batch, or commits pushed to
+       a review) contain much of the same content for every recipient.  The
+       functions generating such mails take an optional RenderCache argument,
+       and callers generating mails for several recipients pass the same
+       object for all of them, so that database queries are made once, and
+       content is rendered once per distinct set of formatting parameters."""
+
+    def __init__(self):
+        self.__values = {}
+
+    def get(self, key, callback):
+        """Return the cached value for |key|, calling |callback| if missing"""
+        if key not in self.__values:
+            self.__values[key] = callback()
+        return self.__values[key]
+
+    def renderChain(self, db, to_user, chain, focus_comment, new_state,
+                    new_type, line_length, context_lines):
+        """Cached version of renderChainInMail()"""
+        # The formatted timestamps of the comments depend on the time zone of
+        # the user the chain was loaded for, so they are part of the key.
+        key = ("chain", chain.id, chain.state,
+               tuple((comment.id, comment.when) for comment in chain.comments),
+               focus_comment.id if focus_comment else None,
+               new_state, new_type, line_length, context_lines,
+               tuple(to_user.getCriticURLs(db)),
+               to_user.getPreference(db, "email.updatedReview.quotedComments"))
+        return self.get(key, lambda: renderChainInMail(
+            db, to_user, chain, focus_comment, new_state, new_type,
+            line_length, context_lines))
+
+    def renderFiles(self, db, to_user, review, title, files_lines,
+                    commits=None, relevant_only=False, relevant_files=None,
+                    showcommit_link=False):
+        """Cached version of renderFiles()"""
+        key = ("files", title, tuple(map(tuple, files_lines)),
+               tuple(commits) if commits else None,
+               frozenset(relevant_files) if relevant_only else None,
+               showcommit_link,
+               tuple(to_user.getCriticURLs(db)) if showcommit_link else None)
+        return self.get(key, lambda: renderFiles(
+            db, to_user, review, title, files_lines, commits, relevant_only,
+            relevant_files, showcommit_link))
+
+    def unifiedDiff(self, db, changeset, context_lines):
+        """Cached version of changeset.text.unified()"""
+        return self.get(("diff", changeset.id, context_lines),
+                        lambda: changeset_text.unified(db, changeset, context_lines))
+
+    def commitStats(self, repository, commit):
+        """Cached output of 'git show --stat' for the commit"""
+        return self.get(("stats", commit.sha1), lambda: repository.run(
+            "show", "--oneline", "--stat", commit.sha1).split('\n', 1)[1])
+
 def checkEmailEnabled(db, to_user):
     """Check whether we should send emails to the user."""
     if to_user.email_verified is False:
@@ -226,7 +283,7 @@ def checkEmailEnabled(db, to_user):
         # User has requested that no emails be sent.
         raise MailDisabled
 
-def sendReviewCreated(db, from_user, to_user, recipients, review):
+def sendReviewCreated(db, from_user, to_user, recipients, review, render_cache=None):
     # First check if we can/should send emails to the user at all.
     try:
         checkEmailEnabled(db, to_user)
@@ -234,6 +291,9 @@ def sendReviewCreated(db, from_user, to_user, recipients, review):
     except MailDisabled:
         return []
 
+    if render_cache is None:
+        render_cache = RenderCache()
+
     line_length = to_user.getPreference(db, "email.lineLength")
     hr = "-" * line_length
 
@@ -305,7 +365,7 @@ the review is currently stuck; it cannot finish unless there are reviewers.
     pending_files_lines = cursor.fetchall()
 
     if pending_files_lines:
-        body += renderFiles(db, to_user, review, "These changes were assigned to you:", pending_files_lines, showcommit_link=True)
+        body += render_cache.renderFiles(db, to_user, review, "These changes were assigned to you:", pending_files_lines, showcommit_link=True)
 
     all_commits = to_user.getPreference(db, "email.newReview.displayCommits")
 
@@ -322,7 +382,20 @@ the review is currently stuck; it cannot finish unless there are reviewers.
 
         # FIXME: The order here is essentially random.  We shouldn't depend on
         # it, and reversing it doesn't make much sense...
-        commits = list(reversed(review.branch.getCommits(db)))
+        commits = render_cache.get(
+            ("commits", review.id),
+            lambda: list(reversed(review.branch.getCommits(db))))
+
+        def loadChangeset(commit):
+            cursor.execute("""SELECT id
+                                FROM reviewchangesets
+                                JOIN changesets ON (id=changeset)
+                               WHERE review=%s
+                                 AND child=%s""", (review.id, commit.getId(db)))
+
+            (changeset_id,) = cursor.fetchone()
+
+            return changeset_load.loadChangeset(db, review.repository, changeset_id)
 
         if diffMaxLines == 0: diffs = None
         else:
@@ -331,15 +404,11 @@ the review is currently stuck; it cannot finish unless there are reviewers.
 
             for commit in commits:
                 if len(commit.parents) == 1:
-                    cursor.execute("""SELECT id
-                                        FROM reviewchangesets
-                                        JOIN changesets ON (id=changeset)
-                                       WHERE review=%s
-                                         AND child=%s""", (review.id, commit.getId(db)))
+                    changeset = render_cache.get(
+                        ("changeset", commit.sha1),
+                        lambda: loadChangeset(commit))
 
-                    (changeset_id,) = cursor.fetchone()
-
-                    diff = changeset_text.unified(db, changeset_load.loadChangeset(db, review.repository, changeset_id), contextLines)
+                    diff = render_cache.unifiedDiff(db, changeset, contextLines)
                     diffs[commit] = diff
                     lines += diff.count("\n")
                     if lines > diffMaxLines:
@@ -352,7 +421,7 @@ the review is currently stuck; it cannot finish unless there are reviewers.
             lines = 0
 
             for commit in commits:
-                commit_stats = review.repository.run("show", "--oneline", "--stat", commit.sha1).split('\n', 1)[1]
+                commit_stats = render_cache.commitStats(review.repository, commit)
                 stats[commit] = commit_stats
                 lines += commit_stats.count('\n')
                 if lines > statsMaxLines:
@@ -391,9 +460,12 @@ def renderFiles(db, to_user, review, title, files_lines, commits=None, relevant_
     if files_lines:
         files = []
 
+        paths = dbutils.describe_files(
+            db, [file_id for file_id, _, _ in files_lines])
+
         for file_id, delete_count, insert_count in files_lines:
             if not relevant_only or file_id in relevant_files:
-                files.append((dbutils.describe_file(db, file_id), delete_count, insert_count))
+                files.append((paths[file_id], delete_count, insert_count))
 
         if files:
             paths = []
@@ -537,7 +609,7 @@ the review is currently stuck; it cannot finish unless there are reviewers.
                      subject, body),
             message_id)
 
-def sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_accepted, is_accepted, profiler=None):
+def sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_accepted, is_accepted, profiler=None, render_cache=None):
     if profiler: profiler.check("generate mail: start")
 
     # First check if we can/should send emails to the user at all.
@@ -550,6 +622,9 @@ def sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_ac
     if from_user == to_user and to_user.getPreference(db, "email.ignoreOwnChanges"):
         return []
 
+    if render_cache is None:
+        render_cache = RenderCache()
+
     cursor = db.cursor()
 
     line_length = to_user.getPreference(db, "email.lineLength")
@@ -568,57 +643,65 @@ def sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_ac
 
     if profiler: profiler.check("generate mail: get relevant files")
 
-    cursor.execute("SELECT comment FROM batches WHERE id=%s", [batch_id])
-    batch_chain_id = cursor.fetchone()[0]
-
-    if profiler: profiler.check("generate mail: batch chain")
-
-    cursor.execute("""SELECT reviewfiles.file, SUM(reviewfiles.deleted), SUM(reviewfiles.inserted)
-                        FROM reviewfiles
-                        JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
-                       WHERE reviewfilechanges.batch=%s
-                         AND reviewfilechanges.to_state='reviewed'
-                    GROUP BY reviewfiles.file""",
-                       (batch_id,))
-    reviewed_files_lines = cursor.fetchall()
-
-    if profiler: profiler.check("generate mail: reviewed files/lines")
-
-    cursor.execute("""SELECT DISTINCT changesets.child
-                        FROM reviewfiles
-                        JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
-                        JOIN changesets ON (changesets.id=reviewfiles.changeset)
-                       WHERE reviewfilechanges.batch=%s
-                         AND reviewfilechanges.to_state='reviewed'""",
+    def loadBatch():
+        cursor.execute("SELECT comment FROM batches WHERE id=%s", [batch_id])
+        batch_chain_id = cursor.fetchone()[0]
+
+        if profiler: profiler.check("generate mail: batch chain")
+
+        cursor.execute("""SELECT reviewfiles.file, SUM(reviewfiles.deleted), SUM(reviewfiles.inserted)
+                            FROM reviewfiles
+                            JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
+                           WHERE reviewfilechanges.batch=%s
+                             AND reviewfilechanges.to_state='reviewed'
+                        GROUP BY reviewfiles.file""",
+                           (batch_id,))
+        reviewed_files_lines = cursor.fetchall()
+
+        if profiler: profiler.check("generate mail: reviewed files/lines")
+
+        cursor.execute("""SELECT DISTINCT changesets.child
+                            FROM reviewfiles
+                            JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
+                            JOIN changesets ON (changesets.id=reviewfiles.changeset)
+                           WHERE reviewfilechanges.batch=%s
+                             AND reviewfilechanges.to_state='reviewed'""",
+                           (batch_id,))
+        reviewed_commits = [commit_id for (commit_id,) in cursor]
+
+        if profiler: profiler.check("generate mail: reviewed commits")
+
+        cursor.execute("""SELECT reviewfiles.file, SUM(reviewfiles.deleted), SUM(reviewfiles.inserted)
+                            FROM reviewfiles
+                            JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
+                           WHERE reviewfilechanges.batch=%s
+                             AND reviewfilechanges.to_state='pending'
+                        GROUP BY reviewfiles.file""",
                        (batch_id,))
-    reviewed_commits = [commit_id for (commit_id,) in cursor]
+        unreviewed_files_lines = cursor.fetchall()
 
-    if profiler: profiler.check("generate mail: reviewed commits")
+        if profiler: profiler.check("generate mail: unreviewed files/lines")
 
-    cursor.execute("""SELECT reviewfiles.file, SUM(reviewfiles.deleted), SUM(reviewfiles.inserted)
-                        FROM reviewfiles
-                        JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
-                       WHERE reviewfilechanges.batch=%s
-                         AND reviewfilechanges.to_state='pending'
-                    GROUP BY reviewfiles.file""",
-                   (batch_id,))
-    unreviewed_files_lines = cursor.fetchall()
+        cursor.execute("""SELECT DISTINCT changesets.child
+                            FROM reviewfiles
+                            JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
+                            JOIN changesets ON (changesets.id=reviewfiles.changeset)
+                           WHERE reviewfilechanges.batch=%s
+                             AND reviewfilechanges.to_state='pending'""",
+                           (batch_id,))
+        unreviewed_commits = [commit_id for (commit_id,) in cursor]
 
-    if profiler: profiler.check("generate mail: unreviewed files/lines")
+        if profiler: profiler.check("generate mail: unreviewed commits")
 
-    cursor.execute("""SELECT DISTINCT changesets.child
-                        FROM reviewfiles
-                        JOIN reviewfilechanges ON (reviewfilechanges.file=reviewfiles.id)
-                        JOIN changesets ON (changesets.id=reviewfiles.changeset)
-                       WHERE reviewfilechanges.batch=%s
-                         AND reviewfilechanges.to_state='pending'""",
-                       (batch_id,))
-    unreviewed_commits = [commit_id for (commit_id,) in cursor]
+        return (batch_chain_id, reviewed_files_lines, reviewed_commits,
+                unreviewed_files_lines, unreviewed_commits)
 
-    if profiler: profiler.check("generate mail: unreviewed commits")
+    (batch_chain_id, reviewed_files_lines, reviewed_commits,
+     unreviewed_files_lines, unreviewed_commits) = \
+        render_cache.get(("batch", batch_id), loadBatch)
 
-    reviewed_files = renderFiles(db, to_user, review, "Reviewed Files:", reviewed_files_lines, reviewed_commits, relevant_only, relevant_files)
-    unreviewed_files = renderFiles(db, to_user, review, "Unreviewed Files:", unreviewed_files_lines, unreviewed_commits, relevant_only, relevant_files)
+    reviewed_files = render_cache.renderFiles(db, to_user, review, "Reviewed Files:", reviewed_files_lines, reviewed_commits, relevant_only, relevant_files)
+    unreviewed_files = render_cache.renderFiles(db, to_user, review, "Unreviewed Files:", unreviewed_files_lines, unreviewed_commits, relevant_only, relevant_files)
 
     if profiler: profiler.check("generate mail: render files")
 
@@ -632,48 +715,59 @@ def sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_ac
         cursor.execute("SELECT 1 FROM commentchainusers WHERE chain=%s AND uid=%s", (chain.id, to_user.id))
         return cursor.fetchone() is not None
 
-    def fetchNewCommentChains():
-        chains = []
-        for (chain_id,) in cursor.fetchall():
-            if chain_id != batch_chain_id:
-                chain = review_comment.CommentChain.fromId(db, chain_id, from_user, review=review)
-                if not relevant_only or isRelevantComment(chain):
-                    chain.loadComments(db, from_user)
-                    chains.append((chain, None, None))
-        return chains
-
-    def fetchAdditionalCommentChains():
-        chains = []
-        for chain_id, comment_id, new_state, new_type in cursor.fetchall():
-            if comment_id is not None or new_state is not None or new_type is not None:
-                chain = review_comment.CommentChain.fromId(db, chain_id, from_user, review=review)
-                if not relevant_only or isRelevantComment(chain):
-                    chain.loadComments(db, from_user)
-                    chains.append((chain, new_state, new_type))
-        return chains
-
-    cursor.execute("SELECT id FROM commentchains WHERE batch=%s AND type='issue' ORDER BY id ASC", [batch_id])
-    new_issues = fetchNewCommentChains()
-
-    if profiler: profiler.check("generate mail: new issues")
-
-    cursor.execute("SELECT id FROM commentchains WHERE batch=%s AND type='note' ORDER BY id ASC", [batch_id])
-    new_notes = fetchNewCommentChains()
-
-    if profiler: profiler.check("generate mail: new notes")
-
-    cursor.execute("""SELECT commentchains.id, comments.id, commentchainchanges.to_state, commentchainchanges.to_type
-                        FROM commentchains
-             LEFT OUTER JOIN comments ON (commentchains.id=comments.chain
-                                      AND comments.batch=%s)
-             LEFT OUTER JOIN commentchainchanges ON (commentchains.id=commentchainchanges.chain
-                                                 AND commentchainchanges.batch=%s)
-                       WHERE commentchains.review=%s
-                         AND commentchains.batch!=%s""",
-                   [batch_id, batch_id, review.id, batch_id])
-    additional_comments = fetchAdditionalCommentChains()
-
-    if profiler: profiler.check("generate mail: additional comments")
+    def loadCommentChains():
+        cursor.execute("SELECT id, type FROM commentchains WHERE batch=%s AND type IN ('issue', 'note') ORDER BY id ASC", [batch_id])
+        new_chain_ids = [(chain_id, chain_type) for chain_id, chain_type in cursor
+                         if chain_id != batch_chain_id]
+
+        cursor.execute("""SELECT commentchains.id, comments.id, commentchainchanges.to_state, commentchainchanges.to_type
+                            FROM commentchains
+                 LEFT OUTER JOIN comments ON (commentchains.id=comments.chain
+                                          AND comments.batch=%s)
+                 LEFT OUTER JOIN commentchainchanges ON (commentchains.id=commentchainchanges.chain
+                                                     AND commentchainchanges.batch=%s)
+                           WHERE commentchains.review=%s
+                             AND commentchains.batch!=%s""",
+                       [batch_id, batch_id, review.id, batch_id])
+        additional_changes = [(chain_id, new_state, new_type)
+                              for chain_id, comment_id, new_state, new_type in cursor
+                              if comment_id is not None or new_state is not None or new_type is not None]
+
+        chain_ids = set(chain_id for chain_id, _ in new_chain_ids)
+        chain_ids.update(chain_id for chain_id, _, _ in additional_changes)
+        if batch_chain_id is not None:
+            chain_ids.add(batch_chain_id)
+
+        chains = review_comment.CommentChain.fromIds(db, sorted(chain_ids), from_user, review=review)
+        review_comment.loadCommentsForChains(db, chains, from_user)
+        chains_by_id = dict((chain.id, chain) for chain in chains)
+
+        new_issues = [(chains_by_id[chain_id], None, None)
+                      for chain_id, chain_type in new_chain_ids
+                      if chain_type == "issue"]
+        new_notes = [(chains_by_id[chain_id], None, None)
+                     for chain_id, chain_type in new_chain_ids
+                     if chain_type == "note"]
+        additional_comments = [(chains_by_id[chain_id], new_state, new_type)
+                               for chain_id, new_state, new_type in additional_changes]
+
+        if profiler: profiler.check("generate mail: comment chains")
+
+        return (chains_by_id.get(batch_chain_id), new_issues, new_notes,
+                additional_comments)
+
+    batch_chain, new_issues, new_notes, additional_comments = \
+        render_cache.get(("chains", batch_id), loadCommentChains)
+
+    if relevant_only:
+        def filterRelevant(chains):
+            return [(chain, new_state, new_type)
+                    for chain, new_state, new_type in chains
+                    if isRelevantComment(chain)]
+
+        new_issues = filterRelevant(new_issues)
+        new_notes = filterRelevant(new_notes)
+        additional_comments = filterRelevant(additional_comments)
 
     if is_accepted != was_accepted and not reviewed_files and not unreviewed_files and not new_issues and not new_notes and not additional_comments:
         return []
@@ -692,18 +786,11 @@ This is an automatic message generated by the review at:
 
 """ % data
 
-    if batch_chain_id is not None:
-        batch_chain = review_comment.CommentChain.fromId(db, batch_chain_id, from_user, review=review)
-    else:
-        batch_chain = None
-
     data["batch.author.fullname"] = from_user.fullname
 
     first_name = from_user.getFirstName()
 
     if batch_chain is not None:
-        batch_chain.loadComments(db, from_user)
-
         comment_ids.add(batch_chain.comments[0].id)
 
         remark = """%s'%s comment:
@@ -740,7 +827,7 @@ This is an automatic message generated by the review at:
                 else:
                     focus_comment = None
                 if focus_comment is not None or new_state is not None or new_type is not None:
-                    result += renderChainInMail(db, to_user, chain, focus_comment, new_state, new_type, line_length, context_lines) + "\n\n"
+                    result += render_cache.renderChain(db, to_user, chain, focus_comment, new_state, new_type, line_length, context_lines) + "\n\n"
                 if focus_comment is not None:
                     comment_ids.add(focus_comment.id)
         return result
@@ -822,7 +909,7 @@ This is an automatic message generated by the review at:
 
     return files
 
-def sendReviewAddedCommits(db, from_user, to_user, recipients, review, commits, changesets, tracked_branch=False):
+def sendReviewAddedCommits(db, from_user, to_user, recipients, review, commits, changesets, tracked_branch=False, render_cache=None):
     # First check if we can/should send emails to the user at all.
     try:
         checkEmailEnabled(db, to_user)
@@ -833,6 +920,9 @@ def sendReviewAddedCommits(db, from_user, to_user, recipients, review, commits,
     if from_user == to_user and to_user.getPreference(db, "email.ignoreOwnChanges"):
         return []
 
+    if render_cache is None:
+        render_cache = RenderCache()
+
     line_length = to_user.getPreference(db, "email.lineLength")
     hr = "-" * line_length
     relevant_only = to_user not in review.owners and to_user != from_user and to_user.getPreference(db, "email.updatedReview.relevantChangesOnly")
@@ -930,11 +1020,22 @@ This is an automatic message generated by the review at:
         else:
             showcommit_link = False
 
-        body += renderFiles(db, to_user, review, "These changes were assigned to you:", pending_files_lines, showcommit_link=showcommit_link)
+        body += render_cache.renderFiles(db, to_user, review, "These changes were assigned to you:", pending_files_lines, showcommit_link=showcommit_link)
 
     all_commits = to_user.getPreference(db, "email.updatedReview.displayCommits")
     context_lines = to_user.getPreference(db, "email.comment.contextLines")
 
+    def addressedChains(commit):
+        def loadChains():
+            cursor.execute("SELECT id FROM commentchains WHERE review=%s AND state='addressed' AND addressed_by=%s ORDER BY id ASC", (review.id, commit.getId(db)))
+            chains = review_comment.CommentChain.fromIds(db, [chain_id for (chain_id,) in cursor], None, review=review)
+            review_comment.loadCommentsForChains(db, chains, to_user, include_draft_comments=False)
+            return chains
+
+        # Comment timestamps are formatted in the recipient's time zone, so
+        # the chains are shared between recipients with the same time zone.
+        return render_cache.get(("addressed", commit.sha1, to_user.getPreference(db, "timezone")), loadChains)
+
     if all_commits:
         body += "The additional commit%s requested to be reviewed are:\n\n" % ("s" if len(commits) > 1 else "")
 
@@ -953,7 +1054,7 @@ This is an automatic message generated by the review at:
 
             for commit in commits:
                 if commit in changeset_for_commit:
-                    diff = changeset_text.unified(db, changeset_for_commit[commit], contextLines)
+                    diff = render_cache.unifiedDiff(db, changeset_for_commit[commit], contextLines)
                     diffs[commit] = diff
                     lines += diff.count("\n")
                     if lines > diffMaxLines:
@@ -966,7 +1067,7 @@ This is an automatic message generated by the review at:
             lines = 0
 
             for commit in commits:
-                commit_stats = review.repository.run("show", "--oneline", "--stat", commit.sha1).split('\n', 1)[1]
+                commit_stats = render_cache.commitStats(review.repository, commit)
                 stats[commit] = commit_stats
                 lines += commit_stats.count('\n')
                 if lines > statsMaxLines:
@@ -992,14 +1093,8 @@ Author: %(author.fullname)s <%(author.email)s> at %(author.time)s
             if diffs and commit in diffs:
                 body += "\n" + diffs[commit]
 
-            cursor.execute("SELECT id FROM commentchains WHERE review=%s AND state='addressed' AND addressed_by=%s", (review.id, commit.getId(db)))
-            rows = cursor.fetchall()
-
-            if rows:
-                for (chain_id,) in rows:
-                    chain = review_comment.CommentChain.fromId(db, chain_id, to_user, review=review)
-                    chain.loadComments(db, to_user, include_draft_comments=False)
-                    body += "\n\n" + renderChainInMail(db, to_user, chain, None, "addressed", None, line_length, context_lines)
+            for chain in addressedChains(commit):
+                body += "\n\n" + render_cache.renderChain(db, to_user, chain, None, "addressed", None, line_length, context_lines)
 
     files = []
 
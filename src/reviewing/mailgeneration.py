@@ -0,0 +1,131 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""Deferred generation of review notification mails.
+
+Generating the notification mails for a review event (review created, commits
+added, changes submitted) involves rendering one mail per recipient, which can
+take a long time for large reviews.  Instead of doing it in the request that
+triggered the event, the event is recorded in the mailgenerationevents table, in
+the same transaction as the change itself, and the mails are generated later by
+the mailgeneration background service."""
+
+import os
+import signal
+import traceback
+
+import configuration
+import dbutils
+import gitutils
+import textutils
+import diff
+import changeset.load as changeset_load
+
+import utils as review_utils
+
+def signalMailGenerationService():
+    try:
+        with open(configuration.services.MAILGENERATION["pidfile_path"]) as pidfile:
+            pid = int(pidfile.read().strip())
+        os.kill(pid, signal.SIGHUP)
+    except Exception:
+        # Print traceback to stderr.  Might end up in web server's error log,
+        # where it has a chance to be noticed.
+        traceback.print_exc()
+
+def queueEvent(db, event_type, user, review, recipients, data):
+    data = data.copy()
+    data["recipients"] = [to_user.id for to_user in recipients]
+
+    # The system user (e.g. the branch tracker updating a tracked review) has
+    # no row in the users table, so it's recorded as NULL.
+    user_id = None if user.isSystem() else user.id
+
+    cursor = db.cursor()
+    cursor.execute("""INSERT INTO mailgenerationevents (type, review, uid, data)
+                           VALUES (%s, %s, %s, %s)""",
+                   (event_type, review.id, user_id, textutils.json_encode(data)))
+
+    def transactionCallback(event):
+        if event == "commit":
+            signalMailGenerationService()
+
+    db.registerTransactionCallback(transactionCallback)
+
+def queueReviewCreated(db, user, review, recipients):
+    queueEvent(db, "reviewcreated", user, review, recipients, {})
+
+def queueCommitsAdded(db, user, review, recipients, commits, changesets, tracked_branch=False):
+    queueEvent(db, "commitsadded", user, review, recipients,
+               { "commits": [commit.getId(db) for commit in commits],
+                 "changesets": [changeset.id for changeset in changesets],
+                 "tracked_branch": tracked_branch })
+
+def queueBatchSubmitted(db, user, review, batch_id, was_accepted, is_accepted):
+    queueEvent(db, "batchsubmitted", user, review, review.getRecipients(db),
+               { "batch_id": batch_id,
+                 "was_accepted": was_accepted,
+                 "is_accepted": is_accepted })
+
+def generateMails(db, event_id, pending_mails):
+    """Generate the mails for a queued event
+
+       The filenames of generated mails are appended to the list
+       |pending_mails|, also if an exception is raised part-way, so that the
+       caller can discard them.  Returns False if there is no such event."""
+
+    cursor = db.cursor()
+    cursor.execute("""SELECT type, review, uid, data
+                        FROM mailgenerationevents
+                       WHERE id=%s""",
+                   (event_id,))
+
+    row = cursor.fetchone()
+    if not row:
+        return False
+
+    event_type, review_id, user_id, data = row
+
+    review = dbutils.Review.fromId(db, review_id)
+    if user_id is None:
+        from_user = dbutils.User.makeSystem()
+    else:
+        from_user = dbutils.User.fromId(db, user_id)
+    data = textutils.json_decode(data)
+
+    # Recipients are recorded when the event is queued; users that have been
+    # deleted since then are skipped.
+    recipients = filter(None, dbutils.User.fromIds(db, data["recipients"]))
+
+    if event_type == "reviewcreated":
+        review_utils.generateMailsForReviewCreated(
+            db, from_user, review, recipients, pending_mails=pending_mails)
+    elif event_type == "commitsadded":
+        repository = review.repository
+        commits = gitutils.Commit.fromIds(db, repository, data["commits"])
+        changesets = changeset_load.loadChangesets(
+            db, repository,
+            [diff.Changeset.fromId(db, repository, changeset_id)
+             for changeset_id in data["changesets"]])
+        review_utils.generateMailsForAddedCommits(
+            db, from_user, review, recipients, commits, changesets,
+            tracked_branch=data["tracked_branch"], pending_mails=pending_mails)
+    else:
+        review_utils.generateMailsForBatch(
+            db, data["batch_id"], data["was_accepted"], data["is_accepted"],
+            recipients=recipients, pending_mails=pending_mails)
+
+    return True
@@ -0,0 +1,164 @@
+# -*- mode: python; encoding: utf-8 -*-
+#
+# Copyright 2016 the Critic contributors, Opera Software ASA
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License.  You may obtain a copy of
+# the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+"""Trigram index used by the review search.
+
+For each review, the reviewsearchtrigrams table records which (lower-cased)
+trigrams occur in the review's summary, description, branch name, published
+comments and file paths.  A search term can only match a review if every
+trigram in the term's literal parts occurs in the corresponding field, so the
+index is used to narrow down the set of candidate reviews before the actual
+(and expensive) pattern matching is done.
+
+The index is updated incrementally by the code that writes the indexed text.
+Trigrams are never removed, except when a summary or description is replaced,
+since stale trigrams only make the set of candidates slightly bigger."""
+
+import re
+
+import textutils
+
+FIELDS = frozenset(["summary", "description", "branch", "comment", "path"])
+
+def trigrams(text):
+    """Return the set of trigrams in |text|, as UTF-8 encoded strings"""
+
+    if not text:
+        return set()
+
+    text = textutils.decode(text).lower()
+
+    return set(text[offset:offset + 3].encode("utf-8")
+               for offset in range(len(text) - 2))
+
+def patternTrigrams(pattern):
+    """Return the trigrams any string matching the glob |pattern| contains
+
+       The pattern can contain the wildcards '*', '**/' and '?'.  Only the
+       literal parts between wildcards contribute trigrams."""
+
+    result = set()
+    for literal in re.split(r"\*\*/|[*?]", pattern):
+        result.update(trigrams(literal))
+    return result
+
+def addToIndex(cursor, review_id, field, texts):
+    """Add the trigrams of all strings in |texts| to the index"""
+
+    assert field in FIELDS
+
+    new_trigrams = set()
+    for text in texts:
+        new_trigrams.update(trigrams(text))
+
+    if not new_trigrams:
+        return
+
+    cursor.execute("""SELECT trigram
+                        FROM reviewsearchtrigrams
+                       WHERE review=%s
+                         AND field=%s""",
+                   (review_id, field))
+    new_trigrams.difference_update(
+        textutils.decode(trigram).encode("utf-8") for (trigram,) in cursor)
+
+    cursor.executemany("""INSERT INTO reviewsearchtrigrams (review, field, trigram)
+                               VALUES (%s, %s, %s)""",
+                       [(review_id, field, trigram)
+                        for trigram in sorted(new_trigrams)])
+
+def replaceInIndex(cursor, review_id, field, texts):
+    """Replace all trigrams of a field in the index"""
+
+    assert field in FIELDS
+
+    cursor.execute("""DELETE FROM reviewsearchtrigrams
+                            WHERE review=%s
+                              AND field=%s""",
+                   (review_id, field))
+
+    addToIndex(cursor, review_id, field, texts)
+
+def indexPaths(cursor, review_id, changeset_ids):
+    """Add the paths of all files modified by the changesets to the index"""
+
+    cursor.execute("""SELECT DISTINCT files.path
+                        FROM fileversions
+                        JOIN files ON (files.id=fileversions.file)
+                       WHERE fileversions.changeset=ANY (%s)""",
+                   (list(changeset_ids),))
+
+    addToIndex(cursor, review_id, "path", [path for (path,) in cursor])
+
+def indexComments(cursor, review_id, batch_id):
+    """Add the text of all comments published in a batch to the index"""
+
+    cursor.execute("""SELECT comments.comment
+                        FROM comments
+                        JOIN commentchains ON (commentchains.id=comments.chain)
+                       WHERE commentchains.review=%s
+                         AND comments.batch=%s""",
+                   (review_id, batch_id))
+
+    addToIndex(cursor, review_id, "comment", [text for (text,) in cursor])
+
+def estimateMatches(cursor, field, required_trigrams):
+    """Return an upper bound on the number of reviews that can match
+
+       The bound is the number of reviews containing the least common of the
+       required trigrams, and is zero if any of them doesn't occur at all."""
+
+    assert field in FIELDS and required_trigrams
+
+    cursor.execute("""SELECT trigram, COUNT(*)
+                        FROM reviewsearchtrigrams
+                       WHERE field=%s
+                         AND trigram=ANY (%s)
+                    GROUP BY trigram""",
+                   (field, sorted(required_trigrams)))
+
+    counts = [count for _, count in cursor]
+
+    if len(counts) < len(required_trigrams):
+        return 0
+    return min(counts)
+
+def findMatches(cursor, field, required_trigrams, candidates=None):
+    """Return the ids of reviews containing all the required trigrams
+
+       If |candidates| is not None, only reviews in it are returned."""
+
+    assert field in FIELDS and required_trigrams
+
+    query = """SELECT review
+                 FROM reviewsearchtrigrams
+                WHERE field=%s
+                  AND trigram=ANY (%s)"""
+    arguments = [field, sorted(required_trigrams)]
+
+    if candidates is not None:
+        query += """
+                  AND review=ANY (%s)"""
+        arguments.append(sorted(candidates))
+
+    query += """
+             GROUP BY review
+               HAVING COUNT(DISTINCT trigram)=%s"""
+    arguments.append(len(required_trigrams))
+
+    cursor.execute(query, arguments)
+
+    return set(review_id for (review_id,) in cursor)
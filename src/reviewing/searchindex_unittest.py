@@ -0,0 +1,33 @@
+def trigrams():
+    import reviewing.searchindex
+
+    trigrams = reviewing.searchindex.trigrams
+    patternTrigrams = reviewing.searchindex.patternTrigrams
+
+    assert trigrams(None) == set()
+    assert trigrams("ab") == set()
+    assert trigrams("abc") == set(["abc"])
+    assert trigrams("AbCd") == set(["abc", "bcd"])
+    assert trigrams("aaaa") == set(["aaa"])
+
+    # Trigrams are sequences of characters, not bytes.
+    assert trigrams("\xc3\xa5\xc3\xa4\xc3\xb6") == set(["\xc3\xa5\xc3\xa4\xc3\xb6"])
+    assert trigrams(u"\xc5\xc4\xd6x") == set(["\xc3\xa5\xc3\xa4\xc3\xb6",
+                                              "\xc3\xa4\xc3\xb6x"])
+
+    assert patternTrigrams("support") == trigrams("support")
+    assert patternTrigrams("*") == set()
+    assert patternTrigrams("ab?cd") == set()
+    assert patternTrigrams("abc*def") == set(["abc", "def"])
+    assert patternTrigrams("src/**/foo.py") == (trigrams("src/") |
+                                                 trigrams("foo.py"))
+
+    # Every trigram required by a pattern must occur in every string matching
+    # the pattern.
+    for pattern, string in [("s*port", "support"),
+                            ("src/**/foo.py", "src/a/b/foo.py"),
+                            ("src/**/foo.py", "src/foo.py"),
+                            ("Ma?e sure", "Make sure")]:
+        assert patternTrigrams(pattern) <= trigrams(string), (pattern, string)
+
+    print "trigrams: ok"
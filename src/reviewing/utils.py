@@ -22,6 +22,8 @@ import htmlutils
 import configuration
 
 import mail
+import mailgeneration
+import searchindex
 import diff
 import changeset.utils as changeset_utils
 import changeset.load as changeset_load
@@ -260,7 +262,13 @@ def assignChanges(db, user, review, commits=None, changesets=None, update=False)
 
     return new_reviewers, new_watchers
 
+# Number of changesets requested from the changeset service at a time when
+# adding commits to a review.  Between requests, progress is reported.
+CHANGESET_REQUEST_BATCH_SIZE = 50
+
 def createChangesetsForCommits(db, commits, silent_if_empty=set(), full_merges=set(), replayed_rebases={}):
+    import index
+
     repository = commits[0].repository
     changesets = []
     silent_commits = set()
@@ -270,8 +278,10 @@ def createChangesetsForCommits(db, commits, silent_if_empty=set(), full_merges=s
     for commit in commits:
         if commit not in full_merges and commit not in replayed_rebases:
             simple_commits.append(commit)
-    if simple_commits:
-        changeset_utils.createChangesets(db, repository, simple_commits)
+    for offset in range(0, len(simple_commits), CHANGESET_REQUEST_BATCH_SIZE):
+        batch = simple_commits[offset:offset + CHANGESET_REQUEST_BATCH_SIZE]
+        changeset_utils.createChangesets(db, repository, batch)
+        index.progress.queuedChangesets(len(batch))
 
     for commit in commits:
         if commit in full_merges:
@@ -295,10 +305,11 @@ def createChangesetsForCommits(db, commits, silent_if_empty=set(), full_merges=s
                 silent_changesets.update(commit_changesets)
 
         changesets.extend(commit_changesets)
+        index.progress.processedCommits()
 
     return changesets, silent_commits, silent_changesets
 
-def addCommitsToReview(db, user, review, commits, new_review=False, commitset=None, pending_mails=None, silent_if_empty=set(), full_merges=set(), replayed_rebases={}, tracked_branch=False):
+def addCommitsToReview(db, user, review, commits, new_review=False, commitset=None, pending_mails=None, silent_if_empty=set(), full_merges=set(), replayed_rebases={}, tracked_branch=False, deferrable=False):
     cursor = db.cursor()
 
     if not new_review:
@@ -380,6 +391,32 @@ Please confirm that this is intended by loading:
             commitset &= set(new_commits)
             commits = [commit for commit in commits if commit in commitset]
 
+    if not new_review:
+        index.progress.setPhase("adding commits to review")
+
+        # Nothing below rejects the push, so if the githook service's time
+        # budget has been spent, the rest can be finished after the push has
+        # been accepted.  The caller records it as a deferred review update.
+        if deferrable and index.progress.overBudget():
+            return False
+    else:
+        new_commits = None
+
+    addConfirmedCommitsToReview(db, user, review, commits, new_commits, new_review, pending_mails, silent_if_empty, full_merges, replayed_rebases, tracked_branch)
+
+    return True
+
+def addConfirmedCommitsToReview(db, user, review, commits, new_commits=None, new_review=False, pending_mails=None, silent_if_empty=set(), full_merges=set(), replayed_rebases={}, tracked_branch=False):
+    """addConfirmedCommitsToReview(db, user, review, commits, ...) -> None
+
+Add commits that have passed the checks in addCommitsToReview() to the review.
+The caller commits the transaction."""
+
+    cursor = db.cursor()
+
+    if not new_review and new_commits is None:
+        new_commits = log_commitset.CommitSet(commits)
+
     changesets, silent_commits, silent_changesets = \
         createChangesetsForCommits(db, commits, silent_if_empty, full_merges, replayed_rebases)
 
@@ -400,6 +437,9 @@ Please confirm that this is intended by loading:
                              GROUP BY reviewchangesets.review, reviewchangesets.changeset, fileversions.file""",
                        reviewchangesets_values)
 
+    searchindex.indexPaths(cursor, review.id,
+                           [changeset.id for changeset in changesets])
+
     new_reviewers, new_watchers = assignChanges(db, user, review, changesets=changesets)
 
     cursor.execute("SELECT include FROM reviewrecipientfilters WHERE review=%s AND uid IS NULL", (review.id,))
@@ -432,11 +472,9 @@ Please confirm that this is intended by loading:
     notify_changesets = filter(lambda changeset: changeset not in silent_changesets, changesets)
 
     if not new_review and notify_changesets:
-        recipients = review.getRecipients(db)
-        for to_user in recipients:
-            pending_mails.extend(mail.sendReviewAddedCommits(
-                    db, user, to_user, recipients, review, notify_commits,
-                    notify_changesets, tracked_branch=tracked_branch))
+        mailgeneration.queueCommitsAdded(
+            db, user, review, review.getRecipients(db), notify_commits,
+            notify_changesets, tracked_branch=tracked_branch)
 
     mail.sendPendingMails(pending_mails)
 
@@ -445,8 +483,6 @@ Please confirm that this is intended by loading:
     for user_id in new_watchers:
         review.watchers[User.fromId(db, user_id)] = "automatic"
 
-    return True
-
 def createReview(db, user, repository, commits, branch_name, summary, description, from_branch_name=None, via_push=False, reviewfilters=None, applyfilters=True, applyparentfilters=False, recipientfilters=None):
     cursor = db.cursor()
 
@@ -548,6 +584,10 @@ using the command<p>
 
         review = dbutils.Review.fromId(db, cursor.fetchone()[0])
 
+        searchindex.addToIndex(cursor, review.id, "summary", [summary])
+        searchindex.addToIndex(cursor, review.id, "description", [description])
+        searchindex.addToIndex(cursor, review.id, "branch", [branch_name])
+
         cursor.execute("""INSERT INTO reviewusers (review, uid, owner)
                                VALUES (%s, %s, TRUE)""",
                        (review.id, user.id))
@@ -576,10 +616,9 @@ using the command<p>
         # Reload to get list of changesets added by addCommitsToReview().
         review = dbutils.Review.fromId(db, review.id)
 
-        pending_mails = []
         recipients = review.getRecipients(db)
-        for to_user in recipients:
-            pending_mails.extend(mail.sendReviewCreated(db, user, to_user, recipients, review))
+
+        mailgeneration.queueReviewCreated(db, user, review, recipients)
 
         if not is_opt_in:
             recipient_by_id = dict((to_user.id, to_user) for to_user in recipients)
@@ -668,8 +707,6 @@ using the command<p>
 
         db.commit()
 
-        mail.sendPendingMails(pending_mails)
-
         return review
     except:
         if not via_push:
@@ -952,7 +989,28 @@ def applyFilters(db, user, review, globalfilters=False, parentfilters=False):
 
     mail.sendPendingMails(pending_mails)
 
-def generateMailsForBatch(db, batch_id, was_accepted, is_accepted, profiler=None):
+def generateMailsForReviewCreated(db, from_user, review, recipients, pending_mails=None):
+    if pending_mails is None: pending_mails = []
+
+    render_cache = mail.RenderCache()
+    for to_user in recipients:
+        pending_mails.extend(mail.sendReviewCreated(db, from_user, to_user, recipients, review, render_cache=render_cache))
+
+    return pending_mails
+
+def generateMailsForAddedCommits(db, from_user, review, recipients, commits, changesets, tracked_branch=False, pending_mails=None):
+    if pending_mails is None: pending_mails = []
+
+    render_cache = mail.RenderCache()
+    for to_user in recipients:
+        pending_mails.extend(mail.sendReviewAddedCommits(
+                db, from_user, to_user, recipients, review, commits,
+                changesets, tracked_branch=tracked_branch,
+                render_cache=render_cache))
+
+    return pending_mails
+
+def generateMailsForBatch(db, batch_id, was_accepted, is_accepted, profiler=None, recipients=None, pending_mails=None):
     cursor = db.cursor()
     cursor.execute("SELECT review, uid FROM batches WHERE id=%s", (batch_id,))
 
@@ -961,11 +1019,12 @@ def generateMailsForBatch(db, batch_id, was_accepted, is_accepted, profiler=None
     review = dbutils.Review.fromId(db, review_id)
     from_user = dbutils.User.fromId(db, user_id)
 
-    pending_mails = []
+    if pending_mails is None: pending_mails = []
+    if recipients is None: recipients = review.getRecipients(db)
 
-    recipients = review.getRecipients(db)
+    render_cache = mail.RenderCache()
     for to_user in recipients:
-        pending_mails.extend(mail.sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_accepted, is_accepted, profiler=profiler))
+        pending_mails.extend(mail.sendReviewBatch(db, from_user, to_user, recipients, review, batch_id, was_accepted, is_accepted, profiler=profiler, render_cache=render_cache))
 
     return pending_mails
 
@@ -15,31 +15,150 @@
 # the License.
 
 import os
+import re
+import bisect
 
 import syntaxhighlight
 import configuration
 
-def importCodeContexts(db, sha1, language):
-    codecontexts_path = syntaxhighlight.generateHighlightPath(sha1, language) + ".ctx"
+class CodeContextIndex(object):
+    """Interval index over the code contexts of a single file version
+
+       Answers "what is the innermost code context containing line N?" without
+       a database query per line.  The contexts are sorted by first line, and a
+       tree of maximum last lines over that order is used to find the last
+       context that starts before the line and ends after it."""
+
+    def __init__(self, contexts):
+        # Sort by first line, and for equal first lines, by descending last
+        # line, so that the innermost context comes last.
+        self.__contexts = sorted(
+            contexts, key=lambda (first_line, last_line, context): (first_line, -last_line))
+        self.__first_lines = [first_line for first_line, _, _ in self.__contexts]
+
+        size = 1
+        while size < len(self.__contexts):
+            size *= 2
+
+        tree = [0] * (2 * size)
+        for index, (_, last_line, _) in enumerate(self.__contexts):
+            tree[size + index] = last_line
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+
+        self.__size = size
+        self.__tree = tree
+
+    def __len__(self):
+        return len(self.__contexts)
+
+    def __find(self, node, low, high, limit, line):
+        # Return the last context in [low, min(high, limit)) that ends on or
+        # after |line|.
+        if low >= limit or self.__tree[node] < line:
+            return None
+        if high - low == 1:
+            return self.__contexts[low][2]
+        middle = (low + high) // 2
+        context = self.__find(2 * node + 1, middle, high, limit, line)
+        if context is None:
+            context = self.__find(2 * node, low, middle, limit, line)
+        return context
+
+    def find(self, line):
+        """Return the innermost context containing |line|, or None"""
+        limit = bisect.bisect_right(self.__first_lines, line)
+        if not limit:
+            return None
+        return self.__find(1, 0, self.__size, limit, line)
+
+def minimizeCodeContext(context):
+    return re.sub("\\(.*(?:\\)|...$)", "(...)", context)
+
+def loadCodeContexts(db, sha1s):
+    """Return a dictionary mapping each SHA-1 to a CodeContextIndex
+
+       The indexes are cached in the database session, and the contexts of all
+       SHA-1s not already cached are fetched using a single query."""
+
+    cache = db.storage["CodeContexts"]
+    result = {}
+    missing = set()
+
+    for sha1 in sha1s:
+        if sha1 in cache:
+            result[sha1] = cache[sha1]
+        else:
+            missing.add(sha1)
+
+    if missing:
+        cursor = db.cursor()
+        cursor.execute("""SELECT sha1, first_line, last_line, context
+                            FROM codecontexts
+                           WHERE sha1=ANY (%s)""",
+                       (list(missing),))
+
+        contexts = dict((sha1, []) for sha1 in missing)
+        for sha1, first_line, last_line, context in cursor:
+            contexts[sha1].append((first_line, last_line, context))
+
+        for sha1, sha1_contexts in contexts.items():
+            index = CodeContextIndex(sha1_contexts)
+            # Don't remember the absence of contexts; they may just not have
+            # been imported yet.
+            if index:
+                cache[sha1] = index
+            result[sha1] = index
+
+    return result
+
+def getCodeContexts(db, lookups, minimized=False):
+    """Return the code contexts of a list of (sha1, line) tuples
+
+       The returned list contains a context (or None) per tuple, in order."""
+
+    indexes = loadCodeContexts(db, set(sha1 for sha1, _ in lookups))
+    contexts = []
+
+    for sha1, line in lookups:
+        context = indexes[sha1].find(line)
+        if context is not None and minimized:
+            context = minimizeCodeContext(context)
+        contexts.append(context)
+
+    return contexts
+
+def importCodeContexts(db, sha1, language, mode="legacy"):
+    codecontexts_path = syntaxhighlight.generateHighlightPath(sha1, language, mode) + ".ctx"
 
     if os.path.isfile(codecontexts_path):
+        max_context_length = configuration.services.HIGHLIGHT["max_context_length"]
         contexts_values = []
 
         for line in open(codecontexts_path):
             line = line.strip()
 
             first_line, last_line, context = line.split(" ", 2)
-            if len(context) > configuration.services.HIGHLIGHT["max_context_length"]:
-                context = context[:configuration.services.HIGHLIGHT["max_context_length"] - 3] + "..."
-            contexts_values.append((sha1, context, int(first_line), int(last_line)))
+            if len(context) > max_context_length:
+                context = context[:max_context_length - 3] + "..."
+            contexts_values.extend((sha1, context, int(first_line), int(last_line)))
 
         cursor = db.cursor()
         cursor.execute("DELETE FROM codecontexts WHERE sha1=%s", [sha1])
-        cursor.executemany("INSERT INTO codecontexts (sha1, context, first_line, last_line) VALUES (%s, %s, %s, %s)", contexts_values)
+
+        # Insert many rows per statement rather than one statement per row.
+        rows_per_insert = 200
+        values_per_row = 4
+        for offset in range(0, len(contexts_values), rows_per_insert * values_per_row):
+            values = contexts_values[offset:offset + rows_per_insert * values_per_row]
+            cursor.execute("INSERT INTO codecontexts (sha1, context, first_line, last_line) VALUES "
+                           + ", ".join(["(%s, %s, %s, %s)"] * (len(values) // values_per_row)),
+                           values)
+
         db.commit()
 
         os.unlink(codecontexts_path)
 
-        return len(contexts_values)
+        return len(contexts_values) // values_per_row
     else:
         return 0
@@ -0,0 +1,40 @@
+def index():
+    from syntaxhighlight.context import CodeContextIndex
+
+    def naive(contexts, line):
+        # What the old per-line query did: the containing context with the
+        # greatest first line.
+        matching = sorted((first_line, -last_line, context)
+                          for first_line, last_line, context in contexts
+                          if first_line <= line <= last_line)
+        return matching[-1][2] if matching else None
+
+    contexts = [(1, 100, "class A"),
+                (5, 20, "def a1()"),
+                (25, 60, "def a2()"),
+                (30, 40, "def inner()"),
+                (70, 70, "def oneliner()"),
+                (120, 150, "class B"),
+                (120, 130, "def b1()")]
+
+    code_contexts = CodeContextIndex(contexts)
+
+    assert len(code_contexts) == 7
+    assert code_contexts.find(0) is None
+    assert code_contexts.find(1) == "class A"
+    assert code_contexts.find(10) == "def a1()"
+    assert code_contexts.find(21) == "class A"
+    assert code_contexts.find(35) == "def inner()"
+    assert code_contexts.find(41) == "def a2()"
+    assert code_contexts.find(70) == "def oneliner()"
+    assert code_contexts.find(110) is None
+    assert code_contexts.find(120) == "def b1()"
+    assert code_contexts.find(140) == "class B"
+    assert code_contexts.find(151) is None
+
+    for line in range(0, 160):
+        assert code_contexts.find(line) == naive(contexts, line), line
+
+    assert CodeContextIndex([]).find(1) is None
+
+    print "index: ok"
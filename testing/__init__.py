@@ -129,6 +129,7 @@ class Instance(object):
                                                 "githook",
                                                 "highlight",
                                                 "maildelivery",
+                                                "mailgeneration",
                                                 "maintenance",
                                                 "servicemanager",
                                                 "watchdog"])
@@ -331,7 +331,8 @@ class Frontend(object):
         return result
 
     def json(self, path, expect=None, params={}, expected_http_status=200,
-             post=None, put=None, delete=False):
+             post=None, put=None, delete=False, headers={},
+             response_headers=None):
         url = "api/v1/" + path
         full_url = "http://%s:%d/%s" % (self.hostname, self.http_port, url)
 
@@ -342,6 +343,7 @@ class Frontend(object):
 
         kwargs = { "params": params,
                    "headers": { "Accept": "application/vnd.api+json" } }
+        kwargs["headers"].update(headers)
         method = "GET"
 
         self.current_session.apply(kwargs)
@@ -365,6 +367,11 @@ class Frontend(object):
 
         self.current_session.process_response(response)
 
+        if response_headers is not None:
+            response_headers.update(
+                (name.lower(), value)
+                for name, value in response.headers.items())
+
         def response_json():
             if hasattr(response, "json"):
                 if callable(response.json):
@@ -401,8 +408,8 @@ class Frontend(object):
                             % (error["title"], error["message"]))
                 raise HTTPError(url, expected_http_status, response.status_code)
 
-            if response.status_code == 204:
-                # No content.
+            if response.status_code in (204, 304):
+                # No content / not modified.
                 return None
 
             if hasattr(response, "json"):
@@ -295,9 +295,11 @@ class Mailbox(object):
             return mail
 
         if accept is not None and self.instance:
-            # Wait until the instance's mail delivery service is idle, which
-            # means it has delivered all pending mail.  After that, the mail
-            # should be here, or it never will be.
+            # Wait until the instance's mail generation and mail delivery
+            # services are idle, which means all pending mail has been
+            # generated and delivered.  After that, the mail should be here, or
+            # it never will be.
+            self.instance.synchronize_service("mailgeneration")
             self.instance.synchronize_service("maildelivery")
 
             mail = find_mail()
@@ -1,3 +1,5 @@
+import os
+
 TEST_NAME = "030-trackingreview"
 BRANCH_NAME = [TEST_NAME + "-1",
                TEST_NAME + "-2"]
@@ -172,3 +174,25 @@ with testing.utils.settings("alice", SETTINGS), frontend.signin("alice"):
         "r/%d" % review_id,
         expect={
             "tracking": check_tracking(BRANCH_NAME[1]) })
+
+    # Add a commit to the tracked branch.  The branch tracker adds it to the
+    # review as the Critic system user, which has no row in the users table.
+    with repository.workcopy() as work:
+        work.run(["checkout", "-b", BRANCH_NAME[1],
+                  "origin/" + BRANCH_NAME[1]])
+        with open(os.path.join(work.path, TEST_NAME + ".txt"), "w") as text:
+            print >>text, "Added to the tracked branch."
+        work.run(["add", TEST_NAME + ".txt"])
+        work.run(["commit", "-m", "Update tracked branch"])
+        work.run(["push", "origin", "HEAD"])
+
+    frontend.operation(
+        "triggertrackedbranchupdate",
+        data={
+            "branch_id": trackedbranch_id })
+
+    instance.synchronize_service("branchtracker")
+
+    mailbox.pop(
+        accept=[to("alice"),
+                about("Updated Review: " + SUMMARY)])
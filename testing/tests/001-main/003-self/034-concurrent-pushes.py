@@ -0,0 +1,59 @@
+import os
+import threading
+
+# Push to many branches concurrently.  The githook service processes at most a
+# few pushes at a time and the rest are queued, but all of them should succeed.
+
+BRANCH_PREFIX = "034-concurrent-pushes/"
+PUSHES = 12
+
+with repository.workcopy() as work:
+    REMOTE_URL = instance.repository_url("alice")
+
+    sha1s = {}
+
+    for index in range(PUSHES):
+        branch = BRANCH_PREFIX + str(index)
+        filename = "034-concurrent-pushes-%d.txt" % index
+
+        work.run(["checkout", "-b", branch, "origin/master"])
+        with open(os.path.join(work.path, filename), "w") as text_file:
+            print >>text_file, "Pushed concurrently (%d)" % index
+        work.run(["add", filename])
+        work.run(["commit", "-m", "Concurrent push %d" % index])
+
+        sha1s[branch] = work.run(["rev-parse", "HEAD"]).strip()
+
+    errors = []
+
+    def push(branch):
+        try:
+            work.run(["push", "-q", REMOTE_URL,
+                      "%s:refs/heads/%s" % (sha1s[branch], branch)])
+        except testing.repository.GitCommandError as error:
+            errors.append((branch, error))
+
+    threads = [threading.Thread(target=push, args=(branch,))
+               for branch in sorted(sha1s)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for branch, error in errors:
+        logger.error("push of %s failed:\n%s" % (branch, error.output))
+
+    for branch, sha1 in sorted(sha1s.items()):
+        remote_sha1 = work.run(["ls-remote", REMOTE_URL,
+                                "refs/heads/" + branch]).split()[0]
+        testing.expect.check(sha1, remote_sha1)
+
+        frontend.json(
+            "branches",
+            params={ "name": branch,
+                     "repository": 1 },
+            expect={ "id": int,
+                     "name": branch,
+                     "repository": 1,
+                     "head": int })
@@ -0,0 +1,102 @@
+import re
+import threading
+
+# Rebase a review onto an unrelated upstream while other pushes are queued.
+# Processing the rebase replays it, and pushes the replayed commit to a
+# keepalive ref in the same repository.  That push must not be queued behind
+# the push that triggered it, or neither ever finishes.
+
+def to(name):
+    return testing.mailbox.ToRecipient("%s@example.org" % name)
+
+def about(subject):
+    return testing.mailbox.WithSubject(subject)
+
+# See 012-replayrebase.py.
+COMMIT_SHA1 = "aca57d0899e5193232dbbea726d94a838a4274ed"
+PARENT_SHA1 = "ca89553db7a2ba22fef70535a65beedf33c97216"
+TARGET_SHA1 = "132dbfb7c2ac0f4333fb483a70f1e8cce0333d11"
+
+SUMMARY = "Use temporary clones for relaying instead of temporary remotes"
+
+BRANCH_PREFIX = "035-replayrebase-queue/"
+PUSHES = 8
+
+SETTINGS = { "review.createViaPush": True,
+             "email.subjectLine.updatedReview.reviewRebased":
+                 "Rebased Review: %(summary)s" }
+
+def keepalive_refs(work, remote_url):
+    return set(line.split()[1] for line in work.run(
+        ["ls-remote", remote_url, "refs/keepalive/*"]).splitlines())
+
+with testing.utils.settings("alice", SETTINGS), frontend.signin("alice"):
+    with repository.workcopy() as work:
+        REMOTE_URL = instance.repository_url("alice")
+
+        work.run(["checkout", "-b", "r/035-replayrebase-queue", PARENT_SHA1])
+        work.run(["cherry-pick", COMMIT_SHA1],
+                 GIT_COMMITTER_NAME="Alice von Testing",
+                 GIT_COMMITTER_EMAIL="alice@example.org")
+
+        output = work.run(["push", REMOTE_URL, "HEAD"])
+        next_is_review_url = False
+
+        for line in output.splitlines():
+            if not line.startswith("remote:"):
+                continue
+            line = line[len("remote:"):].split("\x1b", 1)[0].strip()
+            if line == "Submitted review:":
+                next_is_review_url = True
+            elif next_is_review_url:
+                review_id = int(re.search(r"/r/(\d+)$", line).group(1))
+                break
+        else:
+            testing.expect.check("<review URL in git hook output>",
+                                 "<expected content not found>")
+
+        mailbox.pop(accept=[to("alice"),
+                            about("New Review: %s" % SUMMARY)])
+
+        frontend.operation(
+            "preparerebase",
+            data={ "review_id": review_id,
+                   "new_upstream": TARGET_SHA1 })
+
+        work.run(["rebase", "--onto", TARGET_SHA1, PARENT_SHA1])
+
+        keepalives_before = keepalive_refs(work, REMOTE_URL)
+
+        errors = []
+
+        def push(refspec):
+            try:
+                work.run(["push", "-q", "--force", REMOTE_URL, refspec])
+            except testing.repository.GitCommandError as error:
+                errors.append((refspec, error))
+
+        refspecs = ["HEAD:refs/heads/r/035-replayrebase-queue"]
+        refspecs.extend("%s:refs/heads/%s%d" % (TARGET_SHA1, BRANCH_PREFIX,
+                                                index)
+                        for index in range(PUSHES))
+
+        threads = [threading.Thread(target=push, args=(refspec,))
+                   for refspec in refspecs]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for refspec, error in errors:
+            logger.error("push of %s failed:\n%s" % (refspec, error.output))
+
+        # The replayed rebase was pushed to a new keepalive ref.
+        testing.expect.check(
+            True, len(keepalive_refs(work, REMOTE_URL) - keepalives_before) > 0)
+
+        mailbox.pop(accept=[to("alice"),
+                            about("Updated Review: %s" % SUMMARY)])
+
+        mailbox.pop(accept=[to("alice"),
+                            about("Rebased Review: %s" % SUMMARY)])
@@ -0,0 +1,78 @@
+# @dependency 001-main/003-self/200-json/004-review.py
+# @dependency 001-main/003-self/200-json/005-commits.py
+# @dependency 001-main/003-self/200-json/006-comments.py
+
+SHA1 = "78d7849db854f3544d7291cce96a0a4fa6d6843d"
+
+def fetch(path, params={}, etag=None, expected_http_status=200):
+    headers = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    response_headers = {}
+    frontend.json(path, params=params, headers=headers,
+                  response_headers=response_headers,
+                  expected_http_status=expected_http_status)
+    return response_headers
+
+# Commits are immutable, and cacheable indefinitely.
+commit_id = frontend.json(
+    "commits",
+    params={ "sha1": SHA1,
+             "repository": "critic" })["id"]
+
+headers = fetch("commits/%d" % commit_id, params={ "repository": "critic" })
+commit_etag = headers.get("etag")
+testing.expect.true(commit_etag is not None, "ETag header sent for commit")
+testing.expect.check("private, max-age=31536000", headers.get("cache-control"))
+
+headers = fetch("commits/%d" % commit_id, params={ "repository": "critic" },
+                etag=commit_etag, expected_http_status=304)
+testing.expect.check(commit_etag, headers.get("etag"))
+
+fetch("commits/%d" % commit_id, params={ "repository": "critic" },
+      etag='"bogus"')
+
+# Listings are never handled conditionally.
+headers = fetch("commits", params={ "repository": "critic",
+                                    "sha1": SHA1 })
+testing.expect.true("etag" not in headers, "no ETag header for listing")
+
+# Reviews must be revalidated, and change ETag when modified.
+result = frontend.operation(
+    "searchreview",
+    data={ "query": "branch:r/100-reviewing/001-comment.basic" })
+review_id = result["reviews"][0]["id"]
+
+with frontend.signin("alice"):
+    headers = fetch("reviews/%d" % review_id)
+    review_etag = headers.get("etag")
+    testing.expect.true(review_etag is not None, "ETag header sent for review")
+    testing.expect.check("private, no-cache", headers.get("cache-control"))
+
+    fetch("reviews/%d" % review_id, etag=review_etag,
+          expected_http_status=304)
+
+    # Linked resources aren't covered by the ETag.
+    headers = fetch("reviews/%d" % review_id, params={ "include": "users" },
+                    etag=review_etag)
+    testing.expect.true("etag" not in headers,
+                        "no ETag header with linked resources")
+
+    note_id = frontend.json(
+        "comments",
+        params={ "review": review_id },
+        post={ "type": "note",
+               "text": "Conditional GET note" })["id"]
+
+    headers = fetch("reviews/%d" % review_id, etag=review_etag)
+    testing.expect.true(headers.get("etag") != review_etag,
+                        "review ETag changed by new draft comment")
+
+    frontend.json("comments/%d" % note_id, delete=True,
+                  expected_http_status=204)
+
+with frontend.signin("bob"):
+    # The ETag is specific to the user.
+    headers = fetch("reviews/%d" % review_id, etag=review_etag)
+    testing.expect.true(headers.get("etag") != review_etag,
+                        "review ETag differs between users")
@@ -69,6 +69,22 @@ Function = page
             expected_content_type="text/plain",
             expect={ "error_message": error_message(4, "path pattern should not start with a '/'") })
 
+    with TransferredFile("MANIFEST", """\
+Author = Alice von Testing <alice@example.org>
+Description = Extension with invalid MANIFEST
+
+[Inject foo]
+Description = Inject role with invalid cache specification
+Script = script.js
+Function = inject
+Cached = user, forever
+"""):
+        frontend.page(
+            "loadmanifest",
+            params={ "key": "alice/InvalidExtension" },
+            expected_content_type="text/plain",
+            expect={ "error_message": error_message(8, "invalid 'cached' value 'forever': expected 'user', 'path' and/or a number of seconds") })
+
     with script_js, TransferredFile("MANIFEST", """\
 Author = Alice von Testing <alice@example.org>
 Description = Extension with soon to be missing MANIFEST
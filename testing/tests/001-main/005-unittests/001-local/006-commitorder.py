@@ -0,0 +1 @@
+instance.unittest("commitorder", ["basic", "relabeling"])
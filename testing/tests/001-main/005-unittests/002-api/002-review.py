@@ -1,3 +1,3 @@
 # @dependency 001-main/003-self/004-createreview.py
 
-instance.unittest("api.review", ["basic"])
+instance.unittest("api.review", ["basic", "prefetch"])
@@ -0,0 +1 @@
+instance.unittest("api.transaction", ["scheduling", "modifications"])
@@ -0,0 +1 @@
+instance.unittest("auth.credentialcache", ["basic"])
@@ -0,0 +1 @@
+instance.unittest("dbutils.generations", ["basic", "transactions"])
@@ -0,0 +1,3 @@
+# @dependency 001-main/003-self/100-reviewing/001-comments.basic.py
+
+instance.unittest("reviewing.comment", ["bulk"])
@@ -0,0 +1 @@
+instance.unittest("syntaxhighlight.context", ["index"])
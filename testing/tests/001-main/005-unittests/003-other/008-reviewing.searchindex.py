@@ -0,0 +1 @@
+instance.unittest("reviewing.searchindex", ["trigrams"])
@@ -0,0 +1 @@
+instance.unittest("background.pushqueue", ["scheduling"])
@@ -0,0 +1,2 @@
+instance.unittest("log.commitset", ["commonancestors", "fromrange",
+                                      "ordering"])
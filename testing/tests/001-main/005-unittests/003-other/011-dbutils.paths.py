@@ -0,0 +1 @@
+instance.unittest("dbutils.paths", ["paths", "normalization", "concurrent"])
@@ -0,0 +1 @@
+instance.unittest("extensions.registry", ["installs", "refs"])
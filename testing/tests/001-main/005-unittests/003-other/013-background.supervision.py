@@ -0,0 +1,2 @@
+instance.unittest("background.supervision", ["backoff", "limits", "sampling",
+                                              "restart", "stop"])
@@ -0,0 +1 @@
+instance.unittest("dbutils.branch", ["archivemultiple"])
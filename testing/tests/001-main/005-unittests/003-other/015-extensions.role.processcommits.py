@@ -0,0 +1 @@
+instance.unittest("extensions.role.processcommits", ["events"])
@@ -775,6 +775,11 @@ class Instance(testing.Instance):
                                  % (service_name, timeout))
             time.sleep(timeout)
             return
+        if not (self.__upgraded or testing.exists_at(
+                self.install_commit, "src/background/%s.py" % service_name)):
+            # The service doesn't exist in the installed commit, and we haven't
+            # upgraded yet, so there's nothing to synchronize with.
+            return
         testing.logger.debug("Synchronizing service: %s" % service_name)
         pidfile_path = os.path.join("/var/run/critic/main", service_name + ".pid")
         if force_maintenance: